@@ -36,17 +36,34 @@ import os
 # define path to logs folder
 log_folder = os.path.join(root_path, "logs")
 
+# define path to the folder where generated cohorts are staged between tasks
+# -> tasks of a cohort may run on different workers: with a multi-node executor
+# (e.g. Celery or Kubernetes) INGESTION_STAGING_FOLDER must be a storage shared by
+# every worker (e.g. an NFS/EFS mount); the default local folder needs a single-node
+# executor (e.g. LocalExecutor)
+staging_folder = os.environ.get(
+    "INGESTION_STAGING_FOLDER", os.path.join(root_path, "staging")
+)
+
+# define A/B testing arms (groups) and the sample size of each cohort of an arm
+# -> one cohort per arm and size (e.g. INGESTION_COHORT_SIZES=5000,1000)
+arms = os.environ.get("INGESTION_ARMS", "CONTROL,TREATMENT").split(",")
+cohort_sizes = [
+    int(size) for size in os.environ.get("INGESTION_COHORT_SIZES", "5000").split(",")
+]
+
 
 #######################################
 ############## LIBRARIES ##############
 
+import shutil
 from datetime import datetime
 from airflow.models import DAG
 from airflow.decorators import task
-from airflow.operators.python import PythonOperator, PythonVirtualenvOperator
 
 
 # import required libraries -> project library
+from synthetic_data_ingestion.cohort import Cohort
 from synthetic_data_ingestion.rds_ingestion import RdsIngestor
 from synthetic_data_ingestion.sample_creator import SynthCustomers
 from synthetic_data_ingestion.dynamodb_ingestion import DynamodbIngestor
@@ -57,42 +74,125 @@ from synthetic_data_ingestion.lambda_ingestion import LambdaIngestor
 ############## FUNCTIONS ################
 
 
-def rds_ingestion(synth_customer_object: SynthCustomers, log_folder: str) -> None:
+@task
+def define_cohorts(params: dict = None) -> list:
+    """Define the cohorts to be created on this run: one cohort per arm and
+    cohort size of the DAG params (the number of mapped tasks is defined at run time)
+
+    Args
+        params: a dict with the DAG params "arms" and "cohort_sizes"
+
+    Return
+        cohorts: a list of dicts with the group and num_samples of each cohort"""
+
+    return [
+        {"group": group, "num_samples": int(num_samples)}
+        for group in params["arms"]
+        for num_samples in params["cohort_sizes"]
+    ]
+
+
+@task
+def generate_cohort(cohort: dict, log_folder: str, run_id: str = None, ti=None) -> str:
+    """Generate the synthetic samples and report of a cohort and stage them
+    for the ingestion tasks (samples are generated at run time, not when
+    the scheduler parses the DAG file)
+
+    Args
+        cohort: a dict with the group and num_samples of the cohort
+        log_folder: a string with the path to store logs
+        run_id: a string with the id of the DAG run
+        ti: the task instance (its map index identifies the cohort of the run)
+
+    Return
+        cohort_path: a string with the path to the staged Cohort object"""
+
+    # instanciate SynthCustomers object
+    synth_customers = SynthCustomers(
+        num_samples=cohort["num_samples"], group=cohort["group"], log_folder=log_folder
+    )
+    # generate synthetic samples and report
+    synth_cohort = synth_customers.generate_samples()
+
+    # define staging folder of the DAG run
+    run_folder = os.path.join(staging_folder, run_id)
+    os.makedirs(run_folder, exist_ok=True)
+
+    # define staged file path (map index -> unique even for repeated cohorts)
+    cohort_path = os.path.join(
+        run_folder,
+        f"{ti.map_index}-{cohort['group'].lower()}-{cohort['num_samples']}.cohort",
+    )
+
+    # stage Cohort object in its binary format (XComs only hold its path)
+    with open(cohort_path, "wb") as cohort_file:
+        cohort_file.write(synth_cohort.to_bytes())
+
+    return cohort_path
+
+
+def load_cohort(cohort_path: str) -> Cohort:
+    """Load a Cohort object staged by generate_cohort
+
+    Args
+        cohort_path: a string with the path to the staged Cohort object"""
+
+    with open(cohort_path, "rb") as cohort_file:
+        return Cohort.from_bytes(cohort_file.read())
+
+
+@task
+def rds_ingestion(cohort_path: str, log_folder: str) -> str:
     """Send synthetic data to AWS RDS.
 
     Args
-        synth_customer_object: a synthetic_data_ingestion.sample_creator.SynthCustomers object.
+        cohort_path: a string with the path to a staged Cohort object.
         log_folder: a string with the path to store logs."""
 
     # instantiate a RdsIngestor object
-    rds_ingestor = RdsIngestor(synth_customers, log_folder)
+    rds_ingestor = RdsIngestor(load_cohort(cohort_path), log_folder)
     # send synthetic samples to AWS RDS
-    rds_ingestor.ingest_samples()
+    return rds_ingestor.ingest_samples()
 
 
-def lambda_ingestion(synth_customer_object: SynthCustomers, log_folder: str) -> None:
+@task
+def lambda_ingestion(
+    cohort_path: str, log_folder: str, run_id: str = None, ti=None
+) -> str:
     """Send synthetic data to AWS Lambda (FastAPI).
 
     Args
-        synth_customer_object: a synthetic_data_ingestion.sample_creator.SynthCustomers object.
-        log_folder: a string with the path to store logs."""
+        cohort_path: a string with the path to a staged Cohort object.
+        log_folder: a string with the path to store logs.
+        run_id: a string with the id of the DAG run.
+        ti: the task instance (its map index identifies the cohort of the run)."""
 
     # instanciate LambdaIngestor object
-    lam_ingestion = LambdaIngestor(synth_customers)
+    # (task retries of a cohort send the same Idempotency-Key)
+    lam_ingestion = LambdaIngestor(
+        load_cohort(cohort_path),
+        log_folder,
+        idempotency_key=f"{run_id}-{ti.map_index}",
+    )
     # send report to FastAPI on AWS Lambda
-    lam_ingestion.send_report_to_lambda()
+    return lam_ingestion.send_report_to_lambda()
 
 
-def dynamo_ingestion(logs_folder: str) -> None:
-    """send log to AWS DynamoDB
+@task(trigger_rule="all_done")  # regardless of upstream success/fail
+def dynamo_ingestion(logs_folder: str, run_id: str = None) -> str:
+    """send log to AWS DynamoDB and remove the cohorts staged on the DAG run
 
     Args
-        log_folder: a string with the path to store logs"""
+        log_folder: a string with the path to store logs
+        run_id: a string with the id of the DAG run"""
+
+    # remove staged cohorts of the DAG run
+    shutil.rmtree(os.path.join(staging_folder, run_id), ignore_errors=True)
 
     # instanciate a DynamodbIngestor object
     dynamo_ingestor = DynamodbIngestor(logs_folder)
     # send log to AWS DynamoDB
-    dynamo_ingestor.send_logs()
+    return dynamo_ingestor.send_logs()
 
 
 #########################################
@@ -106,49 +206,29 @@ with DAG(
     end_date=None,
     schedule_interval="@weekly",
     catchup=False,  # don't wait schedule_interval after start date
+    params={"arms": arms, "cohort_sizes": cohort_sizes},  # overridable per run
 ) as dag:
 
-    # iterate over groups to be created
-    for group in ["CONTROL", "TREATMENT"]:
-        # instanciate SynthCustomers object
-        synth_customers = SynthCustomers(
-            num_samples=5000, group=group, log_folder=log_folder
-        )
-        # generate synthetic samples
-        synth_customers.generate_samples()
-        # generate report
-        synth_customers.generate_report()
-
-        # task to ingest data on AWS RDS Database
-        rds_ingestion_task = PythonOperator(
-            task_id=f"rds_ingestion_{group.lower()}",
-            python_callable=rds_ingestion,  # call python function
-            op_kwargs={
-                "synth_customer_object": synth_customers,
-                "log_folder": log_folder,
-            },  # callable args
-            show_return_value_in_logs=True,
-        )
-
-        # task to ingest data on AWS Lambda (FastAPI)
-        lambda_ingestion_task = PythonOperator(
-            task_id=f"lambda_ingestion_{group.lower()}",
-            python_callable=lambda_ingestion,  # call python function
-            op_kwargs={
-                "synth_customer_object": synth_customers,
-                "log_folder": log_folder,
-            },  # callable args
-            show_return_value_in_logs=True,
-        )
-
-        # task to send data to AWS DynamoDB
-        dynamo_ingestion_task = PythonOperator(
-            task_id=f"dynamo_ingestion_{group.lower()}",
-            python_callable=dynamo_ingestion,  # call python function
-            op_kwargs={"logs_folder": log_folder},  # callable args
-            trigger_rule="all_done",  # regardless of upstream success/fail
-            show_return_value_in_logs=True,
-        )
-
-        # define workflow
-        rds_ingestion_task >> lambda_ingestion_task >> dynamo_ingestion_task
+    # task to define the cohorts of the run (one per arm and cohort size)
+    cohorts = define_cohorts()
+
+    # one task per cohort to generate and stage its synthetic samples
+    cohort_paths = generate_cohort.partial(log_folder=log_folder).expand(cohort=cohorts)
+
+    # one task per cohort to ingest data on AWS RDS Database
+    rds_ingestion_tasks = rds_ingestion.partial(log_folder=log_folder).expand(
+        cohort_path=cohort_paths
+    )
+
+    # one task per cohort to ingest data on AWS Lambda (FastAPI)
+    # -> runs in parallel with RDS ingestion (they do not depend on each other)
+    lambda_ingestion_tasks = lambda_ingestion.partial(log_folder=log_folder).expand(
+        cohort_path=cohort_paths
+    )
+
+    # a single task to send logs of all cohorts to AWS DynamoDB
+    dynamo_ingestion_task = dynamo_ingestion(logs_folder=log_folder)
+
+    # define workflow
+    # define_cohorts >> generate_cohort[] >> (rds_ingestion[] | lambda_ingestion[]) >> dynamo_ingestion
+    [rds_ingestion_tasks, lambda_ingestion_tasks] >> dynamo_ingestion_task
@@ -0,0 +1,426 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Load test and latency benchmark of the Lambda API (lambda_api/lambda_function.py)
+driven in-process (ASGI transport) and through uvicorn (HTTP on localhost), with
+moto standing in for AWS S3. Throughput and p50/p95/p99 latencies are reported per
+mode, concurrency and payload size; results can be compared against a baseline file.
+
+Usage
+    python benchmarks/bench_lambda_api.py --modes inprocess uvicorn --concurrency 1 8 32
+    python benchmarks/bench_lambda_api.py --baseline benchmarks/results/lambda_api-<ts>.json
+"""
+
+# import required libraries
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import threading
+import statistics
+from datetime import datetime
+
+# append project root to the list of directories
+# where the Python interpreter searches for modules
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def build_report(region_size: int) -> dict:
+    """Create a report whose region weights have region_size keys
+    (the payload size grows with the number of regions)
+
+    Args
+        region_size: an integer with the number of region weights"""
+
+    return {
+        "group": "TREATMENT",
+        "gamma_shape": 3,
+        "gamma_scale": 10,
+        "poisson_lambda": 3,
+        "date_interval": "[2022-06-28,2022-07-04] [extremes included]",
+        "region": {f"REGION_{idx}": 1 / region_size for idx in range(region_size)},
+        "gender": {"MALE": 0.5, "FEMALE": 0.5},
+        "device": {"MOBILE": 0.5, "COMPUTER": 0.5},
+    }
+
+
+def summarize(durations: list, errors: int, elapsed: float) -> dict:
+    """Get throughput and latency percentiles (in ms) of a load test
+
+    Args
+        durations: a list of floats with request durations in seconds
+        errors: an integer with the number of failed requests
+        elapsed: a float with the wall time of the load test in seconds"""
+
+    # get percentiles (99 cut points)
+    cuts = statistics.quantiles(durations, n=100, method="inclusive")
+
+    return {
+        "requests": len(durations),
+        "errors": errors,
+        "throughput_rps": round(len(durations) / elapsed, 1),
+        "mean_ms": round(statistics.mean(durations) * 1000, 3),
+        "p50_ms": round(cuts[49] * 1000, 3),
+        "p95_ms": round(cuts[94] * 1000, 3),
+        "p99_ms": round(cuts[98] * 1000, 3),
+    }
+
+
+async def load_test(
+    client, path: str, content: bytes, num_requests: int, concurrency: int
+) -> dict:
+    """Send num_requests POST requests with at most concurrency requests in flight
+
+    Args
+        client: a httpx.AsyncClient (ASGI or HTTP transport)
+        path: a string with the endpoint path
+        content: the json bytes sent on each request
+        num_requests: an integer with the number of requests
+        concurrency: an integer with the maximum number of requests in flight"""
+
+    # instanciate list of durations and error counter
+    durations, errors = [], 0
+
+    # limit number of requests in flight
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send() -> None:
+        """Send one request and record its duration"""
+
+        nonlocal errors
+
+        # wait for a free slot
+        async with semaphore:
+            # time request
+            start = time.perf_counter()
+            response = await client.post(
+                path, content=content, headers={"Content-type": "application/json"}
+            )
+            durations.append(time.perf_counter() - start)
+
+            # count failed requests
+            if (response.status_code != 200) or ("error" in response.text):
+                errors += 1
+
+    # send all requests
+    start = time.perf_counter()
+    await asyncio.gather(*[send() for _ in range(num_requests)])
+    elapsed = time.perf_counter() - start
+
+    return summarize(durations, errors, elapsed)
+
+
+class ErrorCounter(logging.Handler):
+    """Logging handler that counts the errors logged by the API
+    (e.g. manifest update failures), instead of printing them"""
+
+    def __init__(self) -> None:
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.count += 1
+
+
+def free_port() -> int:
+    """Get a free TCP port on localhost"""
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class UvicornServer:
+    def __init__(self, app) -> None:
+        """Run the API with uvicorn on a background thread (context manager)
+
+        Args
+            app: the FastAPI app"""
+
+        # import uvicorn only when the uvicorn mode is used
+        import uvicorn
+
+        # define server on a free port
+        self.port = free_port()
+        self.server = uvicorn.Server(
+            uvicorn.Config(
+                app,
+                host="127.0.0.1",
+                port=self.port,
+                log_level="warning",
+                lifespan="off",
+            )
+        )
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> str:
+        """Start the server and get its url"""
+
+        # start server and wait until it accepts connections
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+
+        return f"http://127.0.0.1:{self.port}"
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        """Stop the server"""
+
+        self.server.should_exit = True
+        self.thread.join()
+
+
+async def run_mode(
+    mode: str,
+    app,
+    path: str,
+    contents: dict,
+    concurrency_levels: list,
+    num_requests: int,
+    warmup: int,
+) -> list:
+    """Run the load tests of one mode
+
+    Args
+        mode: a string with "inprocess" or "uvicorn"
+        app: the FastAPI app
+        path: a string with the endpoint path
+        contents: a dict with the json bytes of each region size
+        concurrency_levels: a list of integers with the concurrency of each load test
+        num_requests: an integer with the number of requests of each load test
+        warmup: an integer with the number of requests sent before timing"""
+
+    # import httpx only when the benchmark is run
+    import httpx
+
+    # instanciate list of results
+    results = []
+
+    # count errors logged by the API
+    error_counter = ErrorCounter()
+    api_logger = logging.getLogger("lambda_function.py")
+    api_logger.addHandler(error_counter)
+    api_logger.propagate = False
+
+    async def run_all(client) -> None:
+        """Run every load test with the given client"""
+
+        # iterate over payload sizes and concurrency levels
+        for region_size, content in contents.items():
+            for concurrency in concurrency_levels:
+                # warm up connections, caches and the thread pool
+                await load_test(client, path, content, max(warmup, 2), concurrency)
+
+                # run load test
+                logged_errors = error_counter.count
+                result = await load_test(
+                    client, path, content, num_requests, concurrency
+                )
+                result["api_logged_errors"] = error_counter.count - logged_errors
+
+                # add result
+                results.append(
+                    {
+                        "mode": mode,
+                        "path": path,
+                        "concurrency": concurrency,
+                        "region_size": region_size,
+                        "payload_bytes": len(content),
+                        **result,
+                    }
+                )
+
+                # print result
+                print(
+                    f"{mode:<11}{concurrency:>6}{len(content):>12}{result['throughput_rps']:>10.1f}"
+                    f"{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['errors']:>8}{result['api_logged_errors']:>8}"
+                )
+
+    # define connection limits of the client
+    limits = httpx.Limits(max_connections=max(concurrency_levels))
+
+    # in-process -> ASGI transport (no network)
+    if mode == "inprocess":
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),
+            base_url="http://lambda-api",
+            limits=limits,
+            timeout=60,
+        ) as client:
+            await run_all(client)
+
+    # uvicorn -> HTTP on localhost
+    else:
+        with UvicornServer(app) as url:
+            async with httpx.AsyncClient(
+                base_url=url, limits=limits, timeout=60
+            ) as client:
+                await run_all(client)
+
+    return results
+
+
+def compare(results: list, baseline_path: str, max_regression: float) -> list:
+    """Compare results with a baseline results file
+
+    Args
+        results: a list of result dicts
+        baseline_path: a string with the path to a previous results file
+        max_regression: a float with the maximum relative regression
+            of p95 latency and throughput (e.g. 0.2 = 20 %)
+
+    Return
+        regressions: a list of strings describing each regression"""
+
+    # load baseline results
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+
+    # index baseline by load test
+    def load_test_key(r):
+        return (r["mode"], r["path"], r["concurrency"], r["region_size"])
+
+    baseline = {load_test_key(r): r for r in baseline}
+
+    # instanciate list of regressions
+    regressions = []
+
+    # iterate over results
+    for r in results:
+        # load test not on baseline
+        if load_test_key(r) not in baseline:
+            continue
+
+        # get baseline result
+        b = baseline[load_test_key(r)]
+
+        # check latency and throughput
+        if r["p95_ms"] > b["p95_ms"] * (1 + max_regression):
+            regressions.append(
+                f"{load_test_key(r)}: p95 {b['p95_ms']} ms -> {r['p95_ms']} ms"
+            )
+        if r["throughput_rps"] < b["throughput_rps"] * (1 - max_regression):
+            regressions.append(
+                f"{load_test_key(r)}: throughput {b['throughput_rps']} -> {r['throughput_rps']} req/s"
+            )
+
+    return regressions
+
+
+def main(argv: list = None) -> int:
+    """Run the benchmark, print results and save them as json"""
+
+    # define command line arguments
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        default=["inprocess", "uvicorn"],
+        choices=["inprocess", "uvicorn"],
+    )
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--region-sizes", nargs="+", type=int, default=[5, 1000, 10000])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--path", default="/sampling_report")
+    parser.add_argument(
+        "--no-manifest",
+        dest="manifest",
+        action="store_false",
+        help="do not record objects on the partition manifests",
+    )
+    parser.add_argument("--baseline", help="results file to check for regressions")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument(
+        "--output",
+        default=os.path.join(
+            "benchmarks",
+            "results",
+            f"lambda_api-{datetime.utcnow():%Y%m%dT%H%M%S}.json",
+        ),
+    )
+    args = parser.parse_args(argv)
+
+    # set fake AWS environment
+    os.environ.setdefault("AWS_S3_BUCKET", "bench-bucket")
+    for variable in ["AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"]:
+        os.environ.setdefault(variable, "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+    # import moto, boto3 and the API
+    import boto3
+    from moto import mock_s3
+    from synthetic_data_ingestion.serializers import get_serializer
+
+    # define if objects are recorded on the partition manifests
+    os.environ["REPORT_MANIFEST"] = str(args.manifest).lower()
+
+    # define request contents of each payload size
+    contents = {
+        region_size: get_serializer("json").dumps(build_report(region_size))
+        for region_size in args.region_sizes
+    }
+
+    # print header
+    print(
+        f"{'mode':<11}{'conc':>6}{'bytes':>12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'logged':>8}"
+    )
+
+    # instanciate list of results
+    results = []
+
+    # open moto mock
+    with mock_s3():
+        # create the fake bucket
+        boto3.client("s3").create_bucket(Bucket=os.environ["AWS_S3_BUCKET"])
+
+        # import the API (S3 client is created inside the mock)
+        from lambda_api.lambda_function import app
+
+        # iterate over modes
+        for mode in args.modes:
+            results.extend(
+                asyncio.run(
+                    run_mode(
+                        mode,
+                        app,
+                        args.path,
+                        contents,
+                        args.concurrency,
+                        args.requests,
+                        args.warmup,
+                    )
+                )
+            )
+
+    # save results
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as output_file:
+        json.dump(
+            {"benchmark": "lambda_api", "params": vars(args), "results": results},
+            output_file,
+            indent=2,
+        )
+
+    # check regressions against a baseline
+    if args.baseline is not None:
+        # compare results
+        regressions = compare(results, args.baseline, args.max_regression)
+
+        # print regressions
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+
+        # fail if there are regressions
+        if regressions:
+            return 1
+
+    return 0
+
+
+# check if script is being called directly
+if __name__ == "__main__":
+    sys.exit(main())
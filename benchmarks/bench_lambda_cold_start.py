@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Cold start and warm request benchmark of the Lambda API (lambda_api/lambda_function.py)
+on a local Lambda-like harness: each cold start is a new python process that imports
+the module (container initialization) and invokes lambda_handler with API Gateway
+events, with moto standing in for AWS S3.
+
+Usage
+    python benchmarks/bench_lambda_cold_start.py --cold-starts 5 --warm-requests 200
+"""
+
+# import required libraries
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from datetime import datetime
+
+# define project root
+ROOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# append project root to the list of directories
+# where the Python interpreter searches for modules
+sys.path.append(ROOT_PATH)
+
+# define report sent on each request
+REPORT = {
+    "group": "TREATMENT",
+    "gamma_shape": 3,
+    "gamma_scale": 10,
+    "poisson_lambda": 3,
+    "date_interval": "[2022-06-28,2022-07-04] [extremes included]",
+    "region": {"LAM": 0.2, "NAM": 0.2, "EUR": 0.2, "AFR": 0.2, "ASA": 0.2},
+    "gender": {"MALE": 0.5, "FEMALE": 0.5},
+    "device": {"MOBILE": 0.5, "COMPUTER": 0.5},
+}
+
+
+def api_gateway_event(path: str, body: dict) -> dict:
+    """Create an API Gateway (HTTP API, payload 2.0) POST event"""
+
+    return {
+        "version": "2.0",
+        "routeKey": "$default",
+        "rawPath": path,
+        "rawQueryString": "",
+        "headers": {"content-type": "application/json", "host": "localhost"},
+        "requestContext": {
+            "accountId": "123456789012",
+            "apiId": "bench",
+            "domainName": "localhost",
+            "requestId": "bench",
+            "routeKey": "$default",
+            "stage": "$default",
+            "time": "01/Jul/2022:00:00:00 +0000",
+            "timeEpoch": 0,
+            "http": {
+                "method": "POST",
+                "path": path,
+                "protocol": "HTTP/1.1",
+                "sourceIp": "127.0.0.1",
+                "userAgent": "bench",
+            },
+        },
+        "body": json.dumps(body),
+        "isBase64Encoded": False,
+    }
+
+
+def run_container(warm_requests: int) -> dict:
+    """Simulate one Lambda container: import the API module and
+    invoke it with one cold and warm_requests warm requests"""
+
+    # set fake AWS environment
+    os.environ.setdefault("AWS_S3_BUCKET", "bench-bucket")
+    for variable in ["AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"]:
+        os.environ.setdefault(variable, "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+    # import moto and boto3 before timing (AWS Lambda runtime already has boto3)
+    import boto3
+    from moto import mock_s3
+
+    # open moto mock
+    with mock_s3():
+        # create the fake bucket
+        boto3.client("s3").create_bucket(Bucket=os.environ["AWS_S3_BUCKET"])
+
+        # time container initialization (module import)
+        start = time.perf_counter()
+        from lambda_api.lambda_function import lambda_handler, TIMINGS
+
+        init_ms = (time.perf_counter() - start) * 1000
+
+        # define API Gateway event
+        event = api_gateway_event("/sampling_report", REPORT)
+
+        # instanciate list of invocation durations
+        durations = []
+
+        # invoke handler (first = cold request)
+        for _ in range(warm_requests + 1):
+            start = time.perf_counter()
+            response = lambda_handler(event, None)
+            durations.append((time.perf_counter() - start) * 1000)
+
+            # make sure request was successful
+            assert response["statusCode"] == 200, response
+
+    return {
+        "init_ms": init_ms,
+        "module_init_ms": TIMINGS["init_ms"],
+        "cold_request_ms": durations[0],
+        "warm_p50_ms": statistics.median(durations[1:]),
+        "warm_p95_ms": sorted(durations[1:])[int(0.95 * (len(durations) - 2))],
+    }
+
+
+def main(argv: list = None) -> int:
+    """Run the benchmark, print results and save them as json"""
+
+    # define command line arguments
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cold-starts", type=int, default=5)
+    parser.add_argument("--warm-requests", type=int, default=200)
+    parser.add_argument("--container", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument(
+        "--output",
+        default=os.path.join(
+            "benchmarks",
+            "results",
+            f"lambda_cold_start-{datetime.utcnow():%Y%m%dT%H%M%S}.json",
+        ),
+    )
+    args = parser.parse_args(argv)
+
+    # child process -> simulate one container and print its timings
+    if args.container:
+        print(json.dumps(run_container(args.warm_requests)))
+        return 0
+
+    # instanciate list of container results
+    containers = []
+
+    # iterate over cold starts (one new process per container)
+    for _ in range(args.cold_starts):
+        # run container
+        output = subprocess.run(
+            [
+                sys.executable,
+                os.path.abspath(__file__),
+                "--container",
+                "--warm-requests",
+                str(args.warm_requests),
+            ],
+            cwd=ROOT_PATH,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        # parse container timings (last line of the output)
+        containers.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    # summarize containers
+    summary = {
+        key: round(statistics.median(c[key] for c in containers), 3)
+        for key in containers[0]
+    }
+
+    # print results
+    for key, value in summary.items():
+        print(f"{key:<20}{value:>12.3f} ms (median of {len(containers)} containers)")
+
+    # save results
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as output_file:
+        json.dump(
+            {
+                "benchmark": "lambda_cold_start",
+                "params": vars(args),
+                "summary": summary,
+                "containers": containers,
+            },
+            output_file,
+            indent=2,
+        )
+
+    return 0
+
+
+# check if script is being called directly
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,437 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""End-to-end benchmark of the ingestion pipeline (synthetic_data_ingestion.pipeline):
+generate -> RDS -> Lambda -> DynamoDB without AWS. Local stand-ins replace every sink:
+SQLite (or a local Postgres with --rds-url) for AWS RDS, the FastAPI app of
+lambda_api served in-process by uvicorn for AWS Lambda, and moto for AWS S3 and
+AWS DynamoDB. Stage-level throughput and latency are reported per mode, cohort size
+and concurrency; results can be compared against a baseline file.
+
+Usage
+    python benchmarks/bench_pipeline.py --cohort-sizes 1000 100000 --concurrency 1 4
+    python benchmarks/bench_pipeline.py --modes pipelined --rds-url postgresql+psycopg2://u:p@localhost/postgres
+    python benchmarks/bench_pipeline.py --baseline benchmarks/results/pipeline-<ts>.json
+"""
+
+# import required libraries
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+from datetime import datetime
+from unittest.mock import patch
+from sqlalchemy import create_engine, event, inspect, text
+
+# append project root to the list of directories
+# where the Python interpreter searches for modules
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# import required libraries -> project library
+from synthetic_data_ingestion.rds_ingestion import RdsIngestor
+from synthetic_data_ingestion.sample_creator import SynthCustomers
+from synthetic_data_ingestion.pipeline import (
+    define_cohorts,
+    is_failure,
+    run_pipeline,
+    run_pipelined,
+)
+
+# import required libraries -> Lambda API benchmark (uvicorn on a background thread)
+from bench_lambda_api import UvicornServer
+
+
+# sinks of the benchmarked flow (parquet is not an AWS sink)
+SINKS = ["rds", "lambda", "dynamo"]
+
+# stages reported per run (in flow order)
+STAGES = ["generate", "rds", "lambda", "dynamo"]
+
+
+def create_rds_engine(rds_url: str, folder: str):
+    """Create the engine standing in for AWS RDS: a SQLite file with an attached
+    "public" database (the postgres schema of the table) or the given database url
+
+    Args
+        rds_url: a string with a SQLAlchemy url (None = SQLite file on folder)
+        folder: a string with the path to store the SQLite files"""
+
+    # use the given database (e.g. a local Postgres)
+    if rds_url is not None:
+        return create_engine(rds_url)
+
+    # create a SQLite engine (waits for the lock of concurrent writers)
+    engine = create_engine(
+        f"sqlite:///{os.path.join(folder, 'rds.db')}", connect_args={"timeout": 600}
+    )
+
+    # attach the "public" database on every new connection
+    @event.listens_for(engine, "connect")
+    def attach_public(dbapi_connection, connection_record):
+        dbapi_connection.execute(
+            f"ATTACH DATABASE '{os.path.join(folder, 'public.db')}' AS public"
+        )
+
+    return engine
+
+
+def reset_sinks(engine, dynamodb, table_name: str, log_folder: str) -> None:
+    """Empty every sink before a run (same work on every run)
+
+    Args
+        engine: the SQLAlchemy engine standing in for AWS RDS
+        dynamodb: a boto3 DynamoDB resource (moto)
+        table_name: a string with the name of the DynamoDB table
+        log_folder: a string with the path of the logs sent to DynamoDB"""
+
+    # create the RDS table (with the project schema) on the first run:
+    # concurrent writers of a run must not race to create it
+    if not inspect(engine).has_table("SyntheticCustomers", schema="public"):
+        RdsIngestor(
+            SynthCustomers(
+                num_samples=1, group="CONTROL", log_folder=log_folder
+            ).generate_samples(),
+            log_folder=log_folder,
+        ).ingest_samples()
+
+    # empty the RDS table (kept, so it is never created during a run)
+    with engine.begin() as connection:
+        connection.execute(text('DELETE FROM public."SyntheticCustomers"'))
+
+    # recreate the DynamoDB table (with the project key schema)
+    if table_name in [table.name for table in dynamodb.tables.all()]:
+        dynamodb.Table(table_name).delete()
+    dynamodb.create_table(
+        TableName=table_name,
+        KeySchema=[
+            {"AttributeName": "timestamp", "KeyType": "HASH"},
+            {"AttributeName": "log_file_sequence", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "timestamp", "AttributeType": "S"},
+            {"AttributeName": "log_file_sequence", "AttributeType": "N"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+    # empty the log files (logs of a run only)
+    for log_file in os.listdir(log_folder):
+        open(os.path.join(log_folder, log_file), "w").close()
+
+
+def count_sink_rows(engine, dynamodb, table_name: str) -> dict:
+    """Count the rows stored on the RDS and DynamoDB stand-ins after a run"""
+
+    # count RDS rows (no table -> no rows)
+    try:
+        with engine.connect() as connection:
+            rds_rows = connection.execute(
+                text('SELECT COUNT(*) FROM public."SyntheticCustomers"')
+            ).scalar()
+    except Exception:
+        rds_rows = 0
+
+    # count DynamoDB items (log lines)
+    dynamo_items = dynamodb.Table(table_name).scan(Select="COUNT")["Count"]
+
+    return {"rds": rds_rows, "dynamo": dynamo_items}
+
+
+def summarize_stage(stages: list, rows: int) -> dict:
+    """Get the throughput and the latency percentiles (in ms) of the calls of a stage
+
+    Args
+        stages: a list of the stage dicts of the stage (one per call)
+        rows: an integer with the rows processed by the stage"""
+
+    # get durations of finished calls
+    durations = [stage["duration_s"] for stage in stages if stage["duration_s"]]
+
+    # instanciate summary
+    summary = {
+        "calls": len(stages),
+        "errors": sum(
+            stage["duration_s"] is None or is_failure(stage["response"])
+            for stage in stages
+        ),
+        "rows": rows,
+    }
+
+    # no finished calls -> no throughput and no latency (nan is printed and
+    # never flagged as a latency regression; 0 rows/s is a throughput regression)
+    if not durations:
+        return {
+            **summary,
+            "total_s": 0.0,
+            "rows_per_s": 0.0,
+            "p50_ms": float("nan"),
+            "p95_ms": float("nan"),
+            "max_ms": float("nan"),
+        }
+
+    # get percentiles (99 cut points, at least 2 durations)
+    cuts = statistics.quantiles(durations * 2, n=100, method="inclusive")
+
+    return {
+        **summary,
+        "total_s": round(sum(durations), 6),
+        "rows_per_s": round(rows / sum(durations), 1),
+        "p50_ms": round(cuts[49] * 1000, 3),
+        "p95_ms": round(cuts[94] * 1000, 3),
+        "max_ms": round(max(durations) * 1000, 3),
+    }
+
+
+def run_case(
+    mode: str,
+    cohorts: list,
+    concurrency: int,
+    batch_size: int,
+    log_folder: str,
+) -> dict:
+    """Run the pipeline once
+
+    Args
+        mode: a string with "staged" or "pipelined"
+        cohorts: a list of dicts created by define_cohorts
+        concurrency: an integer with the number of sink threads (staged) or
+            cohorts run in parallel (pipelined)
+        batch_size: an integer with the maximum number of samples of a batch
+        log_folder: a string with the path to store logs"""
+
+    # run pipeline on pipelined mode
+    if mode == "pipelined":
+        return run_pipelined(
+            cohorts,
+            sinks=SINKS,
+            batch_size=batch_size,
+            max_cohorts=concurrency,
+            log_folder=log_folder,
+        )
+
+    # run pipeline on staged mode
+    return run_pipeline(
+        cohorts,
+        sinks=SINKS,
+        process_workers=min(concurrency, os.cpu_count() or 1),
+        thread_workers=concurrency,
+        log_folder=log_folder,
+    )
+
+
+def compare(results: list, baseline_path: str, max_regression: float) -> list:
+    """Compare results with a baseline results file
+
+    Args
+        results: a list of result dicts
+        baseline_path: a string with the path to a previous results file
+        max_regression: a float with the maximum relative regression
+            of p95 latency and throughput (e.g. 0.2 = 20 %)
+
+    Return
+        regressions: a list of strings describing each regression"""
+
+    # load baseline results
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+
+    # index baseline by run and stage
+    def stage_key(r):
+        return (r["mode"], r["cohort_size"], r["concurrency"], r["stage"])
+
+    baseline = {stage_key(r): r for r in baseline}
+
+    # instanciate list of regressions
+    regressions = []
+
+    # iterate over results
+    for r in results:
+        # stage not on baseline
+        if stage_key(r) not in baseline:
+            continue
+
+        # get baseline result
+        b = baseline[stage_key(r)]
+
+        # check latency and throughput
+        if r["p95_ms"] > b["p95_ms"] * (1 + max_regression):
+            regressions.append(
+                f"{stage_key(r)}: p95 {b['p95_ms']} ms -> {r['p95_ms']} ms"
+            )
+        if r["rows_per_s"] < b["rows_per_s"] * (1 - max_regression):
+            regressions.append(
+                f"{stage_key(r)}: throughput {b['rows_per_s']} -> {r['rows_per_s']} rows/s"
+            )
+
+    return regressions
+
+
+def main(argv: list = None) -> int:
+    """Run the benchmark, print results and save them as json"""
+
+    # define command line arguments
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        default=["staged", "pipelined"],
+        choices=["staged", "pipelined"],
+    )
+    parser.add_argument("--cohort-sizes", nargs="+", type=int, default=[1000, 100_000])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4])
+    parser.add_argument(
+        "--cohorts-per-arm",
+        type=int,
+        default=2,
+        help="cohorts of each arm (CONTROL and TREATMENT) per run (sizes cohort size, +1, ...)",
+    )
+    parser.add_argument("--batch-size", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rds-url", help="SQLAlchemy url of a local database")
+    parser.add_argument("--baseline", help="results file to check for regressions")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument(
+        "--output",
+        default=os.path.join(
+            "benchmarks",
+            "results",
+            f"pipeline-{datetime.utcnow():%Y%m%dT%H%M%S}.json",
+        ),
+    )
+    args = parser.parse_args(argv)
+
+    # create folders of the stand-ins and of the logs
+    work_folder = tempfile.mkdtemp(prefix="bench_pipeline-")
+    log_folder = os.path.join(work_folder, "logs")
+    os.makedirs(log_folder)
+
+    # set fake AWS environment
+    os.environ.setdefault("AWS_S3_BUCKET", "bench-bucket")
+    os.environ.setdefault("AWS_DYNAMODB_TABLE", "bench-logs")
+    for variable in ["AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"]:
+        os.environ.setdefault(variable, "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+    # import moto and boto3
+    import boto3
+    from moto import mock_dynamodb, mock_s3
+
+    # create the engine standing in for AWS RDS
+    engine = create_rds_engine(args.rds_url, work_folder)
+
+    # print header
+    print(
+        f"{'mode':<10}{'size':>9}{'conc':>6} {'stage':<10}{'calls':>6}{'errors':>7}{'rows/s':>14}{'p50 ms':>10}{'p95 ms':>10}{'wall s':>9}"
+    )
+
+    # instanciate list of results
+    results = []
+
+    # open moto mocks and use the stand-in engine on every RdsIngestor
+    with mock_s3(), mock_dynamodb(), patch.object(
+        RdsIngestor, "_create_conn_engine", lambda self: setattr(self, "engine", engine)
+    ):
+        # create the fake bucket and DynamoDB resource
+        boto3.client("s3").create_bucket(Bucket=os.environ["AWS_S3_BUCKET"])
+        dynamodb = boto3.resource("dynamodb")
+
+        # import the API (S3 client is created inside the mock)
+        from lambda_api.lambda_function import app
+
+        # serve the API in-process
+        with UvicornServer(app) as url:
+            # send the reports of LambdaIngestor to the local API
+            os.environ["AWS_LAMBDA_API"] = url
+
+            # iterate over modes, cohort sizes and concurrency levels
+            for mode in args.modes:
+                for cohort_size in args.cohort_sizes:
+                    for concurrency in args.concurrency:
+                        # empty sinks
+                        reset_sinks(
+                            engine,
+                            dynamodb,
+                            os.environ["AWS_DYNAMODB_TABLE"],
+                            log_folder,
+                        )
+
+                        # define cohorts (cohort names must be unique ->
+                        # cohorts of an arm differ by one sample)
+                        cohorts = define_cohorts(
+                            ["CONTROL", "TREATMENT"],
+                            [cohort_size + i for i in range(args.cohorts_per_arm)],
+                            args.seed,
+                        )
+
+                        # run pipeline
+                        run = run_case(
+                            mode, cohorts, concurrency, args.batch_size, log_folder
+                        )
+
+                        # count rows stored on the stand-ins
+                        stored = count_sink_rows(
+                            engine, dynamodb, os.environ["AWS_DYNAMODB_TABLE"]
+                        )
+
+                        # define rows of each stage
+                        rows = {
+                            "generate": sum(c["num_samples"] for c in cohorts),
+                            "rds": stored["rds"],
+                            "lambda": len(cohorts),  # one report per cohort
+                            "dynamo": stored["dynamo"],
+                        }
+
+                        # iterate over stages
+                        for stage in STAGES:
+                            # get calls of the stage
+                            stages = [s for s in run["stages"] if s["stage"] == stage]
+
+                            # stage did not run
+                            if not stages:
+                                continue
+
+                            # summarize stage
+                            r = {
+                                "mode": mode,
+                                "cohort_size": cohort_size,
+                                "concurrency": concurrency,
+                                "stage": stage,
+                                "wall_s": round(run["wall_s"], 6),
+                                **summarize_stage(stages, rows[stage]),
+                            }
+                            results.append(r)
+
+                            # print result
+                            print(
+                                f"{mode:<10}{cohort_size:>9}{concurrency:>6} {stage:<10}{r['calls']:>6}{r['errors']:>7}{r['rows_per_s']:>14.1f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['wall_s']:>9.3f}"
+                            )
+
+    # save results
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as output_file:
+        json.dump(
+            {"benchmark": "pipeline", "params": vars(args), "results": results},
+            output_file,
+            indent=2,
+        )
+
+    # check regressions against a baseline
+    if args.baseline is not None:
+        # compare results
+        regressions = compare(results, args.baseline, args.max_regression)
+
+        # print regressions
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+
+        # fail if there are regressions
+        if regressions:
+            return 1
+
+    return 0
+
+
+# check if script is being called directly
+if __name__ == "__main__":
+    sys.exit(main())
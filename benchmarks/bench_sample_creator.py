@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Throughput benchmark of the synthetic data generation
+(synthetic_data_ingestion.sample_creator): every gen_* method and generate_samples
+end to end, from 1e3 to 1e8 rows. Rows per second, bytes per row and peak memory
+are reported per method and number of rows; results can be compared against a
+baseline file (exit code 1 on regressions).
+
+Usage
+    python benchmarks/bench_sample_creator.py --rows 1000 100000 10000000
+    python benchmarks/bench_sample_creator.py --rows 100000000 --methods generate_samples
+    python benchmarks/bench_sample_creator.py --baseline benchmarks/results/sample_creator-<ts>.json
+"""
+
+# import required libraries
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+from datetime import datetime
+
+# append project root to the list of directories
+# where the Python interpreter searches for modules
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# import required libraries -> project library
+from synthetic_data_ingestion import memory
+from synthetic_data_ingestion.sample_creator import SynthCustomers
+
+
+# benchmarked methods and the sampling_dict columns they create
+METHODS = {
+    "gen_total_purchase_price": ["total_purchase_price"],
+    "gen_num_diff_items": ["num_diff_items"],
+    "gen_purchase_date": ["purchase_date"],
+    "gen_region": ["region"],
+    "gen_gender": ["gender"],
+    "gen_group": ["group"],
+    "gen_device": ["device"],
+    "generate_samples": [
+        "total_purchase_price",
+        "num_diff_items",
+        "purchase_date",
+        "region",
+        "gender",
+        "group",
+        "device",
+    ],
+}
+
+# rows generated per benchmark case before repetitions are cut
+# (big cases run once -> the benchmark stays in minutes)
+REPEAT_ROWS = 10_000_000
+
+
+def new_synth_customers(rows: int, log_folder: str) -> SynthCustomers:
+    """Create a SynthCustomers object ready to run any gen_* method
+    (fixed seed and reference date -> same work on every run)"""
+
+    return SynthCustomers(
+        num_samples=rows,
+        group="CONTROL",
+        log_folder=log_folder,
+        reference_date="2022-01-03",
+        seed=0,
+    )
+
+
+def run_case(method: str, rows: int, repeat: int, log_folder: str) -> dict:
+    """Time a method on rows samples and measure its peak memory
+
+    Return
+        result: a dict with the rows per second, bytes per row and peak memory"""
+
+    # instanciate list of durations
+    durations = []
+
+    # iterate over repetitions (at most REPEAT_ROWS rows generated per case)
+    for _ in range(max(1, min(repeat, REPEAT_ROWS // rows))):
+        # create a new object (samples of the last repetition are released)
+        synth_customers = new_synth_customers(rows, log_folder)
+
+        # time method
+        start = time.perf_counter()
+        getattr(synth_customers, method)()
+        durations.append(time.perf_counter() - start)
+
+    # get bytes of the created columns
+    num_bytes = sum(
+        synth_customers.sampling_dict[column].nbytes for column in METHODS[method]
+    )
+
+    # release samples before measuring memory
+    del synth_customers
+
+    # measure peak memory on a separate run (tracemalloc slows allocations down)
+    memory.enable(top=0)
+    try:
+        synth_customers = new_synth_customers(rows, log_folder)
+        with memory.track(method) as record:
+            getattr(synth_customers, method)()
+        del synth_customers
+    finally:
+        memory.disable()
+
+    # get median duration
+    duration = statistics.median(durations)
+
+    return {
+        "method": method,
+        "rows": rows,
+        "repeat": len(durations),
+        "median_s": round(duration, 6),
+        "rows_per_s": round(rows / duration),
+        "bytes_per_row": round(num_bytes / rows, 2),
+        "peak_mb": round(record["peak_mb"], 3),
+        "peak_bytes_per_row": round(record["peak_mb"] * memory.MB / rows, 2),
+    }
+
+
+def compare(results: list, baseline_path: str, max_regression: float) -> list:
+    """Compare results with a baseline results file
+
+    Args
+        results: a list of result dicts
+        baseline_path: a string with the path to a previous results file
+        max_regression: a float with the maximum relative regression
+            of rows per second and peak memory (e.g. 0.2 = 20 %)
+
+    Return
+        regressions: a list of strings describing each regression"""
+
+    # load baseline results
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+
+    # index baseline by benchmark case
+    def case_key(r):
+        return (r["method"], r["rows"])
+
+    baseline = {case_key(r): r for r in baseline}
+
+    # instanciate list of regressions
+    regressions = []
+
+    # iterate over results
+    for r in results:
+        # case not on baseline
+        if case_key(r) not in baseline:
+            continue
+
+        # get baseline result
+        b = baseline[case_key(r)]
+
+        # check throughput and peak memory
+        if r["rows_per_s"] < b["rows_per_s"] * (1 - max_regression):
+            regressions.append(
+                f"{case_key(r)}: throughput {b['rows_per_s']} -> {r['rows_per_s']} rows/s"
+            )
+        if r["peak_mb"] > b["peak_mb"] * (1 + max_regression):
+            regressions.append(
+                f"{case_key(r)}: peak memory {b['peak_mb']} -> {r['peak_mb']} MB"
+            )
+
+    return regressions
+
+
+def main(argv: list = None) -> int:
+    """Run the benchmark, print results and save them as json"""
+
+    # define command line arguments
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--rows",
+        nargs="+",
+        type=lambda value: int(float(value)),  # accept 1e6
+        default=[1_000, 10_000, 100_000, 1_000_000, 10_000_000],
+    )
+    parser.add_argument(
+        "--methods", nargs="+", default=list(METHODS), choices=list(METHODS)
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--log-folder", default=tempfile.gettempdir())
+    parser.add_argument("--baseline", help="results file to check for regressions")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument(
+        "--output",
+        default=os.path.join(
+            "benchmarks",
+            "results",
+            f"sample_creator-{datetime.utcnow():%Y%m%dT%H%M%S}.json",
+        ),
+    )
+    args = parser.parse_args(argv)
+
+    # print header
+    print(
+        f"{'method':<26}{'rows':>11}{'rows/s':>14}{'bytes/row':>11}{'peak MB':>10}{'peak B/row':>12}"
+    )
+
+    # instanciate list of results
+    results = []
+
+    # iterate over number of rows and methods
+    for rows in args.rows:
+        for method in args.methods:
+            # run benchmark case
+            r = run_case(method, rows, args.repeat, args.log_folder)
+            results.append(r)
+
+            # print result
+            print(
+                f"{r['method']:<26}{r['rows']:>11}{r['rows_per_s']:>14}{r['bytes_per_row']:>11.1f}{r['peak_mb']:>10.1f}{r['peak_bytes_per_row']:>12.1f}"
+            )
+
+    # save results
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as output_file:
+        json.dump(
+            {"benchmark": "sample_creator", "params": vars(args), "results": results},
+            output_file,
+            indent=2,
+        )
+
+    # check regressions against a baseline
+    if args.baseline is not None:
+        # compare results
+        regressions = compare(results, args.baseline, args.max_regression)
+
+        # print regressions
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+
+        # fail if there are regressions
+        if regressions:
+            return 1
+
+    return 0
+
+
+# check if script is being called directly
+if __name__ == "__main__":
+    sys.exit(main())
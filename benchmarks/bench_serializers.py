@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark of the report serializers (synthetic_data_ingestion.serializers)
+on large reports: high cardinality region weights and empirical histograms.
+
+Usage
+    python benchmarks/bench_serializers.py --region-size 100000 --histogram-size 1000000
+"""
+
+# import required libraries
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import numpy as np
+from datetime import datetime
+
+# append project root to the list of directories
+# where the Python interpreter searches for modules
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# import required libraries -> project library
+from synthetic_data_ingestion.sample_creator import SynthCustomers
+from synthetic_data_ingestion.serializers import SERIALIZERS, get_serializer
+
+
+def build_reports(region_size: int, histogram_size: int, log_folder: str) -> dict:
+    """Create the reports used on the benchmark
+
+    Args
+        region_size: an integer with the number of region weights
+        histogram_size: an integer with the number of histogram bins
+        log_folder: a string with the path to store logs"""
+
+    # create a regular creation report
+    synth_customers = SynthCustomers(
+        num_samples=1000, group="CONTROL", log_folder=log_folder
+    )
+    synth_customers.generate_samples()
+    default_report = synth_customers.generate_report()
+
+    # define numpy random generator
+    np_gen = np.random.default_rng(0)
+
+    # define region weights with numpy floats
+    weights = np_gen.dirichlet(np.ones(region_size))
+    region_report = {
+        **default_report,
+        "region": {f"REGION_{idx}": weight for idx, weight in enumerate(weights)},
+    }
+
+    # define an empirical histogram of total purchase prices
+    counts, edges = np.histogram(
+        np_gen.gamma(shape=3, scale=10, size=histogram_size * 10), bins=histogram_size
+    )
+    histogram_report = {
+        **default_report,
+        "histogram_counts": counts,
+        "histogram_edges": edges,
+    }
+
+    return {
+        "default_report": default_report,
+        "high_cardinality_region": region_report,
+        "empirical_histogram": histogram_report,
+    }
+
+
+def time_call(func, repeat: int) -> float:
+    """Get the median duration (in seconds) of repeat calls of func"""
+
+    # instanciate list of durations
+    durations = []
+
+    # iterate over repetitions
+    for _ in range(repeat):
+        # time call
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+
+    return statistics.median(durations)
+
+
+def run_benchmark(
+    region_size: int, histogram_size: int, repeat: int, log_folder: str
+) -> list:
+    """Time dumps and loads of every available serializer on every report
+
+    Return
+        results: a list of dicts (one per serializer and report)"""
+
+    # create reports
+    reports = build_reports(region_size, histogram_size, log_folder)
+
+    # instanciate list of results
+    results = []
+
+    # iterate over reports
+    for case, report in reports.items():
+        # iterate over available serializers
+        for name in SERIALIZERS:
+            # get serializer
+            serializer = get_serializer(name)
+
+            # serialize once to get size and content to deserialize
+            content = serializer.dumps(report)
+
+            # time dumps and loads
+            dumps_s = time_call(lambda: serializer.dumps(report), repeat)
+            loads_s = time_call(lambda: serializer.loads(content), repeat)
+
+            # add result
+            results.append(
+                {
+                    "case": case,
+                    "serializer": name,
+                    "size_bytes": len(content),
+                    "dumps_ms": round(dumps_s * 1000, 3),
+                    "loads_ms": round(loads_s * 1000, 3),
+                    "dumps_mb_per_s": round(len(content) / dumps_s / 1e6, 2),
+                }
+            )
+
+    return results
+
+
+def main(argv: list = None) -> int:
+    """Run the benchmark, print results and save them as json"""
+
+    # define command line arguments
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--region-size", type=int, default=100_000)
+    parser.add_argument("--histogram-size", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--log-folder", default=tempfile.gettempdir())
+    parser.add_argument(
+        "--output",
+        default=os.path.join(
+            "benchmarks",
+            "results",
+            f"serializers-{datetime.utcnow():%Y%m%dT%H%M%S}.json",
+        ),
+    )
+    args = parser.parse_args(argv)
+
+    # run benchmark
+    results = run_benchmark(
+        args.region_size, args.histogram_size, args.repeat, args.log_folder
+    )
+
+    # print results
+    print(
+        f"{'case':<25}{'serializer':<13}{'size (KB)':>12}{'dumps (ms)':>12}{'loads (ms)':>12}"
+    )
+    for r in results:
+        print(
+            f"{r['case']:<25}{r['serializer']:<13}{r['size_bytes'] / 1024:>12.1f}{r['dumps_ms']:>12.2f}{r['loads_ms']:>12.2f}"
+        )
+
+    # save results
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as output_file:
+        json.dump(
+            {"benchmark": "serializers", "params": vars(args), "results": results},
+            output_file,
+            indent=2,
+        )
+
+    return 0
+
+
+# check if script is being called directly
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,971 @@
 # Library imports
+import time
+
+# start of the container initialization (cold start)
+INIT_START = time.perf_counter()
+
 import os
+import re
 import json
+import math
 import boto3
-import uvicorn
+import asyncio
+import atexit
+import logging
+import threading
+import hashlib
+import statistics
+import functools
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from mangum import Mangum
-from datetime import datetime
+from datetime import date, datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 from dotenv import load_dotenv
-from fastapi import FastAPI
-from typing import Dict
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+from starlette.datastructures import MutableHeaders
+from pydantic import conint
+from typing import Dict, List, Optional
 from typing_extensions import TypedDict
+from synthetic_data_ingestion.serializers import get_serializer
+from synthetic_data_ingestion.report_manifest import (
+    CONFLICT_CODES,
+    check_botocore_version,
+    fetch_reports,
+    manifest_entry,
+    partition_dates,
+    read_manifests,
+    report_filters,
+    select_entries,
+    update_manifest,
+)
+
+
+# take environment variables from .env (once per container)
+load_dotenv()
+
+# fail at init if the AWS SDK has no S3 conditional writes (an older runtime SDK
+# would make every keyed report and every manifest update fail)
+check_botocore_version()
+
+# instanciate logger (AWS Lambda sends it to CloudWatch)
+logger = logging.getLogger("lambda_function.py")
+
+# maximum number of warm request durations kept to compute latency percentiles
+TIMINGS_WINDOW = 1000
+
+# request timings of the container
+# (cold = first request after initialization, warm = the following ones)
+TIMINGS = {
+    "init_ms": None,
+    "cold_request_ms": None,
+    "warm_ms": deque(maxlen=TIMINGS_WINDOW),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def timings_enabled() -> bool:
+    """Check once per container if request timings are recorded
+    (REQUEST_TIMINGS: off by default -> no per-request overhead and no /timings)"""
+
+    return os.environ.get("REQUEST_TIMINGS", "").lower() in ("1", "true")
+
+
+@functools.lru_cache(maxsize=None)
+def get_config() -> dict:
+    """Load the API configuration once per container
+    (raises an error if a required environmental variable is not found)"""
+
+    return {
+        # define bucket name
+        "bucket_name": os.environ["AWS_S3_BUCKET"],
+        # define serializer of stored reports ("json" or "msgpack")
+        "serializer": get_serializer(os.environ.get("REPORT_SERIALIZER", "json")),
+        # define if reports are micro-batched before being sent to S3
+        # (long-running servers only, e.g. uvicorn: ignored on AWS Lambda)
+        "batching": os.environ.get("REPORT_BATCHING", "").lower() in ("1", "true"),
+        # define flush limits of micro-batches: number of reports,
+        # size in bytes and age in seconds of the oldest buffered report
+        "batch_max_reports": int(os.environ.get("BATCH_MAX_REPORTS", 500)),
+        "batch_max_bytes": int(os.environ.get("BATCH_MAX_BYTES", 5 * 1024 * 1024)),
+        "batch_max_age": float(os.environ.get("BATCH_MAX_AGE_S", 10)),
+        # define if written objects are recorded on the partition manifests
+        "manifest": os.environ.get("REPORT_MANIFEST", "true").lower() in ("1", "true"),
+        # define time to live (in seconds) and size of the report query cache
+        "cache_ttl": float(os.environ.get("REPORT_CACHE_TTL_S", 30)),
+        "cache_size": int(os.environ.get("REPORT_CACHE_SIZE", 128)),
+        # define maximum number of days and of parallel downloads of a report query
+        "read_max_days": int(os.environ.get("READ_MAX_DAYS", 366)),
+        "read_max_workers": int(os.environ.get("READ_MAX_WORKERS", 8)),
+        # define number of idempotency keys kept in memory
+        "idempotency_cache_size": int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", 10000)),
+        # define age (in seconds) of a pending idempotency key claim that can be
+        # taken over (AWS Lambda maximum timeout) and days the key markers are kept
+        "idempotency_claim_ttl": float(os.environ.get("IDEMPOTENCY_CLAIM_TTL_S", 900)),
+        "idempotency_ttl_days": int(os.environ.get("IDEMPOTENCY_TTL_DAYS", 7)),
+        # define part size of multipart uploads (S3 minimum is 5 MB)
+        # and expiration (in seconds) of presigned upload urls
+        "upload_part_size": int(os.environ.get("UPLOAD_PART_SIZE", 8 * 1024 * 1024)),
+        # define maximum size (in bytes) of an uploaded report
+        "upload_max_bytes": int(os.environ.get("UPLOAD_MAX_BYTES", 1024**3)),
+        "upload_url_expires": int(os.environ.get("UPLOAD_URL_EXPIRES_S", 900)),
+    }
+
+
+# manifest entries not recorded yet (by partition date) and their lock
+# -> failed updates are retried by the next record_manifest call
+MANIFEST_PENDING = {}
+MANIFEST_PENDING_LOCK = threading.Lock()
+
+
+def record_manifest(file_name: str, size: int, reports: list, partition_date) -> None:
+    """Add a written object to the manifest of its partition (if enabled),
+    together with the entries of previous failed updates. Errors are only
+    logged (the reports are already on S3): the entries of a failed update
+    are re-queued, so the object still appears on the manifest
+
+    Args
+        file_name: a string with the S3 key of the object
+        size: an integer with the size (in bytes) of the object
+        reports: a list of the reports (dicts) stored on the object
+        partition_date: a date with the partition (extracted_at) of the object"""
+
+    # manifest is disabled
+    if not get_config()["manifest"]:
+        return
+
+    # take the pending entries and add the new one
+    with MANIFEST_PENDING_LOCK:
+        pending = MANIFEST_PENDING.copy()
+        MANIFEST_PENDING.clear()
+
+    pending[partition_date] = pending.get(partition_date, []) + [
+        manifest_entry(file_name, size, reports)
+    ]
+
+    # iterate over partitions
+    for pending_date, entries in pending.items():
+        # try to update manifest
+        try:
+            update_manifest(
+                get_s3_client(), get_config()["bucket_name"], pending_date, entries
+            )
+
+        # in case of errors
+        except Exception as e:
+            # re-queue entries
+            with MANIFEST_PENDING_LOCK:
+                MANIFEST_PENDING.setdefault(pending_date, []).extend(entries)
+
+            # log a critical
+            logger.critical(
+                f"record_manifest NOT successful: raised error ---> {e} "
+                f"({len(entries)} entries re-queued)"
+            )
+
+
+# default number of S3 client connections (and of S3 write threads)
+DEFAULT_S3_MAX_POOL = 50
+
+
+@functools.lru_cache(maxsize=None)
+def get_s3_client():
+    """Create the AWS S3 client once per container
+    (reusing its keep-alive connections between requests)"""
+
+    return boto3.client(
+        "s3",
+        config=Config(
+            max_pool_connections=int(os.environ.get("S3_MAX_POOL", DEFAULT_S3_MAX_POOL))
+        ),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_s3_executor() -> ThreadPoolExecutor:
+    """Create the bounded thread pool of report writes once per container.
+    It has one thread per S3 client connection, so in-flight writes never wait
+    for a connection and do not compete with other endpoints for threads"""
+
+    return ThreadPoolExecutor(
+        max_workers=int(os.environ.get("S3_MAX_POOL", DEFAULT_S3_MAX_POOL)),
+        thread_name_prefix="s3_write",
+    )
+
+
+async def run_on_s3_executor(func, *args):
+    """Run a blocking S3 write on the report write thread pool
+    without blocking the event loop
+
+    Args
+        func: a function that writes to S3
+        args: the arguments of func
+
+    Return
+        the value returned by func"""
+
+    # get event loop of the request
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(get_s3_executor(), functools.partial(func, *args))
+
+
+class ReportBuffer:
+    def __init__(self, max_reports: int, max_bytes: int, max_age: float) -> None:
+        """In-process buffer of reports that are sent to S3 as a single NDJSON
+        file (one report per line) when max_reports or max_bytes is reached or
+        when the oldest buffered report is max_age seconds old.
+        Flushes run on a background thread, so requests do not wait for S3.
+        Only used on long-running servers (e.g. uvicorn): AWS Lambda freezes
+        containers between invocations and drops them without a shutdown event
+
+        Args
+            max_reports: an integer with the maximum number of buffered reports
+            max_bytes: an integer with the maximum size (in bytes) of a file
+            max_age: a float with the maximum age (in seconds) of a buffered report"""
+
+        # define flush limits
+        self.max_reports = max_reports
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        # lock that protects buffered reports
+        self.lock = threading.Lock()
+        # lock that allows one flush at a time
+        self.flush_lock = threading.Lock()
+
+        # buffered reports (json lines), their size, the idempotency keys of the
+        # buffered reports and their responses (markers are written by the flush),
+        # and the time (utc and monotonic clock) the oldest buffered report was received
+        self.lines, self.num_bytes, self.keys = [], 0, []
+        self.first_at, self.first_clock = None, None
+
+        # events to wake up and stop the flush thread
+        self.wake = threading.Event()
+        self.stop = threading.Event()
+
+        # start the flush thread (daemon -> does not block the process exit)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add(self, report: dict, idempotency_key: str = None) -> int:
+        """Add a report to the buffer
+
+        Args
+            report: a dictionary that follows ReportValues typing
+            idempotency_key: a string sent on the Idempotency-Key header (or None):
+                its S3 marker is written once the report is sent to S3
+
+        Return
+            num_reports: an integer with the number of buffered reports"""
+
+        # serialize report
+        line = get_serializer("json").dumps(report)
+
+        # add report to the buffer
+        with self.lock:
+            # first buffered report -> start age timer
+            if not self.lines:
+                self.first_at, self.first_clock = datetime.utcnow(), time.monotonic()
+
+            self.lines.append(line)
+            self.num_bytes += len(line) + 1
+            num_reports = len(self.lines)
+
+            # keep key and response of the report
+            if idempotency_key is not None:
+                self.keys.append(
+                    (idempotency_key, REPORT_BUFFERED_MSG.format(num_reports))
+                )
+
+        # wake up flush thread if a limit was reached
+        if self._is_due():
+            self.wake.set()
+
+        return num_reports
+
+    def flush(self) -> int:
+        """Send all buffered reports to S3 as a single NDJSON file and write
+        the markers of their idempotency keys (the reports are now durable).
+        On errors, reports are kept on the buffer and the error is raised
+
+        Return
+            num_reports: an integer with the number of reports sent"""
+
+        # one flush at a time
+        with self.flush_lock:
+            # take buffered reports
+            with self.lock:
+                lines, keys, first_at = self.lines, self.keys, self.first_at
+                self.lines, self.num_bytes, self.keys = [], 0, []
+                self.first_at, self.first_clock = None, None
+
+            # nothing to send
+            if not lines:
+                return 0
+
+            # try to send reports to S3
+            try:
+                # define file name (time the oldest report was received)
+                # replacing empty space between date and time with "Z" (UTC time)
+                file_name = f"data_lake_raw/lambda_api/sampling_report/extracted_at={first_at.date()}/api_request_at={str(first_at).replace(' ', 'Z')}.ndjson"
+
+                # put content on the required S3 bucket
+                get_s3_client().put_object(
+                    Bucket=get_config()["bucket_name"],
+                    Key=file_name,
+                    Body=b"\n".join(lines),
+                )
+
+                # record object on the partition manifest
+                record_manifest(
+                    file_name,
+                    sum(len(line) + 1 for line in lines) - 1,
+                    [get_serializer("json").loads(line) for line in lines],
+                    first_at.date(),
+                )
+
+            # in case of errors -> put reports back on the buffer
+            except Exception:
+                with self.lock:
+                    self.lines = lines + self.lines
+                    self.keys = keys + self.keys
+                    self.num_bytes = sum(len(line) + 1 for line in self.lines)
+                    self.first_at, self.first_clock = first_at, time.monotonic()
+
+                raise
+
+            # write the markers of the idempotency keys of the sent reports
+            for idempotency_key, response_msg in keys:
+                store_idempotency_key(idempotency_key, response_msg)
+
+        return len(lines)
+
+    def close(self) -> None:
+        """Stop the flush thread and send the remaining reports"""
+
+        # stop flush thread
+        self.stop.set()
+        self.wake.set()
+        self.thread.join()
+
+        # try to send the remaining reports
+        try:
+            self.flush()
+
+        # in case of errors
+        except Exception as e:
+            # log a critical
+            logger.critical(f"close method NOT successful: raised error ---> {e}")
+
+    def _is_due(self) -> bool:
+        """Check if a flush limit was reached"""
+
+        with self.lock:
+            return bool(self.lines) and (
+                (len(self.lines) >= self.max_reports)
+                or (self.num_bytes >= self.max_bytes)
+                or (time.monotonic() - self.first_clock >= self.max_age)
+            )
+
+    def _run(self) -> None:
+        """Flush the buffer whenever a limit is reached (flush thread)"""
+
+        # run until close method is called
+        while not self.stop.is_set():
+            # wait for a full buffer or for the next age check
+            self.wake.wait(timeout=max(self.max_age / 2, 0.01))
+            self.wake.clear()
+
+            # check limits
+            if self.stop.is_set() or not self._is_due():
+                continue
+
+            # try to flush
+            try:
+                self.flush()
+
+            # in case of errors -> retry on the next check
+            except Exception as e:
+                # log a critical
+                logger.critical(f"flush method NOT successful: raised error ---> {e}")
+
+
+# environment variable set by the AWS Lambda runtime
+LAMBDA_RUNTIME_ENV = "AWS_LAMBDA_FUNCTION_NAME"
+
+
+@functools.lru_cache(maxsize=None)
+def get_report_buffer():
+    """Create the report buffer once per container
+
+    Return
+        buffer: a ReportBuffer object (None if micro-batching is disabled
+            or if the API runs on AWS Lambda)"""
+
+    # get configuration
+    config = get_config()
+
+    # micro-batching is disabled
+    if not config["batching"]:
+        return None
+
+    # AWS Lambda (set by its runtime) -> buffered reports would be lost when
+    # the container is dropped, so reports are written on each request
+    if LAMBDA_RUNTIME_ENV in os.environ:
+        # log a warning
+        logger.warning(
+            "get_report_buffer called: micro-batching is disabled on AWS Lambda"
+        )
+
+        return None
+
+    return ReportBuffer(
+        max_reports=config["batch_max_reports"],
+        max_bytes=config["batch_max_bytes"],
+        max_age=config["batch_max_age"],
+    )
+
+
+def close_report_buffer() -> None:
+    """Send buffered reports to S3 (if micro-batching is enabled)"""
+
+    # buffer only exists if it was already created
+    if get_report_buffer.cache_info().currsize:
+        # get buffer
+        buffer = get_report_buffer()
+
+        # flush remaining reports
+        if buffer is not None:
+            buffer.close()
+
+
+# send buffered reports before the process exits
+atexit.register(close_report_buffer)
+
+
+# LRU cache of report queries (query -> cached response) and its lock
+REPORT_CACHE = OrderedDict()
+REPORT_CACHE_LOCK = threading.Lock()
+
+
+def query_reports(query: tuple) -> dict:
+    """Get the response of a report query from the cache. Responses older than
+    the cache time to live are validated against the partition manifests: reports
+    are only downloaded again if a manifest changed (new ETag)
+
+    Args
+        query: a (start_date, end_date, group, gamma_shape, poisson_lambda) tuple
+
+    Return
+        response: a dict with the json "body", the "etag" and the "last_modified"
+            (http date of the newest manifest, None if there are no manifests)"""
+
+    # get configuration
+    config = get_config()
+
+    # get cached response
+    with REPORT_CACHE_LOCK:
+        cached = REPORT_CACHE.get(query)
+
+    # fresh cached response -> storage is not touched
+    if (cached is not None) and (
+        time.monotonic() - cached["checked_at"] < config["cache_ttl"]
+    ):
+        # mark query as recently used
+        with REPORT_CACHE_LOCK:
+            if query in REPORT_CACHE:
+                REPORT_CACHE.move_to_end(query)
+
+        return cached
+
+    # split query
+    start_date, end_date, group, gamma_shape, poisson_lambda = query
+
+    # get the AWS S3 client (created once per container)
+    s3 = get_s3_client()
+
+    # read the manifest of each day
+    manifests = read_manifests(
+        s3,
+        config["bucket_name"],
+        partition_dates(start_date, end_date),
+        config["read_max_workers"],
+    )
+
+    # define version of the query data (ETags of the manifests)
+    version = [etag for _, etag, _ in manifests]
+
+    # no cached response or manifests changed -> download reports
+    if (cached is None) or (cached["version"] != version):
+        # define report filters
+        filters = report_filters(group, gamma_shape, poisson_lambda)
+
+        # download objects and keep matching reports
+        reports = fetch_reports(
+            s3,
+            config["bucket_name"],
+            select_entries([manifest for manifest, _, _ in manifests], filters),
+            filters,
+            config["read_max_workers"],
+        )
+
+        # define last modification of the query data
+        modified = [lm for _, _, lm in manifests if lm is not None]
+
+        cached = {
+            "version": version,
+            "body": get_serializer("json").dumps(reports),
+            "etag": '"'
+            + hashlib.sha256(repr((query, version)).encode()).hexdigest()
+            + '"',
+            "last_modified": format_datetime(
+                max(modified).astimezone(timezone.utc), usegmt=True
+            )
+            if modified
+            else None,
+        }
+
+    # mark response as validated now
+    cached = {**cached, "checked_at": time.monotonic()}
+
+    # cache response, evicting the least recently used queries
+    with REPORT_CACHE_LOCK:
+        REPORT_CACHE[query] = cached
+        REPORT_CACHE.move_to_end(query)
+        while len(REPORT_CACHE) > config["cache_size"]:
+            REPORT_CACHE.popitem(last=False)
+
+    return cached
+
+
+def is_not_modified(request: Request, cached: dict) -> bool:
+    """Check the conditional headers of a request (If-None-Match has
+    precedence over If-Modified-Since)
+
+    Args
+        request: the fastapi request
+        cached: a dict returned by query_reports"""
+
+    # get client ETags
+    if_none_match = request.headers.get("if-none-match")
+
+    # client sent ETags -> compare them (weak comparison)
+    if if_none_match is not None:
+        etags = [etag.strip() for etag in if_none_match.split(",")]
+        etags = [etag[2:] if etag.startswith("W/") else etag for etag in etags]
+        return ("*" in etags) or (cached["etag"] in etags)
+
+    # get client last modification
+    if_modified_since = request.headers.get("if-modified-since")
+
+    # client sent a last modification -> compare it
+    if (if_modified_since is not None) and (cached["last_modified"] is not None):
+        try:
+            return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(
+                cached["last_modified"]
+            )
+        # invalid date -> ignore header
+        except (TypeError, ValueError):
+            return False
+
+    return False
+
+
+# prefix of the idempotency key markers (one object per key)
+IDEMPOTENCY_PREFIX = "data_lake_raw/lambda_api/idempotency_key"
+
+# LRU cache of recent idempotency keys (key -> response) and its lock
+IDEMPOTENCY_CACHE = OrderedDict()
+IDEMPOTENCY_CACHE_LOCK = threading.Lock()
+
+# response to a request whose idempotency key is still being processed
+IDEMPOTENCY_PENDING_MSG = "A request with the same Idempotency-Key is being processed"
+
+# response to a buffered report (number of buffered reports)
+REPORT_BUFFERED_MSG = (
+    "Report buffered for batched input to S3 bucket --> {} buffered reports"
+)
+
+
+def idempotency_marker(idempotency_key: str) -> str:
+    """Get the S3 key of the marker of an idempotency key
+    (hashed, so any client key is a valid S3 key)"""
+
+    return f"{IDEMPOTENCY_PREFIX}/{hashlib.sha256(idempotency_key.encode()).hexdigest()}.json"
+
+
+def cache_idempotency_key(idempotency_key: str, response_msg: str) -> None:
+    """Keep the response of an idempotency key on the LRU cache"""
+
+    with IDEMPOTENCY_CACHE_LOCK:
+        _cache_idempotency_key(idempotency_key, response_msg)
+
+
+def _cache_idempotency_key(idempotency_key: str, response_msg: str) -> None:
+    """Keep the response of an idempotency key on the LRU cache
+    (IDEMPOTENCY_CACHE_LOCK must be held)"""
+
+    IDEMPOTENCY_CACHE[idempotency_key] = response_msg
+    IDEMPOTENCY_CACHE.move_to_end(idempotency_key)
+    while len(IDEMPOTENCY_CACHE) > get_config()["idempotency_cache_size"]:
+        IDEMPOTENCY_CACHE.popitem(last=False)
+
+
+def cached_idempotency_key(idempotency_key: str):
+    """Get the response of a recent idempotency key from the LRU cache
+    (None if the key is not on memory)"""
+
+    with IDEMPOTENCY_CACHE_LOCK:
+        if idempotency_key in IDEMPOTENCY_CACHE:
+            IDEMPOTENCY_CACHE.move_to_end(idempotency_key)
+            return IDEMPOTENCY_CACHE[idempotency_key]
+
+    return None
+
+
+def get_idempotency_marker(idempotency_key: str) -> tuple:
+    """Get the S3 marker of an idempotency key
+
+    Return
+        (marker, etag, last_modified): a dict with the marker content, a string
+            with its ETag and a datetime with its last modification
+            (None, None and None if the key was never claimed)"""
+
+    # try to read the marker
+    try:
+        marker = get_s3_client().get_object(
+            Bucket=get_config()["bucket_name"], Key=idempotency_marker(idempotency_key)
+        )
+
+    # marker does not exist
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return None, None, None
+
+        raise
+
+    return json.loads(marker["Body"].read()), marker["ETag"], marker["LastModified"]
+
+
+def marker_response(idempotency_key: str, marker: dict, last_modified):
+    """Get the response stored on the marker of an idempotency key
+
+    Return
+        response_msg: the original response, IDEMPOTENCY_PENDING_MSG if the original
+            request is still being processed or None if its claim is stale (older
+            than IDEMPOTENCY_CLAIM_TTL_S: the request crashed or timed out)"""
+
+    # get original response
+    response_msg = marker.get("response")
+
+    # original request finished -> keep key on memory
+    if response_msg is not None:
+        cache_idempotency_key(idempotency_key, response_msg)
+
+        return response_msg
+
+    # time the key was claimed (markers without it -> time they were written)
+    claimed_at = marker.get("claimed_at", last_modified.timestamp())
+
+    # stale claim -> can be taken over
+    if time.time() - claimed_at > get_config()["idempotency_claim_ttl"]:
+        return None
+
+    return IDEMPOTENCY_PENDING_MSG
+
+
+def read_idempotency_key(idempotency_key: str):
+    """Read the response of an idempotency key: the in-memory LRU is checked
+    first, then the S3 marker of the key (read only)
+
+    Return
+        response_msg: the original response (IDEMPOTENCY_PENDING_MSG if the original
+            request is still being processed, None if the key was never claimed
+            or if its claim is stale)"""
+
+    # recent key -> original response from memory
+    response_msg = cached_idempotency_key(idempotency_key)
+    if response_msg is not None:
+        return response_msg
+
+    # get marker of the key
+    marker, _, last_modified = get_idempotency_marker(idempotency_key)
+
+    # key was never claimed
+    if marker is None:
+        return None
+
+    return marker_response(idempotency_key, marker, last_modified)
+
+
+def claim_idempotency_key(idempotency_key: str):
+    """Claim an idempotency key before writing a report: the in-memory LRU is
+    checked first, then the S3 marker of the key, which is created with a
+    conditional write (If-None-Match), so only one request claims the key.
+    A stale claim (see marker_response) is taken over with a conditional write
+    on the marker that was read (If-Match on its ETag)
+
+    Args
+        idempotency_key: a string sent on the Idempotency-Key header (or None)
+
+    Return
+        response_msg: None if the key was claimed (or no key was sent), else the
+            response of the original request (or IDEMPOTENCY_PENDING_MSG)"""
+
+    # no idempotency key -> nothing to check
+    if idempotency_key is None:
+        return None
+
+    # recent key -> original response from memory
+    response_msg = cached_idempotency_key(idempotency_key)
+    if response_msg is not None:
+        return response_msg
+
+    # get marker of the key (claimed by another request or container)
+    marker, etag, last_modified = get_idempotency_marker(idempotency_key)
+
+    # key was never claimed -> create the marker
+    if marker is None:
+        condition = {"IfNoneMatch": "*"}
+
+    # key was claimed -> original response (or a stale claim)
+    else:
+        response_msg = marker_response(idempotency_key, marker, last_modified)
+        if response_msg is not None:
+            return response_msg
+
+        # stale claim -> replace the marker that was read
+        condition = {"IfMatch": etag}
+
+        # log a warning
+        logger.warning(
+            "claim_idempotency_key called: stale claim of an idempotency key taken over"
+        )
+
+    # define claim params
+    put_params = {
+        "Bucket": get_config()["bucket_name"],
+        "Key": idempotency_marker(idempotency_key),
+        "Body": json.dumps(
+            {"idempotency_key": idempotency_key, "claimed_at": time.time()}
+        ).encode("UTF-8"),
+    }
+
+    # try to claim the key (fails if the marker changed in the meantime)
+    try:
+        get_s3_client().put_object(**condition, **put_params)
+
+    # S3 store errors
+    except ClientError as e:
+        # get error code
+        code = e.response.get("Error", {}).get("Code")
+
+        # S3 store without conditional writes -> claim without condition
+        if code == "NotImplemented":
+            get_s3_client().put_object(**put_params)
+
+        # another request claimed the key -> its response
+        elif code in CONFLICT_CODES:
+            return read_idempotency_key(idempotency_key) or IDEMPOTENCY_PENDING_MSG
+
+        else:
+            raise
+
+    return None
+
+
+def store_idempotency_key(idempotency_key: str, response_msg: str) -> None:
+    """Write the response of an idempotency key on its S3 marker.
+    Errors are only logged: the key stays claimed (pending) on S3
+    until its claim is stale"""
+
+    # try to store the response on the marker
+    try:
+        get_s3_client().put_object(
+            Bucket=get_config()["bucket_name"],
+            Key=idempotency_marker(idempotency_key),
+            Body=json.dumps(
+                {"idempotency_key": idempotency_key, "response": response_msg}
+            ).encode("UTF-8"),
+        )
+
+    # in case of errors
+    except Exception as e:
+        # log a critical
+        logger.critical(f"store_idempotency_key NOT successful: raised error ---> {e}")
+
+
+def complete_idempotency_key(idempotency_key: str, response_msg: str) -> str:
+    """Store the response of a claimed idempotency key (on S3 and on memory)
+
+    Return
+        response_msg: the given response"""
+
+    # no idempotency key -> nothing to store
+    if idempotency_key is None:
+        return response_msg
+
+    # store the response on the marker
+    store_idempotency_key(idempotency_key, response_msg)
+
+    # keep key on memory
+    cache_idempotency_key(idempotency_key, response_msg)
+
+    return response_msg
+
+
+def buffer_report(buffer, data: dict, idempotency_key: str = None):
+    """Add a report to the report buffer and answer without waiting for S3.
+    Duplicated keys get the original response (from the in-memory LRU, then from
+    the S3 marker, read only); the marker of the key is written once, by the
+    flush that sends the report to S3
+
+    Args
+        buffer: a ReportBuffer object
+        data: a dictionary that follows ReportValues typing
+        idempotency_key: a string sent on the Idempotency-Key header (or None)
+
+    Return
+        response_msg: a string with the number of buffered reports"""
+
+    # duplicated request -> original response
+    if idempotency_key is not None:
+        original_msg = read_idempotency_key(idempotency_key)
+        if original_msg is not None:
+            return idempotent_response(original_msg)
+
+    # buffer report and keep its key on memory in one step
+    # (a concurrent request with the same key is not buffered twice)
+    with IDEMPOTENCY_CACHE_LOCK:
+        # key buffered by a concurrent request -> its response
+        if idempotency_key in IDEMPOTENCY_CACHE:
+            return IDEMPOTENCY_CACHE[idempotency_key]
+
+        # add report to the buffer
+        response_msg = REPORT_BUFFERED_MSG.format(buffer.add(data, idempotency_key))
+
+        # keep key on memory
+        if idempotency_key is not None:
+            _cache_idempotency_key(idempotency_key, response_msg)
+
+    return response_msg
+
+
+def release_idempotency_key(idempotency_key: str) -> None:
+    """Delete the marker of a claimed idempotency key whose report was not
+    written, so the request can be retried"""
+
+    # no idempotency key -> nothing to release
+    if idempotency_key is None:
+        return
+
+    # try to delete the marker
+    try:
+        get_s3_client().delete_object(
+            Bucket=get_config()["bucket_name"], Key=idempotency_marker(idempotency_key)
+        )
+
+    # in case of errors
+    except Exception as e:
+        # log a critical
+        logger.critical(
+            f"release_idempotency_key NOT successful: raised error ---> {e}"
+        )
+
+
+# id of the bucket lifecycle rule that expires the idempotency key markers
+IDEMPOTENCY_LIFECYCLE_RULE = "expire-idempotency-keys"
+
+
+def configure_idempotency_lifecycle() -> list:
+    """Add (or update) the bucket lifecycle rule that deletes the idempotency key
+    markers IDEMPOTENCY_TTL_DAYS days after they are written (one marker per
+    keyed report -> retries are deduplicated within this window). Other lifecycle
+    rules of the bucket are kept. Run once per deployment (make idempotency_lifecycle)
+
+    Return
+        rules: a list with the lifecycle rules of the bucket"""
+
+    # get configuration and S3 client
+    config = get_config()
+    s3 = get_s3_client()
+
+    # try to get the current lifecycle rules
+    try:
+        rules = s3.get_bucket_lifecycle_configuration(Bucket=config["bucket_name"])[
+            "Rules"
+        ]
+
+    # bucket without lifecycle rules
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "NoSuchLifecycleConfiguration":
+            raise
+
+        rules = []
+
+    # replace the rule of the idempotency key markers
+    rules = [rule for rule in rules if rule.get("ID") != IDEMPOTENCY_LIFECYCLE_RULE]
+    rules.append(
+        {
+            "ID": IDEMPOTENCY_LIFECYCLE_RULE,
+            "Filter": {"Prefix": f"{IDEMPOTENCY_PREFIX}/"},
+            "Status": "Enabled",
+            "Expiration": {"Days": config["idempotency_ttl_days"]},
+        }
+    )
+
+    # put lifecycle rules
+    s3.put_bucket_lifecycle_configuration(
+        Bucket=config["bucket_name"], LifecycleConfiguration={"Rules": rules}
+    )
+
+    return rules
+
+
+def idempotent_response(response_msg: str):
+    """Get the http response of a duplicated request: the original response
+    or 409 Conflict if the original request is still being processed"""
+
+    # original request still being processed
+    if response_msg == IDEMPOTENCY_PENDING_MSG:
+        return JSONResponse(status_code=409, content=response_msg)
+
+    return response_msg
+
+
+def reset_runtime() -> None:
+    """Drop the cached configuration, S3 client, write thread pool, report
+    buffer and request timings (as if the container was started again)"""
+
+    # send buffered reports and drop the report buffer
+    close_report_buffer()
+    get_report_buffer.cache_clear()
+
+    # wait for in-flight writes and drop the write thread pool
+    if get_s3_executor.cache_info().currsize:
+        get_s3_executor().shutdown(wait=True)
+    get_s3_executor.cache_clear()
+
+    # clear cached configuration and client
+    get_config.cache_clear()
+    get_s3_client.cache_clear()
+
+    # clear cached report queries
+    with REPORT_CACHE_LOCK:
+        REPORT_CACHE.clear()
+
+    # clear cached idempotency keys
+    with IDEMPOTENCY_CACHE_LOCK:
+        IDEMPOTENCY_CACHE.clear()
+
+    # clear request timings and their flag
+    timings_enabled.cache_clear()
+    TIMINGS["cold_request_ms"] = None
+    TIMINGS["warm_ms"].clear()
 
 
 # create a class to define the value types of input dictionary
@@ -32,10 +989,100 @@ class ReportValues(TypedDict, total=True):
     device: Dict[str, float]
 
 
+# maximum number of parts of a S3 multipart upload
+UPLOAD_MAX_PARTS = 10000
+
+
+# create a class to define the value types of an upload request
+class UploadRequest(TypedDict, total=True):
+    # value of size key (size of the report in bytes) = int > 0
+    size: conint(gt=0)
+
+
+# create a class to define the value types of an uploaded part
+class UploadPart(TypedDict, total=True):
+    # value of PartNumber key = int
+    PartNumber: int
+    # value of ETag key = str
+    ETag: str
+
+
+# create a class to define the value types of an upload completion
+class UploadCompletion(TypedDict, total=True):
+    # value of key key (S3 key returned by /report_uploads) = str
+    key: str
+    # value of upload_id key (None for single part uploads) = str
+    upload_id: Optional[str]
+    # value of parts key is a list of uploaded parts (empty for single part uploads)
+    parts: List[UploadPart]
+    # value of group key = str
+    group: str
+    # value of gamma_shape key = int
+    gamma_shape: int
+    # value of poisson_lambda key = int
+    poisson_lambda: int
+
+
+# create a class to define the value types of an upload abort
+class UploadAbort(TypedDict, total=True):
+    # value of key key (S3 key returned by /report_uploads) = str
+    key: str
+    # value of upload_id key (None for single part uploads) = str
+    upload_id: Optional[str]
+
+
+# pattern of the S3 keys of uploaded reports (partition date on the first group)
+UPLOAD_KEY_PATTERN = re.compile(
+    r"^data_lake_raw/lambda_api/sampling_report/extracted_at=(\d{4}-\d{2}-\d{2})/api_request_at=[^/]+\.json$"
+)
+
+
 # Create the FastAPI object
 app = FastAPI()
 
 
+class TimingMiddleware:
+    """ASGI middleware recording the duration of each request (until its response
+    starts) and sending it on the Server-Timing header. Requests are passed
+    through untouched unless REQUEST_TIMINGS is on (see timings_enabled)"""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        # not a request or timings off -> pass through
+        if (scope["type"] != "http") or not timings_enabled():
+            return await self.app(scope, receive, send)
+
+        # time request
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            # response starts -> record duration and send it to the client
+            if message["type"] == "http.response.start":
+                duration_ms = (time.perf_counter() - start) * 1000
+
+                # first request of the container -> cold request
+                if TIMINGS["cold_request_ms"] is None:
+                    TIMINGS["cold_request_ms"] = duration_ms
+                # following requests -> warm requests
+                else:
+                    TIMINGS["warm_ms"].append(duration_ms)
+
+                # add duration header
+                MutableHeaders(scope=message).append(
+                    "Server-Timing", f"app;dur={duration_ms:.3f}"
+                )
+
+            await send(message)
+
+        await self.app(scope, receive, send_with_timing)
+
+
+# record request timings (only if REQUEST_TIMINGS is on)
+app.add_middleware(TimingMiddleware)
+
+
 # simple endpoint to check if API is running on the cloud
 @app.get("/")
 def api_status():
@@ -44,13 +1091,310 @@ def api_status():
     return "API in ON!"
 
 
-@app.post("/sampling_report")  # define endpoint
-def save_report(data: ReportValues):
-    """Take the data sent on post request, validate input types and
-    send report to a S3 bucket.
+@app.on_event("shutdown")
+def flush_reports():
+    """Send buffered reports to S3 when the API shuts down (no data loss)"""
+
+    close_report_buffer()
+
+    # drop closed buffer
+    get_report_buffer.cache_clear()
+
+
+@app.get("/timings")
+def api_timings():
+    """Endpoint with the initialization duration, the cold request duration
+    and the latency percentiles of warm requests of the container.
+    Not found unless REQUEST_TIMINGS is on (no authentication: internal
+    timings must only be exposed on private deployments, e.g. benchmarks)"""
+
+    # timings off -> endpoint not available
+    if not timings_enabled():
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    # get warm request durations
+    warm = sorted(TIMINGS["warm_ms"])
+
+    return {
+        "init_ms": TIMINGS["init_ms"],
+        "cold_request_ms": TIMINGS["cold_request_ms"],
+        "warm_requests": len(warm),
+        "warm_p50_ms": statistics.median(warm) if warm else None,
+        "warm_p95_ms": warm[int(0.95 * (len(warm) - 1))] if warm else None,
+    }
+
+
+@app.get("/sampling_reports")  # define endpoint
+def get_reports(
+    request: Request,
+    start_date: date,
+    end_date: date = None,
+    group: str = None,
+    gamma_shape: int = None,
+    poisson_lambda: int = None,
+):
+    """Get the reports received between start_date and end_date that match
+    the given fields. Responses are cached (REPORT_CACHE_TTL_S) and carry ETag and
+    Last-Modified headers, so repeated polls can be answered with 304 Not Modified
+
+    Args
+        request: the fastapi request (conditional headers)
+        start_date: a date with the first day (extracted_at) of the query
+        end_date: a date with the last day of the query (default: start_date)
+        group: a string to filter reports by group
+        gamma_shape: an integer to filter reports by gamma_shape
+        poisson_lambda: an integer to filter reports by poisson_lambda
+
+    Return
+        response: a json list of reports"""
+
+    # single day query
+    if end_date is None:
+        end_date = start_date
+
+    # try to query reports
+    try:
+        # check date interval
+        if not 0 <= (end_date - start_date).days < get_config()["read_max_days"]:
+            raise ValueError(
+                f"end_date must be within {get_config()['read_max_days']} days after start_date"
+            )
+
+        # get response (cached or from S3)
+        cached = query_reports(
+            (start_date, end_date, group, gamma_shape, poisson_lambda)
+        )
+
+    # in case of errors
+    except Exception as e:
+
+        return f"The following error was raised on API: {e}"
+
+    # define cache headers
+    headers = {
+        "ETag": cached["etag"],
+        "Cache-Control": f"max-age={int(get_config()['cache_ttl'])}",
+    }
+    if cached["last_modified"] is not None:
+        headers["Last-Modified"] = cached["last_modified"]
+
+    # client already has the response
+    if is_not_modified(request, cached):
+        return Response(status_code=304, headers=headers)
+
+    return Response(
+        content=cached["body"], media_type="application/json", headers=headers
+    )
+
+
+@app.post("/report_uploads")  # define endpoint
+def create_upload(data: UploadRequest):
+    """Negotiate the upload of a large report (above the AWS Lambda payload limit):
+    the client uploads it directly to S3 with presigned urls, so the report never
+    passes through the API. Reports bigger than one part use a multipart upload
+    (one presigned url per part, uploaded in parallel by the client)
+
+    Args
+        data: a dictionary that follows UploadRequest typing
+
+    Return
+        upload: a dict with the S3 "key", the "upload_id" (None for single part
+            uploads), the "part_size" and the presigned "urls" (one per part)
+            (413 Payload Too Large above UPLOAD_MAX_BYTES or UPLOAD_MAX_PARTS parts)"""
+
+    # timestamp (in UTC) that API received the request
+    timestamp = datetime.utcnow()
+
+    # try to create the upload
+    try:
+        # get configuration (loaded once per container)
+        config = get_config()
+
+        # validate user input -> size and number of parts within limits
+        if (data["size"] > config["upload_max_bytes"]) or (
+            math.ceil(data["size"] / config["upload_part_size"]) > UPLOAD_MAX_PARTS
+        ):
+            # raise http exception with problem indication
+            raise HTTPException(
+                status_code=413,
+                detail=f"size must be at most {config['upload_max_bytes']} bytes and {UPLOAD_MAX_PARTS} parts",
+            )
+
+        # define file name
+        # replacing empty space between date and time with "Z" (UTC time)
+        file_name = f"data_lake_raw/lambda_api/sampling_report/extracted_at={timestamp.date()}/api_request_at={str(timestamp).replace(' ', 'Z')}.json"
+
+        # get the AWS S3 client (created once per container)
+        s3 = get_s3_client()
+
+        # define number of parts
+        part_size = config["upload_part_size"]
+        num_parts = max(math.ceil(data["size"] / part_size), 1)
+
+        # single part -> one presigned put_object url
+        if num_parts == 1:
+            upload_id = None
+            urls = [
+                s3.generate_presigned_url(
+                    "put_object",
+                    Params={"Bucket": config["bucket_name"], "Key": file_name},
+                    ExpiresIn=config["upload_url_expires"],
+                )
+            ]
+
+        # many parts -> multipart upload with one presigned url per part
+        else:
+            upload_id = s3.create_multipart_upload(
+                Bucket=config["bucket_name"],
+                Key=file_name,
+                ContentType="application/json",
+            )["UploadId"]
+            urls = [
+                s3.generate_presigned_url(
+                    "upload_part",
+                    Params={
+                        "Bucket": config["bucket_name"],
+                        "Key": file_name,
+                        "UploadId": upload_id,
+                        "PartNumber": part_number,
+                    },
+                    ExpiresIn=config["upload_url_expires"],
+                )
+                for part_number in range(1, num_parts + 1)
+            ]
+
+    # invalid request -> 4xx response
+    except HTTPException:
+        raise
+
+    # in case of errors
+    except Exception as e:
+
+        return f"The following error was raised on API: {e}"
+
+    return {
+        "key": file_name,
+        "upload_id": upload_id,
+        "part_size": part_size,
+        "urls": urls,
+    }
+
+
+@app.post("/report_uploads/complete")  # define endpoint
+def complete_upload(data: UploadCompletion, idempotency_key: str = Header(None)):
+    """Complete the upload of a large report and record its metadata
+    on the partition manifest
+
+    Args
+        data: a dictionary that follows UploadCompletion typing
+        idempotency_key: a string sent on the Idempotency-Key header: retries with
+            the same key get the original response and the report is recorded once
+
+    Return
+        response_msg: a string with the status of report upload to AWS S3 bucket"""
+
+    # idempotency key claimed by this request (released on errors)
+    claimed_key = None
+
+    # try to complete the upload
+    try:
+        # duplicated request -> original response
+        original_msg = claim_idempotency_key(idempotency_key)
+        if original_msg is not None:
+            return idempotent_response(original_msg)
+        claimed_key = idempotency_key
+
+        # check that the key was created by /report_uploads
+        key_match = UPLOAD_KEY_PATTERN.match(data["key"])
+        if key_match is None:
+            raise ValueError(f"{data['key']} is not a report upload key")
+
+        # define bucket name (configuration is loaded once per container)
+        bucket_name = get_config()["bucket_name"]
+
+        # get the AWS S3 client (created once per container)
+        s3 = get_s3_client()
+
+        # multipart upload -> assemble parts
+        if data["upload_id"] is not None:
+            s3.complete_multipart_upload(
+                Bucket=bucket_name,
+                Key=data["key"],
+                UploadId=data["upload_id"],
+                MultipartUpload={
+                    "Parts": sorted(data["parts"], key=lambda part: part["PartNumber"])
+                },
+            )
+
+        # check uploaded report
+        s3_head = s3.head_object(Bucket=bucket_name, Key=data["key"])
+
+        # record object on the partition manifest
+        record_manifest(
+            data["key"],
+            s3_head["ContentLength"],
+            [data],
+            date.fromisoformat(key_match.group(1)),
+        )
+
+    # in case of errors
+    except Exception as e:
+        # allow the request to be retried
+        release_idempotency_key(claimed_key)
+
+        return f"The following error was raised on API: {e}"
+
+    # report was successfully uploaded
+    else:
+
+        # get S3 head request status
+        r_status = s3_head["ResponseMetadata"]["HTTPStatusCode"]
+
+        # prepare reponse message
+        response_msg = f"HTTP status of report upload to S3 bucket --> {r_status}"
+
+        return complete_idempotency_key(idempotency_key, response_msg)
+
+
+@app.post("/report_uploads/abort")  # define endpoint
+def abort_upload(data: UploadAbort):
+    """Abort a multipart upload (its uploaded parts are deleted)
+
+    Args
+        data: a dictionary that follows UploadAbort typing
+
+    Return
+        response_msg: a string with the status of the abort request"""
+
+    # try to abort the upload
+    try:
+        # check that the key was created by /report_uploads
+        if UPLOAD_KEY_PATTERN.match(data["key"]) is None:
+            raise ValueError(f"{data['key']} is not a report upload key")
+
+        # multipart upload -> delete uploaded parts
+        if data["upload_id"] is not None:
+            get_s3_client().abort_multipart_upload(
+                Bucket=get_config()["bucket_name"],
+                Key=data["key"],
+                UploadId=data["upload_id"],
+            )
+
+    # in case of errors
+    except Exception as e:
+
+        return f"The following error was raised on API: {e}"
+
+    return "Report upload aborted"
+
+
+def write_report(data: ReportValues, idempotency_key: str = None):
+    """Send a report to a S3 bucket (blocking: run on the write thread pool).
 
     Args
         data: a dictionary that follows ReportValues typing
+        idempotency_key: a string sent on the Idempotency-Key header: retries with
+            the same key get the original response and no new object is written
 
     Return
         response_msg: a string with the status of report input trial on AWS S3 bucket"""
@@ -63,25 +1407,49 @@ def save_report(data: ReportValues):
     # replacing empty space between date and time with "Z" (UTC time)
     timestamp_datetime = str(timestamp).replace(" ", "Z")
 
+    # idempotency key claimed by this request (released on errors)
+    claimed_key = None
+
     # try to load variables and send data to S3
     try:
-        # take environment variables from .env
-        load_dotenv()
+        # get report buffer (None if micro-batching is disabled)
+        buffer = get_report_buffer()
+
+        # micro-batching -> buffer report and answer without waiting for S3
+        # (no claim: the key marker is written when the report is flushed)
+        if buffer is not None:
+            return buffer_report(buffer, data, idempotency_key)
+
+        # duplicated request -> original response
+        original_msg = claim_idempotency_key(idempotency_key)
+        if original_msg is not None:
+            return idempotent_response(original_msg)
+        claimed_key = idempotency_key
+
+        # get configuration (loaded once per container)
+        config = get_config()
         # define bucket name
-        bucket_name = os.environ["AWS_S3_BUCKET"]
+        bucket_name = config["bucket_name"]
+        # define serializer of stored reports
+        serializer = config["serializer"]
         # define file name
-        file_name = f"data_lake_raw/lambda_api/sampling_report/extracted_at={timestamp_date}/api_request_at={timestamp_datetime}.json"
+        file_name = f"data_lake_raw/lambda_api/sampling_report/extracted_at={timestamp_date}/api_request_at={timestamp_datetime}.{serializer.extension}"
         # content to be sent
-        content = bytes(json.dumps(data).encode("UTF-8"))
+        content = serializer.dumps(data)
 
-        # create a resource service client for AWS S3
-        s3 = boto3.client("s3")
+        # get the AWS S3 client (created once per container)
+        s3 = get_s3_client()
 
         # put content on the required S3 bucket
         s3_put = s3.put_object(Bucket=bucket_name, Key=file_name, Body=content)
 
+        # record object on the partition manifest
+        record_manifest(file_name, len(content), [data], timestamp_date)
+
     # in case of errors
     except Exception as e:
+        # allow the request to be retried
+        release_idempotency_key(claimed_key)
 
         return f"The following error was raised on API: {e}"
 
@@ -94,14 +1462,123 @@ def save_report(data: ReportValues):
         # prepare reponse message
         response_msg = f"HTTP status of report input to S3 bucket --> {r_status}"
 
-        return response_msg
+        return complete_idempotency_key(idempotency_key, response_msg)
+
+
+def write_reports(data: List[ReportValues], idempotency_key: str = None):
+    """Send a list of reports to a S3 bucket as a single NDJSON file
+    (one report per line; blocking: run on the write thread pool).
+
+    Args
+        data: a list of dictionaries that follow ReportValues typing
+        idempotency_key: a string sent on the Idempotency-Key header: retries with
+            the same key get the original response and no new object is written
+
+    Return
+        response_msg: a string with the status of reports input trial on AWS S3 bucket"""
+
+    # timestamp (in UTC) that API received the data
+    timestamp = datetime.utcnow()
+    # define date of timestamp
+    timestamp_date = timestamp.date()
+    # define datetime of timestamp
+    # replacing empty space between date and time with "Z" (UTC time)
+    timestamp_datetime = str(timestamp).replace(" ", "Z")
+
+    # idempotency key claimed by this request (released on errors)
+    claimed_key = None
+
+    # try to load variables and send data to S3
+    try:
+        # duplicated request -> original response
+        original_msg = claim_idempotency_key(idempotency_key)
+        if original_msg is not None:
+            return idempotent_response(original_msg)
+        claimed_key = idempotency_key
+
+        # define bucket name (configuration is loaded once per container)
+        bucket_name = get_config()["bucket_name"]
+        # define file name
+        file_name = f"data_lake_raw/lambda_api/sampling_report/extracted_at={timestamp_date}/api_request_at={timestamp_datetime}.ndjson"
+        # define json serializer
+        serializer = get_serializer("json")
+        # content to be sent -> one json report per line
+        content = b"\n".join(serializer.dumps(report) for report in data)
+
+        # get the AWS S3 client (created once per container)
+        s3 = get_s3_client()
+
+        # put content on the required S3 bucket
+        s3_put = s3.put_object(Bucket=bucket_name, Key=file_name, Body=content)
+
+        # record object on the partition manifest
+        record_manifest(file_name, len(content), data, timestamp_date)
+
+    # in case of errors
+    except Exception as e:
+        # allow the request to be retried
+        release_idempotency_key(claimed_key)
+
+        return f"The following error was raised on API: {e}"
+
+    # data was successfully input in s3 bucket
+    else:
+
+        # get S3 input request status
+        r_status = s3_put["ResponseMetadata"]["HTTPStatusCode"]
+
+        # prepare reponse message
+        response_msg = (
+            f"HTTP status of {len(data)} reports input to S3 bucket --> {r_status}"
+        )
+
+        return complete_idempotency_key(idempotency_key, response_msg)
+
+
+@app.post("/sampling_report")  # define endpoint
+async def save_report(data: ReportValues, idempotency_key: str = Header(None)):
+    """Take the data sent on post request, validate input types and
+    send report to a S3 bucket (on the write thread pool).
+
+    Args
+        data: a dictionary that follows ReportValues typing
+        idempotency_key: a string sent on the Idempotency-Key header: retries with
+            the same key get the original response and no new object is written
+
+    Return
+        response_msg: a string with the status of report input trial on AWS S3 bucket"""
+
+    return await run_on_s3_executor(write_report, data, idempotency_key)
+
+
+@app.post("/sampling_reports")  # define endpoint
+async def save_reports(data: List[ReportValues], idempotency_key: str = Header(None)):
+    """Take the list of reports sent on post request, validate input types and
+    send all reports to a S3 bucket as a single NDJSON file (on the write thread pool).
+
+    Args
+        data: a list of dictionaries that follow ReportValues typing
+        idempotency_key: a string sent on the Idempotency-Key header: retries with
+            the same key get the original response and no new object is written
+
+    Return
+        response_msg: a string with the status of reports input trial on AWS S3 bucket"""
+
+    return await run_on_s3_executor(write_reports, data, idempotency_key)
 
 
 # use Mangum adapter to run FastAPI in AWS Lambda
-lambda_handler = Mangum(app)
+# (lifespan off -> no report buffer to flush: micro-batching is disabled on AWS Lambda)
+lambda_handler = Mangum(app, lifespan="off")
+
+# end of the container initialization (cold start)
+TIMINGS["init_ms"] = (time.perf_counter() - INIT_START) * 1000
 
 
 # check if api.py if being called directly
 if __name__ == "__main__":
+    # uvicorn is only needed to run the API locally (not on AWS Lambda)
+    import uvicorn
+
     # Run the API on http://127.0.0.1:8000
     uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -5,6 +5,12 @@ echo "---> Checking pipenv! <---"
 # check if pipenv is running
 pipenv install
 
+# install the AWS SDK pinned on the project requirements: S3 conditional
+# writes (idempotency keys and report manifests) need botocore >= 1.35.68,
+# newer than the SDK of some AWS Lambda runtimes -> the zip bundles it
+echo "---> Installing pinned boto3/botocore <---"
+pipenv run pip install $(grep -E "^(boto3|botocore|s3transfer|jmespath)==" ../requirements.txt)
+
 # define path to current folder
 DIR=$(pwd)
 
@@ -31,9 +37,9 @@ cd $SITE_PACKAGES
 # -9 = compress better
 # zip every code of venv library
 # into package.zip of project folder
-# ignoring boto3 and botocore (Lambda has them)
+# including the pinned boto3 and botocore (the runtime SDK may be too old)
 # -q = quiet
-zip -r9 -q --exclude=*boto3* --exclude=*botocore* $DIR/lambda_venv.zip *
+zip -r9 -q $DIR/lambda_venv.zip *
 
 # change back to project directory
 cd $DIR
@@ -43,6 +49,15 @@ zip -g -q lambda_venv.zip .env lambda_function.py
 
 echo "---> Adding lambda_function.py and .env files to zip <---"
 
+# change to project root directory
+cd $DIR/..
+# add the serializers and report manifest modules shared with the project package to the zip
+zip -g -q $DIR/lambda_venv.zip synthetic_data_ingestion/__init__.py synthetic_data_ingestion/serializers.py synthetic_data_ingestion/report_manifest.py
+# change back to lambda_api directory
+cd $DIR
+
+echo "---> Adding synthetic_data_ingestion/serializers.py and report_manifest.py to zip <---"
+
 # print report
 echo "---> Venv successfully zipped! <---"
 
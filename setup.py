@@ -19,5 +19,6 @@ setup(name='synthetic_data_ingestion', # project name
       test_suite='tests', # folder with tests
       # include_package_data: to install data from MANIFEST.in
       include_package_data=True, # include data package inside package
-      scripts=['scripts/synthetic_data_ingestion-run'], # available scripts
+      scripts=['scripts/synthetic_data_ingestion-run',
+               'scripts/synthetic_data_ingestion-backfill'], # available scripts
       zip_safe=False) # project canNOT be installed and run from a zip file
@@ -0,0 +1,322 @@
+"""Backfill of the weekly cohorts of a date range: each week and group is generated
+with the week as reference date and loaded on AWS RDS (replacing its rows) and on
+AWS Lambda API, with at most max_workers cohorts in parallel.
+
+Usage
+    synthetic_data_ingestion-backfill --start-date 2022-01-03 --end-date 2022-03-28
+    synthetic_data_ingestion-backfill --start-date 2022-01-03 --end-date 2022-01-31 --no-reports
+"""
+
+# import required libraries
+import sys
+import time
+import hashlib
+import argparse
+import logging
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from synthetic_data_ingestion.rds_ingestion import RdsIngestor
+from synthetic_data_ingestion.sample_creator import SynthCustomers
+from synthetic_data_ingestion.lambda_ingestion import LambdaIngestor
+
+
+# default A/B testing arms of a backfill
+DEFAULT_ARMS = ["CONTROL", "TREATMENT"]
+
+# default number of weekly cohorts loaded in parallel
+DEFAULT_BACKFILL_WORKERS = 4
+
+
+def backfill_weeks(start_date, end_date) -> list:
+    """Get the first day of each week between start_date and end_date
+    (weeks start on Monday; a week that starts on end_date is included).
+    Weeks of every backfill are aligned, so a rerun never replaces part
+    of a neighbouring week
+
+    Args
+        start_date: a date or a string with format YYYY-MM-DD (a Monday)
+        end_date: a date or a string with format YYYY-MM-DD"""
+
+    # convert strings to dates
+    start_date, end_date = [
+        d if isinstance(d, date) else date.fromisoformat(d)
+        for d in [start_date, end_date]
+    ]
+
+    # validate user input -> start_date is a Monday
+    if start_date.weekday() != 0:
+        # raise value error with problem indication
+        raise ValueError(
+            f"start_date param must be a Monday (week start): {start_date} is a {start_date:%A}"
+        )
+
+    return [
+        start_date + timedelta(days=days)
+        for days in range(0, (end_date - start_date).days + 1, 7)
+    ]
+
+
+def cohort_seed(week_start, group: str, seed: int = 0) -> int:
+    """Derive the random generator seed of a weekly cohort
+    (same week, group and seed -> same samples and report)
+
+    Args
+        week_start: a date or a string with format YYYY-MM-DD
+        group: a string ("CONTROL" or "TREATMENT")
+        seed: an integer with the seed of the backfill"""
+
+    # hash cohort identification
+    digest = hashlib.sha256(f"{seed}:{week_start}:{group}".encode("UTF-8")).digest()
+
+    return int.from_bytes(digest[:8], "big")
+
+
+def backfill_idempotency_key(week_start, group: str, seed: int = 0) -> str:
+    """Get the Idempotency-Key of the report of a weekly cohort
+    (reruns of the backfill do not write the report again)
+
+    Args
+        week_start: a date or a string with format YYYY-MM-DD
+        group: a string ("CONTROL" or "TREATMENT")
+        seed: an integer with the seed of the backfill"""
+
+    return f"backfill-{week_start}-{group}-{seed}"
+
+
+class Backfiller:
+    def __init__(
+        self,
+        start_date,
+        end_date,
+        arms: list = None,
+        num_samples: int = 5000,
+        seed: int = 0,
+        max_workers: int = DEFAULT_BACKFILL_WORKERS,
+        send_reports: bool = True,
+        log_folder: str = None,
+    ) -> None:
+        """Instanciate a backfill of the weekly cohorts between start_date and end_date.
+        Each cohort is generated with the week as reference date and a seed derived
+        from the week, so reruns generate the same samples: RDS rows of the week and
+        group are replaced (a single cohort per group and week -> weeks that hold
+        rows of other cohorts of the same group, e.g. loaded by the DAG, are not
+        replaced, see RdsIngestor._delete_week_rows) and reports
+        are sent with a fixed Idempotency-Key
+
+        Args
+            start_date: a date or a string with format YYYY-MM-DD (Monday of the first week)
+            end_date: a date or a string with format YYYY-MM-DD (included)
+            arms: a list of strings with the groups of each week (default: CONTROL and TREATMENT)
+            num_samples: an integer with the number of samples of each cohort
+            seed: an integer with the seed of the backfill
+            max_workers: an integer with the maximum number of cohorts loaded in parallel
+            send_reports: a boolean to send the cohort reports to AWS Lambda API
+            log_folder: a string with the path to store logs"""
+
+        # instanciate logger
+        self.logger = logging.getLogger("backfill.py")
+
+        # define log date in utc
+        logging.Formatter.converter = time.gmtime
+
+        # check if user input a folder to store logs
+        if log_folder is None:
+            # set a default folder
+            log_folder = "../logs"
+
+        # define logging configuration
+        logging.basicConfig(
+            filename=f"{log_folder}/data_ingestion-{datetime.utcnow().date()}.log",
+            level=logging.INFO,
+            format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+            datefmt="%Y:%m:%d %H:%M:%S",
+        )
+
+        # validate user input -> max_workers >= 1
+        if not (isinstance(max_workers, int) and max_workers >= 1):
+            # log a warning
+            self.logger.warning(
+                "Backfiller object NOT instanciated: max_workers param must be an integer >= 1"
+            )
+
+            raise ValueError("max_workers param must be an integer >= 1")
+
+        # define arms of each week
+        arms = list(arms) if arms is not None else list(DEFAULT_ARMS)
+
+        # validate user input -> one cohort per group and week (loads replace
+        # every RDS row of the group and week, see RdsIngestor._delete_week_rows)
+        if len(set(arms)) != len(arms):
+            # log a warning
+            self.logger.warning(
+                "Backfiller object NOT instanciated: arms param must not have repeated groups"
+            )
+
+            raise ValueError("arms param must not have repeated groups")
+
+        # define weeks to be loaded (raises an error on invalid dates)
+        self.weeks = backfill_weeks(start_date, end_date)
+
+        # define backfill params
+        self.arms = arms
+        self.num_samples = num_samples
+        self.seed = seed
+        self.max_workers = max_workers
+        self.send_reports = send_reports
+        self.log_folder = log_folder
+
+        # log an information
+        self.logger.info(
+            f"Backfiller object successfully instanciated: {len(self.weeks)} weeks, arms = {self.arms}, max_workers = {max_workers}"
+        )
+
+    def load_week(self, week_start: date, group: str) -> dict:
+        """Generate the cohort of a week and group and load it on AWS RDS
+        (replacing the rows of the week and group) and on AWS Lambda API
+
+        Args
+            week_start: a date with the first day of the week
+            group: a string ("CONTROL" or "TREATMENT")
+
+        Return
+            result: a dict with the cohort identification and the response
+                of each ingestion"""
+
+        # define cohort identification
+        result = {
+            "week_start": str(week_start),
+            "group": group,
+            "seed": cohort_seed(week_start, group, self.seed),
+            "rds": None,
+            "lambda": None,
+        }
+
+        # try to generate and load cohort
+        try:
+            # instanciate SynthCustomers object of the week
+            synth_customers = SynthCustomers(
+                num_samples=self.num_samples,
+                group=group,
+                log_folder=self.log_folder,
+                reference_date=week_start,
+                seed=result["seed"],
+            )
+            # generate synthetic samples
+            synth_customers.generate_samples()
+            # generate report
+            synth_customers.generate_report()
+
+            # send samples to AWS RDS (replacing rows of the week and group)
+            result["rds"] = RdsIngestor(
+                synth_customers, self.log_folder
+            ).ingest_samples(replace=True)
+
+            # samples not loaded -> do not send the report of the week
+            if result["rds"] != "ingest_samples method successfully called":
+                raise Exception(result["rds"])
+
+            # send report to AWS Lambda API (fixed key -> never duplicated)
+            if self.send_reports:
+                result["lambda"] = LambdaIngestor(
+                    synth_customers,
+                    self.log_folder,
+                    idempotency_key=backfill_idempotency_key(
+                        week_start, group, self.seed
+                    ),
+                ).send_report_to_lambda()
+
+        # in case of errors
+        except Exception as e:
+            # log a critical
+            self.logger.critical(
+                f"load_week method NOT successful: week = {week_start}, group = {group}, raised error ---> {e}"
+            )
+
+            result["error"] = f"load_week method NOT successful: raised error ---> {e}"
+
+        return result
+
+    def run(self) -> list:
+        """Load all cohorts of the backfill with at most max_workers cohorts in parallel
+
+        Return
+            results: a list of load_week dicts in the weeks and arms order"""
+
+        # define cohorts to be loaded
+        cohorts = [
+            (week_start, group) for week_start in self.weeks for group in self.arms
+        ]
+
+        # time backfill
+        start = time.perf_counter()
+
+        # open a thread pool with context manager
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # load each cohort on its own thread
+            results = list(
+                executor.map(lambda cohort: self.load_week(*cohort), cohorts)
+            )
+
+        # count cohorts with errors
+        num_errors = sum("error" in result for result in results)
+
+        # log an information
+        self.logger.info(
+            f"run method successfully called: {len(results)} cohorts loaded in {time.perf_counter() - start:.1f} s, {num_errors} with errors"
+        )
+
+        return results
+
+
+def main(argv: list = None) -> int:
+    """Run a backfill from the command line and print the result of each cohort"""
+
+    # define command line arguments
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--start-date", required=True, help="YYYY-MM-DD")
+    parser.add_argument("--end-date", required=True, help="YYYY-MM-DD")
+    parser.add_argument("--arms", nargs="+", default=DEFAULT_ARMS)
+    parser.add_argument("--num-samples", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-workers", type=int, default=DEFAULT_BACKFILL_WORKERS)
+    parser.add_argument(
+        "--no-reports",
+        action="store_true",
+        help="do not send the cohort reports to AWS Lambda API",
+    )
+    parser.add_argument("--log-folder", default=None)
+    args = parser.parse_args(argv)
+
+    # try to instanciate backfill
+    try:
+        backfiller = Backfiller(
+            args.start_date,
+            args.end_date,
+            arms=args.arms,
+            num_samples=args.num_samples,
+            seed=args.seed,
+            max_workers=args.max_workers,
+            send_reports=not args.no_reports,
+            log_folder=args.log_folder,
+        )
+
+    # in case of invalid dates, arms or max_workers
+    except ValueError as e:
+        parser.error(str(e))
+
+    # run backfill
+    results = backfiller.run()
+
+    # print result of each cohort
+    for result in results:
+        print(
+            f"{result['week_start']} {result['group']:<10}{result.get('error', 'OK')}"
+        )
+
+    # fail if any cohort failed
+    return int(any("error" in result for result in results))
+
+
+# check if script is being called directly
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+"""Compact immutable value of a generated cohort: only its samples (column buffers)
+and its blueprint (the creation report with the params used to generate them),
+without the logger, the random generator and the configuration lists of a
+SynthCustomers object. Returned by SynthCustomers.generate_samples and accepted
+by the ingestors.
+
+Cohorts serialize to a flat binary format (to_bytes): a small JSON header followed
+by the raw column buffers, so from_bytes only creates read-only views on the
+data (no per-row decoding). Pickle (Airflow staging, process pools) uses the same format.
+
+Cohorts are deeply immutable: samples and creation report are read-only mappings,
+columns are read-only arrays (writeable columns are copied, so no one keeps a
+writeable reference to them) and nested values of the report are frozen too
+(use to_builtin to get a plain copy, e.g. to serialize the report).
+
+Usage
+    cohort = SynthCustomers(num_samples=5000, group="CONTROL").generate_samples()
+    data = cohort.to_bytes()
+    RdsIngestor(Cohort.from_bytes(data)).ingest_samples()
+"""
+
+# import required libraries
+import json
+import struct
+import numpy as np
+from datetime import datetime
+from types import MappingProxyType
+from synthetic_data_ingestion.serializers import NpEncoder
+
+
+# first bytes of a serialized cohort (format name and version)
+MAGIC = b"SDICOH01"
+
+# byte size of the header length and alignment of the column buffers
+HEADER_LENGTH = struct.Struct("<Q")
+ALIGNMENT = 8
+
+
+def freeze(obj):
+    """Get a read-only copy of a value: dicts become read-only mappings and lists
+    become tuples (nested values included)
+
+    Args
+        obj: a value made of dicts, lists and scalars (e.g. a creation report)"""
+
+    # dict -> read-only mapping
+    if isinstance(obj, (dict, MappingProxyType)):
+        return MappingProxyType({key: freeze(value) for key, value in obj.items()})
+
+    # list -> tuple
+    if isinstance(obj, (list, tuple)):
+        return tuple(freeze(value) for value in obj)
+
+    return obj
+
+
+def to_builtin(obj):
+    """Get a plain copy (dicts and lists) of a value frozen by freeze
+
+    Args
+        obj: a value made of read-only mappings, tuples and scalars"""
+
+    # read-only mapping -> dict
+    if isinstance(obj, (dict, MappingProxyType)):
+        return {key: to_builtin(value) for key, value in obj.items()}
+
+    # tuple -> list
+    if isinstance(obj, (list, tuple)):
+        return [to_builtin(value) for value in obj]
+
+    return obj
+
+
+class Cohort:
+    """Frozen cohort: group, number of samples, generating date, samples
+    (a read-only mapping of read-only numpy arrays) and creation report
+    (blueprint, a read-only mapping)"""
+
+    __slots__ = (
+        "group",
+        "num_samples",
+        "gen_date_utc",
+        "sampling_dict",
+        "creation_report",
+    )
+
+    def __init__(
+        self,
+        group: str,
+        num_samples: int,
+        gen_date_utc: datetime,
+        sampling_dict: dict,
+        creation_report: dict,
+    ) -> None:
+        """Class constructor (read-only columns are kept as views, not copied;
+        writeable columns are copied)
+
+        Args
+            group: a string ("CONTROL" or "TREATMENT") with the AB-testing group
+            num_samples: an integer with the number of samples
+            gen_date_utc: a datetime with the generating date
+            sampling_dict: a dict of numpy arrays with num_samples items each
+                (an empty dict for a cohort without samples, e.g. sent through
+                shared memory)
+            creation_report: a dict with the params used to generate the samples"""
+
+        # validate user input -> every column has num_samples items
+        if any(len(values) != num_samples for values in sampling_dict.values()):
+            # raise value error with problem indication
+            raise ValueError("sampling_dict columns must have num_samples items")
+
+        # create read-only views of the columns
+        # (writeable columns could be changed by their owner -> copy them)
+        columns = {}
+        for column, values in sampling_dict.items():
+            columns[column] = values.copy() if values.flags.writeable else values.view()
+            columns[column].flags.writeable = False
+
+        # define attributes (frozen object -> bypass __setattr__)
+        object.__setattr__(self, "group", group)
+        object.__setattr__(self, "num_samples", num_samples)
+        object.__setattr__(self, "gen_date_utc", gen_date_utc)
+        object.__setattr__(self, "sampling_dict", MappingProxyType(columns))
+        object.__setattr__(self, "creation_report", freeze(creation_report))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Cohort object is frozen: can't set {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Cohort object is frozen: can't delete {name}")
+
+    def __repr__(self) -> str:
+        return f"Cohort(group={self.group!r}, num_samples={self.num_samples}, gen_date_utc={self.gen_date_utc!r}, columns={list(self.sampling_dict)})"
+
+    def __eq__(self, other) -> bool:
+        # compare cohorts only
+        if not isinstance(other, Cohort):
+            return NotImplemented
+
+        return (
+            (self.group, self.num_samples, self.gen_date_utc, self.creation_report)
+            == (
+                other.group,
+                other.num_samples,
+                other.gen_date_utc,
+                other.creation_report,
+            )
+        ) and (
+            (list(self.sampling_dict) == list(other.sampling_dict))
+            and all(
+                np.array_equal(values, other.sampling_dict[column])
+                and (values.dtype == other.sampling_dict[column].dtype)
+                for column, values in self.sampling_dict.items()
+            )
+        )
+
+    # numpy arrays inside -> not hashable
+    __hash__ = None
+
+    def __reduce__(self):
+        # pickle with the binary format (no per-item pickling of the samples)
+        return (Cohort.from_bytes, (self.to_bytes(),))
+
+    def with_columns(self, sampling_dict: dict):
+        """Get a copy of the cohort with other samples (e.g. shared memory views)
+
+        Args
+            sampling_dict: a dict of numpy arrays with num_samples items each"""
+
+        return Cohort(
+            self.group,
+            self.num_samples,
+            self.gen_date_utc,
+            sampling_dict,
+            self.creation_report,
+        )
+
+    def to_bytes(self) -> bytes:
+        """Serialize the cohort: MAGIC, header length, JSON header
+        (attributes and the dtype, shape and offset of each column) and
+        the column buffers (aligned to ALIGNMENT bytes)"""
+
+        # instanciate column specs and offset of the next buffer
+        columns, offset = [], 0
+
+        # iterate over columns
+        for column, values in self.sampling_dict.items():
+            # validate input -> fixed size items (object arrays hold pointers)
+            if values.dtype.hasobject:
+                # raise value error with problem indication
+                raise ValueError(f"{column} column has object dtype")
+
+            # describe column
+            columns.append([column, values.dtype.str, values.shape, offset])
+
+            # define offset of the next buffer
+            offset += -(-values.nbytes // ALIGNMENT) * ALIGNMENT
+
+        # create header
+        header = json.dumps(
+            {
+                "group": self.group,
+                "num_samples": self.num_samples,
+                "gen_date_utc": self.gen_date_utc.isoformat(),
+                "creation_report": to_builtin(self.creation_report),
+                "columns": columns,
+            },
+            cls=NpEncoder,
+        ).encode("UTF-8")
+
+        # pad header (buffers start at an aligned position)
+        header += b" " * (-(len(MAGIC) + HEADER_LENGTH.size + len(header)) % ALIGNMENT)
+
+        # instanciate pieces of the output (MAGIC, header length and header)
+        pieces = [MAGIC, HEADER_LENGTH.pack(len(header)), header]
+
+        # add column buffers and their padding
+        for values in self.sampling_dict.values():
+            pieces.append(np.ascontiguousarray(values).view(np.uint8))
+            pieces.append(b"\0" * (-values.nbytes % ALIGNMENT))
+
+        # join pieces (single copy of the samples)
+        return b"".join(pieces)
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        """Deserialize a cohort created by to_bytes (the columns are
+        read-only views on data)
+
+        Args
+            data: a bytes-like object created by to_bytes"""
+
+        # validate input -> serialized cohort
+        if bytes(data[: len(MAGIC)]) != MAGIC:
+            # raise value error with problem indication
+            raise ValueError("data param is not a serialized Cohort object")
+
+        # read header
+        (header_length,) = HEADER_LENGTH.unpack_from(data, len(MAGIC))
+        start = len(MAGIC) + HEADER_LENGTH.size
+        header = json.loads(bytes(data[start : start + header_length]))
+        start += header_length
+
+        # create views on the column buffers
+        sampling_dict = {
+            column: np.frombuffer(
+                data,
+                dtype=np.dtype(dtype),
+                count=int(np.prod(shape)),
+                offset=start + offset,
+            ).reshape(shape)
+            for column, dtype, shape, offset in header["columns"]
+        }
+
+        return cls(
+            header["group"],
+            header["num_samples"],
+            datetime.fromisoformat(header["gen_date_utc"]),
+            sampling_dict,
+            header["creation_report"],
+        )
@@ -0,0 +1,479 @@
+# import required libraries
+import io
+import os
+import json
+import zlib
+import boto3
+import logging
+import threading
+import time
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from boto3.dynamodb.types import TypeDeserializer
+from synthetic_data_ingestion.dynamodb_ingestion import (
+    BUNDLE_KEY_PREFIX,
+    TTL_ATTRIBUTE,
+)
+
+
+# columns of the archived log files
+ARCHIVE_COLUMNS = [
+    "timestamp",
+    "log_file_sequence",
+    "level",
+    "name",
+    "msg",
+    "run_id",
+    TTL_ATTRIBUTE,
+]
+
+# attribute that marks archived items (archive time in epoch seconds)
+ARCHIVED_ATTRIBUTE = "archived_at"
+
+# default number of days before expiry (TTL_ATTRIBUTE) that items are archived
+# (DynamoDB TTL may delete items as soon as they expire -> run archive more often)
+DEFAULT_MARGIN_DAYS = 1
+
+
+class DynamodbLogArchiver:
+    def __init__(
+        self,
+        log_folder: str = None,
+        segments: int = 4,
+        s3_endpoint_url: str = None,
+    ) -> None:
+        """Instanciate an archiver that moves old log items of the
+        DynamoDB log table to partitioned Parquet files
+
+        Args
+            log_folder: a string with the path to store logs
+            segments: an integer with the number of parallel scan segments
+            s3_endpoint_url: a string with the endpoint of an S3 compatible store
+                (default: AWS S3)"""
+
+        # instanciate logger
+        self.logger = logging.getLogger("dynamodb_archival.py")
+
+        # define log date in utc
+        logging.Formatter.converter = time.gmtime
+
+        # check if user input a folder to store logs
+        if log_folder is None:
+            # set a default folder
+            log_folder = "../logs"
+
+        # define logging configuration
+        logging.basicConfig(
+            filename=f"{log_folder}/data_ingestion-{datetime.utcnow().date()}.log",
+            level=logging.INFO,
+            format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+            datefmt="%Y:%m:%d %H:%M:%S",
+        )
+
+        # take environment variables from .env.
+        load_dotenv()
+
+        # define table name -> raise error if not found
+        self.table_name = os.environ["AWS_DYNAMODB_TABLE"]
+
+        # create a low level client (thread safe, shared by scan segments)
+        self.client = boto3.client("dynamodb")
+
+        # define number of parallel scan segments and the lock of the keys
+        # archived by a run (shared by the segment threads)
+        self.segments = segments
+        self._archived_keys_lock = threading.Lock()
+
+        # define endpoint of the S3 compatible store
+        self.s3_endpoint_url = s3_endpoint_url
+
+        # log an information
+        self.logger.info(
+            f"DynamodbLogArchiver object successfully instanciated: segments = {segments}"
+        )
+
+    def enable_ttl(self) -> str:
+        """Enable DynamoDB TTL on the TTL_ATTRIBUTE of the log table"""
+
+        # try to enable TTL
+        try:
+            # enable TTL on the log table
+            self.client.update_time_to_live(
+                TableName=self.table_name,
+                TimeToLiveSpecification={
+                    "Enabled": True,
+                    "AttributeName": TTL_ATTRIBUTE,
+                },
+            )
+
+        # exception on TTL update
+        except Exception as e:
+            # log a warning
+            self.logger.critical(
+                f"enable_ttl method NOT successful: raised error ---> {e}"
+            )
+
+            return f"enable_ttl method NOT successful: raised error ---> {e}"
+
+        # TTL enabled
+        else:
+            # log an information
+            self.logger.info("enable_ttl method successfully called")
+
+            return "enable_ttl method successfully called"
+
+    def archive(
+        self,
+        destination: str,
+        older_than_days: int = None,
+        compression: str = "snappy",
+        delete: bool = False,
+        margin_days: float = DEFAULT_MARGIN_DAYS,
+    ) -> str:
+        """Export expiring (TTL_ATTRIBUTE less than margin_days ahead) or old log
+        items to Parquet files partitioned by log date
+        (destination/date=YYYY-MM-DD/part-<run>-<segment>-<page>.parquet). Items are
+        archived before DynamoDB TTL deletes them as long as archive runs at least
+        once every margin_days. Log bundles are archived by their TTL only (their
+        keys hold no date): their log lines are decompressed to the same partitions.
+        Each scanned page is written as it arrives (memory holds one page per
+        segment) and its items are then deleted or marked with ARCHIVED_ATTRIBUTE,
+        so reruns never export them again
+
+        Args
+            destination: a string with a local folder or a "s3://bucket/prefix" path
+            older_than_days: an integer to also archive logs older than the given
+                number of days (default: only expiring logs)
+            compression: a string with the Parquet compression codec
+            delete: a boolean to delete archived items from the table
+                (instead of waiting for DynamoDB TTL to remove them)
+            margin_days: a number of days before expiry that items are archived"""
+
+        # try to archive logs
+        try:
+            # define scan params shared by all segments
+            scan_params = self._scan_params(
+                older_than_days=older_than_days, margin_days=margin_days
+            )
+
+            # define the name of the files written by this archive run
+            run_name = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+
+            # instanciate keys of the items archived by this run
+            # (segments never overlap on DynamoDB, but some DynamoDB
+            # compatible stores ignore the segment params)
+            archived_keys = set()
+
+            # open a thread pool with context manager
+            with ThreadPoolExecutor(max_workers=self.segments) as executor:
+                # archive each segment on its own thread
+                num_rows = sum(
+                    executor.map(
+                        lambda segment: self._archive_segment(
+                            segment,
+                            scan_params,
+                            destination=destination,
+                            run_name=run_name,
+                            compression=compression,
+                            delete=delete,
+                            archived_keys=archived_keys,
+                        ),
+                        range(self.segments),
+                    )
+                )
+
+        # exception on archival
+        except Exception as e:
+            # log a warning
+            self.logger.critical(
+                f"archive method NOT successful: raised error ---> {e}"
+            )
+
+            return f"archive method NOT successful: raised error ---> {e}"
+
+        # logs archived
+        else:
+            # log an information
+            self.logger.info(
+                f"archive method successfully called: {num_rows} items archived"
+            )
+
+            return f"archive method successfully called: {num_rows} items archived"
+
+    def _scan_params(
+        self, older_than_days: int = None, margin_days: float = DEFAULT_MARGIN_DAYS
+    ) -> dict:
+        """Get the scan params of the archivable items (not archived yet)
+
+        Args
+            older_than_days: an integer to also select logs older than the given
+                number of days
+            margin_days: a number of days before expiry that items are selected"""
+
+        # define filter -> log lines and log bundles that expire within the margin
+        filter_expression = "(#ttl <= :expiry)"
+        expression_values = {
+            ":expiry": {"N": str(int(time.time() + margin_days * 86400))}
+        }
+
+        # check if old logs must be selected too
+        if older_than_days is not None:
+            # define the timestamp of the oldest log kept on the table
+            cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+
+            # select logs older than the cutoff
+            # (bundle keys sort after any timestamp -> never selected)
+            filter_expression += " OR (#ts < :cutoff)"
+            expression_values[":cutoff"] = {"S": cutoff.strftime("%Y:%m:%dZ%H:%M:%S")}
+
+        return {
+            "TableName": self.table_name,
+            # items archived by previous runs are skipped
+            "FilterExpression": f"attribute_not_exists(#archived) AND ({filter_expression})",
+            "ExpressionAttributeNames": {
+                "#ttl": TTL_ATTRIBUTE,
+                "#ts": "timestamp",
+                "#archived": ARCHIVED_ATTRIBUTE,
+            },
+            "ExpressionAttributeValues": expression_values,
+            "TotalSegments": self.segments,
+        }
+
+    def _archive_segment(
+        self,
+        segment: int,
+        scan_params: dict,
+        destination: str,
+        run_name: str,
+        compression: str,
+        delete: bool,
+        archived_keys: set,
+    ) -> int:
+        """Scan the pages of the given segment and archive each page as it arrives
+
+        Args
+            segment: an integer with the scan segment
+            scan_params: a dict created by _scan_params
+            destination: a string with a local folder or a "s3://bucket/prefix" path
+            run_name: a string that identifies the archive run on the file names
+            compression: a string with the Parquet compression codec
+            delete: a boolean to delete archived items (instead of marking them)
+            archived_keys: a set with the keys of the items archived by the run
+
+        Return
+            num_rows: an integer with the number of archived log lines"""
+
+        # instanciate deserializer of DynamoDB attribute values
+        deserializer = TypeDeserializer()
+
+        # instanciate number of archived log lines, page number and first page params
+        num_rows, page, params = 0, 0, {**scan_params, "Segment": segment}
+
+        # iterate over pages
+        while True:
+            # scan page
+            response = self.client.scan(**params)
+
+            # deserialize items
+            items = [
+                {key: deserializer.deserialize(value) for key, value in item.items()}
+                for item in response["Items"]
+            ]
+
+            # keep items not archived by another segment
+            with self._archived_keys_lock:
+                items = [
+                    item
+                    for item in items
+                    if (item["timestamp"], item["log_file_sequence"])
+                    not in archived_keys
+                ]
+                archived_keys.update(
+                    (item["timestamp"], item["log_file_sequence"]) for item in items
+                )
+
+            # archive page
+            if items:
+                num_rows += self._archive_page(
+                    items,
+                    destination=destination,
+                    part_name=f"part-{run_name}-{segment:03d}-{page:06d}.parquet",
+                    compression=compression,
+                    delete=delete,
+                )
+
+            # check if there are more pages
+            if "LastEvaluatedKey" not in response:
+                break
+
+            # start next page where the last one stopped
+            params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+            page += 1
+
+        return num_rows
+
+    def _archive_page(
+        self,
+        items: list,
+        destination: str,
+        part_name: str,
+        compression: str,
+        delete: bool,
+    ) -> int:
+        """Write the log lines of a page of items to their partitions and then
+        delete or mark the items (written files are never exported again)
+
+        Return
+            num_rows: an integer with the number of archived log lines"""
+
+        # get log lines of the items (log bundles are decompressed)
+        rows = self._log_rows(items)
+
+        # check if the page has log lines (e.g. only bundle index items)
+        if rows:
+            # create a dataframe with archived columns
+            df_archive = pd.DataFrame(rows).reindex(columns=ARCHIVE_COLUMNS)
+
+            # define partition (log date) of each item
+            # e.g. "2022:07:01Z10:00:00" -> "2022-07-01"
+            df_archive["date"] = df_archive["timestamp"].str[:10].str.replace(":", "-")
+
+            # iterate over partitions
+            for date, df_partition in df_archive.groupby("date"):
+                # write partition file
+                self._write_partition(
+                    df_partition.drop(columns="date"),
+                    path=f"{destination.rstrip('/')}/date={date}/{part_name}",
+                    compression=compression,
+                )
+
+        # check if archived items must be deleted
+        if delete:
+            self._delete_items(items)
+
+        # mark archived items (kept until DynamoDB TTL removes them)
+        else:
+            self._mark_items(items)
+
+        return len(rows)
+
+    def _log_rows(self, items: list) -> list:
+        """Get the log lines of the scanned items: log line items are kept and
+        the chunk items of log bundles are decompressed to one row per log line
+        (index items of log bundles hold no log lines)
+
+        Args
+            items: a list of deserialized items of the log table"""
+
+        # instanciate list of log lines
+        rows = []
+
+        # iterate over items
+        for item in items:
+            # log line item
+            if not item["timestamp"].startswith(BUNDLE_KEY_PREFIX):
+                rows.append(item)
+
+            # chunk item of a log bundle
+            elif "bundle" in item:
+                # decompress chunk (json lines)
+                raw = zlib.decompress(bytes(item["bundle"]))
+
+                # iterate over json lines
+                for line in raw.splitlines():
+                    # get log information
+                    timestamp, sequence, level, name, msg = json.loads(line)
+
+                    # add log line with the run id and TTL of the bundle
+                    rows.append(
+                        {
+                            "timestamp": timestamp,
+                            "log_file_sequence": sequence,
+                            "level": level,
+                            "name": name,
+                            "msg": msg,
+                            "run_id": item["timestamp"][len(BUNDLE_KEY_PREFIX) :],
+                            TTL_ATTRIBUTE: item.get(TTL_ATTRIBUTE),
+                        }
+                    )
+
+        return rows
+
+    def _write_partition(
+        self, df_partition: pd.DataFrame, path: str, compression: str
+    ) -> None:
+        """Write a partition as a Parquet file on a local folder or on S3"""
+
+        # convert DynamoDB numbers (decimals) to integers
+        df_partition = df_partition.astype(
+            {"log_file_sequence": "int64", TTL_ATTRIBUTE: "float64"}
+        )
+
+        # write parquet file to memory
+        buffer = io.BytesIO()
+        df_partition.to_parquet(buffer, index=False, compression=compression)
+
+        # destination is an S3 compatible store
+        if path.startswith("s3://"):
+            # split bucket and key
+            bucket, key = path[len("s3://") :].split("/", 1)
+
+            # create a service client for the S3 compatible store
+            s3 = boto3.client("s3", endpoint_url=self.s3_endpoint_url)
+
+            # put parquet file on the bucket
+            s3.put_object(Bucket=bucket, Key=key, Body=buffer.getvalue())
+
+        # destination is a local folder
+        else:
+            # create partition folder if needed
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            # write parquet file
+            with open(path, "wb") as parquet_file:
+                parquet_file.write(buffer.getvalue())
+
+    def _mark_items(self, items: list) -> None:
+        """Mark the given items as archived (ARCHIVED_ATTRIBUTE = archive time)"""
+
+        # creates a Table resource
+        table = boto3.resource("dynamodb").Table(self.table_name)
+
+        # define archive time
+        archived_at = int(time.time())
+
+        # open dynamodb client with context manaer
+        with table.batch_writer() as writer:
+            # iterate over archived items (log items never change -> put them again)
+            for item in items:
+                writer.put_item(Item={**item, ARCHIVED_ATTRIBUTE: archived_at})
+
+        # log an information
+        self.logger.info(
+            f"_mark_items method successfully called: {len(items)} items marked"
+        )
+
+    def _delete_items(self, items: list) -> None:
+        """Delete the given items from the log table"""
+
+        # creates a Table resource
+        table = boto3.resource("dynamodb").Table(self.table_name)
+
+        # open dynamodb client with context manaer
+        with table.batch_writer() as writer:
+            # iterate over archived items
+            for item in items:
+                # delete item
+                writer.delete_item(
+                    Key={
+                        "timestamp": item["timestamp"],
+                        "log_file_sequence": item["log_file_sequence"],
+                    }
+                )
+
+        # log an information
+        self.logger.info(
+            f"_delete_items method successfully called: {len(items)} items deleted"
+        )
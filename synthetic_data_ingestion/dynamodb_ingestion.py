@@ -1,12 +1,31 @@
 # import required libraries
 import os
 import re
+import json
+import zlib
 import boto3
 import logging
 import time
 import pandas as pd
 from datetime import datetime
 from dotenv import load_dotenv
+from boto3.dynamodb.conditions import Key
+from synthetic_data_ingestion import memory, tracing
+
+
+# maximum size (in bytes) of a compressed log bundle
+# (DynamoDB items are limited to 400 KB -> keep room for the other attributes)
+BUNDLE_MAX_BYTES = 350 * 1024
+
+# maximum size (in bytes) of raw log lines grouped before compression
+# (log lines usually compress ~10x, so start with big groups and split if needed)
+BUNDLE_RAW_BYTES = 8 * BUNDLE_MAX_BYTES
+
+# prefix of the partition key of log bundle items
+BUNDLE_KEY_PREFIX = "bundle#"
+
+# name of the attribute used by DynamoDB TTL to expire items
+TTL_ATTRIBUTE = "expires_at"
 
 
 class DynamodbIngestor:
@@ -39,8 +58,9 @@ class DynamodbIngestor:
         # define a attribute with logs_folder input
         self.logs_folder = logs_folder
 
-        # parse logs folder
-        self._parse_logs()
+        # parse logs folder (all log lines are kept in memory -> memory tracked)
+        with memory.track("dynamo.parse_logs"):
+            self._parse_logs()
 
         # set a flag to indicate that table was already created
         self._table_created_flag = True
@@ -53,8 +73,30 @@ class DynamodbIngestor:
             f"DynamodbIngestor object successfully instanciated: logs_folder = {logs_folder}"
         )
 
-    def send_logs(self) -> str:
-        """Send logs (in batch) to AWS DynamoDB"""
+    @tracing.traced("dynamo.send_logs")
+    def send_logs(
+        self, bundle: bool = False, run_id: str = None, ttl_days: int = None
+    ) -> str:
+        """Send logs (in batch) to AWS DynamoDB
+
+        Args
+            bundle: a boolean to send logs as compressed bundles (one index item
+                and a few chunk items per run) instead of one item per log line
+            run_id: a string to identify the run of the logs
+                (default: UTC timestamp of the call)
+            ttl_days: an integer with the number of days logs are kept on the table
+                (sets the TTL_ATTRIBUTE of every item; default: logs never expire)"""
+
+        # check if user input a run id
+        if run_id is None:
+            # set the UTC timestamp as default run id
+            run_id = datetime.utcnow().strftime("%Y:%m:%dZ%H:%M:%S")
+
+        # define attributes shared by all items
+        # (DynamoDB TTL expects the expiration time as epoch seconds)
+        extra_attributes = {}
+        if ttl_days is not None:
+            extra_attributes[TTL_ATTRIBUTE] = int(time.time()) + ttl_days * 86400
 
         # check if logs were not sent yet
         if not self._logs_sent:
@@ -65,23 +107,37 @@ class DynamodbIngestor:
                 # create a DynamoDB client
                 self._create_client()
 
-                # open dynamodb client with context manaer
-                with self.table.batch_writer() as writer:
-                    # iterate over all logs
-                    for log in self.all_logs:
-                        # send log
-                        writer.put_item(
-                            Item={
-                                "timestamp": log[0],  # log level
-                                "log_file_sequence": log[1],  # timestamp (in UTC)
-                                "level": log[2],  # log level
-                                "name": log[3],  # log name
-                                "msg": log[4],  # log message
-                            }
-                        )
+                # check if logs must be sent as compressed bundles
+                if bundle:
+                    # send logs as compressed bundles
+                    self._send_log_bundles(
+                        run_id=run_id, extra_attributes=extra_attributes
+                    )
+
+                # logs must be sent one item per log line
+                else:
+                    # open dynamodb client with context manaer
+                    with self.table.batch_writer() as writer:
+                        # iterate over all logs
+                        for log in self.all_logs:
+                            # send log
+                            writer.put_item(
+                                Item={
+                                    "timestamp": log[0],  # log level
+                                    "log_file_sequence": log[1],  # timestamp (in UTC)
+                                    "level": log[2],  # log level
+                                    "name": log[3],  # log name
+                                    "msg": log[4],  # log message
+                                    "run_id": run_id,  # run identifier
+                                    **extra_attributes,  # e.g. TTL attribute
+                                }
+                            )
 
             # exception on batch sending
             except Exception as e:
+                # mark the trace span as failed
+                tracing.record_error(str(e))
+
                 # log a warning
                 self.logger.critical(
                     f"send_logs method NOT successful: raised error ---> {e}"
@@ -92,6 +148,9 @@ class DynamodbIngestor:
             # log sent
             else:
 
+                # add rows (log lines) to the trace span
+                tracing.set_attributes(rows=len(self.all_logs), bundle=bundle)
+
                 # log an information
                 self.logger.info(f"send_logs method successfully called")
 
@@ -113,6 +172,119 @@ class DynamodbIngestor:
             # message to user
             return "Nothing was done once log were already sent"
 
+    def _send_log_bundles(self, run_id: str, extra_attributes: dict = None) -> None:
+        """Send parsed logs as compressed bundles: chunk items first
+        and then the index item of the run (so readers only find complete runs).
+        Bundle items carry the run id only in their partition key so that
+        they stay out of the run_id index of log lines
+
+        Args
+            run_id: a string to identify the run of the bundled logs
+            extra_attributes: a dict with attributes added to every item"""
+
+        # check if user input extra attributes
+        if extra_attributes is None:
+            # set no extra attributes
+            extra_attributes = {}
+
+        # group parsed logs into compressed chunks
+        chunks = self._bundle_logs()
+
+        # define the partition key shared by all items of the run
+        partition_key = f"{BUNDLE_KEY_PREFIX}{run_id}"
+
+        # open dynamodb client with context manaer
+        with self.table.batch_writer() as writer:
+            # iterate over chunks (sequence 0 is reserved for the index item)
+            for idx, (num_logs, raw_bytes, chunk) in enumerate(chunks, start=1):
+                # send chunk
+                writer.put_item(
+                    Item={
+                        "timestamp": partition_key,  # run partition key
+                        "log_file_sequence": idx,  # chunk sequence
+                        "num_logs": num_logs,  # log lines inside chunk
+                        "bundle": chunk,  # zlib compressed json lines
+                        **extra_attributes,  # e.g. TTL attribute
+                    }
+                )
+
+        # send the index item of the run
+        self.table.put_item(
+            Item={
+                "timestamp": partition_key,  # run partition key
+                "log_file_sequence": 0,  # index item sequence
+                "num_chunks": len(chunks),  # number of chunk items
+                "num_logs": len(self.all_logs),  # number of log lines
+                "raw_bytes": sum(c[1] for c in chunks),  # uncompressed size
+                "compressed_bytes": sum(len(c[2]) for c in chunks),  # stored size
+                "compression": "zlib",  # compression algorithm
+                "created_at": datetime.utcnow().strftime("%Y:%m:%dZ%H:%M:%S"),
+                **extra_attributes,  # e.g. TTL attribute
+            }
+        )
+
+        # log an information
+        self.logger.info(
+            f"_send_log_bundles method successfully called: run_id = {run_id}, chunks = {len(chunks)}"
+        )
+
+    def _bundle_logs(self) -> list:
+        """Group parsed logs into zlib compressed chunks of json lines
+        whose size stays below BUNDLE_MAX_BYTES
+
+        Return
+            chunks: a list of (number of logs, raw bytes, compressed bytes) tuples"""
+
+        # serialize each log as a json line
+        lines = [json.dumps(log).encode("UTF-8") + b"\n" for log in self.all_logs]
+
+        # instanciate list of line groups and the group being filled
+        groups, group, group_bytes = [], [], 0
+
+        # iterate over serialized lines
+        for line in lines:
+            # close the group if the line makes it bigger than allowed
+            if group and group_bytes + len(line) > BUNDLE_RAW_BYTES:
+                groups.append(group)
+                group, group_bytes = [], 0
+
+            # add line to the group being filled
+            group.append(line)
+            group_bytes += len(line)
+
+        # add the last group (if any)
+        if group:
+            groups.append(group)
+
+        # instanciate final chunks list
+        chunks = []
+
+        # iterate over groups while there are groups to compress
+        while groups:
+            # take the first group
+            group = groups.pop(0)
+            # join group lines
+            raw = b"".join(group)
+            # compress joined lines
+            compressed = zlib.compress(raw, 9)
+
+            # compressed group fits inside a DynamoDB item
+            if len(compressed) <= BUNDLE_MAX_BYTES:
+                chunks.append((len(group), len(raw), compressed))
+
+            # group has more than one line -> split it in half and try again
+            elif len(group) > 1:
+                half = len(group) // 2
+                groups[:0] = [group[:half], group[half:]]
+
+            # a single log line can't fit inside a DynamoDB item
+            else:
+                raise ValueError(
+                    f"log line with {len(raw)} bytes can't fit inside a DynamoDB item"
+                )
+
+        return chunks
+
     def _create_client(self) -> None:
         """Create a client to connect with AWS DynamoDB"""
 
@@ -330,3 +502,108 @@ class DynamodbIngestor:
             )
 
             return "_delete_logs method successfully called: not log was deleted once none was already sent to DynamoDB"
+
+
+class DynamodbLogBundleReader:
+    def __init__(self, log_folder: str = None) -> None:
+        """Instanciate a reader of the log bundles sent by
+        DynamodbIngestor.send_logs(bundle=True)
+
+        Args
+            log_folder: a string with the path to store logs"""
+
+        # instanciate logger
+        self.logger = logging.getLogger("dynamodb_ingestion.py")
+
+        # define log date in utc
+        logging.Formatter.converter = time.gmtime
+
+        # check if user input a folder to store logs
+        if log_folder is None:
+            # set a default folder
+            log_folder = "../logs"
+
+        # define logging configuration
+        logging.basicConfig(
+            filename=f"{log_folder}/data_ingestion-{datetime.utcnow().date()}.log",
+            level=logging.INFO,
+            format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+            datefmt="%Y:%m:%d %H:%M:%S",
+        )
+
+        # take environment variables from .env.
+        load_dotenv()
+
+        # create a resource service client
+        dynamodb = boto3.resource("dynamodb")
+
+        # creates a Table resource
+        self.table = dynamodb.Table(os.environ["AWS_DYNAMODB_TABLE"])
+
+        # log an information
+        self.logger.info("DynamodbLogBundleReader object successfully instanciated")
+
+    def get_index(self, run_id: str) -> dict:
+        """Get the index item of the given run (None if run was not found)
+
+        Args
+            run_id: a string with the run identifier used on send_logs"""
+
+        # get index item of the run
+        response = self.table.get_item(
+            Key={"timestamp": f"{BUNDLE_KEY_PREFIX}{run_id}", "log_file_sequence": 0}
+        )
+
+        return response.get("Item")
+
+    def stream_logs(self, run_id: str):
+        """Decompress and yield the logs of the given run, in the order they were
+        parsed, as (timestamp, log_file_sequence, level, name, msg) tuples
+
+        Args
+            run_id: a string with the run identifier used on send_logs"""
+
+        # get index item of the run
+        index = self.get_index(run_id)
+
+        # run was not found
+        if index is None:
+            # log a warning
+            self.logger.warning(
+                f"stream_logs method called: no log bundle found for run_id = {run_id}"
+            )
+
+            return
+
+        # define query params -> only chunk items of the given run
+        query_params = {
+            "KeyConditionExpression": Key("timestamp").eq(
+                f"{BUNDLE_KEY_PREFIX}{run_id}"
+            )
+            & Key("log_file_sequence").between(1, int(index["num_chunks"])),
+        }
+
+        # iterate over query pages
+        while True:
+            # query chunk items
+            response = self.table.query(**query_params)
+
+            # iterate over chunk items
+            for item in response["Items"]:
+                # decompress chunk (boto3 returns a Binary wrapper)
+                raw = zlib.decompress(bytes(item["bundle"]))
+
+                # iterate over json lines
+                for line in raw.splitlines():
+                    # yield log as a tuple
+                    yield tuple(json.loads(line))
+
+            # check if there are more pages
+            if "LastEvaluatedKey" not in response:
+                break
+
+            # start next page where the last one stopped
+            query_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        # log an information
+        self.logger.info(f"stream_logs method successfully called: run_id = {run_id}")
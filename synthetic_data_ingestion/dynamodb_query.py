@@ -0,0 +1,459 @@
+# import required libraries
+import os
+import boto3
+import logging
+import time
+import threading
+import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from dotenv import load_dotenv
+from boto3.dynamodb.conditions import Key, Attr
+
+
+# global secondary indexes of the log table
+# (index name -> (partition key, sort key))
+LOG_INDEXES = {
+    "run_id-timestamp-index": ("run_id", "timestamp"),
+    "level-timestamp-index": ("level", "timestamp"),
+    "name-timestamp-index": ("name", "timestamp"),
+}
+
+# interval and timeout (in seconds) of the polls of a created index status
+# (new indexes are CREATING while DynamoDB backfills them)
+INDEX_POLL_INTERVAL = 5
+INDEX_POLL_TIMEOUT = 3600
+
+# default time (in seconds) that the logs of a run are kept on the LRU cache
+# (a run may still be sending logs -> cached logs are refreshed)
+DEFAULT_CACHE_TTL = 300
+
+
+class DynamodbLogQuery:
+    def __init__(
+        self,
+        log_folder: str = None,
+        cache_size: int = 0,
+        max_workers: int = 4,
+        cache_ttl: float = DEFAULT_CACHE_TTL,
+    ) -> None:
+        """Instanciate a query client for the logs sent by DynamodbIngestor
+
+        Args
+            log_folder: a string with the path to store logs
+            cache_size: an integer with the number of runs kept on a local
+                LRU cache (0 = no cache)
+            max_workers: an integer with the maximum number of parallel queries
+            cache_ttl: a number of seconds that the logs of a run are cached"""
+
+        # instanciate logger
+        self.logger = logging.getLogger("dynamodb_query.py")
+
+        # define log date in utc
+        logging.Formatter.converter = time.gmtime
+
+        # check if user input a folder to store logs
+        if log_folder is None:
+            # set a default folder
+            log_folder = "../logs"
+
+        # define logging configuration
+        logging.basicConfig(
+            filename=f"{log_folder}/data_ingestion-{datetime.utcnow().date()}.log",
+            level=logging.INFO,
+            format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+            datefmt="%Y:%m:%d %H:%M:%S",
+        )
+
+        # take environment variables from .env.
+        load_dotenv()
+
+        # define table name -> raise error if not found
+        self.table_name = os.environ["AWS_DYNAMODB_TABLE"]
+
+        # create a resource service client
+        dynamodb = boto3.resource("dynamodb")
+
+        # creates a Table resource
+        self.table = dynamodb.Table(self.table_name)
+
+        # boto3 resources are not thread safe -> one Table resource per query thread
+        self._local = threading.local()
+
+        # define cache size, time to live and the LRU cache of runs
+        # (run_id -> (cache time, list of logs)) shared by the query threads
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._run_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        # define maximum number of parallel queries
+        self.max_workers = max_workers
+
+        # log an information
+        self.logger.info(
+            f"DynamodbLogQuery object successfully instanciated: cache_size = {cache_size}"
+        )
+
+    def create_indexes(self) -> str:
+        """Create the missing global secondary indexes (LOG_INDEXES) on the log table.
+        DynamoDB only allows one index creation per table update, so indexes
+        are created one at a time, waiting for every index to be active in between"""
+
+        # try to create indexes
+        try:
+            # get a low level client from the table resource
+            client = self.table.meta.client
+
+            # get names of the existing indexes
+            existing = {
+                index["IndexName"]
+                for index in client.describe_table(TableName=self.table_name)[
+                    "Table"
+                ].get("GlobalSecondaryIndexes", [])
+            }
+
+            # instanciate list of created indexes
+            created = []
+
+            # iterate over project indexes
+            for index_name, (hash_key, range_key) in LOG_INDEXES.items():
+                # index already exists -> nothing to do
+                if index_name in existing:
+                    continue
+
+                # create index
+                client.update_table(
+                    TableName=self.table_name,
+                    AttributeDefinitions=[
+                        {"AttributeName": hash_key, "AttributeType": "S"},
+                        {"AttributeName": range_key, "AttributeType": "S"},
+                    ],
+                    GlobalSecondaryIndexUpdates=[
+                        {
+                            "Create": {
+                                "IndexName": index_name,
+                                "KeySchema": [
+                                    {"AttributeName": hash_key, "KeyType": "HASH"},
+                                    {"AttributeName": range_key, "KeyType": "RANGE"},
+                                ],
+                                "Projection": {"ProjectionType": "ALL"},
+                            }
+                        }
+                    ],
+                )
+
+                # wait for the index backfill before the next update
+                # (the table is active while its new index is still CREATING)
+                self._wait_indexes_active(client)
+
+                # add index to created list
+                created.append(index_name)
+
+        # exception on index creation
+        except Exception as e:
+            # log a warning
+            self.logger.critical(
+                f"create_indexes method NOT successful: raised error ---> {e}"
+            )
+
+            return f"create_indexes method NOT successful: raised error ---> {e}"
+
+        # indexes created
+        else:
+            # log an information
+            self.logger.info(
+                f"create_indexes method successfully called: created = {created}"
+            )
+
+            return "create_indexes method successfully called"
+
+    def _wait_indexes_active(self, client) -> None:
+        """Poll the table description until every global secondary index is ACTIVE
+
+        Args
+            client: a boto3 DynamoDB client"""
+
+        # define time limit of the polls
+        deadline = time.monotonic() + INDEX_POLL_TIMEOUT
+
+        # iterate over polls
+        while True:
+            # get status of the table indexes
+            statuses = [
+                index["IndexStatus"]
+                for index in client.describe_table(TableName=self.table_name)[
+                    "Table"
+                ].get("GlobalSecondaryIndexes", [])
+            ]
+
+            # all indexes are active
+            if all(status == "ACTIVE" for status in statuses):
+                return
+
+            # validate poll time -> indexes are active before the deadline
+            if time.monotonic() > deadline:
+                # raise timeout error with problem indication
+                raise TimeoutError(
+                    f"indexes of {self.table_name} not active after {INDEX_POLL_TIMEOUT} s: {statuses}"
+                )
+
+            # wait for the next poll
+            time.sleep(INDEX_POLL_INTERVAL)
+
+    def query_page(
+        self,
+        index_name: str,
+        key_value: str,
+        start: str = None,
+        end: str = None,
+        limit: int = None,
+        start_key: dict = None,
+        level: str = None,
+        run_id: str = None,
+    ) -> dict:
+        """Query one page of logs of the given index
+
+        Args
+            index_name: a string with one of the LOG_INDEXES names
+            key_value: a string with the value of the index partition key
+            start: a string or datetime with the first timestamp (included)
+            end: a string or datetime with the last timestamp (included)
+            limit: an integer with the maximum number of items evaluated
+            start_key: a dict with the "last_key" of the previous page
+            level: a string to filter logs by level
+            run_id: a string to filter logs by run
+
+        Return
+            page: a dict with the "items" of the page and the "last_key"
+                to get the next page (None if this is the last page)"""
+
+        # get index keys
+        hash_key, range_key = LOG_INDEXES[index_name]
+
+        # define key condition on the index partition key
+        key_condition = Key(hash_key).eq(key_value)
+
+        # add a timestamp condition if an interval was given
+        if (start is not None) or (end is not None):
+            key_condition = key_condition & Key(range_key).between(
+                self._format_timestamp(start, "0000:00:00Z00:00:00"),
+                self._format_timestamp(end, "9999:99:99Z99:99:99"),
+            )
+
+        # define query params
+        query_params = {
+            "IndexName": index_name,
+            "KeyConditionExpression": key_condition,
+        }
+
+        # define filters on non-key attributes (evaluated by DynamoDB)
+        filters = [
+            Attr(attribute).eq(value)
+            for attribute, value in [("level", level), ("run_id", run_id)]
+            if value is not None
+        ]
+
+        # add optional params
+        if filters:
+            query_params["FilterExpression"] = functools.reduce(
+                lambda left, right: left & right, filters
+            )
+        if limit is not None:
+            query_params["Limit"] = limit
+        if start_key is not None:
+            query_params["ExclusiveStartKey"] = start_key
+
+        # query the index
+        response = self._thread_table().query(**query_params)
+
+        return {
+            "items": response["Items"],
+            "last_key": response.get("LastEvaluatedKey"),
+        }
+
+    def query_all(self, index_name: str, key_value: str, **kwargs) -> list:
+        """Query all pages of logs of the given index
+
+        Args
+            index_name: a string with one of the LOG_INDEXES names
+            key_value: a string with the value of the index partition key
+            kwargs: other query_page params (start, end, limit, level, run_id)"""
+
+        # instanciate list of logs and the key of the next page
+        items, start_key = [], None
+
+        # iterate over pages
+        while True:
+            # query page
+            page = self.query_page(index_name, key_value, start_key=start_key, **kwargs)
+            # add page items
+            items.extend(page["items"])
+
+            # check if there are more pages
+            if page["last_key"] is None:
+                break
+
+            # start next page where the last one stopped
+            start_key = page["last_key"]
+
+        return items
+
+    def query_run(self, run_id: str, level: str = None) -> list:
+        """Query all logs of the given run, sorted by timestamp.
+        Recent runs are kept on the local LRU cache (if enabled) for cache_ttl
+        seconds, so logs sent later by an open run are still returned
+
+        Args
+            run_id: a string with the run identifier used on send_logs
+            level: a string to filter logs by level"""
+
+        # get cached logs of the run (None if not cached or expired)
+        items = self._cached_run(run_id)
+
+        # run is not cached
+        if items is None:
+            # query all logs of the run
+            items = self.query_all("run_id-timestamp-index", run_id)
+
+            # check if cache is enabled
+            if self.cache_size > 0:
+                with self._cache_lock:
+                    # cache logs of the run
+                    self._run_cache[run_id] = (time.monotonic(), items)
+                    self._run_cache.move_to_end(run_id)
+
+                    # evict the least recently used runs
+                    while len(self._run_cache) > self.cache_size:
+                        self._run_cache.popitem(last=False)
+
+        # filter by level if required
+        if level is not None:
+            items = [item for item in items if item["level"] == level]
+
+        # log an information
+        self.logger.info(
+            f"query_run method successfully called: run_id = {run_id}, level = {level}"
+        )
+
+        return items
+
+    def _cached_run(self, run_id: str) -> list:
+        """Get the cached logs of the given run (None if not cached or expired)"""
+
+        with self._cache_lock:
+            # run is not cached
+            if run_id not in self._run_cache:
+                return None
+
+            # get cache time and logs
+            cached_at, items = self._run_cache[run_id]
+
+            # cached logs expired -> remove them
+            if time.monotonic() - cached_at > self.cache_ttl:
+                del self._run_cache[run_id]
+                return None
+
+            # mark run as recently used
+            self._run_cache.move_to_end(run_id)
+
+            return items
+
+    def query_levels(
+        self, levels: list, start: str = None, end: str = None, run_id: str = None
+    ) -> list:
+        """Query logs of the given levels (one parallel query per level),
+        sorted by timestamp
+
+        Args
+            levels: a list of strings with log levels (e.g. ["CRITICAL", "WARNING"])
+            start: a string or datetime with the first timestamp (included)
+            end: a string or datetime with the last timestamp (included)
+            run_id: a string to filter logs by run"""
+
+        # query levels in parallel (logs of other runs are filtered by DynamoDB)
+        items = self._query_parallel(
+            "level-timestamp-index", levels, start, end, run_id=run_id
+        )
+
+        # log an information
+        self.logger.info(f"query_levels method successfully called: levels = {levels}")
+
+        return items
+
+    def query_modules(self, names: list, start: str = None, end: str = None) -> list:
+        """Query logs of the given modules (one parallel query per module),
+        sorted by timestamp
+
+        Args
+            names: a list of strings with logger names (e.g. ["rds_ingestion.py"])
+            start: a string or datetime with the first timestamp (included)
+            end: a string or datetime with the last timestamp (included)"""
+
+        # query modules in parallel
+        items = self._query_parallel("name-timestamp-index", names, start, end)
+
+        # log an information
+        self.logger.info(f"query_modules method successfully called: names = {names}")
+
+        return items
+
+    def clear_cache(self) -> None:
+        """Remove all runs from the local LRU cache"""
+
+        # remove cached runs
+        with self._cache_lock:
+            self._run_cache.clear()
+
+    def _query_parallel(
+        self, index_name: str, key_values: list, start: str, end: str, **filters
+    ) -> list:
+        """Query all pages of each key value in parallel and merge results by timestamp
+        (filters are query_page filters, e.g. run_id)"""
+
+        # open a thread pool with context manager
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # query each key value on its own thread
+            results = executor.map(
+                lambda key_value: self.query_all(
+                    index_name, key_value, start=start, end=end, **filters
+                ),
+                key_values,
+            )
+
+            # merge results
+            items = [item for result in results for item in result]
+
+        # sort merged logs by timestamp and log sequence
+        return sorted(
+            items, key=lambda item: (item["timestamp"], item["log_file_sequence"])
+        )
+
+    def _thread_table(self):
+        """Get the Table resource of the current thread"""
+
+        # main thread -> use the object table
+        if threading.current_thread() is threading.main_thread():
+            return self.table
+
+        # create a Table resource for the thread if needed
+        if not hasattr(self._local, "table"):
+            self._local.table = (
+                boto3.session.Session().resource("dynamodb").Table(self.table_name)
+            )
+
+        return self._local.table
+
+    def _format_timestamp(self, value, default: str) -> str:
+        """Convert a datetime to the timestamp format of the log table"""
+
+        # no value given -> use default
+        if value is None:
+            return default
+
+        # datetime given -> convert it to the log table format
+        if isinstance(value, datetime):
+            return value.strftime("%Y:%m:%dZ%H:%M:%S")
+
+        return value
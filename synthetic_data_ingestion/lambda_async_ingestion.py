@@ -0,0 +1,185 @@
+# import required libraries
+import os
+import time
+import asyncio
+import logging
+import httpx
+from datetime import datetime
+from synthetic_data_ingestion.lambda_ingestion import (
+    LambdaIngestor,
+    DEFAULT_TIMEOUT,
+    DEFAULT_UPLOAD_BYTES,
+    _parse_response,
+)
+
+
+# default maximum number of reports sent at the same time
+DEFAULT_MAX_CONCURRENCY = 10
+
+
+class AsyncLambdaIngestor:
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        timeout: tuple = DEFAULT_TIMEOUT,
+        log_folder: str = None,
+        transport: httpx.AsyncBaseTransport = None,
+        upload_threshold: int = DEFAULT_UPLOAD_BYTES,
+    ) -> None:
+        """Send the reports of many SynthCustomers objects to AWS Lambda API
+        concurrently (asyncio + httpx), so the wall time of N reports approaches
+        the latency of the slowest one instead of the sum of all latencies
+
+        Args
+            max_concurrency: an integer with the maximum number of reports in flight
+            timeout: a (connect, read) tuple with per request timeouts in seconds
+            log_folder: a string with the path to store logs
+            transport: a httpx transport (e.g. httpx.MockTransport on tests)
+            upload_threshold: an integer with the size (in bytes) above which reports
+                are uploaded directly to S3 (presigned urls, as LambdaIngestor does)
+                instead of sent on the request body"""
+
+        # instanciate logger
+        self.logger = logging.getLogger("lambda_async_ingestion.py")
+
+        # define log date in utc
+        logging.Formatter.converter = time.gmtime
+
+        # check if user input a folder to store logs
+        if log_folder is None:
+            # set a default folder
+            log_folder = "../logs"
+
+        # define logging configuration
+        logging.basicConfig(
+            filename=f"{log_folder}/data_ingestion-{datetime.utcnow().date()}.log",
+            level=logging.INFO,
+            format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+            datefmt="%Y:%m:%d %H:%M:%S",
+        )
+
+        # define concurrency limit, timeouts and transport
+        self.max_concurrency = max_concurrency
+        self.timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        self.transport = transport
+
+        # keep log folder and upload threshold to instanciate the LambdaIngestor objects
+        self.log_folder = log_folder
+        self.upload_threshold = upload_threshold
+
+        # log an information
+        self.logger.info(
+            f"AsyncLambdaIngestor object successfully instanciated: max_concurrency = {max_concurrency}"
+        )
+
+    async def send_reports(self, cohorts: list) -> list:
+        """Send the report of each cohort concurrently to the /sampling_report endpoint
+
+        Args
+            cohorts: a list of synthetic_data_ingestion.sample_creator.SynthCustomers
+                objects (after generate_samples and generate_report methods)
+
+        Return
+            results: a list (in the cohorts order) of dicts with the "group",
+                the "status_code" (None on errors) and the "response" of each report"""
+
+        # validate cohorts and convert their reports to json
+        # (raises the LambdaIngestor exceptions on invalid cohorts)
+        ingestors = [
+            LambdaIngestor(
+                cohort, self.log_folder, upload_threshold=self.upload_threshold
+            )
+            for cohort in cohorts
+        ]
+        for ingestor in ingestors:
+            ingestor._jsonify_report()
+
+        # load environmental variables -> raise error if not found
+        LAMBDA_URL = os.environ["AWS_LAMBDA_API"]
+
+        # limit number of reports in flight
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        # open a client with a pool of keep-alive connections
+        async with httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+            ),
+            transport=self.transport,
+        ) as client:
+            # send all reports concurrently and gather results in the cohorts order
+            results = await asyncio.gather(
+                *[
+                    self._send_report(client, semaphore, LAMBDA_URL, ingestor)
+                    for ingestor in ingestors
+                ]
+            )
+
+        # log an information
+        self.logger.info(
+            f"send_reports method successfully called: {sum(r['status_code'] == 200 for r in results)}/{len(results)} reports sent"
+        )
+
+        return results
+
+    def send_reports_sync(self, cohorts: list) -> list:
+        """Run send_reports from synchronous code (e.g. an Airflow task)
+
+        Args
+            cohorts: a list of synthetic_data_ingestion.sample_creator.SynthCustomers objects"""
+
+        return asyncio.run(self.send_reports(cohorts))
+
+    async def _send_report(
+        self,
+        client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+        lambda_url: str,
+        ingestor: LambdaIngestor,
+    ) -> dict:
+        """Send one report, waiting for a free slot of the concurrency limit.
+        Large reports are uploaded directly to S3 with the LambdaIngestor upload
+        (blocking requests -> run on the default thread pool of the event loop)"""
+
+        # group of the report
+        group = ingestor.raw_report["group"]
+
+        # wait for a free slot
+        async with semaphore:
+            # try to send data to api
+            try:
+                # large report -> upload it directly to S3
+                if len(ingestor.json_report) > ingestor.upload_threshold:
+                    r = await asyncio.get_running_loop().run_in_executor(
+                        None, ingestor._upload_report, lambda_url
+                    )
+
+                # make request
+                else:
+                    r = await client.post(
+                        f"{lambda_url}/sampling_report",
+                        content=ingestor.json_report,
+                        headers=ingestor._request_headers(),
+                    )
+
+            # in case of errors when sending (including timeouts)
+            except Exception as e:
+                # log an crictical
+                self.logger.critical(
+                    f"_send_report method raised the following error ---> {e!r}"
+                )
+
+                return {"group": group, "status_code": None, "response": repr(e)}
+
+        # parse response from lambda api
+        response = _parse_response(r)
+
+        # log status of the report
+        if r.status_code == 200:
+            self.logger.info(f"_send_report method successfully called: {response}")
+        else:
+            self.logger.critical(f"_send_report method called: {response}")
+
+        return {"group": group, "status_code": r.status_code, "response": response}
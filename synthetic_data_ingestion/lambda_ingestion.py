@@ -3,40 +3,194 @@ import os
 import boto3
 import logging
 import time
-import json
-import numpy as np
+import threading
+import uuid
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from synthetic_data_ingestion import tracing
+from synthetic_data_ingestion.cohort import Cohort, to_builtin
 from synthetic_data_ingestion.sample_creator import SynthCustomers
+from synthetic_data_ingestion.serializers import get_serializer
 
+# re-export of NpEncoder (moved to serializers.py): keeps
+# "from synthetic_data_ingestion.lambda_ingestion import NpEncoder" working
+from synthetic_data_ingestion.serializers import NpEncoder
 
-class NpEncoder(json.JSONEncoder):
-    """Custom encoder for json.dumps so as to avoid errors similar to:
-    'Encoder Object of type int64 is not JSON serializable'"""
 
-    def default(self, obj):
-        # if item is numpy integer
-        if isinstance(obj, np.integer):
-            return int(obj)
-        # if item is numpy float
-        if isinstance(obj, np.floating):
-            return float(obj)
-        # if item is numpy array
-        if isinstance(obj, np.ndarray):
-            return obj.tolist()
-        return super(NpEncoder, self).default(obj)
+# take environment variables from .env (once per process)
+load_dotenv()
+
+# default (connect, read) timeouts in seconds of requests to AWS Lambda API
+DEFAULT_TIMEOUT = (3.05, 30)
+
+# default thresholds to flush a batch of reports
+# (AWS Lambda limits request payloads to 6 MB)
+DEFAULT_BATCH_REPORTS = 100
+DEFAULT_BATCH_BYTES = 1024 * 1024
+
+# reports above this size (in bytes) are uploaded directly to S3 with presigned
+# urls negotiated with the AWS Lambda API (AWS Lambda limits request payloads to 6 MB)
+DEFAULT_UPLOAD_BYTES = 5 * 1024 * 1024
+
+# default number of parts of a multipart upload sent at the same time
+DEFAULT_UPLOAD_WORKERS = 4
+
+# start of the error messages of the AWS Lambda API (sent with status code 200)
+API_ERROR_PREFIX = "The following error was raised on API"
+
+# HTTP status codes retried with exponential backoff
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# sessions shared by all LambdaIngestor objects of the process, one per
+# get_session params (keeps TLS connections alive between reports)
+_sessions = {}
+_session_lock = threading.Lock()
+
+
+class IdempotentRetryAdapter(HTTPAdapter):
+    """HTTPAdapter that retries POST requests on RETRY_STATUS_CODES and read errors
+    only when they send an Idempotency-Key (the API runs a repeated key once);
+    other POST requests are retried only on connection errors (never sent)"""
+
+    def __init__(self, idempotent_retry: Retry, **kwargs) -> None:
+        """Class constructor
+
+        Args
+            idempotent_retry: a urllib3 Retry used by POST requests with an Idempotency-Key
+            kwargs: the HTTPAdapter params (max_retries of the other requests)"""
+
+        super().__init__(**kwargs)
+
+        # adapter of the POST requests with an Idempotency-Key
+        # (same connection pool -> same keep-alive connections)
+        self.idempotent_adapter = HTTPAdapter(max_retries=idempotent_retry)
+        self.idempotent_adapter.poolmanager = self.poolmanager
+
+    def send(self, request, **kwargs) -> requests.Response:
+        # POST with an Idempotency-Key -> safe to repeat
+        if (request.method == "POST") and ("Idempotency-Key" in request.headers):
+            return self.idempotent_adapter.send(request, **kwargs)
+
+        return super().send(request, **kwargs)
+
+
+def get_session(
+    pool_maxsize: int = 10, max_retries: int = 3, backoff_factor: float = 0.5
+) -> requests.Session:
+    """Get the requests session shared by all LambdaIngestor objects of the process
+    (one session per params). It is created on the first call with these params,
+    with a keep-alive connection pool and retries with exponential backoff for
+    RETRY_STATUS_CODES and connection errors (POST requests only with an
+    Idempotency-Key, see IdempotentRetryAdapter)
+
+    Args
+        pool_maxsize: an integer with the maximum number of connections kept alive
+        max_retries: an integer with the maximum number of retries per request
+        backoff_factor: a float with the backoff factor between retries
+            (sleeps backoff_factor * 2 ** (retry - 1) seconds)"""
+
+    # define session params
+    params = (pool_maxsize, max_retries, backoff_factor)
+
+    # create each session only once (even if called from many threads)
+    with _session_lock:
+        # session was not created yet
+        if params not in _sessions:
+            # define retry strategy (idempotent methods)
+            retry = Retry(
+                total=max_retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=RETRY_STATUS_CODES,
+                allowed_methods=frozenset(["GET", "PUT"]),
+                raise_on_status=False,  # return the last response after all retries
+            )
+
+            # define an adapter with a pool of keep-alive connections
+            adapter = IdempotentRetryAdapter(
+                retry.new(allowed_methods=retry.allowed_methods | {"POST"}),
+                pool_connections=pool_maxsize,
+                pool_maxsize=pool_maxsize,
+                max_retries=retry,
+            )
+
+            # create the session and mount the adapter for both schemes
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+
+            # keep the session of the params
+            _sessions[params] = session
+
+        return _sessions[params]
+
+
+def new_idempotency_key() -> str:
+    """Get a new random idempotency key: distinct reports (even with the same
+    content, e.g. two cohorts with the same params) never share a key, while
+    retries of the same request reuse the key they were sent with"""
+
+    return uuid.uuid4().hex
+
+
+def _parse_response(r):
+    """Get the json content of the given response
+    (or its text if the response is not a json, e.g. a gateway error page)"""
+
+    # try to parse json content
+    try:
+        return r.json()
+
+    # response is not a json
+    except ValueError:
+        return r.text
+
+
+def _is_success(r, response) -> bool:
+    """Check if a request to the AWS Lambda API succeeded: status code 200
+    and not an error message of the API (also sent with status code 200)
+
+    Args
+        r: a requests.Response
+        response: the content of the response parsed by _parse_response"""
+
+    return (r.status_code == 200) and not (
+        isinstance(response, str) and response.startswith(API_ERROR_PREFIX)
+    )
 
 
 class LambdaIngestor:
     def __init__(
-        self, synth_customer_object: SynthCustomers, log_folder: str = None
+        self,
+        synth_customer_object: SynthCustomers,
+        log_folder: str = None,
+        timeout: tuple = DEFAULT_TIMEOUT,
+        session: requests.Session = None,
+        serializer: str = "json",
+        idempotency_key: str = None,
+        upload_threshold: int = DEFAULT_UPLOAD_BYTES,
+        upload_workers: int = DEFAULT_UPLOAD_WORKERS,
     ) -> None:
         """Save the synth_customer_object input in the LambdaIngestor object
 
         Args
-            synth_customer_object: a synthetic_data_ingestion.sample_creator.SynthCustomers object
-            log_folder: a string with the path to store logs"""
+            synth_customer_object: a synthetic_data_ingestion.cohort.Cohort object (returned by
+                generate_samples) or a synthetic_data_ingestion.sample_creator.SynthCustomers object
+            log_folder: a string with the path to store logs
+            timeout: a (connect, read) tuple with request timeouts in seconds
+            session: a requests.Session to send reports (default: get_session())
+            serializer: a string with the json serializer name used on reports
+                ("json" = orjson if installed, else "stdlib-json"; the AWS Lambda
+                API only accepts json reports)
+            idempotency_key: a string sent on the Idempotency-Key header, e.g. based
+                on the Airflow run id and the map index of the cohort
+                (default: a random key created with the object)
+            upload_threshold: an integer with the size (in bytes) above which reports
+                are uploaded directly to S3 (presigned urls) instead of sent on the request body
+            upload_workers: an integer with the number of parts uploaded at the same time"""
 
         # instanciate logger
         self.logger = logging.getLogger("lambda_ingestion.py")
@@ -57,49 +211,25 @@ class LambdaIngestor:
             datefmt="%Y:%m:%d %H:%M:%S",
         )
 
-        # check if synth_customer_object param is
-        # a synthetic_data_ingestion.sample_creator.SynthCustomers object
-        if type(synth_customer_object) != SynthCustomers:
+        # check if synth_customer_object param is a synthetic_data_ingestion.cohort.Cohort
+        # or a synthetic_data_ingestion.sample_creator.SynthCustomers object
+        if not isinstance(synth_customer_object, (Cohort, SynthCustomers)):
 
             # log a warning
             self.logger.critical(
-                "LambdaIngestor object NOT instanciated: synth_customer_object param is NOT a synthetic_data_ingestion.sample_creator.SynthCustomers object"
+                "LambdaIngestor object NOT instanciated: synth_customer_object param is NOT a synthetic_data_ingestion.cohort.Cohort or a synthetic_data_ingestion.sample_creator.SynthCustomers object"
             )
 
             raise Exception(
-                "LambdaIngestor object NOT instanciated: synth_customer_object param must be a synthetic_data_ingestion.sample_creator.SynthCustomers object"
+                "LambdaIngestor object NOT instanciated: synth_customer_object param must be a synthetic_data_ingestion.cohort.Cohort or a synthetic_data_ingestion.sample_creator.SynthCustomers object"
             )
 
-        # define attributes of a SynthCustomers object
-        # after generate_samples and generate_report methods
-        # have been called
-        required_attributes = {
-            "gamma_shape",
-            "gamma_scale",
-            "poisson_lambda",
-            "region",
-            "region_weights",
-            "gender",
-            "gender_weights",
-            "device",
-            "device_weights",
-            "groups",
-            "logger",
-            "group",
-            "num_samples",
-            "sampling_dict",
-            "sampling_created",
-            "random_shape",
-            "random_scale",
-            "random_lam",
-            "gen_date_utc",
-            "creation_report",
-        }
-
-        # check if synth_customer_object param has all attributes that
-        # a SynthCustomers object has after generate_samples and generate_report methods
-        # have been called
-        if set(synth_customer_object.__dict__.keys()) != required_attributes:
+        # check if synth_customer_object param has all attributes of a Cohort object
+        # (a SynthCustomers object has them after generate_samples and generate_report
+        # methods have been called; other attributes are not needed)
+        if not all(
+            hasattr(synth_customer_object, attribute) for attribute in Cohort.__slots__
+        ):
 
             # log a warning
             self.logger.critical(
@@ -111,19 +241,65 @@ class LambdaIngestor:
             )
 
         # instanciate SynthCustomers object with the input params
-        self.raw_report = synth_customer_object.creation_report
+        # (a plain copy of the report -> serializable and safe to change)
+        self.raw_report = to_builtin(synth_customer_object.creation_report)
+
+        # define request timeouts
+        self.timeout = timeout
+
+        # define session used to send reports
+        self.session = session if session is not None else get_session()
+
+        # define serializer of reports
+        self.serializer = get_serializer(serializer)
+
+        # validate user input -> json serializer (reports are sent as json text)
+        if self.serializer.content_type != "application/json":
+
+            # log a critical
+            self.logger.critical(
+                f"LambdaIngestor object NOT instanciated: {serializer} serializer is not a json serializer"
+            )
+
+            # raise value error with problem indication
+            raise ValueError(
+                f"serializer param must be a json serializer (the AWS Lambda API only accepts json reports): got {serializer}"
+            )
+
+        # define idempotency key of the report (unique per LambdaIngestor object)
+        self.idempotency_key = (
+            idempotency_key if idempotency_key is not None else new_idempotency_key()
+        )
+
+        # define large report upload params
+        self.upload_threshold = upload_threshold
+        self.upload_workers = upload_workers
 
         # log an information
         self.logger.info(f"LambdaIngestor object successfully instanciated")
 
-    def send_report_to_lambda(self) -> str:
-        """Get the raw report, convert to json and send to AWS Lambda API"""
+    @tracing.traced("lambda.send_report_to_lambda")
+    def send_report_to_lambda(self, batcher=None) -> str:
+        """Get the raw report, convert to json and send to AWS Lambda API
+
+        Args
+            batcher: a LambdaReportBatcher to buffer the report and send it
+                with other reports in a single request (default: send now)"""
+
+        # check if report must be batched
+        if batcher is not None:
+            # buffer report on the batcher
+            return batcher.add(self)
 
         # convert raw_report to a json report
         self._jsonify_report()
 
-        # take environment variables from .env.
-        load_dotenv()
+        # add report bytes and transport to the trace span
+        tracing.set_attributes(
+            group=self.raw_report["group"],
+            bytes=len(self.json_report),
+            upload=len(self.json_report) > self.upload_threshold,
+        )
 
         # try to send data to api
         try:
@@ -131,18 +307,24 @@ class LambdaIngestor:
             # load environmental variables -> raise error if not found
             LAMBDA_URL = os.environ["AWS_LAMBDA_API"]
 
-            # request header
-            header = {"Content-type": "application/json"}
+            # large report -> upload it directly to S3
+            if len(self.json_report) > self.upload_threshold:
+                r = self._upload_report(LAMBDA_URL)
 
-            # make request
-            r = requests.post(
-                url=f"{LAMBDA_URL}/sampling_report",
-                data=self.json_report,
-                headers=header,
-            )
+            # make request (reusing the keep-alive connections of the session)
+            else:
+                r = self.session.post(
+                    url=f"{LAMBDA_URL}/sampling_report",
+                    data=self.json_report,
+                    headers=self._request_headers(),
+                    timeout=self.timeout,
+                )
 
         # in case of errors when sending
         except Exception as e:
+            # mark the trace span as failed
+            tracing.record_error(str(e))
+
             # log an crictical
             self.logger.critical(
                 f"send_report_to_lambda method raised the following error ---> {e}"
@@ -154,31 +336,312 @@ class LambdaIngestor:
         # NO error when sending
         else:
 
-            # check status code
-            if r.status_code == 200:
+            # parse response from lambda api
+            response = _parse_response(r)
+
+            # add status code to the trace span
+            tracing.set_attributes(status_code=r.status_code)
+
+            # check status code and response
+            if _is_success(r, response):
 
                 # log an information
                 self.logger.info(
-                    f"send_report_to_lambda method successfully called: {r.json()}"
+                    f"send_report_to_lambda method successfully called: {response}"
                 )
 
                 # response from lambda api
-                return r.json()
+                return response
 
-            # status code not 200
+            # status code not 200 or error message
             else:
 
+                # mark the trace span as failed
+                tracing.record_error(response)
+
                 # log an information
-                self.logger.critical(f"send_report_to_lambda method called: {r.json()}")
+                self.logger.critical(f"send_report_to_lambda method called: {response}")
 
                 # response from lambda api
-                return r.json()
+                return response
+
+    def _upload_report(self, lambda_url: str) -> requests.Response:
+        """Upload the json report directly to S3: the AWS Lambda API creates
+        presigned urls (one per part of a multipart upload), parts are uploaded
+        in parallel and the API completes the upload and records its metadata
+
+        Args
+            lambda_url: a string with the url of the AWS Lambda API
+
+        Return
+            r: the response of the upload completion request"""
+
+        # encode json report
+        content = self.json_report.encode("UTF-8")
+
+        # request header
+        header = {"Content-type": "application/json"}
+
+        # negotiate upload (a new upload per call -> no idempotency key,
+        # so the session does not retry it on server errors)
+        r = self.session.post(
+            url=f"{lambda_url}/report_uploads",
+            data=self.serializer.dumps({"size": len(content)}),
+            headers=header,
+            timeout=self.timeout,
+        )
+
+        # parse upload (key, upload_id, part_size and urls)
+        upload = _parse_response(r)
+
+        # upload was not created
+        if (r.status_code != 200) or not isinstance(upload, dict):
+            raise Exception(f"report upload NOT created: {upload}")
+
+        def put_part(part_number: int) -> dict:
+            """Upload one part and get its ETag"""
+
+            # define bytes of the part
+            start = (part_number - 1) * upload["part_size"]
+            part = content[start : start + upload["part_size"]]
+
+            # upload part with its presigned url
+            r_part = self.session.put(
+                url=upload["urls"][part_number - 1], data=part, timeout=self.timeout
+            )
+            r_part.raise_for_status()
+
+            return {"PartNumber": part_number, "ETag": r_part.headers["ETag"]}
+
+        # try to upload parts
+        try:
+            # open a thread pool with context manager
+            with ThreadPoolExecutor(max_workers=self.upload_workers) as executor:
+                # upload each part on its own thread
+                parts = list(executor.map(put_part, range(1, len(upload["urls"]) + 1)))
+
+        # in case of errors -> delete uploaded parts
+        except Exception:
+            self.session.post(
+                url=f"{lambda_url}/report_uploads/abort",
+                data=self.serializer.dumps(
+                    {"key": upload["key"], "upload_id": upload["upload_id"]}
+                ),
+                headers=header,
+                timeout=self.timeout,
+            )
+
+            raise
+
+        # log an information
+        self.logger.info(
+            f"_upload_report method successfully called: {len(parts)} parts uploaded"
+        )
+
+        # complete upload and record report metadata
+        return self.session.post(
+            url=f"{lambda_url}/report_uploads/complete",
+            data=self.serializer.dumps(
+                {
+                    "key": upload["key"],
+                    "upload_id": upload["upload_id"],
+                    "parts": parts if upload["upload_id"] is not None else [],
+                    "group": self.raw_report["group"],
+                    "gamma_shape": self.raw_report["gamma_shape"],
+                    "poisson_lambda": self.raw_report["poisson_lambda"],
+                }
+            ),
+            headers=self._request_headers(),
+            timeout=self.timeout,
+        )
+
+    def _request_headers(self) -> dict:
+        """Get the headers of the report request: retries of the request
+        (including the session retries) send the same Idempotency-Key"""
+
+        return {
+            "Content-type": "application/json",
+            "Idempotency-Key": self.idempotency_key,
+        }
 
     def _jsonify_report(self) -> None:
         """Get the raw report and convert it to a json"""
 
-        # use NpEncoder to convert raw_report to a json report
-        self.json_report = json.dumps(self.raw_report, cls=NpEncoder)
+        # use the serializer to convert raw_report to a json report
+        # (numpy objects are converted natively by orjson)
+        self.json_report = self.serializer.dumps(self.raw_report).decode("UTF-8")
 
         # log an information
         self.logger.info(f"jsonify_report method successfully called")
+
+
+class LambdaReportBatcher:
+    def __init__(
+        self,
+        max_reports: int = DEFAULT_BATCH_REPORTS,
+        max_bytes: int = DEFAULT_BATCH_BYTES,
+        log_folder: str = None,
+        timeout: tuple = DEFAULT_TIMEOUT,
+        session: requests.Session = None,
+    ) -> None:
+        """Buffer reports of many LambdaIngestor objects and send them in a single
+        request to the /sampling_reports endpoint (stored as one NDJSON file)
+
+        Args
+            max_reports: an integer with the number of buffered reports that flushes the batch
+            max_bytes: an integer with the size of buffered reports that flushes the batch
+            log_folder: a string with the path to store logs
+            timeout: a (connect, read) tuple with request timeouts in seconds
+            session: a requests.Session to send reports (default: get_session())"""
+
+        # instanciate logger
+        self.logger = logging.getLogger("lambda_ingestion.py")
+
+        # define log date in utc
+        logging.Formatter.converter = time.gmtime
+
+        # check if user input a folder to store logs
+        if log_folder is None:
+            # set a default folder
+            log_folder = "../logs"
+
+        # define logging configuration
+        logging.basicConfig(
+            filename=f"{log_folder}/data_ingestion-{datetime.utcnow().date()}.log",
+            level=logging.INFO,
+            format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+            datefmt="%Y:%m:%d %H:%M:%S",
+        )
+
+        # define flush thresholds
+        self.max_reports = max_reports
+        self.max_bytes = max_bytes
+
+        # define request timeouts and session
+        self.timeout = timeout
+        self.session = session if session is not None else get_session()
+
+        # instanciate buffer of json reports, its size and its idempotency key
+        # (created on the first flush of the buffered reports)
+        self.json_reports = []
+        self.buffered_bytes = 0
+        self.idempotency_key = None
+
+        # log an information
+        self.logger.info(
+            f"LambdaReportBatcher object successfully instanciated: max_reports = {max_reports}, max_bytes = {max_bytes}"
+        )
+
+    def __enter__(self):
+        """Use the batcher as a context manager that flushes on exit"""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        """Flush remaining reports when leaving the context manager"""
+        self.flush()
+
+    def add(self, lambda_ingestor: LambdaIngestor):
+        """Buffer the report of the given LambdaIngestor and flush the batch
+        if the number or the size of buffered reports reaches its threshold
+
+        Args
+            lambda_ingestor: a LambdaIngestor object
+
+        Return
+            response: the flush response if the batch was flushed or a message"""
+
+        # convert raw report to a json report
+        lambda_ingestor._jsonify_report()
+
+        # buffer json report
+        self.json_reports.append(lambda_ingestor.json_report)
+        self.buffered_bytes += len(lambda_ingestor.json_report)
+
+        # buffered reports changed -> the next flush is a new request
+        self.idempotency_key = None
+
+        # check if batch reached one of its thresholds
+        if (len(self.json_reports) >= self.max_reports) or (
+            self.buffered_bytes >= self.max_bytes
+        ):
+            # send buffered reports
+            return self.flush()
+
+        return (
+            f"add method successfully called: {len(self.json_reports)} reports buffered"
+        )
+
+    def flush(self):
+        """Send all buffered reports in a single request. Reports are kept
+        on the buffer if the request fails (so flush can be retried)
+
+        Return
+            response: the response from the lambda api or an error message"""
+
+        # nothing to send
+        if not self.json_reports:
+            return "Nothing was done once there are no buffered reports"
+
+        # try to send data to api
+        try:
+
+            # load environmental variables -> raise error if not found
+            LAMBDA_URL = os.environ["AWS_LAMBDA_API"]
+
+            # json list of the buffered json reports
+            content = "[" + ",".join(self.json_reports) + "]"
+
+            # define idempotency key of the buffered reports
+            # (retries of the same batch send the same key)
+            if self.idempotency_key is None:
+                self.idempotency_key = new_idempotency_key()
+
+            # request header
+            header = {
+                "Content-type": "application/json",
+                "Idempotency-Key": self.idempotency_key,
+            }
+
+            # make request with a json list of the buffered json reports
+            r = self.session.post(
+                url=f"{LAMBDA_URL}/sampling_reports",
+                data=content,
+                headers=header,
+                timeout=self.timeout,
+            )
+
+        # in case of errors when sending
+        except Exception as e:
+            # log an crictical
+            self.logger.critical(f"flush method raised the following error ---> {e}")
+
+            # message
+            return f"flush method raised the following error ---> {e}"
+
+        # NO error when sending
+        else:
+
+            # parse response from lambda api
+            response = _parse_response(r)
+
+            # check status code and response
+            if _is_success(r, response):
+
+                # log an information
+                self.logger.info(
+                    f"flush method successfully called: {len(self.json_reports)} reports sent, {response}"
+                )
+
+                # empty buffer
+                self.json_reports = []
+                self.buffered_bytes = 0
+                self.idempotency_key = None
+
+            # status code not 200 or error message
+            else:
+
+                # log an information
+                self.logger.critical(f"flush method called: {response}")
+
+            # response from lambda api
+            return response
@@ -0,0 +1,328 @@
+"""Opt-in peak memory accounting of the pipeline stages: each tracked stage
+records the peak of the Python allocations above its start (tracemalloc), the
+memory it kept allocated, the top allocating lines and the peak RSS of the process.
+Stages tracked inside a tracked stage (e.g. the DataFrame conversion of the RDS
+sink) are recorded as its children. Profiling is off by default (tracemalloc
+slows allocations down): tracked stages then cost a single check.
+
+tracemalloc is process wide, so the numbers of stages that run at the same time
+on threads of the same process include the allocations of each other
+(e.g. run the staged pipeline with --thread-workers 1 for exact sink numbers).
+
+On Python 3.8 (no tracemalloc.reset_peak), tracing is restarted at the start of
+each stage instead: peaks are still recorded, but blocks allocated before the
+stage and freed inside it are not subtracted, and the top lines of a stage only
+cover the allocations since its last child stage started.
+
+Usage
+    from synthetic_data_ingestion import memory
+    memory.enable()  # or env var SDI_MEMORY_PROFILE=1
+
+    with memory.track("rds.dataframe") as record:
+        df = pd.DataFrame(data=sampling_dict)
+    print(record["peak_mb"], record["top"])
+"""
+
+# import required libraries
+import os
+import logging
+import functools
+import contextvars
+import tracemalloc
+
+# resource is optional (not available on Windows) -> no peak RSS
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# environment variable that enables profiling on import
+# (e.g. on Airflow workers or on spawned worker processes)
+MEMORY_PROFILE_ENV = "SDI_MEMORY_PROFILE"
+
+# default number of top allocating lines recorded per stage
+DEFAULT_TOP = 5
+
+# files left out of the top lines (allocations of the profiler itself and imports)
+IGNORED_FILES = {
+    tracemalloc.__file__,
+    __file__,
+    "<frozen importlib._bootstrap>",
+    "<frozen importlib._bootstrap_external>",
+}
+
+# bytes in a MB
+MB = 1024 * 1024
+
+# instanciate logger
+logger = logging.getLogger("memory.py")
+
+# record of the current tracked stage (parent of the next record)
+_current_record = contextvars.ContextVar("current_record", default=None)
+
+# number of top allocating lines per stage (None = profiling off)
+_top = None
+
+# traced memory before the last restart of tracing (Python 3.8 peak reset)
+_offset = 0
+
+
+def _traced_memory() -> tuple:
+    """Get the traced memory and its peak (in bytes, since tracing was first started)"""
+
+    # get traced memory since the last restart
+    current, peak = tracemalloc.get_traced_memory()
+
+    return current + _offset, peak + _offset
+
+
+def _reset_peak() -> None:
+    """Set the peak of the traced memory to the traced memory"""
+
+    global _offset
+
+    # reset peak (Python >= 3.9)
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+
+    # restart tracing (the peak of a new trace starts at 0)
+    else:
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        tracemalloc.start()
+        _offset += current
+
+
+class _Tracker:
+    """Context manager that records the memory of a stage"""
+
+    __slots__ = ("record", "_start", "_snapshot", "_token")
+
+    def __init__(self, stage: str, attributes: dict) -> None:
+        """Class constructor
+
+        Args
+            stage: a string with the name of the stage
+            attributes: a dict with attributes of the record (e.g. cohort)"""
+
+        # instanciate record of the stage
+        self.record = {"stage": stage, **attributes}
+        self._start = self._snapshot = self._token = None
+
+    def __enter__(self) -> dict:
+        global _offset
+
+        # start tracing allocations (first tracked stage)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _offset = 0
+
+        # take snapshot of the start (before measuring -> left out of the stage)
+        self._snapshot = tracemalloc.take_snapshot() if _top else None
+
+        # get traced memory and peak of the parent stage so far
+        current, peak = _traced_memory()
+
+        # add record to the parent stage and keep its peak
+        parent = _current_record.get()
+        if parent is not None:
+            parent.setdefault("children", []).append(self.record)
+            parent["_peak"] = max(parent.get("_peak", 0), peak)
+
+        # become the current stage and reset peak
+        self._token = _current_record.set(self.record)
+        _reset_peak()
+        self._start = current
+
+        return self.record
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        # get traced memory and peak of the stage
+        current, peak = _traced_memory()
+        peak = max(self.record.pop("_peak", 0), peak)
+
+        # restore parent stage and keep the peak of the stage on it
+        _current_record.reset(self._token)
+        parent = _current_record.get()
+        if parent is not None:
+            parent["_peak"] = max(parent.get("_peak", 0), peak)
+
+        # record peak above the start, memory kept allocated and peak RSS
+        self.record["peak_mb"] = (peak - self._start) / MB
+        self.record["allocated_mb"] = (current - self._start) / MB
+        self.record["peak_rss_mb"] = peak_rss_mb()
+
+        # record top allocating lines
+        if self._snapshot is not None:
+            self.record["top"] = top_allocations(self._snapshot, _top)
+
+        # log an information
+        logger.info(
+            f"{self.record['stage']} memory: peak = {self.record['peak_mb']:.1f} MB, peak RSS = {self.record['peak_rss_mb']} MB"
+        )
+
+        return False
+
+
+class _NoopTracker:
+    """Tracker used when profiling is off (does nothing)"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        return False
+
+
+# shared no-op tracker
+NOOP_TRACKER = _NoopTracker()
+
+
+def enable(top: int = DEFAULT_TOP) -> None:
+    """Turn memory profiling on
+
+    Args
+        top: an integer with the number of top allocating lines recorded per stage
+            (0 = no top lines -> no snapshots)"""
+
+    global _top
+
+    # validate user input -> top >= 0
+    if not (isinstance(top, int) and top >= 0):
+        # raise value error with problem indication
+        raise ValueError("top param must be an integer >= 0")
+
+    # instanciate number of top lines
+    _top = top
+
+    # log an information
+    logger.info(f"memory profiling enabled: top = {top}")
+
+
+def enable_from_env() -> None:
+    """Turn memory profiling on if the SDI_MEMORY_PROFILE environment variable
+    is set (its value is the number of top lines, "1" = DEFAULT_TOP)"""
+
+    # get environment variable
+    value = os.environ.get(MEMORY_PROFILE_ENV)
+
+    # profiling stays off without environment variable
+    if value:
+        enable(DEFAULT_TOP if value == "1" else int(value))
+
+
+def disable() -> None:
+    """Turn memory profiling off (and stop tracing allocations)"""
+
+    global _top
+
+    _top = None
+
+    # stop tracing allocations
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def is_enabled() -> bool:
+    """Check if memory profiling is on"""
+
+    return _top is not None
+
+
+def track(stage: str, **attributes):
+    """Track the memory of a stage with a context manager that gives its
+    record (None if profiling is off)
+
+    Args
+        stage: a string with the name of the stage
+        attributes: attributes of the record (e.g. cohort="control-5000")"""
+
+    # profiling off -> shared no-op tracker
+    if _top is None:
+        return NOOP_TRACKER
+
+    return _Tracker(stage, attributes)
+
+
+def tracked(stage: str):
+    """Decorator that tracks the memory of the decorated function
+
+    Args
+        stage: a string with the name of the stage"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # profiling off -> plain call
+            if _top is None:
+                return func(*args, **kwargs)
+
+            # run function on a tracked stage
+            with _Tracker(stage, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def peak_rss_mb():
+    """Get the peak RSS (in MB) of the process (None if unknown)"""
+
+    # resource is not available
+    if resource is None:
+        return None
+
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def peak_rss_children_mb():
+    """Get the largest peak RSS (in MB) of the finished worker processes (None if unknown)"""
+
+    # resource is not available
+    if resource is None:
+        return None
+
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+
+def top_allocations(start_snapshot, top: int) -> list:
+    """Get the lines that allocated most memory since a snapshot
+
+    Args
+        start_snapshot: a tracemalloc.Snapshot taken at the start of the stage
+        top: an integer with the number of lines
+
+    Return
+        a list of dicts with the line (file:line), the size (in MB) and
+            the number of blocks allocated since the snapshot"""
+
+    # compare memory now with the start of the stage
+    # (lines are filtered after grouping: Snapshot.filter_traces is slow on big cohorts)
+    differences = tracemalloc.take_snapshot().compare_to(start_snapshot, "lineno")
+
+    # keep lines that allocated memory (differences are sorted by absolute size)
+    allocations = [
+        difference
+        for difference in differences
+        if (difference.size_diff > 0)
+        and (difference.traceback[0].filename not in IGNORED_FILES)
+    ]
+
+    return [
+        {
+            "line": f"{difference.traceback[0].filename}:{difference.traceback[0].lineno}",
+            "size_mb": difference.size_diff / MB,
+            "count": difference.count_diff,
+        }
+        for difference in allocations[:top]
+    ]
+
+
+# turn memory profiling on from the environment variable
+enable_from_env()
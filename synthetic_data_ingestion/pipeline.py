@@ -0,0 +1,1094 @@
+"""Local runner of the synthetic data ingestion pipeline (no Airflow needed):
+generate cohorts -> RDS, Lambda and Parquet sinks -> DynamoDB log sink, as a small
+in-process DAG. In staged mode, cohorts are generated on a process pool (CPU bound)
+and each sink starts on a thread pool (I/O bound) as soon as its cohort is ready. In
+pipelined mode, cohorts are generated in batches that sinks consume from bounded
+queues while the next batches are generated. With --handoff shared_memory, the
+staged workers send the cohort columns through shared memory blocks (a constant
+size descriptor) instead of pickling them.
+
+Usage
+    synthetic_data_ingestion-run --arms CONTROL TREATMENT --cohort-sizes 5000 --seed 42
+    synthetic_data_ingestion-run --sinks rds lambda --reference-date 2022-01-03 --replace
+    synthetic_data_ingestion-run --mode pipelined --cohort-sizes 5000000 --sinks rds parquet
+    synthetic_data_ingestion-run --cohort-sizes 5000000 --handoff shared_memory
+    synthetic_data_ingestion-run --trace-file ../logs/traces.jsonl --trace-format otlp
+"""
+
+# import required libraries
+import os
+import sys
+import json
+import time
+import queue
+import logging
+import argparse
+import threading
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from synthetic_data_ingestion import memory, shared_columns, tracing
+from synthetic_data_ingestion.cohort import Cohort
+from synthetic_data_ingestion.rds_ingestion import RdsIngestor
+from synthetic_data_ingestion.sample_creator import SynthCustomers
+from synthetic_data_ingestion.lambda_ingestion import LambdaIngestor
+from synthetic_data_ingestion.dynamodb_ingestion import DynamodbIngestor
+
+
+# sinks of the generated cohorts (dynamo sends the logs after all other sinks)
+SINKS = ["rds", "lambda", "parquet", "dynamo"]
+
+# sinks run when none is selected
+DEFAULT_SINKS = ["rds", "lambda", "dynamo"]
+
+# sinks that consume the samples in batches on pipelined mode
+# (the other sinks only need the cohort report or the logs)
+BATCH_SINKS = ["rds", "parquet"]
+
+# default number of samples of a batch and of batches queued per sink
+# (pipelined mode keeps at most queue_batches + 2 batches in memory per sink)
+DEFAULT_BATCH_SIZE = 100_000
+DEFAULT_QUEUE_BATCHES = 4
+
+# end of the batches of a cohort whose generation failed (None ends a complete
+# cohort): the batch sinks raise GenerationError, so they discard the cohort
+GENERATION_FAILED = "GENERATION_FAILED"
+
+# pieces of the messages returned by the ingestors when they fail
+FAILURE_MARKERS = ("NOT success", "raised the following error", "error was raised")
+
+# instanciate logger
+logger = logging.getLogger("pipeline.py")
+
+
+class GenerationError(Exception):
+    """Raised on the batch sinks of a cohort whose generation failed"""
+
+
+def define_cohorts(arms: list, cohort_sizes: list, seed: int = None) -> list:
+    """Define one cohort per arm and cohort size, each with its own seed
+    derived from the run seed (None = random samples)
+
+    Args
+        arms: a list of strings with the groups ("CONTROL" or "TREATMENT")
+        cohort_sizes: a list of integers with the number of samples of each cohort
+            (without repetitions -> one cohort name per arm and size)
+        seed: an integer with the seed of the run
+
+    Return
+        cohorts: a list of dicts with the group, num_samples and seed of each cohort"""
+
+    # validate user input -> no repeated arms or cohort sizes
+    if (len(set(arms)) != len(arms)) or (len(set(cohort_sizes)) != len(cohort_sizes)):
+        # raise value error with problem indication
+        raise ValueError("arms and cohort_sizes params must not have repeated values")
+
+    # define cohort params
+    cohorts = [
+        {"group": group, "num_samples": num_samples}
+        for group in arms
+        for num_samples in cohort_sizes
+    ]
+
+    # derive independent seeds of the cohorts
+    if seed is not None:
+        for cohort, child in zip(
+            cohorts, np.random.SeedSequence(seed).spawn(len(cohorts))
+        ):
+            cohort["seed"] = int(child.generate_state(1)[0])
+
+    return cohorts
+
+
+def cohort_name(cohort: dict) -> str:
+    """Get the name of a cohort (e.g. control-5000)"""
+
+    return f"{cohort['group'].lower()}-{cohort['num_samples']}"
+
+
+def validate_cohorts(cohorts: list, replace: bool = False) -> None:
+    """Check that every cohort of a run has its own name (names identify
+    the stages of a cohort and its Parquet file) and, when replacing RDS rows,
+    that every group has a single cohort (the RDS table has no cohort column:
+    a replace deletes every row of the group and week, even of other cohorts)
+
+    Args
+        cohorts: a list of dicts created by define_cohorts
+        replace: a boolean to replace the RDS rows of the cohorts week and group"""
+
+    # get names of the cohorts
+    names = [cohort_name(cohort) for cohort in cohorts]
+
+    # validate user input -> unique cohort names
+    if len(set(names)) != len(names):
+        # raise value error with problem indication
+        raise ValueError(
+            "cohorts param must not have repeated cohorts (same group and num_samples)"
+        )
+
+    # get groups of the cohorts
+    groups = [cohort["group"] for cohort in cohorts]
+
+    # validate user input -> one cohort per group and week when replacing
+    if replace and (len(set(groups)) != len(groups)):
+        # raise value error with problem indication
+        raise ValueError(
+            "cohorts param must have one cohort per group when replace is True"
+        )
+
+
+def is_failure(response) -> bool:
+    """Check if the message returned by an ingestor is a failure"""
+
+    return isinstance(response, str) and any(
+        marker in response for marker in FAILURE_MARKERS
+    )
+
+
+def generate_cohort(
+    cohort: dict,
+    reference_date,
+    log_folder: str,
+    trace_parent: dict = None,
+    handoff: str = "pickle",
+) -> tuple:
+    """Generate the samples and report of a cohort (run on a worker process)
+
+    Args
+        cohort: a dict with the group, num_samples and seed of the cohort
+        reference_date: a date or a string with format YYYY-MM-DD (None = today)
+        log_folder: a string with the path to store logs
+        trace_parent: a dict with the trace span of the run (tracing.current_context)
+        handoff: a string with "pickle" (samples sent with the cohort) or
+            "shared_memory" (samples moved to shared memory blocks)
+
+    Return
+        (synth_cohort, duration, memory_record, descriptor): the Cohort object, a
+            float with the duration (in seconds) of the generation, a dict with its
+            memory (None if memory profiling is off) and a dict with the shared
+            memory blocks of the samples (None on "pickle" handoff, whose samples
+            stay on the sampling_dict of the cohort)"""
+
+    # time generation
+    start = time.perf_counter()
+
+    # trace generation as a child of the run span (of the parent process)
+    # and track its memory (on the worker process)
+    with tracing.span(
+        "pipeline.generate_cohort", parent=trace_parent, cohort=cohort_name(cohort)
+    ), memory.track("generate", cohort=cohort_name(cohort)) as memory_record:
+        # instanciate SynthCustomers object
+        synth_customers = SynthCustomers(
+            num_samples=cohort["num_samples"],
+            group=cohort["group"],
+            log_folder=log_folder,
+            reference_date=reference_date,
+            seed=cohort.get("seed"),
+        )
+        # generate synthetic samples and report
+        # (only the compact Cohort object is sent to the run process)
+        synth_cohort = synth_customers.generate_samples()
+
+    # move samples to shared memory (the cohort is sent without them)
+    descriptor = None
+    if handoff == "shared_memory":
+        descriptor = shared_columns.share_columns(synth_cohort.sampling_dict)
+        synth_cohort = synth_cohort.with_columns({})
+
+    return synth_cohort, time.perf_counter() - start, memory_record, descriptor
+
+
+def rds_sink(synth_cohort: Cohort, log_folder: str, replace: bool) -> str:
+    """Send the samples of a cohort to AWS RDS"""
+
+    return RdsIngestor(synth_cohort, log_folder).ingest_samples(replace=replace)
+
+
+def lambda_sink(synth_cohort: Cohort, log_folder: str) -> str:
+    """Send the report of a cohort to AWS Lambda API"""
+
+    return LambdaIngestor(synth_cohort, log_folder).send_report_to_lambda()
+
+
+def write_parquet(batches, path: str) -> str:
+    """Write batches of samples to a Parquet file (one row group per batch)
+
+    Args
+        batches: an iterable of dicts with the same keys as sampling_dict
+        path: a string with the path to the Parquet file
+
+    Return
+        a string with the status of the write"""
+
+    # create folder of the file
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    # instanciate writer and number of written rows
+    writer, num_rows = None, 0
+
+    # try to write batches
+    try:
+        # iterate over batches
+        for batch in batches:
+            # convert batch to an arrow table
+            # (parquet has no float16 -> float32)
+            table = pa.table(
+                {
+                    column: values.astype(np.float32)
+                    if values.dtype == np.float16
+                    else values
+                    for column, values in batch.items()
+                }
+            )
+
+            # open writer with the schema of the first batch
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+
+            # write batch as a row group
+            writer.write_table(table)
+            num_rows += table.num_rows
+
+    # in case of errors -> remove the partial file
+    except Exception:
+        if writer is not None:
+            writer.close()
+            os.remove(path)
+
+        raise
+
+    # close file
+    if writer is not None:
+        writer.close()
+
+    # add rows and bytes (on disk) to the trace span
+    tracing.set_attributes(
+        rows=num_rows, bytes=os.path.getsize(path) if writer is not None else 0
+    )
+
+    return f"write_parquet successfully called: {num_rows} rows written"
+
+
+def parquet_sink(synth_cohort: Cohort, parquet_folder: str) -> str:
+    """Write the samples of a cohort to a Parquet file"""
+
+    return write_parquet(
+        [synth_cohort.sampling_dict],
+        os.path.join(parquet_folder, f"{cohort_file_name(synth_cohort)}.parquet"),
+    )
+
+
+def cohort_file_name(synth_customers) -> str:
+    """Get the file name of a cohort (e.g. control-5000-2022-01-03) from
+    a Cohort or a SynthCustomers object"""
+
+    return f"{synth_customers.group.lower()}-{synth_customers.num_samples}-{synth_customers.gen_date_utc.date()}"
+
+
+def dynamo_sink(log_folder: str) -> str:
+    """Send the logs to AWS DynamoDB"""
+
+    return DynamodbIngestor(log_folder).send_logs()
+
+
+def timed(func, *args) -> tuple:
+    """Call func and time it
+
+    Return
+        (response, duration, memory_record): the value returned by func (or the
+            raised error as a failure message), a float with the duration (in seconds)
+            and a dict with its memory (None if memory profiling is off)"""
+
+    # get stage name
+    name = getattr(func, "__name__", "stage")
+
+    # time call
+    start = time.perf_counter()
+
+    # trace call and track its memory
+    with tracing.span(f"pipeline.{name}"), memory.track(name) as memory_record:
+        # try to call func
+        try:
+            response = func(*args)
+
+        # in case of errors
+        except Exception as e:
+            response = f"{name} NOT successful: raised error ---> {e}"
+
+        # mark the trace span of failed stages
+        if is_failure(response):
+            tracing.record_error(response)
+
+    return response, time.perf_counter() - start, memory_record
+
+
+@tracing.traced("pipeline.run_pipeline")
+def run_pipeline(
+    cohorts: list,
+    sinks: list = None,
+    reference_date=None,
+    replace: bool = False,
+    process_workers: int = None,
+    thread_workers: int = 8,
+    parquet_folder: str = None,
+    log_folder: str = None,
+    handoff: str = "pickle",
+) -> dict:
+    """Run the pipeline: generate each cohort on a process pool and send it to the
+    RDS and Lambda sinks on a thread pool as soon as it is generated; the DynamoDB
+    sink sends the logs after all other stages (even if some of them failed)
+
+    Args
+        cohorts: a list of dicts created by define_cohorts
+        sinks: a list of strings with the sinks to run (default: all SINKS)
+        reference_date: a date or a string with format YYYY-MM-DD (None = today)
+        replace: a boolean to replace the RDS rows of the cohorts week and group
+            (one cohort per group -> see validate_cohorts)
+        process_workers: an integer with the number of generation processes
+            (default: number of CPUs, at most one per cohort)
+        thread_workers: an integer with the number of sink threads
+        parquet_folder: a string with the path to store the Parquet files
+        log_folder: a string with the path to store logs
+        handoff: a string with the way cohorts are sent from the generation processes
+            to the sinks ("pickle" or "shared_memory" -> constant cost per cohort;
+            blocks are released when the sinks of the cohort are done)
+
+    Return
+        run: a dict with the wall time and the stages (name, cohort,
+            duration and response) of the run"""
+
+    # validate user input -> handoff in HANDOFFS
+    if handoff not in shared_columns.HANDOFFS:
+        # raise value error with problem indication
+        raise ValueError(f"handoff param must be one of {shared_columns.HANDOFFS}")
+
+    # validate user input -> unique cohort names (one per group when replacing)
+    validate_cohorts(cohorts, replace)
+
+    # share the resource tracker with the generation processes
+    # (shared memory blocks never released are removed when the run ends)
+    if handoff == "shared_memory":
+        shared_columns.ensure_cleanup()
+
+    # define sinks and folders
+    sinks, parquet_folder, log_folder = run_defaults(sinks, parquet_folder, log_folder)
+
+    # define number of generation processes
+    if process_workers is None:
+        process_workers = min(os.cpu_count() or 1, max(len(cohorts), 1))
+
+    # instanciate list of stages
+    stages = []
+
+    # instanciate dict of shared cohorts (cohort index -> [SharedColumns, sinks left])
+    shared_cohorts = {}
+
+    # time run
+    start = time.perf_counter()
+
+    # try to run cohorts
+    try:
+        # open process and thread pools with context manager
+        with ProcessPoolExecutor(max_workers=process_workers) as processes:
+            with ThreadPoolExecutor(max_workers=thread_workers) as threads:
+                # generate cohorts in parallel
+                generations = {
+                    processes.submit(
+                        generate_cohort,
+                        cohort,
+                        reference_date,
+                        log_folder,
+                        tracing.current_context(),
+                        handoff,
+                    ): index
+                    for index, cohort in enumerate(cohorts)
+                }
+
+                # instanciate dict of sink futures
+                sink_futures = {}
+
+                # start the sinks of each cohort as soon as it is generated
+                for generation in as_completed(generations):
+                    # get cohort index and name
+                    index = generations[generation]
+                    name = cohort_name(cohorts[index])
+
+                    # try to get the generated cohort
+                    try:
+                        (
+                            synth_cohort,
+                            duration,
+                            memory_record,
+                            descriptor,
+                        ) = generation.result()
+
+                        # attach the samples sent through shared memory
+                        if descriptor is not None:
+                            shared = shared_columns.SharedColumns(descriptor)
+                            synth_cohort = synth_cohort.with_columns(shared.columns)
+                            shared_cohorts[index] = [shared, 0]
+
+                    # in case of errors -> no sinks for the cohort
+                    except Exception as e:
+                        stages.append(
+                            {
+                                "stage": "generate",
+                                "cohort": name,
+                                "duration_s": None,
+                                "response": f"generate_cohort NOT successful: raised error ---> {e}",
+                            }
+                        )
+                        continue
+
+                    # record generation
+                    stages.append(
+                        {
+                            "stage": "generate",
+                            "cohort": name,
+                            "duration_s": duration,
+                            "response": "generate_cohort successfully called",
+                            "memory": memory_record,
+                        }
+                    )
+
+                    # send cohort to RDS and Lambda concurrently
+                    if "rds" in sinks:
+                        sink_futures[
+                            threads.submit(
+                                tracing.propagate(timed),
+                                rds_sink,
+                                synth_cohort,
+                                log_folder,
+                                replace,
+                            )
+                        ] = ("rds", index)
+                    if "lambda" in sinks:
+                        sink_futures[
+                            threads.submit(
+                                tracing.propagate(timed),
+                                lambda_sink,
+                                synth_cohort,
+                                log_folder,
+                            )
+                        ] = ("lambda", index)
+                    if "parquet" in sinks:
+                        sink_futures[
+                            threads.submit(
+                                tracing.propagate(timed),
+                                parquet_sink,
+                                synth_cohort,
+                                parquet_folder,
+                            )
+                        ] = ("parquet", index)
+
+                    # count sinks of the shared cohort (none -> release it now)
+                    if index in shared_cohorts:
+                        shared_cohorts[index][1] = len(
+                            set(sinks) & {"rds", "lambda", "parquet"}
+                        )
+                        if not shared_cohorts[index][1]:
+                            shared_cohorts.pop(index)[0].release()
+
+                    # drop the cohort of the loop (its samples may be released
+                    # while the next cohorts are generated)
+                    del synth_cohort
+
+                # wait for the sinks of all cohorts
+                for sink_future in as_completed(sink_futures):
+                    # get response and duration
+                    response, duration, memory_record = sink_future.result()
+
+                    # record sink
+                    stage, index = sink_futures[sink_future]
+                    stages.append(
+                        {
+                            "stage": stage,
+                            "cohort": cohort_name(cohorts[index]),
+                            "duration_s": duration,
+                            "response": response,
+                            "memory": memory_record,
+                        }
+                    )
+
+                    # release a shared cohort after its last sink
+                    # (its sinks returned -> its views are not read anymore)
+                    if index in shared_cohorts:
+                        shared_cohorts[index][1] -= 1
+                        if not shared_cohorts[index][1]:
+                            shared_cohorts.pop(index)[0].release()
+
+    # release shared cohorts left (e.g. interrupted run) after the sinks stopped
+    finally:
+        for shared, _ in shared_cohorts.values():
+            shared.release()
+
+        # unmap released blocks whose views are gone
+        shared_columns.close_deferred()
+
+    # send logs of the run (regardless of upstream success/fail)
+    if "dynamo" in sinks:
+        response, duration, memory_record = timed(dynamo_sink, log_folder)
+        stages.append(
+            {
+                "stage": "dynamo",
+                "cohort": None,
+                "duration_s": duration,
+                "response": response,
+                "memory": memory_record,
+            }
+        )
+
+    # define run summary
+    run = {
+        "wall_s": time.perf_counter() - start,
+        "stages": stages,
+        "memory": run_memory(),
+    }
+
+    # log an information
+    logger.info(
+        f"run_pipeline successfully called: {len(cohorts)} cohorts, {len(stages)} stages in {run['wall_s']:.3f} s"
+    )
+
+    return run
+
+
+def run_defaults(sinks: list, parquet_folder: str, log_folder: str) -> tuple:
+    """Get the default sinks and folders of a run (when not given)"""
+
+    # define sinks
+    sinks = list(DEFAULT_SINKS) if sinks is None else list(sinks)
+
+    # check if user input a folder to store Parquet files
+    if parquet_folder is None:
+        # set a default folder
+        parquet_folder = "../data"
+
+    # check if user input a folder to store logs
+    if log_folder is None:
+        # set a default folder
+        log_folder = "../logs"
+
+    return sinks, parquet_folder, log_folder
+
+
+def queued_batches(batch_queue: queue.Queue):
+    """Get the batches put on a queue until the end of the cohort (None).
+    Raise GenerationError if the generation of the cohort failed (GENERATION_FAILED)"""
+
+    # iterate until the end of the cohort
+    while True:
+        # wait for the next batch
+        batch = batch_queue.get()
+
+        # end of the cohort
+        if batch is None:
+            return
+
+        # generation failed -> sinks must not commit the partial cohort
+        if batch is GENERATION_FAILED:
+            raise GenerationError("cohort generation failed")
+
+        yield batch
+
+
+def consume_batches(sink, batch_queue: queue.Queue, stage: dict) -> None:
+    """Run a batch sink on the batches of a queue and record its duration
+    and response on stage. The queue is always drained, so a failed sink
+    never blocks the producer
+
+    Args
+        sink: a function that takes an iterable of batches and returns a status string
+        batch_queue: a queue.Queue with the batches of a cohort
+            (ended by None or GENERATION_FAILED)
+        stage: a dict to record the duration and response of the sink"""
+
+    # define batches of the queue
+    batches = queued_batches(batch_queue)
+
+    # time sink
+    start = time.perf_counter()
+
+    # trace sink and track its memory
+    with tracing.span(
+        f"pipeline.{stage['stage']}_batches", cohort=stage["cohort"]
+    ), memory.track(stage["stage"], cohort=stage["cohort"]) as memory_record:
+        # try to consume batches
+        try:
+            stage["response"] = sink(batches)
+
+        # in case of errors
+        except Exception as e:
+            stage[
+                "response"
+            ] = f"{stage['stage']} sink NOT successful: raised error ---> {e}"
+
+        # drain remaining batches (sink stopped before the end of the cohort)
+        finally:
+            try:
+                for _ in batches:
+                    pass
+            except GenerationError:
+                pass
+
+            stage["duration_s"] = time.perf_counter() - start
+
+        # record memory of the sink
+        stage["memory"] = memory_record
+
+        # mark the trace span of failed sinks
+        if is_failure(stage["response"]):
+            tracing.record_error(stage["response"])
+
+
+@tracing.traced("pipeline.run_cohort_pipelined")
+def run_cohort_pipelined(
+    cohort: dict,
+    sinks: list,
+    batch_size: int,
+    queue_batches: int,
+    reference_date,
+    replace: bool,
+    parquet_folder: str,
+    log_folder: str,
+) -> list:
+    """Generate a cohort in batches and send each batch to the batch sinks
+    while the next one is generated. Each batch sink consumes a bounded queue:
+    when a sink falls behind, generation waits (backpressure) and memory stays capped.
+    If generation fails, the batch sinks discard the partial cohort (RDS rolls back
+    its transaction, the Parquet file is removed) and their stages are still recorded
+
+    Return
+        stages: a list of the stage dicts (name, cohort, duration and response)"""
+
+    # get cohort name
+    name = cohort_name(cohort)
+
+    # instanciate SynthCustomers object
+    synth_customers = SynthCustomers(
+        num_samples=cohort["num_samples"],
+        group=cohort["group"],
+        log_folder=log_folder,
+        reference_date=reference_date,
+        seed=cohort.get("seed"),
+    )
+
+    # define batches (distribution params are chosen now) and report
+    batches = synth_customers.generate_batches(batch_size)
+    synth_customers.generate_report()
+
+    # define batch sinks of the cohort
+    batch_sinks = {
+        "rds": lambda b: RdsIngestor(synth_customers, log_folder).ingest_batches(
+            b, replace=replace
+        ),
+        "parquet": lambda b: write_parquet(
+            b,
+            os.path.join(
+                parquet_folder, f"{cohort_file_name(synth_customers)}.parquet"
+            ),
+        ),
+    }
+
+    # instanciate stages, queues and consumer threads of the batch sinks
+    stages, queues, consumers = [], [], []
+
+    # iterate over selected batch sinks
+    for stage_name in [sink for sink in BATCH_SINKS if sink in sinks]:
+        # define stage, bounded queue and consumer thread
+        stage = {"stage": stage_name, "cohort": name, "duration_s": None}
+        batch_queue = queue.Queue(maxsize=queue_batches)
+        consumer = threading.Thread(
+            target=tracing.propagate(consume_batches),
+            args=(batch_sinks[stage_name], batch_queue, stage),
+            daemon=True,
+        )
+
+        # start consumer
+        consumer.start()
+
+        # add stage, queue and consumer
+        stages.append(stage)
+        queues.append(batch_queue)
+        consumers.append(consumer)
+
+    # send report to Lambda while samples are generated
+    if "lambda" in sinks:
+        lambda_thread = ThreadPoolExecutor(max_workers=1)
+        lambda_future = lambda_thread.submit(
+            tracing.propagate(timed), lambda_sink, synth_customers, log_folder
+        )
+
+    # instanciate generation time (without the waits on full queues),
+    # response and end of the cohort
+    generation_s = 0.0
+    response = "generate_batches successfully called"
+    end = GENERATION_FAILED
+
+    # track memory of the generation (batches in flight included)
+    with memory.track("generate", cohort=name) as memory_record:
+        # try to produce batches
+        try:
+            while True:
+                # time batch generation
+                start = time.perf_counter()
+                batch = next(batches, None)
+                generation_s += time.perf_counter() - start
+
+                # end of the cohort
+                if batch is None:
+                    end = None
+                    break
+
+                # put batch on every queue (waits while a queue is full)
+                for batch_queue in queues:
+                    batch_queue.put(batch)
+
+        # in case of errors
+        except Exception as e:
+            response = f"generate_batches NOT successful: raised error ---> {e}"
+
+            # mark the trace span as failed
+            tracing.record_error(response)
+
+        # end the cohort on every queue (GENERATION_FAILED unless it is complete)
+        finally:
+            for batch_queue in queues:
+                batch_queue.put(end)
+
+            # wait for the batch sinks
+            for consumer in consumers:
+                consumer.join()
+
+    # add cohort, rows and generation time to the trace span
+    tracing.set_attributes(
+        cohort=name, rows=cohort["num_samples"], generate_s=generation_s
+    )
+
+    # record generation
+    stages.insert(
+        0,
+        {
+            "stage": "generate",
+            "cohort": name,
+            "duration_s": generation_s,
+            "response": response,
+            "memory": memory_record,
+        },
+    )
+
+    # wait for the report
+    if "lambda" in sinks:
+        response, duration, memory_record = lambda_future.result()
+        lambda_thread.shutdown()
+        stages.append(
+            {
+                "stage": "lambda",
+                "cohort": name,
+                "duration_s": duration,
+                "response": response,
+                "memory": memory_record,
+            }
+        )
+
+    return stages
+
+
+@tracing.traced("pipeline.run_pipelined")
+def run_pipelined(
+    cohorts: list,
+    sinks: list = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    queue_batches: int = DEFAULT_QUEUE_BATCHES,
+    reference_date=None,
+    replace: bool = False,
+    max_cohorts: int = 2,
+    parquet_folder: str = None,
+    log_folder: str = None,
+) -> dict:
+    """Run the pipeline overlapping generation and ingestion: each cohort is
+    generated in batches that the RDS and Parquet sinks consume from bounded queues
+    while the next batches are generated, so a cohort takes about
+    max(generation, ingestion) instead of their sum; the DynamoDB sink sends the
+    logs after all other stages (even if some of them failed)
+
+    Args
+        cohorts: a list of dicts created by define_cohorts
+        sinks: a list of strings with the sinks to run (default: DEFAULT_SINKS)
+        batch_size: an integer with the maximum number of samples of a batch
+        queue_batches: an integer with the maximum number of batches queued per sink
+        reference_date: a date or a string with format YYYY-MM-DD (None = today)
+        replace: a boolean to replace the RDS rows of the cohorts week and group
+            (one cohort per group -> see validate_cohorts)
+        max_cohorts: an integer with the maximum number of cohorts run in parallel
+        parquet_folder: a string with the path to store the Parquet files
+        log_folder: a string with the path to store logs
+
+    Return
+        run: a dict with the wall time and the stages (name, cohort,
+            duration and response) of the run"""
+
+    # validate user input -> unique cohort names (one per group when replacing)
+    validate_cohorts(cohorts, replace)
+
+    # define sinks and folders
+    sinks, parquet_folder, log_folder = run_defaults(sinks, parquet_folder, log_folder)
+
+    # instanciate list of stages
+    stages = []
+
+    # time run
+    start = time.perf_counter()
+
+    # open a thread pool with context manager (one producer per cohort)
+    with ThreadPoolExecutor(max_workers=max_cohorts) as producers:
+        # run cohorts in parallel
+        cohort_futures = {
+            producers.submit(
+                tracing.propagate(run_cohort_pipelined),
+                cohort,
+                sinks,
+                batch_size,
+                queue_batches,
+                reference_date,
+                replace,
+                parquet_folder,
+                log_folder,
+            ): cohort_name(cohort)
+            for cohort in cohorts
+        }
+
+        # get stages of each cohort
+        for cohort_future in as_completed(cohort_futures):
+            # try to get stages
+            try:
+                stages.extend(cohort_future.result())
+
+            # in case of errors
+            except Exception as e:
+                stages.append(
+                    {
+                        "stage": "generate",
+                        "cohort": cohort_futures[cohort_future],
+                        "duration_s": None,
+                        "response": f"run_cohort_pipelined NOT successful: raised error ---> {e}",
+                    }
+                )
+
+    # send logs of the run (regardless of upstream success/fail)
+    if "dynamo" in sinks:
+        response, duration, memory_record = timed(dynamo_sink, log_folder)
+        stages.append(
+            {
+                "stage": "dynamo",
+                "cohort": None,
+                "duration_s": duration,
+                "response": response,
+                "memory": memory_record,
+            }
+        )
+
+    # define run summary
+    run = {
+        "wall_s": time.perf_counter() - start,
+        "stages": stages,
+        "memory": run_memory(),
+    }
+
+    # log an information
+    logger.info(
+        f"run_pipelined successfully called: {len(cohorts)} cohorts, {len(stages)} stages in {run['wall_s']:.3f} s"
+    )
+
+    return run
+
+
+def run_memory():
+    """Get the peak RSS (in MB) of the run process and of its worker processes
+    (None if memory profiling is off)"""
+
+    # memory profiling off -> no memory
+    if not memory.is_enabled():
+        return None
+
+    return {
+        "peak_rss_mb": memory.peak_rss_mb(),
+        "peak_rss_children_mb": memory.peak_rss_children_mb(),
+    }
+
+
+def summarize_stages(stages: list) -> dict:
+    """Get the number of calls, failures and the total, mean and max durations
+    (in seconds) of each stage, and its max memory peak (in MB) when profiled"""
+
+    # instanciate dict of summaries
+    summary = {}
+
+    # iterate over stages in run order
+    for stage in stages:
+        # get summary of the stage
+        s = summary.setdefault(
+            stage["stage"],
+            {"calls": 0, "failures": 0, "total_s": 0.0, "max_s": 0.0},
+        )
+
+        # add stage call
+        s["calls"] += 1
+        s["failures"] += int(
+            stage["duration_s"] is None or is_failure(stage["response"])
+        )
+        s["total_s"] += stage["duration_s"] or 0.0
+        s["max_s"] = max(s["max_s"], stage["duration_s"] or 0.0)
+
+        # add memory peak of profiled stages
+        if stage.get("memory"):
+            s["peak_mb"] = max(s.get("peak_mb", 0.0), stage["memory"]["peak_mb"])
+
+    # add mean durations
+    for s in summary.values():
+        s["mean_s"] = s["total_s"] / s["calls"]
+
+    return summary
+
+
+def main(argv: list = None) -> int:
+    """Run the pipeline from the command line and print per-stage timings"""
+
+    # define command line arguments
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--arms", nargs="+", default=["CONTROL", "TREATMENT"])
+    parser.add_argument("--cohort-sizes", nargs="+", type=int, default=[5000])
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--reference-date", default=None, help="YYYY-MM-DD")
+    parser.add_argument("--sinks", nargs="*", default=DEFAULT_SINKS, choices=SINKS)
+    parser.add_argument("--mode", default="staged", choices=["staged", "pipelined"])
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--queue-batches", type=int, default=DEFAULT_QUEUE_BATCHES)
+    parser.add_argument("--max-cohorts", type=int, default=2)
+    parser.add_argument("--parquet-folder", default="../data")
+    parser.add_argument(
+        "--replace",
+        action="store_true",
+        help="replace the RDS rows of the cohorts week and group (one cohort size only)",
+    )
+    parser.add_argument("--process-workers", type=int, default=None)
+    parser.add_argument("--thread-workers", type=int, default=8)
+    parser.add_argument(
+        "--handoff",
+        default="pickle",
+        choices=shared_columns.HANDOFFS,
+        help="how staged workers send the cohorts to the sinks",
+    )
+    parser.add_argument(
+        "--log-folder",
+        default="../logs",
+        help="folder of the logs (the dynamo sink sends every file of it)",
+    )
+    parser.add_argument("--output", help="json file to save the stages of the run")
+    parser.add_argument(
+        "--trace-file", help="file to export the trace spans of the run"
+    )
+    parser.add_argument("--trace-format", default="jsonl", choices=tracing.EXPORTERS)
+    parser.add_argument(
+        "--memory-profile",
+        type=int,
+        nargs="?",
+        const=memory.DEFAULT_TOP,
+        default=None,
+        metavar="TOP",
+        help="record the memory peak and the TOP allocating lines of each stage",
+    )
+    args = parser.parse_args(argv)
+
+    # turn tracing on
+    if args.trace_file is not None:
+        tracing.configure(args.trace_file, args.trace_format)
+
+    # turn memory profiling on
+    if args.memory_profile is not None:
+        memory.enable(args.memory_profile)
+
+    # try to define cohorts
+    try:
+        cohorts = define_cohorts(args.arms, args.cohort_sizes, args.seed)
+        validate_cohorts(cohorts, args.replace)
+
+    # in case of repeated arms or cohort sizes (or many cohort sizes with --replace)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # run pipeline on pipelined mode
+    if args.mode == "pipelined":
+        run = run_pipelined(
+            cohorts,
+            sinks=args.sinks,
+            batch_size=args.batch_size,
+            queue_batches=args.queue_batches,
+            reference_date=args.reference_date,
+            replace=args.replace,
+            max_cohorts=args.max_cohorts,
+            parquet_folder=args.parquet_folder,
+            log_folder=args.log_folder,
+        )
+
+    # run pipeline on staged mode
+    else:
+        run = run_pipeline(
+            cohorts,
+            sinks=args.sinks,
+            reference_date=args.reference_date,
+            replace=args.replace,
+            process_workers=args.process_workers,
+            thread_workers=args.thread_workers,
+            parquet_folder=args.parquet_folder,
+            log_folder=args.log_folder,
+            handoff=args.handoff,
+        )
+
+    # summarize stages
+    summary = summarize_stages(run["stages"])
+
+    # print per-stage timings
+    print(
+        f"{'stage':<10}{'calls':>7}{'failed':>8}{'total s':>10}{'mean s':>10}{'max s':>10}"
+    )
+    for stage, s in summary.items():
+        print(
+            f"{stage:<10}{s['calls']:>7}{s['failures']:>8}{s['total_s']:>10.3f}{s['mean_s']:>10.3f}{s['max_s']:>10.3f}"
+        )
+    print(f"{'wall':<10}{'':>7}{'':>8}{run['wall_s']:>10.3f}")
+
+    # print per-stage memory peaks
+    if run["memory"] is not None:
+        print(f"\n{'stage':<10}{'peak MB':>10}")
+        for stage, s in summary.items():
+            if "peak_mb" in s:
+                print(f"{stage:<10}{s['peak_mb']:>10.1f}")
+        print(
+            f"peak RSS MB: run = {run['memory']['peak_rss_mb']}, workers = {run['memory']['peak_rss_children_mb']}"
+        )
+
+    # print failures
+    for stage in run["stages"]:
+        if stage["duration_s"] is None or is_failure(stage["response"]):
+            print(f"FAILED {stage['stage']} {stage['cohort']}: {stage['response']}")
+
+    # save stages of the run
+    if args.output is not None:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as output_file:
+            json.dump(
+                {"params": vars(args), "summary": summary, **run},
+                output_file,
+                indent=2,
+                default=str,
+            )
+
+    # fail if any stage failed
+    return int(any(s["failures"] for s in summary.values()))
+
+
+# check if script is being called directly
+if __name__ == "__main__":
+    sys.exit(main())
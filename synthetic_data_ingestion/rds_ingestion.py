@@ -5,11 +5,13 @@ import boto3
 import logging
 import time
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 from os.path import basename
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy import Float, SmallInteger, String
+from synthetic_data_ingestion import memory, tracing
+from synthetic_data_ingestion.cohort import Cohort
 from synthetic_data_ingestion.sample_creator import SynthCustomers
 
 
@@ -18,7 +20,8 @@ class RdsIngestor:
         """Class constructor. It will instanciate a SynthCustomers object.
 
         Args
-            synth_customer_object: a synthetic_data_ingestion.sample_creator.SynthCustomers object
+            synth_customer_object: a synthetic_data_ingestion.cohort.Cohort object (returned by
+                generate_samples) or a synthetic_data_ingestion.sample_creator.SynthCustomers object
             log_folder: a string with the path to store logs"""
 
         # instanciate logger
@@ -40,49 +43,25 @@ class RdsIngestor:
             datefmt="%Y:%m:%d %H:%M:%S",
         )
 
-        # check if synth_customer_object param is
-        # a synthetic_data_ingestion.sample_creator.SynthCustomers object
-        if type(synth_customer_object) != SynthCustomers:
+        # check if synth_customer_object param is a synthetic_data_ingestion.cohort.Cohort
+        # or a synthetic_data_ingestion.sample_creator.SynthCustomers object
+        if not isinstance(synth_customer_object, (Cohort, SynthCustomers)):
 
             # log a warning
             self.logger.critical(
-                "RdsIngestor object NOT instanciated: synth_customer_object param is NOT a synthetic_data_ingestion.sample_creator.SynthCustomers object"
+                "RdsIngestor object NOT instanciated: synth_customer_object param is NOT a synthetic_data_ingestion.cohort.Cohort or a synthetic_data_ingestion.sample_creator.SynthCustomers object"
             )
 
             raise Exception(
-                "synth_customer_object param must be a synthetic_data_ingestion.sample_creator.SynthCustomers object"
-            )
-
-        # define attributes of a SynthCustomers object
-        # after generate_samples and generate_report methods
-        # have been called
-        required_attributes = {
-            "gamma_shape",
-            "gamma_scale",
-            "poisson_lambda",
-            "region",
-            "region_weights",
-            "gender",
-            "gender_weights",
-            "device",
-            "device_weights",
-            "groups",
-            "logger",
-            "group",
-            "num_samples",
-            "sampling_dict",
-            "sampling_created",
-            "random_shape",
-            "random_scale",
-            "random_lam",
-            "gen_date_utc",
-            "creation_report",
-        }
+                "synth_customer_object param must be a synthetic_data_ingestion.cohort.Cohort or a synthetic_data_ingestion.sample_creator.SynthCustomers object"
+            )
 
-        # check if synth_customer_object param is has all attributes that
-        # a SynthCustomers object has after generate_samples and generate_report methods
-        # have been called
-        if set(synth_customer_object.__dict__.keys()) != required_attributes:
+        # check if synth_customer_object param has all attributes of a Cohort object
+        # (a SynthCustomers object has them after generate_samples and generate_report
+        # methods have been called; other attributes are not needed)
+        if not all(
+            hasattr(synth_customer_object, attribute) for attribute in Cohort.__slots__
+        ):
 
             # log a warning
             self.logger.critical(
@@ -101,13 +80,46 @@ class RdsIngestor:
             f"RdsIngestor object successfully instanciated: group = {synth_customer_object.group}, num_samples = {synth_customer_object.num_samples}"
         )
 
-    def ingest_samples(self) -> str:
-        """Send the generated samples to AWS RDS"""
+    @tracing.traced("rds.ingest_samples")
+    def ingest_samples(self, replace: bool = False) -> str:
+        """Send the generated samples to AWS RDS
+
+        Args
+            replace: a boolean to delete the rows of the same group and week
+                (purchase dates of the samples) before inserting the samples, in a
+                single transaction -> reruns overwrite and never duplicate rows
+                (load at most one cohort per group and week: see _delete_week_rows)"""
+
+        # check if there are samples to send (e.g. a SynthCustomers object used
+        # with generate_batches has none -> send them with ingest_batches)
+        if not self.synth_customers.sampling_dict:
+            # mark the trace span as failed
+            tracing.record_error("no samples")
+
+            # log a critical
+            self.logger.critical(
+                "ingest_samples method NOT successfully called: synth_customer_object param has no samples"
+            )
+
+            return "ingest_samples method NOT successfully called: synth_customer_object param has no samples"
 
         # create a dataframe based on
         # sampling information (on sampling_dict)
-        # from SynthCustomers object
-        self.df_ingestion = pd.DataFrame(data=self.synth_customers.sampling_dict)
+        # from SynthCustomers object (a copy of the samples -> memory tracked)
+        with memory.track("rds.dataframe"):
+            self.df_ingestion = pd.DataFrame(
+                data=dict(self.synth_customers.sampling_dict)
+            )
+
+        # add rows and bytes to the trace span
+        tracing.set_attributes(
+            group=self.synth_customers.group,
+            replace=replace,
+            rows=len(self.df_ingestion),
+            bytes=sum(
+                column.nbytes for column in self.synth_customers.sampling_dict.values()
+            ),
+        )
 
         # create engine to connect with AWS RDS
         self._create_conn_engine()
@@ -118,7 +130,14 @@ class RdsIngestor:
         # try to input data on AWS RDS
         try:
             # open connection with context manager
-            with self.engine.connect() as connection:
+            # (replace -> transaction: delete and insert are committed together)
+            with (
+                self.engine.begin() if replace else self.engine.connect()
+            ) as connection:
+                # delete rows of the same group and week
+                if replace:
+                    self._delete_week_rows(connection)
+
                 # insert data from df_insertion into database
                 self.df_ingestion.to_sql(
                     name="SyntheticCustomers",  # Name of SQL table
@@ -131,6 +150,9 @@ class RdsIngestor:
 
         # input not valid
         except Exception as e:
+            # mark the trace span as failed
+            tracing.record_error(str(e))
+
             # log a warning
             self.logger.critical(
                 f"ingest_samples method NOT successfully called: raised error ---> {e}"
@@ -147,6 +169,148 @@ class RdsIngestor:
 
             return "ingest_samples method successfully called"
 
+    @tracing.traced("rds.ingest_batches")
+    def ingest_batches(self, batches, replace: bool = False) -> str:
+        """Send batches of samples to AWS RDS as they arrive (e.g. from
+        SynthCustomers.generate_batches or a queue), inserting each batch
+        on the same transaction
+
+        Args
+            batches: an iterable of dicts with the same keys as sampling_dict
+            replace: a boolean to delete the rows of the same group and week
+                before inserting the batches -> reruns overwrite and never duplicate rows
+                (load at most one cohort per group and week: see _delete_week_rows)"""
+
+        # create engine to connect with AWS RDS
+        self._create_conn_engine()
+
+        # define schema to input data on table
+        self._create_ingestion_schema()
+
+        # instanciate number of inserted rows and bytes
+        num_rows = num_bytes = 0
+
+        # try to input data on AWS RDS
+        try:
+            # open a transaction with context manager
+            # (all batches are committed together)
+            with self.engine.begin() as connection:
+                # delete rows of the same group and week
+                if replace:
+                    self._delete_week_rows(connection)
+
+                # iterate over batches
+                for batch in batches:
+                    # insert batch into database
+                    pd.DataFrame(data=batch).to_sql(
+                        name="SyntheticCustomers",  # Name of SQL table
+                        con=connection,  # sqlalchemy.engine (Engine or Connection)
+                        schema="public",  # specify the schema
+                        if_exists="append",  # if the table already exists.
+                        index=False,  # don't write df index as a column
+                        dtype=self.dtype_schema,  # schame to input data on table
+                    )
+
+                    # count inserted rows and bytes
+                    num_rows += len(batch["group"])
+                    num_bytes += sum(column.nbytes for column in batch.values())
+
+        # input not valid
+        except Exception as e:
+            # mark the trace span as failed
+            tracing.record_error(str(e))
+
+            # log a warning
+            self.logger.critical(
+                f"ingest_batches method NOT successfully called: raised error ---> {e}"
+            )
+
+            return (
+                f"ingest_batches method NOT successfully called: raised error ---> {e}"
+            )
+
+        # input validated
+        else:
+            # add rows and bytes to the trace span
+            tracing.set_attributes(
+                group=self.synth_customers.group,
+                replace=replace,
+                rows=num_rows,
+                bytes=num_bytes,
+            )
+
+            # log an information
+            self.logger.info(
+                f"ingest_batches method successfully called: {num_rows} rows inserted"
+            )
+
+            return "ingest_batches method successfully called"
+
+    def _delete_week_rows(self, connection) -> None:
+        """Delete the rows of the samples group and week (from the reference date,
+        a Monday, to the reference date + 6 days) from the SyntheticCustomers table.
+        The table has no cohort column, so every row of the group and week would be
+        deleted, including rows of other cohorts: replacing callers must load a
+        single cohort per group and week (Backfiller and validate_cohorts of the
+        pipeline enforce it), and a week with more rows than the cohort (e.g. rows
+        appended by the DAG) is not replaced (the transaction is rolled back)
+
+        Args
+            connection: a sqlalchemy connection with an open transaction"""
+
+        # define first day of the week
+        start_date = self.synth_customers.gen_date_utc.date()
+
+        # validate user input -> weeks start on Monday (replaced weeks never overlap)
+        if start_date.weekday() != 0:
+            # raise value error with problem indication
+            raise ValueError(
+                f"replace needs a reference date on Monday (week start): {start_date} is a {start_date:%A}"
+            )
+
+        # table does not exist yet -> nothing to delete
+        if not inspect(connection).has_table("SyntheticCustomers", schema="public"):
+            return None
+
+        # define params of the rows of the same group and week
+        params = {
+            "group": self.synth_customers.group,
+            "start_date": str(start_date),
+            "end_date": str(start_date + timedelta(days=6)),
+        }
+
+        # count rows of the same group and week
+        num_rows = connection.execute(
+            text(
+                'SELECT COUNT(*) FROM public."SyntheticCustomers" '
+                'WHERE "group" = :group AND purchase_date BETWEEN :start_date AND :end_date'
+            ),
+            params,
+        ).scalar()
+
+        # validate table rows -> the week holds at most one cohort of the group
+        if num_rows > self.synth_customers.num_samples:
+            # raise value error with problem indication
+            raise ValueError(
+                f"replace would delete {num_rows} rows of the group and week "
+                f"(more than the {self.synth_customers.num_samples} samples of a cohort): "
+                "the week has rows of other cohorts (e.g. loaded by the DAG)"
+            )
+
+        # delete rows of the same group and week
+        result = connection.execute(
+            text(
+                'DELETE FROM public."SyntheticCustomers" '
+                'WHERE "group" = :group AND purchase_date BETWEEN :start_date AND :end_date'
+            ),
+            params,
+        )
+
+        # log an information
+        self.logger.info(
+            f"_delete_week_rows method successfully called: {result.rowcount} rows deleted"
+        )
+
     def _create_conn_engine(self) -> None:
         """Create a engine to connect with AWS RDS database"""
 
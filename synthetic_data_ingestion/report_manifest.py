@@ -0,0 +1,544 @@
+# import required libraries
+import os
+import json
+import time
+import boto3
+import botocore
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from dotenv import load_dotenv
+from synthetic_data_ingestion.serializers import get_serializer
+
+
+# prefix of the reports sent by the AWS Lambda API
+REPORT_PREFIX = "data_lake_raw/lambda_api/sampling_report"
+
+# name of the manifest files of each partition (extracted_at=YYYY-MM-DD)
+# -> one manifest shard per writer: _manifest-<shard>.json
+MANIFEST_NAME = "_manifest"
+
+# number of manifest shards of each partition (readers get all of them)
+MANIFEST_SHARDS = 8
+
+# report fields recorded on the manifest (used to select objects)
+MANIFEST_FIELDS = ["group", "gamma_shape", "poisson_lambda"]
+
+# S3 error codes of a conditional write that lost the race to another writer
+CONFLICT_CODES = {"PreconditionFailed", "ConditionalRequestConflict"}
+
+# first botocore version with S3 conditional writes (IfMatch / IfNoneMatch params)
+MIN_BOTOCORE_VERSION = (1, 35, 68)
+
+# lock of each manifest shard: writer threads of a process never race each other
+# (and updates are still atomic within the process when the S3 store does not
+# support conditional writes)
+_shard_locks = [threading.Lock() for _ in range(MANIFEST_SHARDS)]
+
+
+def check_botocore_version() -> None:
+    """Raise an error if the installed botocore has no S3 conditional writes
+    (every conditional PUT would raise ParamValidationError)"""
+
+    # get installed version
+    version = tuple(int(part) for part in botocore.__version__.split(".")[:3])
+
+    # validate installed version -> conditional writes are available
+    if version < MIN_BOTOCORE_VERSION:
+        # raise runtime error with problem indication
+        raise RuntimeError(
+            f"botocore {botocore.__version__} has no S3 conditional writes: "
+            f"botocore >= {'.'.join(map(str, MIN_BOTOCORE_VERSION))} is needed"
+        )
+
+
+def partition_prefix(partition_date) -> str:
+    """Get the S3 prefix of the reports received on the given date
+
+    Args
+        partition_date: a date or a string with format YYYY-MM-DD"""
+
+    return f"{REPORT_PREFIX}/extracted_at={partition_date}"
+
+
+def manifest_key(partition_date, shard: int) -> str:
+    """Get the S3 key of a manifest shard of the given partition
+
+    Args
+        partition_date: a date or a string with format YYYY-MM-DD
+        shard: an integer with the shard (from 0 to MANIFEST_SHARDS - 1)"""
+
+    return f"{partition_prefix(partition_date)}/{MANIFEST_NAME}-{shard}.json"
+
+
+def acquire_shard() -> int:
+    """Acquire the lock of a manifest shard: the shard of the current thread
+    when it is free, else the next free shard (waits for the shard of the
+    current thread if all of them are busy)
+
+    Return
+        shard: an integer with the acquired shard (release its lock after use)"""
+
+    # define shard of the current thread (same writer -> same shard)
+    first = threading.get_ident() % MANIFEST_SHARDS
+
+    # iterate over shards starting with the shard of the current thread
+    for offset in range(MANIFEST_SHARDS):
+        shard = (first + offset) % MANIFEST_SHARDS
+
+        # shard is free -> use it
+        if _shard_locks[shard].acquire(blocking=False):
+            return shard
+
+    # all shards are busy -> wait for the shard of the current thread
+    _shard_locks[first].acquire()
+
+    return first
+
+
+def manifest_entry(key: str, size: int, reports: list) -> dict:
+    """Create the manifest entry of a report object
+
+    Args
+        key: a string with the S3 key of the object
+        size: an integer with the size (in bytes) of the object
+        reports: a list of the reports (dicts) stored on the object"""
+
+    return {
+        "key": key,
+        "size": size,
+        "reports": [
+            {field: report.get(field) for field in MANIFEST_FIELDS}
+            for report in reports
+        ],
+    }
+
+
+def update_manifest(
+    s3, bucket: str, partition_date, entries: list, max_retries: int = 10
+) -> int:
+    """Add entries to a manifest shard of the given partition.
+    Each shard is updated by one thread of a process at a time (see
+    acquire_shard), so the manifest of a partition is not a hotspot and each
+    update only rewrites a shard. The shard is replaced with a conditional PUT
+    (If-Match on the ETag that was read, If-None-Match on a new shard), so
+    writers of other processes never overwrite each other: the writer that
+    loses the race reads the shard again and retries. If the S3 store does not
+    support conditional writes, updates are only atomic within the process
+    (shard locks). Conditional writes need
+    botocore >= 1.35.68 (older SDKs raise ParamValidationError, see
+    check_botocore_version)
+
+    Args
+        s3: a boto3 S3 client
+        bucket: a string with the bucket name
+        partition_date: a date or a string with format YYYY-MM-DD
+        entries: a list of dicts created by manifest_entry
+        max_retries: an integer with the maximum number of conflicting writes
+
+    Return
+        num_objects: an integer with the number of objects on the manifest shard"""
+
+    # acquire a manifest shard
+    shard = acquire_shard()
+
+    # define manifest key
+    key = manifest_key(partition_date, shard)
+
+    # conditional writes are used until the S3 store rejects them
+    conditional = True
+
+    # try to update the shard (its lock is always released)
+    try:
+        # iterate over attempts
+        for attempt in range(max_retries):
+            # read current manifest and its ETag
+            manifest, etag, _ = read_manifest(s3, bucket, key)
+
+            # add new entries
+            manifest["objects"].extend(entries)
+
+            # define put params
+            put_params = {
+                "Bucket": bucket,
+                "Key": key,
+                "Body": json.dumps(manifest).encode("UTF-8"),
+                "ContentType": "application/json",
+            }
+
+            # only replace the manifest that was read
+            if conditional:
+                if etag is None:
+                    put_params["IfNoneMatch"] = "*"
+                else:
+                    put_params["IfMatch"] = etag
+
+            # try to put manifest
+            try:
+                s3.put_object(**put_params)
+
+            # S3 store errors
+            except ClientError as e:
+                # get error code
+                code = e.response.get("Error", {}).get("Code")
+
+                # S3 store without conditional writes -> fall back to the shard lock
+                if conditional and code == "NotImplemented":
+                    conditional = False
+                    continue
+
+                # another writer updated the manifest -> retry with backoff
+                if code in CONFLICT_CODES:
+                    time.sleep(random.uniform(0, 0.05 * 2**attempt))
+                    continue
+
+                raise
+
+            return len(manifest["objects"])
+
+        raise RuntimeError(
+            f"manifest {key} not updated: {max_retries} conflicting writes in a row"
+        )
+
+    # release the shard
+    finally:
+        _shard_locks[shard].release()
+
+
+def read_manifest(s3, bucket: str, key: str) -> tuple:
+    """Read a manifest and its ETag
+
+    Args
+        s3: a boto3 S3 client
+        bucket: a string with the bucket name
+        key: a string with the manifest key
+
+    Return
+        (manifest, etag, last_modified): a dict with the manifest "objects", a string
+            with its ETag and a datetime with its last modification (an empty
+            manifest, None and None if it does not exist yet)"""
+
+    # try to get manifest
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key)
+
+    # manifest does not exist yet
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return {"objects": []}, None, None
+
+        raise
+
+    return (
+        json.loads(response["Body"].read()),
+        response["ETag"],
+        response["LastModified"],
+    )
+
+
+def read_manifests(s3, bucket: str, dates: list, max_workers: int = 8) -> list:
+    """Read the manifests of the given partitions in parallel
+    (the shards of each partition are merged)
+
+    Args
+        s3: a boto3 S3 client
+        bucket: a string with the bucket name
+        dates: a list of dates (or strings with format YYYY-MM-DD)
+        max_workers: an integer with the maximum number of parallel reads
+
+    Return
+        manifests: a list of merge_shards tuples in the dates order"""
+
+    # open a thread pool with context manager
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # read each shard on its own thread
+        shards = list(
+            executor.map(
+                lambda key: read_manifest(s3, bucket, key),
+                [
+                    manifest_key(partition_date, shard)
+                    for partition_date in dates
+                    for shard in range(MANIFEST_SHARDS)
+                ],
+            )
+        )
+
+    return [
+        merge_shards(shards[idx : idx + MANIFEST_SHARDS])
+        for idx in range(0, len(shards), MANIFEST_SHARDS)
+    ]
+
+
+def merge_shards(shards: list) -> tuple:
+    """Merge the manifest shards of a partition
+
+    Args
+        shards: a list of read_manifest tuples
+
+    Return
+        (manifest, etag, last_modified): a dict with the "objects" of all shards
+            (sorted by key -> time the reports were received), a string with
+            the ETags of the shards and a datetime with the last modification
+            of a shard (an empty manifest, None and None without shards)"""
+
+    # get ETags and last modifications of the existing shards
+    etags = [etag for _, etag, _ in shards if etag is not None]
+    modified = [lm for _, _, lm in shards if lm is not None]
+
+    return (
+        {
+            "objects": sorted(
+                (entry for manifest, _, _ in shards for entry in manifest["objects"]),
+                key=lambda entry: entry["key"],
+            )
+        },
+        ",".join(etags) if etags else None,
+        max(modified) if modified else None,
+    )
+
+
+def partition_dates(start_date, end_date) -> list:
+    """Get all dates between start_date and end_date (included)
+
+    Args
+        start_date: a date or a string with format YYYY-MM-DD
+        end_date: a date or a string with format YYYY-MM-DD"""
+
+    # convert strings to dates
+    start_date, end_date = [
+        d if isinstance(d, date) else date.fromisoformat(d)
+        for d in [start_date, end_date]
+    ]
+
+    return [
+        start_date + timedelta(days=days)
+        for days in range((end_date - start_date).days + 1)
+    ]
+
+
+def report_filters(
+    group: str = None, gamma_shape: int = None, poisson_lambda: int = None
+) -> dict:
+    """Get the given report filters (None = no filter)"""
+
+    return {
+        field: value
+        for field, value in zip(MANIFEST_FIELDS, [group, gamma_shape, poisson_lambda])
+        if value is not None
+    }
+
+
+def match_report(report: dict, filters: dict) -> bool:
+    """Check if a report (or a manifest entry report) matches all filters"""
+
+    return all(report.get(field) == value for field, value in filters.items())
+
+
+def select_entries(manifests: list, filters: dict) -> list:
+    """Select the manifest entries of the objects with at least one
+    report that matches the filters
+
+    Args
+        manifests: a list of manifest dicts
+        filters: a dict created by report_filters"""
+
+    return [
+        entry
+        for manifest in manifests
+        for entry in manifest["objects"]
+        if any(match_report(report, filters) for report in entry["reports"])
+    ]
+
+
+def fetch_reports(
+    s3, bucket: str, entries: list, filters: dict, max_workers: int = 8
+) -> list:
+    """Download the objects of the given manifest entries in parallel and
+    keep the reports that match the filters
+
+    Args
+        s3: a boto3 S3 client
+        bucket: a string with the bucket name
+        entries: a list of manifest entries
+        filters: a dict created by report_filters
+        max_workers: an integer with the maximum number of parallel downloads
+
+    Return
+        reports: a list of reports (dicts) in the entries order"""
+
+    # open a thread pool with context manager
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # download each object on its own thread
+        objects = executor.map(
+            lambda entry: parse_reports(
+                entry["key"],
+                s3.get_object(Bucket=bucket, Key=entry["key"])["Body"].read(),
+            ),
+            entries,
+        )
+
+        # keep matching reports (NDJSON objects may have other reports)
+        return [
+            report
+            for reports in objects
+            for report in reports
+            if match_report(report, filters)
+        ]
+
+
+def parse_reports(key: str, content: bytes) -> list:
+    """Deserialize the reports of an object written by the AWS Lambda API
+
+    Args
+        key: a string with the S3 key of the object (its extension defines the format)
+        content: the bytes of the object
+
+    Return
+        reports: a list of reports (dicts)"""
+
+    # NDJSON -> one json report per line
+    if key.endswith(".ndjson"):
+        serializer = get_serializer("json")
+        return [serializer.loads(line) for line in content.splitlines() if line]
+
+    # msgpack -> one report
+    if key.endswith(".msgpack"):
+        return [get_serializer("msgpack").loads(content)]
+
+    # json -> one report
+    return [get_serializer("json").loads(content)]
+
+
+class ReportManifestReader:
+    def __init__(self, log_folder: str = None, max_workers: int = 8) -> None:
+        """Instanciate a reader of the reports sent by the AWS Lambda API that uses
+        the partition manifests to select objects (no LIST of the partitions)
+
+        Args
+            log_folder: a string with the path to store logs
+            max_workers: an integer with the maximum number of parallel downloads"""
+
+        # instanciate logger
+        self.logger = logging.getLogger("report_manifest.py")
+
+        # define log date in utc
+        logging.Formatter.converter = time.gmtime
+
+        # check if user input a folder to store logs
+        if log_folder is None:
+            # set a default folder
+            log_folder = "../logs"
+
+        # define logging configuration
+        logging.basicConfig(
+            filename=f"{log_folder}/data_ingestion-{datetime.utcnow().date()}.log",
+            level=logging.INFO,
+            format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+            datefmt="%Y:%m:%d %H:%M:%S",
+        )
+
+        # take environment variables from .env.
+        load_dotenv()
+
+        # define bucket name -> raise error if not found
+        self.bucket = os.environ["AWS_S3_BUCKET"]
+
+        # define maximum number of parallel downloads
+        self.max_workers = max_workers
+
+        # create a S3 client (thread safe) with one connection per download thread
+        self.s3 = boto3.client(
+            "s3", config=Config(max_pool_connections=max(max_workers, 10))
+        )
+
+        # log an information
+        self.logger.info(
+            f"ReportManifestReader object successfully instanciated: max_workers = {max_workers}"
+        )
+
+    def get_manifest(self, partition_date) -> dict:
+        """Get the manifest of the given partition
+
+        Args
+            partition_date: a date or a string with format YYYY-MM-DD"""
+
+        # read manifest shards
+        manifest, _, _ = read_manifests(
+            self.s3, self.bucket, [partition_date], self.max_workers
+        )[0]
+
+        return manifest
+
+    def select(
+        self,
+        start_date,
+        end_date,
+        group: str = None,
+        gamma_shape: int = None,
+        poisson_lambda: int = None,
+    ) -> list:
+        """Select the manifest entries of the objects with reports that match the
+        given fields, reading one manifest per day (in parallel)
+
+        Args
+            start_date: a date or a string with format YYYY-MM-DD (included)
+            end_date: a date or a string with format YYYY-MM-DD (included)
+            group: a string to filter reports by group
+            gamma_shape: an integer to filter reports by gamma_shape
+            poisson_lambda: an integer to filter reports by poisson_lambda"""
+
+        # read manifest of each day
+        manifests = read_manifests(
+            self.s3,
+            self.bucket,
+            partition_dates(start_date, end_date),
+            self.max_workers,
+        )
+
+        # keep objects with at least one matching report
+        entries = select_entries(
+            [manifest for manifest, _, _ in manifests],
+            report_filters(group, gamma_shape, poisson_lambda),
+        )
+
+        # log an information
+        self.logger.info(
+            f"select method successfully called: {len(entries)} objects selected"
+        )
+
+        return entries
+
+    def read_reports(self, start_date, end_date, **filters) -> list:
+        """Read the reports that match the given fields, downloading the
+        selected objects in parallel
+
+        Args
+            start_date: a date or a string with format YYYY-MM-DD (included)
+            end_date: a date or a string with format YYYY-MM-DD (included)
+            filters: the report filters of select method (group, gamma_shape, poisson_lambda)
+
+        Return
+            reports: a list of reports (dicts) in the manifest order"""
+
+        # select objects
+        entries = self.select(start_date, end_date, **filters)
+
+        # download objects and keep matching reports
+        reports = fetch_reports(
+            self.s3,
+            self.bucket,
+            entries,
+            report_filters(**filters),
+            self.max_workers,
+        )
+
+        # log an information
+        self.logger.info(
+            f"read_reports method successfully called: {len(reports)} reports read"
+        )
+
+        return reports
@@ -3,7 +3,9 @@ import sys
 import time
 import logging
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from synthetic_data_ingestion import memory, tracing
+from synthetic_data_ingestion.cohort import Cohort
 
 
 class SynthGenBase:
@@ -47,8 +49,11 @@ class SynthGenBase:
         # instanciate possible groups
         self.groups = ["CONTROL", "TREATMENT"]
 
-    def input_validation(self, group: str, num_samples: int) -> None:
-        """Validate user input in regard to group names and number of samples params"""
+    def input_validation(
+        self, group: str, num_samples: int, reference_date=None, seed: int = None
+    ) -> None:
+        """Validate user input in regard to group names, number of samples,
+        reference date and seed params"""
 
         # validate user input -> group = str
         if not isinstance(group, str):
@@ -70,19 +75,42 @@ class SynthGenBase:
             # raise value error with problem indication
             raise ValueError("num_samples param must be an integer >= 1")
 
+        # validate user input -> reference_date = None, date or string YYYY-MM-DD
+        if not (reference_date is None or isinstance(reference_date, (date, str))):
+            # raise value error with problem indication
+            raise TypeError(
+                "reference_date param must be a date or a string with format YYYY-MM-DD"
+            )
+
+        # validate user input -> seed = None or integer >= 0
+        if not (seed is None or (isinstance(seed, int) and seed >= 0)):
+            # raise value error with problem indication
+            raise ValueError("seed param must be an integer >= 0")
+
         return None  # explicitly
 
 
 class SynthCustomers(SynthGenBase):
     """Class to generate synthetic customer behavior given user inputs"""
 
-    def __init__(self, num_samples: int, group: str, log_folder: str = None):
+    def __init__(
+        self,
+        num_samples: int,
+        group: str,
+        log_folder: str = None,
+        reference_date=None,
+        seed: int = None,
+    ):
         """Object constructor
 
         Args
             num_samples: an integer with the number of synthetic customers to generates
             group: a string ("CONTROL" or "TREATMENT") to indicate AB-testing group
-            log_folder: a string with the path to store logs"""
+            log_folder: a string with the path to store logs
+            reference_date: a date or a string with format YYYY-MM-DD with the first
+                day of the purchase dates (None = ingestion date in UTC)
+            seed: an integer to seed the random generator (same seed and params
+                -> same samples and report; None = random)"""
 
         # inherit from father class
         super().__init__()
@@ -109,7 +137,16 @@ class SynthCustomers(SynthGenBase):
         # try to validate input
         try:
             # validate user inputs before assigning them to object attributes
-            self.input_validation(group=group, num_samples=num_samples)
+            self.input_validation(
+                group=group,
+                num_samples=num_samples,
+                reference_date=reference_date,
+                seed=seed,
+            )
+
+            # convert reference date string to date
+            if isinstance(reference_date, str):
+                reference_date = date.fromisoformat(reference_date)
 
         # input not valid
         except Exception as e:
@@ -127,6 +164,13 @@ class SynthCustomers(SynthGenBase):
             self.group = group
             # define num_samples attribute
             self.num_samples = num_samples
+            # define reference_date attribute
+            self.reference_date = reference_date
+            # define seed attribute
+            self.seed = seed
+
+            # define numpy number generator (shared by all generating methods)
+            self.np_gen = np.random.default_rng(seed)
 
             # define dictionary that will hold synthetic data
             self.sampling_dict = {}
@@ -139,34 +183,40 @@ class SynthCustomers(SynthGenBase):
                 f"SynthCustomers object successfully instanciated: group = {self.group}, num_samples = {self.num_samples}"
             )
 
+    @tracing.traced("sample_creator.gen_group")
+    @memory.tracked("sample_creator.gen_group")
     def gen_group(self) -> None:
         """Generate group attribute for the given object"""
 
         # group label to be used on A/B testing
-        self.sampling_dict["group"] = np.array([self.group] * self.num_samples)
+        self.sampling_dict["group"] = self._draw_group(self.num_samples)
+
+        # add rows and bytes to the trace span
+        self._trace_column("group")
 
         # log a debug
         self.logger.debug(f"gen_group method successfully called: group = {self.group}")
 
         return None  # explicitly
 
+    @tracing.traced("sample_creator.gen_total_purchase_price")
+    @memory.tracked("sample_creator.gen_total_purchase_price")
     def gen_total_purchase_price(self) -> None:
         """Generate group total_purchase_price attribute for the given object using
         a gamma distribution so as to have purchase as a continuous right skewed distribution"""
 
-        # define numpy number generator
-        np_gen = np.random.default_rng()
         # chose a random shape a scale params to create the gamma distribution
-        self.random_shape = np.random.choice(self.gamma_shape, size=1)
-        self.random_scale = np.random.choice(self.gamma_scale, size=1)
+        self.random_shape = self.np_gen.choice(self.gamma_shape, size=1)
+        self.random_scale = self.np_gen.choice(self.gamma_scale, size=1)
 
         # generate gamma distribution
-        self.sampling_dict["total_purchase_price"] = np.float16(
-            np_gen.gamma(
-                shape=self.random_shape, scale=self.random_scale, size=self.num_samples
-            )
+        self.sampling_dict["total_purchase_price"] = self._draw_total_purchase_price(
+            self.num_samples
         )
 
+        # add rows and bytes to the trace span
+        self._trace_column("total_purchase_price")
+
         # log a debug
         self.logger.debug(
             f"gen_total_purchase_price method successfully called: shape = {self.random_shape[0]}, scale = {self.random_scale[0]}"
@@ -174,23 +224,23 @@ class SynthCustomers(SynthGenBase):
 
         return None  # explicitly
 
+    @tracing.traced("sample_creator.gen_num_diff_items")
+    @memory.tracked("sample_creator.gen_num_diff_items")
     def gen_num_diff_items(self) -> None:
         """Generate group num_diff_items attribute for the given object using
         a poisson distribution so as to have purchase as a discrete right skewed distribution"""
 
-        # define numpy number generator
-        np_gen = np.random.default_rng()
-
         # choose a random poisson lambda to create the poisson distribution
-        self.random_lam = np.random.choice(self.poisson_lambda, size=1)
+        self.random_lam = self.np_gen.choice(self.poisson_lambda, size=1)
 
         # generate poisson distribution
-        # the "+1" is to avoid getting number of different items equal to zero
-        # once poisson distribution start from 0
-        self.sampling_dict["num_diff_items"] = np.int16(
-            np_gen.poisson(lam=self.random_lam, size=self.num_samples) + 1
+        self.sampling_dict["num_diff_items"] = self._draw_num_diff_items(
+            self.num_samples
         )
 
+        # add rows and bytes to the trace span
+        self._trace_column("num_diff_items")
+
         # log a debug
         self.logger.debug(
             f"gen_num_diff_items method successfully called: lam = {self.random_lam[0]}"
@@ -198,28 +248,21 @@ class SynthCustomers(SynthGenBase):
 
         return None  # explicitly
 
+    @tracing.traced("sample_creator.gen_purchase_date")
+    @memory.tracked("sample_creator.gen_purchase_date")
     def gen_purchase_date(self) -> None:
         """Generate purchase_date attribute for the given object using
-        the ingestion date (in UTC) as a refence and randomly assign number of days
-        so as to cover one week interval (from "ingestion date" to "ingestion date + 6 days")"""
+        the reference date (ingestion date in UTC by default) as a refence and randomly assign
+        number of days so as to cover one week interval (from "reference date" to "reference date + 6 days")"""
 
         # define generating date as an attribute
-        self.gen_date_utc = datetime.utcnow()
-
-        # generate synthetic random dates from "ingestion date" to "ingestion date + 6 days"
-        self.sampling_dict["purchase_date"] = np.array(
-            [
-                str(
-                    # present date in UTC
-                    self.gen_date_utc.date()
-                    +
-                    # random number of days
-                    timedelta(days=np.random.randint(low=0, high=7))
-                )
-                # iterate "num_samples" times
-                for _ in range(self.num_samples)
-            ]
-        )
+        self._choose_gen_date()
+
+        # generate synthetic random dates from "reference date" to "reference date + 6 days"
+        self.sampling_dict["purchase_date"] = self._draw_purchase_date(self.num_samples)
+
+        # add rows and bytes to the trace span
+        self._trace_column("purchase_date")
 
         # log a debug
         self.logger.debug(
@@ -228,18 +271,18 @@ class SynthCustomers(SynthGenBase):
 
         return None  # explicitly
 
+    @tracing.traced("sample_creator.gen_region")
+    @memory.tracked("sample_creator.gen_region")
     def gen_region(self) -> None:
         """Generate region attribute for the given object with synthetic data"""
         # Region meaning:
         # LAM = Latin America, NAM = North America, EUR = Europe, AFR = Africa, ASA = Asia
 
         # generate synthetic region data
-        self.sampling_dict["region"] = np.random.choice(
-            self.region,
-            size=self.num_samples,  # number of samples
-            replace=True,  # create variability
-            p=self.region_weights,  # weight of regions
-        )
+        self.sampling_dict["region"] = self._draw_region(self.num_samples)
+
+        # add rows and bytes to the trace span
+        self._trace_column("region")
 
         # log a debug
         self.logger.debug(
@@ -248,16 +291,16 @@ class SynthCustomers(SynthGenBase):
 
         return None  # explicitly
 
+    @tracing.traced("sample_creator.gen_gender")
+    @memory.tracked("sample_creator.gen_gender")
     def gen_gender(self) -> None:
         """Generate gender attribute for the given object with synthetic data"""
 
         # generate synthetic customer gender data
-        self.sampling_dict["gender"] = np.random.choice(
-            self.gender,
-            size=self.num_samples,  # number of samples
-            replace=True,  # create variability
-            p=self.gender_weights,  # gender weights
-        )
+        self.sampling_dict["gender"] = self._draw_gender(self.num_samples)
+
+        # add rows and bytes to the trace span
+        self._trace_column("gender")
 
         # log a debug
         self.logger.debug(
@@ -266,16 +309,16 @@ class SynthCustomers(SynthGenBase):
 
         return None  # explicitly
 
+    @tracing.traced("sample_creator.gen_device")
+    @memory.tracked("sample_creator.gen_device")
     def gen_device(self) -> None:
         """Generate device attribute for the given object with synthetic data"""
 
         # generate synthetic customer device data
-        self.sampling_dict["device"] = np.random.choice(
-            self.device,
-            size=self.num_samples,  # number of samples
-            replace=True,  # create variability
-            p=self.device_weights,  # device weights
-        )
+        self.sampling_dict["device"] = self._draw_device(self.num_samples)
+
+        # add rows and bytes to the trace span
+        self._trace_column("device")
 
         # log a debug
         self.logger.debug(
@@ -284,8 +327,152 @@ class SynthCustomers(SynthGenBase):
 
         return None  # explicitly
 
-    def generate_samples(self):
-        """Main function that create all the needed object attributes given the available methods"""
+    def _trace_column(self, column: str) -> None:
+        """Add the rows and bytes of a generated column to the current trace span"""
+
+        tracing.set_attributes(
+            rows=self.num_samples, bytes=self.sampling_dict[column].nbytes
+        )
+
+    def _choose_gen_date(self) -> None:
+        """Define the generating date: the reference date at midnight
+        (for backfills of past weeks) or the ingestion date (in UTC)"""
+
+        # define generating date as an attribute
+        if self.reference_date is None:
+            self.gen_date_utc = datetime.utcnow()
+        else:
+            self.gen_date_utc = datetime.combine(
+                self.reference_date, datetime.min.time()
+            )
+
+    def _draw_total_purchase_price(self, size: int) -> np.ndarray:
+        """Draw size total purchase prices from the chosen gamma distribution"""
+
+        return np.float16(
+            self.np_gen.gamma(
+                shape=self.random_shape, scale=self.random_scale, size=size
+            )
+        )
+
+    def _draw_num_diff_items(self, size: int) -> np.ndarray:
+        """Draw size numbers of different items from the chosen poisson distribution"""
+
+        # the "+1" is to avoid getting number of different items equal to zero
+        # once poisson distribution start from 0
+        return np.int16(self.np_gen.poisson(lam=self.random_lam, size=size) + 1)
+
+    def _draw_purchase_date(self, size: int) -> np.ndarray:
+        """Draw size purchase dates (YYYY-MM-DD strings) of the generating date week"""
+
+        # define the 7 dates of the week once (YYYY-MM-DD strings)
+        week_dates = np.array(
+            [str(self.gen_date_utc.date() + timedelta(days=days)) for days in range(7)]
+        )
+
+        # random number of days added to the generating date
+        return week_dates[self.np_gen.integers(low=0, high=7, size=size)]
+
+    def _draw_region(self, size: int) -> np.ndarray:
+        """Draw size regions given the region weights"""
+
+        return self.np_gen.choice(
+            self.region,
+            size=size,  # number of samples
+            replace=True,  # create variability
+            p=self.region_weights,  # weight of regions
+        )
+
+    def _draw_gender(self, size: int) -> np.ndarray:
+        """Draw size genders given the gender weights"""
+
+        return self.np_gen.choice(
+            self.gender,
+            size=size,  # number of samples
+            replace=True,  # create variability
+            p=self.gender_weights,  # gender weights
+        )
+
+    def _draw_group(self, size: int) -> np.ndarray:
+        """Get size group labels"""
+
+        return np.full(size, self.group)
+
+    def _draw_device(self, size: int) -> np.ndarray:
+        """Draw size devices given the device weights"""
+
+        return self.np_gen.choice(
+            self.device,
+            size=size,  # number of samples
+            replace=True,  # create variability
+            p=self.device_weights,  # device weights
+        )
+
+    def generate_batches(self, batch_size: int):
+        """Generate the synthetic customers in batches of at most batch_size samples,
+        so sinks can start writing before the whole cohort is generated and only the
+        batches in flight are kept in memory (sampling_dict stays empty).
+        Distribution params are chosen now, so generate_report can be called
+        before the batches are consumed. The random draws are made in another
+        order than generate_samples (params first, then column by column in each
+        batch), so with the same seed the batches are reproducible for the same
+        batch_size but do not match the samples (nor the params) of generate_samples
+
+        Args
+            batch_size: an integer with the maximum number of samples of a batch
+
+        Return
+            batches: an iterator of dicts with the same keys as sampling_dict"""
+
+        # validate user input -> batch_size >= 1
+        if not (isinstance(batch_size, int) and batch_size >= 1):
+            # raise value error with problem indication
+            raise ValueError("batch_size param must be an integer >= 1")
+
+        # chose a random shape a scale params to create the gamma distribution
+        self.random_shape = self.np_gen.choice(self.gamma_shape, size=1)
+        self.random_scale = self.np_gen.choice(self.gamma_scale, size=1)
+        # choose a random poisson lambda to create the poisson distribution
+        self.random_lam = self.np_gen.choice(self.poisson_lambda, size=1)
+        # define generating date
+        self._choose_gen_date()
+
+        # change sampling created flag (params are defined)
+        self.sampling_created = True
+
+        # log an information
+        self.logger.info(
+            f"generate_batches method successfully called: batch_size = {batch_size}"
+        )
+
+        def batches():
+            # iterate over batch sizes
+            for start in range(0, self.num_samples, batch_size):
+                # define number of samples of the batch
+                size = min(batch_size, self.num_samples - start)
+
+                # draw batch (same columns as generate_samples, not the same
+                # random draws: see the docstring)
+                yield {
+                    "total_purchase_price": self._draw_total_purchase_price(size),
+                    "num_diff_items": self._draw_num_diff_items(size),
+                    "purchase_date": self._draw_purchase_date(size),
+                    "region": self._draw_region(size),
+                    "gender": self._draw_gender(size),
+                    "group": self._draw_group(size),
+                    "device": self._draw_device(size),
+                }
+
+        return batches()
+
+    @tracing.traced("sample_creator.generate_samples")
+    @memory.tracked("sample_creator.generate_samples")
+    def generate_samples(self) -> Cohort:
+        """Main function that create all the needed object attributes given the available methods
+
+        Return
+            cohort: a Cohort object with the samples (made read-only, not copied) and
+                the creation report (compact and immutable -> cheap to send to the ingestors)"""
 
         # generate total_purchase_price data
         self.gen_total_purchase_price()
@@ -305,10 +492,27 @@ class SynthCustomers(SynthGenBase):
         # change sampling created flag
         self.sampling_created = True
 
+        # make samples read-only (the cohort shares them, without copies)
+        for values in self.sampling_dict.values():
+            values.flags.writeable = False
+
+        # add rows and bytes to the trace span
+        tracing.set_attributes(
+            group=self.group,
+            rows=self.num_samples,
+            bytes=sum(column.nbytes for column in self.sampling_dict.values()),
+        )
+
         # log an information
         self.logger.info(f"generate_samples method successfully called.")
 
-        return None  # explicitly
+        return Cohort(
+            group=self.group,
+            num_samples=self.num_samples,
+            gen_date_utc=self.gen_date_utc,
+            sampling_dict=self.sampling_dict,
+            creation_report=self._creation_report(),
+        )
 
     def generate_report(self) -> dict:
         """Record the params used to generate the synthetic data for the given object"""
@@ -317,16 +521,7 @@ class SynthCustomers(SynthGenBase):
         if self.sampling_created:
 
             # create report attribute that will hold creation variables in a dict format
-            self.creation_report = {
-                "group": self.group,
-                "gamma_shape": self.random_shape[0],
-                "gamma_scale": self.random_scale[0],
-                "poisson_lambda": self.random_lam[0],
-                "date_interval": f"[{self.gen_date_utc.date()},{self.gen_date_utc.date() + timedelta(days = 6)}] [extremes included]",
-                "region": dict(zip(self.region, self.region_weights)),
-                "gender": dict(zip(self.gender, self.gender_weights)),
-                "device": dict(zip(self.device, self.device_weights)),
-            }
+            self.creation_report = self._creation_report()
 
             # log an information
             self.logger.info(f"generate_report method successfully called.")
@@ -344,3 +539,17 @@ class SynthCustomers(SynthGenBase):
             raise Exception(
                 "You need to create sampling (via generate_samples method) before making the report (via random_creation_report method)"
             )
+
+    def _creation_report(self) -> dict:
+        """Get the params used to generate the synthetic data (creation report)"""
+
+        return {
+            "group": self.group,
+            "gamma_shape": self.random_shape[0],
+            "gamma_scale": self.random_scale[0],
+            "poisson_lambda": self.random_lam[0],
+            "date_interval": f"[{self.gen_date_utc.date()},{self.gen_date_utc.date() + timedelta(days = 6)}] [extremes included]",
+            "region": dict(zip(self.region, self.region_weights)),
+            "gender": dict(zip(self.gender, self.gender_weights)),
+            "device": dict(zip(self.device, self.device_weights)),
+        }
@@ -0,0 +1,160 @@
+# import required libraries
+import json
+
+# numpy is optional so that the AWS Lambda API can use this module
+# without shipping numpy on its package
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# orjson is optional -> the stdlib json serializer is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# msgpack is optional -> only needed for the binary format
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def numpy_default(obj):
+    """Convert numpy scalars and arrays (not natively handled by a serializer)
+    to python objects. Used as the "default" hook of all serializers"""
+
+    # numpy objects only exist if numpy is installed
+    if np is not None:
+        # if item is numpy integer
+        if isinstance(obj, np.integer):
+            return int(obj)
+        # if item is numpy float
+        if isinstance(obj, np.floating):
+            return float(obj)
+        # if item is numpy boolean
+        if isinstance(obj, np.bool_):
+            return bool(obj)
+        # if item is numpy array
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+class NpEncoder(json.JSONEncoder):
+    """Custom encoder for json.dumps so as to avoid errors similar to:
+    'Encoder Object of type int64 is not JSON serializable'"""
+
+    def default(self, obj):
+        # try to convert numpy objects
+        try:
+            return numpy_default(obj)
+        # not a numpy object
+        except TypeError:
+            return super(NpEncoder, self).default(obj)
+
+
+class StdlibJsonSerializer:
+    """JSON serializer based on the stdlib json module (always available)"""
+
+    # serializer name, http content type and file extension
+    name = "stdlib-json"
+    content_type = "application/json"
+    extension = "json"
+
+    def dumps(self, obj) -> bytes:
+        """Serialize obj to json bytes"""
+        return json.dumps(obj, cls=NpEncoder).encode("UTF-8")
+
+    def loads(self, data: bytes):
+        """Deserialize json bytes"""
+        return json.loads(data)
+
+
+class OrjsonSerializer:
+    """JSON serializer based on orjson: numpy scalars and arrays are
+    serialized natively (no python "default" hook call per numpy object)"""
+
+    # serializer name, http content type and file extension
+    name = "orjson"
+    content_type = "application/json"
+    extension = "json"
+
+    def dumps(self, obj) -> bytes:
+        """Serialize obj to json bytes"""
+        return orjson.dumps(
+            obj, option=orjson.OPT_SERIALIZE_NUMPY, default=numpy_default
+        )
+
+    def loads(self, data: bytes):
+        """Deserialize json bytes"""
+        return orjson.loads(data)
+
+
+class MsgpackSerializer:
+    """Compact binary serializer based on MessagePack"""
+
+    # serializer name, http content type and file extension
+    name = "msgpack"
+    content_type = "application/msgpack"
+    extension = "msgpack"
+
+    def dumps(self, obj) -> bytes:
+        """Serialize obj to msgpack bytes"""
+        return msgpack.packb(obj, default=numpy_default, use_bin_type=True)
+
+    def loads(self, data: bytes):
+        """Deserialize msgpack bytes"""
+        return msgpack.unpackb(data, raw=False)
+
+
+# available serializers (name -> class)
+SERIALIZERS = {"stdlib-json": StdlibJsonSerializer}
+if orjson is not None:
+    SERIALIZERS["orjson"] = OrjsonSerializer
+if msgpack is not None:
+    SERIALIZERS["msgpack"] = MsgpackSerializer
+
+# serializer instances already created (name -> instance)
+_instances = {}
+
+
+def register_serializer(name: str, serializer_class) -> None:
+    """Register a new serializer class (it must have name, content_type and
+    extension attributes and dumps/loads methods)
+
+    Args
+        name: a string with the name used on get_serializer
+        serializer_class: a serializer class"""
+
+    # add serializer class to the available serializers
+    SERIALIZERS[name] = serializer_class
+
+    # remove a cached instance with the same name
+    _instances.pop(name, None)
+
+
+def get_serializer(name: str = "json"):
+    """Get a serializer instance by name
+
+    Args
+        name: a string with a SERIALIZERS name or "json" for the fastest
+            available json serializer (orjson if installed, else stdlib json)"""
+
+    # "json" -> fastest available json serializer
+    if name == "json":
+        name = "orjson" if "orjson" in SERIALIZERS else "stdlib-json"
+
+    # unknown serializer
+    if name not in SERIALIZERS:
+        raise ValueError(
+            f"serializer {name} not available: choose one of {['json'] + list(SERIALIZERS)}"
+        )
+
+    # create serializer instance only once
+    if name not in _instances:
+        _instances[name] = SERIALIZERS[name]()
+
+    return _instances[name]
@@ -0,0 +1,231 @@
+"""Zero-copy handoff of the sampling_dict columns between processes: the producer
+(e.g. a generation worker process) copies each column into a named shared memory
+block and sends only a small descriptor (block name, dtype and shape per column),
+so the cost of sending a cohort no longer grows with its size. The consumer attaches
+read-only numpy views on the blocks and releases them (close + unlink) when
+its sinks are done.
+
+Lifetime: blocks belong to the consumer once the descriptor is sent. Releasing
+unlinks the blocks (their names are removed, the memory stays mapped) and closes
+them. Views are created on a ctypes array that holds the block buffer (a numpy
+view made on block.buf itself does not keep the memory mapped: closing would
+unmap it under the view), so SharedMemory.close raises BufferError while any view
+is alive, e.g. when a Cohort still references the columns after its sinks are
+done. Its close is then deferred and retried by later releases (or
+close_deferred): the memory is unmapped once the last view is gone.
+Blocks of a descriptor that is never attached can be removed with unlink_columns,
+and the resource tracker of the run process (ensure_cleanup) unlinks any leaked
+block when the run process exits. Blocks live on /dev/shm on Linux (its size limits
+the cohorts in flight).
+
+Usage
+    from synthetic_data_ingestion import shared_columns
+
+    # producer process
+    descriptor = shared_columns.share_columns(synth_customers.sampling_dict)
+
+    # consumer process
+    with shared_columns.SharedColumns(descriptor) as columns:
+        df = pd.DataFrame(data=columns)
+"""
+
+# import required libraries
+import ctypes
+import logging
+import threading
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+
+# ways of sending the generated cohorts from the worker processes to the sinks
+HANDOFFS = ["pickle", "shared_memory"]
+
+# instanciate logger
+logger = logging.getLogger("shared_columns.py")
+
+# released blocks that still have views (closed by close_deferred) and their lock
+_deferred_blocks = []
+_deferred_lock = threading.Lock()
+
+
+def ensure_cleanup() -> None:
+    """Start the resource tracker of the run process before its worker processes,
+    so workers share it and blocks never released are unlinked when the run
+    process exits (instead of when the worker that created them exits)"""
+
+    resource_tracker.ensure_running()
+
+
+def close_deferred() -> int:
+    """Close the released blocks whose views are gone (see SharedColumns.release)
+
+    Return
+        num_blocks: an integer with the number of blocks still open (views alive)"""
+
+    with _deferred_lock:
+        # try to close each deferred block (keep the ones with views alive)
+        _deferred_blocks[:] = [
+            block for block in _deferred_blocks if not _try_close(block)
+        ]
+
+        return len(_deferred_blocks)
+
+
+def _try_close(block: shared_memory.SharedMemory) -> bool:
+    """Unmap a block (False if views on it are still alive)"""
+
+    # try to close block
+    try:
+        block.close()
+
+    # buffer still exported to numpy views
+    except BufferError:
+        return False
+
+    return True
+
+
+def share_columns(columns: dict) -> dict:
+    """Copy columns to new shared memory blocks (one per column)
+
+    Args
+        columns: a dict of numpy arrays (e.g. sampling_dict)
+
+    Return
+        descriptor: a dict with the block name, dtype and shape of each column"""
+
+    # instanciate descriptor
+    descriptor = {}
+
+    # try to copy columns
+    try:
+        # iterate over columns
+        for column, values in columns.items():
+            # validate input -> fixed size items (object arrays hold pointers)
+            if values.dtype.hasobject:
+                # raise value error with problem indication
+                raise ValueError(f"{column} column has object dtype")
+
+            # create block (shared memory blocks can't be empty)
+            block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+
+            # copy column to block
+            np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[...] = values
+
+            # describe block and close it (the consumer unlinks it)
+            descriptor[column] = {
+                "name": block.name,
+                "dtype": values.dtype.str,
+                "shape": values.shape,
+            }
+            block.close()
+
+    # in case of errors -> remove blocks already created
+    except Exception:
+        unlink_columns(descriptor)
+        raise
+
+    # log a debug
+    logger.debug(f"share_columns successfully called: columns = {list(descriptor)}")
+
+    return descriptor
+
+
+def unlink_columns(descriptor: dict) -> None:
+    """Remove the shared memory blocks of a descriptor (without attaching views)
+
+    Args
+        descriptor: a dict created by share_columns"""
+
+    # iterate over blocks
+    for column in descriptor.values():
+        # try to remove block
+        try:
+            block = shared_memory.SharedMemory(name=column["name"])
+            block.close()
+            block.unlink()
+
+        # block was already removed
+        except FileNotFoundError:
+            pass
+
+
+class SharedColumns:
+    """Read-only numpy views on the shared memory blocks of a descriptor.
+    Used as a context manager, the blocks are released on exit"""
+
+    __slots__ = ("descriptor", "columns", "_blocks")
+
+    def __init__(self, descriptor: dict) -> None:
+        """Class constructor: attach the blocks of the descriptor
+
+        Args
+            descriptor: a dict created by share_columns"""
+
+        # instanciate descriptor, views and blocks
+        self.descriptor = descriptor
+        self.columns = {}
+        self._blocks = []
+
+        # try to attach blocks
+        try:
+            # iterate over columns
+            for column, spec in descriptor.items():
+                # attach block
+                block = shared_memory.SharedMemory(name=spec["name"])
+                self._blocks.append(block)
+
+                # create read-only view (sinks must not change a shared cohort)
+                # on a ctypes array that holds the block buffer -> the view and
+                # every view derived from it keep the block mapped
+                values = np.ndarray(
+                    tuple(spec["shape"]),
+                    dtype=np.dtype(spec["dtype"]),
+                    buffer=(ctypes.c_char * block.size).from_buffer(block.buf),
+                )
+                values.flags.writeable = False
+                self.columns[column] = values
+
+        # in case of errors -> remove all blocks
+        except Exception:
+            self.release()
+            unlink_columns(descriptor)
+            raise
+
+    def __enter__(self) -> dict:
+        return self.columns
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        self.release()
+        return False
+
+    def release(self) -> None:
+        """Drop the views and remove the blocks (call it when the sinks of the
+        cohort are done). Blocks with views kept elsewhere (e.g. by a Cohort) stay
+        mapped until the last view is gone: their close is deferred to
+        close_deferred, which also runs on every release"""
+
+        # drop views
+        self.columns = {}
+
+        # iterate over blocks
+        for block in self._blocks:
+            # remove block name (the memory stays mapped while it is open)
+            try:
+                block.unlink()
+            except FileNotFoundError:
+                pass
+
+            # unmap block or defer it until its views are gone
+            if not _try_close(block):
+                with _deferred_lock:
+                    _deferred_blocks.append(block)
+
+        # no blocks left
+        self._blocks = []
+
+        # close blocks of previous releases whose views are gone
+        num_blocks = close_deferred()
+
+        # log a debug
+        logger.debug(f"release successfully called: {num_blocks} blocks with views")
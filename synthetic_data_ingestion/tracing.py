@@ -0,0 +1,412 @@
+"""Lightweight tracing of the pipeline stages: nested spans (name, duration,
+attributes such as rows and bytes) exported as one JSON line per span, either
+as plain records ("jsonl") or as OTLP/JSON trace requests ("otlp", the format of
+the OpenTelemetry file exporter). Tracing is off by default: spans are then a
+shared no-op object and traced functions are called directly.
+
+Usage
+    from synthetic_data_ingestion import tracing
+    tracing.configure("../logs/traces.jsonl")  # or env var SDI_TRACE_FILE
+
+    with tracing.span("pipeline.rds", cohort="control-5000") as current:
+        current.set_attributes(rows=5000)
+"""
+
+# import required libraries
+import os
+import json
+import time
+import logging
+import secrets
+import threading
+import functools
+import contextvars
+from synthetic_data_ingestion.serializers import numpy_default
+
+
+# formats of the exported spans
+EXPORTERS = ["jsonl", "otlp"]
+
+# environment variables that enable tracing on import
+# (e.g. on Airflow workers or on spawned worker processes)
+TRACE_FILE_ENV = "SDI_TRACE_FILE"
+TRACE_FORMAT_ENV = "SDI_TRACE_FORMAT"
+
+# name of the traced service
+SERVICE_NAME = "synthetic_data_ingestion"
+
+# instanciate logger
+logger = logging.getLogger("tracing.py")
+
+# span of the current thread or task (parent of the next span)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# exporter of the finished spans (None = tracing off)
+_exporter = None
+
+
+class JsonLinesExporter:
+    """Append each finished span as a JSON line on a local file"""
+
+    def __init__(self, path: str) -> None:
+        """Class constructor
+
+        Args
+            path: a string with the path of the file that receives the spans"""
+
+        # instanciate file path
+        self.path = path
+
+        # instanciate lock -> lines of concurrent threads are not interleaved
+        self.lock = threading.Lock()
+
+    def format(self, span) -> dict:
+        """Get the JSON record of a finished span"""
+
+        return {
+            "name": span.name,
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_span_id": span.parent_span_id,
+            "start_time_unix_nano": span.start_ns,
+            "end_time_unix_nano": span.end_ns,
+            "duration_s": (span.end_ns - span.start_ns) / 1e9,
+            "status": span.status,
+            "attributes": span.attributes,
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+        }
+
+    def export(self, span) -> None:
+        """Write a finished span on the file
+
+        Args
+            span: a finished Span object"""
+
+        # serialize span
+        line = json.dumps(self.format(span), default=_plain) + "\n"
+
+        # append line (file is opened per span -> safe across worker processes)
+        with self.lock:
+            with open(self.path, "a") as trace_file:
+                trace_file.write(line)
+
+
+class OtlpFileExporter(JsonLinesExporter):
+    """Append each finished span as an OTLP/JSON ExportTraceServiceRequest line
+    (readable by the OpenTelemetry collector otlpjsonfile receiver)"""
+
+    def format(self, span) -> dict:
+        """Get the OTLP/JSON request of a finished span"""
+
+        # define OTLP span
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": _otlp_attributes(span.attributes),
+            "status": {"code": 2, "message": span.attributes.get("error", "")}
+            if span.status == "error"
+            else {"code": 1},
+        }
+
+        # add parent span of nested spans
+        if span.parent_span_id is not None:
+            otlp_span["parentSpanId"] = span.parent_span_id
+
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": _otlp_attributes(
+                            {"service.name": SERVICE_NAME, "process.pid": os.getpid()}
+                        )
+                    },
+                    "scopeSpans": [
+                        {"scope": {"name": SERVICE_NAME}, "spans": [otlp_span]}
+                    ],
+                }
+            ]
+        }
+
+
+class Span:
+    """A timed operation of a trace, with the attributes of its work"""
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_span_id",
+        "attributes",
+        "status",
+        "start_ns",
+        "end_ns",
+        "_token",
+    )
+
+    def __init__(self, name: str, parent: dict = None, attributes: dict = None):
+        """Class constructor. The parent is the current span unless it is given
+
+        Args
+            name: a string with the name of the span (e.g. "rds.ingest_samples")
+            parent: a dict with the trace_id and span_id of the parent span
+                (from current_context, e.g. of another process)
+            attributes: a dict with the attributes of the span"""
+
+        # get parent context (current span by default)
+        if parent is None:
+            parent = current_context()
+
+        # instanciate span identifiers (a span without parent starts a trace)
+        self.name = name
+        self.trace_id = parent["trace_id"] if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent["span_id"] if parent else None
+
+        # instanciate attributes and status
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start_ns = self.end_ns = None
+        self._token = None
+
+    def set_attributes(self, **attributes) -> None:
+        """Add attributes to the span (e.g. rows=5000, bytes=40000)"""
+
+        self.attributes.update(attributes)
+
+    def record_error(self, message: str) -> None:
+        """Mark the span as failed (e.g. by an ingestor that returns its errors)"""
+
+        self.status = "error"
+        self.attributes["error"] = message
+
+    def __enter__(self):
+        # become the current span and start timer
+        self._token = _current_span.set(self)
+        self.start_ns = time.time_ns()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        # stop timer and restore parent span
+        self.end_ns = time.time_ns()
+        _current_span.reset(self._token)
+
+        # record raised errors (the error is not suppressed)
+        if exc_type is not None:
+            self.record_error(f"{exc_type.__name__}: {exc_value}")
+
+        # export span (exporter errors never break the traced code)
+        exporter = _exporter
+        if exporter is not None:
+            try:
+                exporter.export(self)
+            except Exception as e:
+                logger.warning(f"span {self.name} NOT exported: raised error ---> {e}")
+
+        return False
+
+
+class _NoopSpan:
+    """Span used when tracing is off (does nothing)"""
+
+    __slots__ = ()
+
+    def set_attributes(self, **attributes) -> None:
+        """Ignore attributes"""
+
+    def record_error(self, message: str) -> None:
+        """Ignore errors"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        return False
+
+
+# shared no-op span
+NOOP_SPAN = _NoopSpan()
+
+
+def configure(path: str, exporter: str = "jsonl") -> None:
+    """Turn tracing on: spans are appended to the path file
+
+    Args
+        path: a string with the path of the file that receives the spans
+        exporter: a string with the format of the spans ("jsonl" or "otlp")"""
+
+    global _exporter
+
+    # validate user input -> exporter in EXPORTERS
+    if exporter not in EXPORTERS:
+        # raise value error with problem indication
+        raise ValueError(f"exporter param must be one of {EXPORTERS}")
+
+    # instanciate exporter
+    _exporter = (
+        OtlpFileExporter(path) if exporter == "otlp" else JsonLinesExporter(path)
+    )
+
+    # log an information
+    logger.info(f"tracing configured: exporter = {exporter}, path = {path}")
+
+
+def configure_from_env() -> None:
+    """Turn tracing on if the SDI_TRACE_FILE environment variable is set
+    (format on SDI_TRACE_FORMAT, "jsonl" by default)"""
+
+    # get trace file
+    path = os.environ.get(TRACE_FILE_ENV)
+
+    # tracing stays off without trace file
+    if path:
+        configure(path, os.environ.get(TRACE_FORMAT_ENV, "jsonl"))
+
+
+def disable() -> None:
+    """Turn tracing off"""
+
+    global _exporter
+
+    _exporter = None
+
+
+def is_enabled() -> bool:
+    """Check if tracing is on"""
+
+    return _exporter is not None
+
+
+def span(name: str, parent: dict = None, **attributes):
+    """Create a span to use as a context manager (a no-op span if tracing is off)
+
+    Args
+        name: a string with the name of the span
+        parent: a dict with the trace_id and span_id of the parent span
+        attributes: the attributes of the span (e.g. cohort="control-5000")"""
+
+    # tracing off -> shared no-op span
+    if _exporter is None:
+        return NOOP_SPAN
+
+    return Span(name, parent, attributes)
+
+
+def current_span():
+    """Get the current span (the no-op span if there is none)"""
+
+    return _current_span.get() or NOOP_SPAN
+
+
+def set_attributes(**attributes) -> None:
+    """Add attributes to the current span (ignored if tracing is off)"""
+
+    # get current span
+    current = _current_span.get()
+
+    # add attributes
+    if current is not None:
+        current.set_attributes(**attributes)
+
+
+def record_error(message: str) -> None:
+    """Mark the current span as failed (ignored if tracing is off)"""
+
+    # get current span
+    current = _current_span.get()
+
+    # mark span as failed
+    if current is not None:
+        current.record_error(message)
+
+
+def current_context():
+    """Get the trace_id and span_id of the current span, to be the parent
+    of spans of other processes (None if there is no current span)"""
+
+    # get current span
+    current = _current_span.get()
+
+    # no current span -> no parent
+    if current is None:
+        return None
+
+    return {"trace_id": current.trace_id, "span_id": current.span_id}
+
+
+def propagate(func):
+    """Bind func to a copy of the current context, so the spans it opens on
+    another thread (e.g. of a ThreadPoolExecutor) are children of the current span.
+    Each submitted call needs its own propagate call"""
+
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+def traced(name: str):
+    """Decorator that runs the decorated function on a span
+
+    Args
+        name: a string with the name of the span"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # tracing off -> plain call
+            if _exporter is None:
+                return func(*args, **kwargs)
+
+            # run function on a span
+            with Span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _plain(value):
+    """Convert an attribute value to a JSON type (numpy values included)"""
+
+    # try to convert numpy values
+    try:
+        return numpy_default(value)
+
+    # other types are exported as strings
+    except TypeError:
+        return str(value)
+
+
+def _otlp_attributes(attributes: dict) -> list:
+    """Convert attributes to OTLP/JSON key-value pairs"""
+
+    # instanciate OTLP attributes
+    otlp_attributes = []
+
+    # iterate over attributes
+    for key, value in attributes.items():
+        # convert numpy values
+        if not isinstance(value, (bool, int, float, str)):
+            value = _plain(value)
+
+        # define typed value (int64 values are strings on OTLP/JSON)
+        if isinstance(value, bool):
+            typed_value = {"boolValue": value}
+        elif isinstance(value, int):
+            typed_value = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed_value = {"doubleValue": value}
+        else:
+            typed_value = {"stringValue": str(value)}
+
+        otlp_attributes.append({"key": key, "value": typed_value})
+
+    return otlp_attributes
+
+
+# turn tracing on from the environment variables
+configure_from_env()
@@ -0,0 +1,247 @@
+# import required libraries
+import time
+import pytest
+import threading
+from datetime import date
+from unittest.mock import patch
+from synthetic_data_ingestion.backfill import (
+    Backfiller,
+    backfill_idempotency_key,
+    backfill_weeks,
+    cohort_seed,
+    main,
+)
+
+
+class TestBackfillHelpers:
+    def test_backfill_weeks(self):
+        """Check if weeks start on start_date (a Monday) and end on end_date (included)"""
+
+        assert (
+            backfill_weeks("2022-01-03", "2022-01-17")
+            == [date(2022, 1, 3), date(2022, 1, 10), date(2022, 1, 17)]
+        ) and (len(backfill_weeks(date(2022, 1, 3), date(2022, 12, 31))) == 52)
+
+    def test_backfill_weeks_not_monday(self):
+        """Check if weeks that do not start on Monday are rejected
+        (reruns would replace parts of the neighbouring weeks)"""
+
+        with pytest.raises(ValueError):
+            backfill_weeks("2022-01-05", "2022-01-31")
+
+    def test_cohort_seed(self):
+        """Check if seeds are derived from the week, the group and the backfill seed"""
+
+        assert (
+            (
+                cohort_seed("2022-01-03", "CONTROL")
+                == cohort_seed(date(2022, 1, 3), "CONTROL")
+            )
+            and (
+                cohort_seed("2022-01-03", "CONTROL")
+                != cohort_seed("2022-01-10", "CONTROL")
+            )
+            and (
+                cohort_seed("2022-01-03", "CONTROL")
+                != cohort_seed("2022-01-03", "TREATMENT")
+            )
+            and (
+                cohort_seed("2022-01-03", "CONTROL")
+                != cohort_seed("2022-01-03", "CONTROL", 1)
+            )
+        )
+
+    def test_backfill_idempotency_key(self):
+        """Check if each cohort has its own fixed Idempotency-Key"""
+
+        assert backfill_idempotency_key(
+            date(2022, 1, 3), "CONTROL"
+        ) == backfill_idempotency_key("2022-01-03", "CONTROL") and (
+            backfill_idempotency_key("2022-01-03", "CONTROL")
+            != backfill_idempotency_key("2022-01-03", "TREATMENT")
+        )
+
+
+class TestBackfiller:
+    def test_constructor_invalid_max_workers(self, tmpdir):
+        """Check if constructor raises an error on invalid max_workers"""
+
+        with pytest.raises(ValueError):
+            Backfiller("2022-01-03", "2022-01-17", max_workers=0, log_folder=tmpdir)
+
+    def test_constructor_repeated_arms(self, tmpdir):
+        """Check if constructor raises an error on repeated arms
+        (two cohorts of a group would replace each other's rows)"""
+
+        with pytest.raises(ValueError):
+            Backfiller(
+                "2022-01-03",
+                "2022-01-17",
+                arms=["CONTROL", "CONTROL"],
+                log_folder=tmpdir,
+            )
+
+    def test_main(self, tmpdir, capsys):
+        """Check if the command line runs the backfill and fails on cohort errors"""
+
+        # run backfill without AWS RDS (second week fails)
+        with patch(
+            "synthetic_data_ingestion.backfill.RdsIngestor.ingest_samples",
+            lambda rds_ingestor, replace=False: (
+                "ingest_samples method successfully called"
+                if rds_ingestor.synth_customers.gen_date_utc.day == 3
+                else "ingest_samples method NOT successfully called"
+            ),
+        ):
+            exit_code = main(
+                [
+                    "--start-date",
+                    "2022-01-03",
+                    "--end-date",
+                    "2022-01-10",
+                    "--arms",
+                    "CONTROL",
+                    "--num-samples",
+                    "10",
+                    "--no-reports",
+                    "--log-folder",
+                    str(tmpdir),
+                ]
+            )
+
+        # get printed results
+        lines = capsys.readouterr().out.splitlines()
+
+        assert (
+            (exit_code == 1)
+            and (len(lines) == 2)
+            and lines[0].endswith("OK")
+            and ("NOT successful" in lines[1])
+        )
+
+    def test_run(self, tmpdir):
+        """Check if every week and arm is loaded with at most max_workers
+        cohorts in parallel, with the week as reference date"""
+
+        # instanciate list of loaded cohorts and in-flight counters
+        loaded, in_flight, max_in_flight = [], [0], [0]
+        lock = threading.Lock()
+
+        def ingest_samples(rds_ingestor, replace=False):
+            # count cohorts in flight
+            with lock:
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+                loaded.append(
+                    (
+                        rds_ingestor.synth_customers.gen_date_utc.date(),
+                        rds_ingestor.synth_customers.group,
+                        replace,
+                    )
+                )
+
+            # slow load
+            time.sleep(0.01)
+
+            with lock:
+                in_flight[0] -= 1
+
+            return "ingest_samples method successfully called"
+
+        # instanciate Backfiller object
+        backfiller = Backfiller(
+            "2022-01-03",
+            "2022-03-28",
+            num_samples=10,
+            max_workers=3,
+            send_reports=False,
+            log_folder=tmpdir,
+        )
+
+        # run backfill without AWS RDS
+        with patch(
+            "synthetic_data_ingestion.backfill.RdsIngestor.ingest_samples",
+            ingest_samples,
+        ):
+            results = backfiller.run()
+
+        assert (
+            (len(results) == 13 * 2)
+            and all("error" not in result for result in results)
+            and (
+                sorted(loaded)
+                == sorted(
+                    (week_start, group, True)
+                    for week_start in backfill_weeks("2022-01-03", "2022-03-28")
+                    for group in ["CONTROL", "TREATMENT"]
+                )
+            )
+            and (1 < max_in_flight[0] <= 3)
+        )
+
+    def test_run_reproducible(self, tmpdir):
+        """Check if reruns generate the same samples and send reports
+        with the same Idempotency-Key"""
+
+        # instanciate list of loaded samples and report keys
+        samples, keys = [], []
+
+        def ingest_samples(rds_ingestor, replace=False):
+            samples.append(
+                rds_ingestor.synth_customers.sampling_dict["total_purchase_price"]
+            )
+            return "ingest_samples method successfully called"
+
+        def send_report_to_lambda(lambda_ingestor, batcher=None):
+            keys.append(lambda_ingestor.idempotency_key)
+            return "HTTP status of report input to S3 bucket --> 200"
+
+        # run backfill of one week and arm twice
+        with patch(
+            "synthetic_data_ingestion.backfill.RdsIngestor.ingest_samples",
+            ingest_samples,
+        ), patch(
+            "synthetic_data_ingestion.backfill.LambdaIngestor.send_report_to_lambda",
+            send_report_to_lambda,
+        ):
+            for _ in range(2):
+                results = Backfiller(
+                    "2022-01-03",
+                    "2022-01-03",
+                    arms=["CONTROL"],
+                    num_samples=100,
+                    log_folder=tmpdir,
+                ).run()
+
+        assert (
+            (samples[0] == samples[1]).all()
+            and (
+                keys[0] == keys[1] == backfill_idempotency_key("2022-01-03", "CONTROL")
+            )
+            and (
+                results[0]["lambda"]
+                == "HTTP status of report input to S3 bucket --> 200"
+            )
+        )
+
+    def test_run_rds_error(self, tmpdir):
+        """Check if the report is not sent when the samples are not loaded"""
+
+        # run backfill with AWS RDS errors
+        with patch(
+            "synthetic_data_ingestion.backfill.RdsIngestor.ingest_samples",
+            return_value="ingest_samples method NOT successfully called: raised error ---> X",
+        ), patch(
+            "synthetic_data_ingestion.backfill.LambdaIngestor.send_report_to_lambda"
+        ) as mock_send:
+            results = Backfiller(
+                "2022-01-03",
+                "2022-01-03",
+                arms=["CONTROL"],
+                num_samples=10,
+                log_folder=tmpdir,
+            ).run()
+
+        assert results[0]["error"].startswith("load_week method NOT successful") and (
+            mock_send.call_count == 0
+        )
@@ -0,0 +1,151 @@
+# import required libraries
+import pickle
+import pytest
+import numpy as np
+from datetime import datetime
+from synthetic_data_ingestion.cohort import Cohort, to_builtin
+from synthetic_data_ingestion.sample_creator import SynthCustomers
+
+
+@pytest.fixture
+def synth_customers(tmpdir):
+    """Generate the samples and report of a small cohort"""
+
+    # generate samples and report
+    synth_customers = SynthCustomers(
+        num_samples=1000,
+        group="TREATMENT",
+        log_folder=tmpdir,
+        reference_date="2022-01-03",
+        seed=5,
+    )
+    synth_customers.generate_samples()
+    synth_customers.generate_report()
+
+    return synth_customers
+
+
+class TestCohort:
+    def test_generate_samples_cohort(self, synth_customers):
+        """Check if generate_samples returns a cohort with read-only views of
+        the samples (made read-only on the object too) and the creation report"""
+
+        # generate samples again (same object)
+        cohort = synth_customers.generate_samples()
+
+        assert (
+            isinstance(cohort, Cohort)
+            and (cohort.group == "TREATMENT")
+            and (cohort.num_samples == 1000)
+            and (cohort.gen_date_utc == synth_customers.gen_date_utc)
+            and (cohort.creation_report == synth_customers.generate_report())
+            and all(
+                np.shares_memory(values, synth_customers.sampling_dict[column])
+                and not values.flags.writeable
+                for column, values in cohort.sampling_dict.items()
+            )
+            # samples of the object are read-only (shared with the cohort)
+            and not synth_customers.sampling_dict["region"].flags.writeable
+        )
+
+    def test_frozen(self, synth_customers):
+        """Check if cohort attributes can't be changed"""
+
+        # generate cohort
+        cohort = synth_customers.generate_samples()
+
+        # try to change the cohort
+        with pytest.raises(AttributeError):
+            cohort.group = "CONTROL"
+        with pytest.raises(AttributeError):
+            del cohort.creation_report
+        with pytest.raises(AttributeError):
+            cohort.logger = None
+        with pytest.raises(ValueError):
+            cohort.sampling_dict["num_diff_items"][0] = 0
+        with pytest.raises(TypeError):
+            cohort.sampling_dict["region"] = cohort.sampling_dict["gender"]
+        with pytest.raises(TypeError):
+            cohort.creation_report["gamma_shape"] = 0
+        with pytest.raises(TypeError):
+            cohort.creation_report["region"]["LAM"] = 1.0
+
+    def test_writeable_columns_copied(self):
+        """Check if writeable columns are copied (their owner can't change the cohort)
+        and if the report is kept as a frozen copy"""
+
+        # define writeable columns and report
+        values = np.arange(3)
+        report = {"group": "CONTROL", "histogram": [1, 2], "region": {"LAM": 0.5}}
+
+        # create cohort
+        cohort = Cohort("CONTROL", 3, datetime(2022, 1, 3), {"id": values}, report)
+
+        # change columns and report
+        values[0] = 10
+        report["histogram"].append(3)
+
+        assert (
+            (cohort.sampling_dict["id"].tolist() == [0, 1, 2])
+            and not np.shares_memory(cohort.sampling_dict["id"], values)
+            and (cohort.creation_report["histogram"] == (1, 2))
+            and (
+                to_builtin(cohort.creation_report)
+                == {"group": "CONTROL", "histogram": [1, 2], "region": {"LAM": 0.5}}
+            )
+        )
+
+    def test_to_bytes(self, synth_customers):
+        """Check if a cohort is equal after a round trip through to_bytes and pickle,
+        and smaller than the pickled SynthCustomers object"""
+
+        # generate cohort
+        cohort = synth_customers.generate_samples()
+
+        # serialize cohort
+        data = cohort.to_bytes()
+        pickled = pickle.dumps(cohort)
+
+        # deserialize cohort
+        loaded = Cohort.from_bytes(data)
+
+        assert (
+            (loaded == cohort)
+            and (pickle.loads(pickled) == cohort)
+            and all(
+                not values.flags.writeable for values in loaded.sampling_dict.values()
+            )
+            and (len(pickled) < len(pickle.dumps(synth_customers)))
+            and (
+                len(data)
+                < sum(values.nbytes for values in cohort.sampling_dict.values()) + 2048
+            )
+        )
+
+    def test_with_columns(self, synth_customers):
+        """Check if with_columns returns a new cohort with other samples"""
+
+        # generate cohort and a copy without samples
+        cohort = synth_customers.generate_samples()
+        empty = cohort.with_columns({})
+
+        assert (
+            (empty.sampling_dict == {})
+            and (empty.creation_report == cohort.creation_report)
+            and (Cohort.from_bytes(empty.to_bytes()) == empty)
+            and (len(cohort.sampling_dict) == 7)
+        )
+
+    def test_invalid(self, synth_customers):
+        """Check if invalid columns and data raise errors"""
+
+        # generate cohort
+        cohort = synth_customers.generate_samples()
+
+        # columns with the wrong number of samples
+        with pytest.raises(ValueError):
+            cohort.with_columns({"region": np.array(["LAM"])})
+
+        # data that is not a serialized cohort
+        with pytest.raises(ValueError):
+            Cohort.from_bytes(pickle.dumps(to_builtin(cohort.creation_report)))
@@ -0,0 +1,253 @@
+# import required libraries
+import os
+import io
+import json
+import zlib
+import time
+import pytest
+import boto3
+import pandas as pd
+from datetime import datetime
+from moto import mock_dynamodb, mock_s3
+from unittest.mock import patch, mock_open
+from synthetic_data_ingestion.dynamodb_ingestion import DynamodbIngestor
+from synthetic_data_ingestion.dynamodb_archival import DynamodbLogArchiver
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_SECURITY_TOKEN"] = "testing"
+    os.environ["AWS_SESSION_TOKEN"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+
+
+@pytest.fixture(scope="function")
+def fake_log_table(aws_credentials, *args, **kwargs):
+    """Pytest fixture that creates a fake DynamoDB table with
+    expired, expiring, old, recent and bundled logs
+    """
+    # open moto mock with fake aws credentials
+    with mock_dynamodb(aws_credentials):
+        # create a fake DynamoDB Table
+        table = boto3.resource("dynamodb").create_table(
+            TableName=os.environ["AWS_DYNAMODB_TABLE"],
+            KeySchema=[
+                {"AttributeName": "timestamp", "KeyType": "HASH"},
+                {"AttributeName": "log_file_sequence", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "timestamp", "AttributeType": "S"},
+                {"AttributeName": "log_file_sequence", "AttributeType": "N"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+
+        # define now in the log table timestamp format
+        now = datetime.utcnow().strftime("%Y:%m:%dZ%H:%M:%S")
+
+        # define items: (timestamp, sequence, expires_at)
+        items = [
+            ("2022:07:01Z10:00:00", 1, int(time.time()) - 60),  # expired
+            ("2022:07:04Z10:00:00", 1, int(time.time()) + 3600),  # expiring
+            ("2022:07:02Z10:00:00", 1, None),  # old without TTL
+            (now, 1, int(time.time()) + 30 * 86400),  # recent
+            ("bundle#run_1", 0, int(time.time()) - 60),  # expired bundle index
+        ]
+
+        # iterate over items
+        for timestamp, sequence, expires_at in items:
+            # define item
+            item = {
+                "timestamp": timestamp,
+                "log_file_sequence": sequence,
+                "level": "INFO",
+                "name": "sample_creator.py",
+                "msg": "message",
+                "run_id": "run_1",
+            }
+            # add TTL if needed
+            if expires_at is not None:
+                item["expires_at"] = expires_at
+            # put item
+            table.put_item(Item=item)
+
+        # put the chunk of the expired bundle (one log line)
+        table.put_item(
+            Item={
+                "timestamp": "bundle#run_1",
+                "log_file_sequence": 1,
+                "num_logs": 1,
+                "bundle": zlib.compress(
+                    json.dumps(
+                        ["2022:07:03Z10:00:00", 1, "INFO", "pipeline.py", "bundled"]
+                    ).encode("UTF-8")
+                    + b"\n"
+                ),
+                "expires_at": int(time.time()) - 60,
+            }
+        )
+
+        # yield the fake table
+        yield table
+
+
+class TestDynamodbLogArchiver:
+
+    # mock "with open" clause and "os.listdir"
+    @patch(
+        target="builtins.open",
+        new_callable=mock_open,
+        read_data="2022:07:01 10:00:00 - INFO - sample_creator.py - message\n",
+    )
+    @patch(target="os.listdir", return_value=["log1"])
+    def test_send_logs_ttl(self, mock_list_dir, mock_open, fake_log_table):
+        """test if send_logs method sets the TTL attribute at write time"""
+
+        # instanciate dynamodb ingestor and send logs with a 30 days TTL
+        DynamodbIngestor("mocking").send_logs(run_id="run_ttl", ttl_days=30)
+
+        # get the sent item
+        item = fake_log_table.get_item(
+            Key={"timestamp": "2022:07:01Z10:00:00", "log_file_sequence": 1}
+        )["Item"]
+
+        assert abs(int(item["expires_at"]) - (time.time() + 30 * 86400)) < 60
+
+    def test_enable_ttl_okay(self, fake_log_table):
+        """test if enable_ttl method enables TTL on the log table"""
+
+        # instanciate archiver
+        archiver = DynamodbLogArchiver("mocking")
+
+        # call enable_ttl method
+        assert archiver.enable_ttl() == "enable_ttl method successfully called"
+
+        # get TTL description
+        ttl = archiver.client.describe_time_to_live(
+            TableName=os.environ["AWS_DYNAMODB_TABLE"]
+        )["TimeToLiveDescription"]
+
+        assert ttl["AttributeName"] == "expires_at"
+
+    def test_archive_expired_local(self, fake_log_table, tmp_path):
+        """test if archive method exports only expired and expiring log lines
+        (bundled log lines included) before DynamoDB TTL deletes them"""
+
+        # instanciate archiver
+        archiver = DynamodbLogArchiver("mocking", segments=3)
+
+        # call archive method
+        assert (
+            archiver.archive(str(tmp_path))
+            == "archive method successfully called: 3 items archived"
+        )
+
+        # read archived partitions
+        df = pd.read_parquet(tmp_path / "date=2022-07-01")
+        df_bundle = pd.read_parquet(tmp_path / "date=2022-07-03")
+
+        assert (
+            (
+                sorted(os.listdir(tmp_path))
+                == ["date=2022-07-01", "date=2022-07-03", "date=2022-07-04"]
+            )
+            and (len(df) == 1)
+            and (df["msg"][0] == "message")
+            and (df_bundle["msg"][0] == "bundled")
+            and (df_bundle["run_id"][0] == "run_1")
+        )
+
+    def test_archive_margin(self, fake_log_table, tmp_path):
+        """test if archive method skips items that expire after the margin"""
+
+        # instanciate archiver
+        archiver = DynamodbLogArchiver("mocking")
+
+        # call archive method without margin
+        assert (
+            archiver.archive(str(tmp_path), margin_days=0)
+            == "archive method successfully called: 2 items archived"
+        ) and (sorted(os.listdir(tmp_path)) == ["date=2022-07-01", "date=2022-07-03"])
+
+    def test_archive_rerun(self, fake_log_table, tmp_path):
+        """test if archive method marks archived items and a rerun
+        does not export them again"""
+
+        # instanciate archiver
+        archiver = DynamodbLogArchiver("mocking", segments=2)
+
+        # call archive method twice
+        archiver.archive(str(tmp_path))
+        files = sorted(
+            file for _, _, file_names in os.walk(tmp_path) for file in file_names
+        )
+
+        assert (
+            archiver.archive(str(tmp_path))
+            == "archive method successfully called: 0 items archived"
+        ) and (
+            sorted(
+                file for _, _, file_names in os.walk(tmp_path) for file in file_names
+            )
+            == files
+        )
+
+    def test_archive_old_delete(self, fake_log_table, tmp_path):
+        """test if archive method exports old logs to their partitions
+        and deletes them from the table"""
+
+        # instanciate archiver
+        archiver = DynamodbLogArchiver("mocking")
+
+        # call archive method
+        archiver.archive(str(tmp_path), older_than_days=30, delete=True)
+
+        # only the recent log must stay on the table
+        assert (
+            sorted(os.listdir(tmp_path))
+            == [
+                "date=2022-07-01",
+                "date=2022-07-02",
+                "date=2022-07-03",
+                "date=2022-07-04",
+            ]
+        ) and (fake_log_table.scan()["Count"] == 1)
+
+    def test_archive_s3(self, fake_log_table):
+        """test if archive method exports logs to an S3 bucket"""
+
+        # open moto mock for S3
+        with mock_s3():
+            # create a fake bucket
+            s3 = boto3.client("s3")
+            s3.create_bucket(Bucket="archive-bucket")
+
+            # instanciate archiver and archive old logs
+            archiver = DynamodbLogArchiver("mocking")
+            archiver.archive("s3://archive-bucket/logs", older_than_days=30)
+
+            # list archived files
+            keys = [
+                obj["Key"]
+                for obj in s3.list_objects_v2(Bucket="archive-bucket")["Contents"]
+            ]
+
+            # read one archived file
+            body = s3.get_object(Bucket="archive-bucket", Key=keys[0])["Body"].read()
+
+        assert (len(keys) == 4) and (len(pd.read_parquet(io.BytesIO(body))) == 1)
+
+    def test_archive_exception(self, fake_log_table, tmp_path):
+        """test if archive method returns the expected value
+        in case there is an error"""
+
+        # instanciate archiver pointing to a table that doesn't exist
+        archiver = DynamodbLogArchiver("mocking")
+        archiver.table_name = "missing_table"
+
+        assert archiver.archive(str(tmp_path)).startswith(
+            "archive method NOT successful: raised error ---> "
+        )
@@ -4,7 +4,17 @@ import pytest
 import boto3
 from moto import mock_dynamodb
 from unittest.mock import patch, mock_open
-from synthetic_data_ingestion.dynamodb_ingestion import DynamodbIngestor
+from synthetic_data_ingestion.dynamodb_ingestion import (
+    DynamodbIngestor,
+    DynamodbLogBundleReader,
+)
+
+
+# define log lines (in the format written by the project loggers) to be parsed
+log_lines = "".join(
+    f"2022:07:01 10:00:{idx % 60:02d} - INFO - sample_creator.py - message number {idx}\n"
+    for idx in range(300)
+)
 
 
 @pytest.fixture(scope="function")
@@ -33,6 +43,33 @@ def fake_dynamo_table(aws_credentials, *args, **kwargs):
         yield dynamodb_table
 
 
+@pytest.fixture(scope="function")
+def fake_dynamo_table_created(aws_credentials, *args, **kwargs):
+    """Pytest fixture that creates an fake DynamoDB table (with the
+    project key schema) on a fake AWS account.
+    """
+    # open moto mock with fake aws credentials
+    with mock_dynamodb(aws_credentials):
+        # create a fake resource
+        dynamodb = boto3.resource("dynamodb")
+        # create a fake DynamoDB Table
+        dynamodb_table = dynamodb.create_table(
+            TableName=os.environ["AWS_DYNAMODB_TABLE"],
+            KeySchema=[
+                {"AttributeName": "timestamp", "KeyType": "HASH"},
+                {"AttributeName": "log_file_sequence", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "timestamp", "AttributeType": "S"},
+                {"AttributeName": "log_file_sequence", "AttributeType": "N"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+
+        # yield the fake table on the fake client account
+        yield dynamodb_table
+
+
 class TestDynamodbIngestor:
 
     # mock "with open" clause and "os.listdir" function
@@ -330,3 +367,76 @@ class TestDynamodbIngestor:
                 assert dynamodb_ingestor._delete_logs().startswith(
                     "_delete_logs method NOT successful: raised error ---> "
                 )
+
+    # mock "with open" clause, "os.listdir"
+    # and use "fake_dynamo_table_created" fixture
+    @patch(target="builtins.open", new_callable=mock_open, read_data=log_lines)
+    @patch(target="os.listdir", return_value=["log1", "log2"])
+    def test_send_logs_bundle_okay(
+        self,
+        mock_list_dir,
+        mock_open,
+        fake_dynamo_table_created,
+    ):
+        """test if send_logs method sends logs as bundles
+        that can be read back in the same order"""
+
+        # instanciate dynamodb ingestor
+        dynamodb_ingestor = DynamodbIngestor("mocking")
+
+        # call send_logs method in bundle mode
+        assert (
+            dynamodb_ingestor.send_logs(bundle=True, run_id="run_1")
+            == "send_logs method successfully called"
+        )
+
+        # instanciate bundle reader
+        reader = DynamodbLogBundleReader("mocking")
+
+        # index item must describe all bundled logs
+        assert reader.get_index("run_1")["num_logs"] == len(dynamodb_ingestor.all_logs)
+
+        # streamed logs must be the parsed logs
+        assert list(reader.stream_logs("run_1")) == dynamodb_ingestor.all_logs
+
+        # only the index item and a single chunk must be written
+        assert fake_dynamo_table_created.scan()["Count"] == 2
+
+    # mock "with open" clause, "os.listdir"
+    @patch(target="builtins.open", new_callable=mock_open, read_data=log_lines)
+    @patch(target="os.listdir", return_value=["log1", "log2"])
+    @patch(
+        target="synthetic_data_ingestion.dynamodb_ingestion.BUNDLE_MAX_BYTES", new=512
+    )
+    def test__bundle_logs_split(self, mock_list_dir, mock_open):
+        """test if _bundle_logs method splits logs into chunks
+        smaller than the configured maximum size"""
+
+        # instanciate dynamodb ingestor
+        dynamodb_ingestor = DynamodbIngestor("mocking")
+
+        # call _bundle_logs method
+        chunks = dynamodb_ingestor._bundle_logs()
+
+        assert (
+            (len(chunks) > 1)
+            and all(len(chunk[2]) <= 512 for chunk in chunks)
+            and (sum(chunk[0] for chunk in chunks) == len(dynamodb_ingestor.all_logs))
+        )
+
+    # mock "with open" clause, "os.listdir"
+    # and use "fake_dynamo_table_created" fixture
+    @patch(target="builtins.open", new_callable=mock_open, read_data=log_lines)
+    @patch(target="os.listdir", return_value=["log1", "log2"])
+    def test_stream_logs_run_not_found(
+        self,
+        mock_list_dir,
+        mock_open,
+        fake_dynamo_table_created,
+    ):
+        """test if stream_logs method yields nothing for an unknown run"""
+
+        # instanciate bundle reader
+        reader = DynamodbLogBundleReader("mocking")
+
+        assert list(reader.stream_logs("unknown_run")) == []
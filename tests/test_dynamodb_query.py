@@ -0,0 +1,220 @@
+# import required libraries
+import os
+import pytest
+import boto3
+from moto import mock_dynamodb
+from unittest.mock import patch, mock_open
+from synthetic_data_ingestion.dynamodb_ingestion import DynamodbIngestor
+from synthetic_data_ingestion.dynamodb_query import DynamodbLogQuery, LOG_INDEXES
+
+
+# define log lines (in the format written by the project loggers) to be parsed
+log_lines = (
+    "2022:07:01 10:00:00 - INFO - sample_creator.py - samples created\n"
+    "2022:07:01 10:00:01 - CRITICAL - rds_ingestion.py - connection refused\n"
+    "2022:07:01 10:00:02 - INFO - lambda_ingestion.py - report sent\n"
+    "2022:07:01 10:00:03 - CRITICAL - lambda_ingestion.py - api error\n"
+)
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_SECURITY_TOKEN"] = "testing"
+    os.environ["AWS_SESSION_TOKEN"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+
+
+@pytest.fixture(scope="function")
+def fake_log_query(aws_credentials, *args, **kwargs):
+    """Pytest fixture that creates a fake DynamoDB table with the
+    logs of two runs and yields a DynamodbLogQuery with indexes created
+    """
+    # open moto mock with fake aws credentials
+    with mock_dynamodb(aws_credentials):
+        # create a fake DynamoDB Table
+        boto3.resource("dynamodb").create_table(
+            TableName=os.environ["AWS_DYNAMODB_TABLE"],
+            KeySchema=[
+                {"AttributeName": "timestamp", "KeyType": "HASH"},
+                {"AttributeName": "log_file_sequence", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "timestamp", "AttributeType": "S"},
+                {"AttributeName": "log_file_sequence", "AttributeType": "N"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+
+        # instanciate query client and create indexes
+        log_query = DynamodbLogQuery("mocking", cache_size=1)
+        log_query.create_indexes()
+
+        # send logs of two runs (second run one week later)
+        for run_id, run_lines in [
+            ("run_1", log_lines),
+            ("run_2", log_lines.replace("2022:07:01", "2022:07:08")),
+        ]:
+            # mock "with open" clause and "os.listdir"
+            with patch(target="builtins.open", new=mock_open(read_data=run_lines)):
+                with patch(target="os.listdir", return_value=["log1"]):
+                    # instanciate dynamodb ingestor and send logs
+                    DynamodbIngestor("mocking").send_logs(run_id=run_id)
+
+        # yield the query client
+        yield log_query
+
+
+class TestDynamodbLogQuery:
+    def test_create_indexes_okay(self, fake_log_query):
+        """test if create_indexes method creates all indexes
+        and does nothing when they already exist"""
+
+        # get names of the table indexes
+        indexes = {
+            index["IndexName"]
+            for index in fake_log_query.table.meta.client.describe_table(
+                TableName=os.environ["AWS_DYNAMODB_TABLE"]
+            )["Table"]["GlobalSecondaryIndexes"]
+        }
+
+        assert (indexes == set(LOG_INDEXES)) and (
+            fake_log_query.create_indexes()
+            == "create_indexes method successfully called"
+        )
+
+    def test_create_indexes_exception(self, fake_log_query):
+        """test if create_indexes method returns the expected value
+        in case there is an error"""
+
+        # point the query client to a table that doesn't exist
+        fake_log_query.table_name = "missing_table"
+
+        assert fake_log_query.create_indexes().startswith(
+            "create_indexes method NOT successful: raised error ---> "
+        )
+
+    def test_query_run_level(self, fake_log_query):
+        """test if query_run method returns only the logs of the
+        given run and level"""
+
+        # query CRITICAL logs of the first run
+        items = fake_log_query.query_run("run_1", level="CRITICAL")
+
+        assert [item["msg"] for item in items] == ["connection refused", "api error"]
+
+    def test_query_run_cache(self, fake_log_query):
+        """test if query_run method answers recent runs from the LRU cache"""
+
+        # query run to fill the cache
+        fake_log_query.query_run("run_1")
+
+        # make sure the cached run doesn't query the table
+        with patch.object(
+            fake_log_query, "query_all", side_effect=Exception("table queried")
+        ):
+            assert len(fake_log_query.query_run("run_1")) == 4
+
+        # querying another run must evict the first one (cache_size = 1)
+        fake_log_query.query_run("run_2")
+
+        assert list(fake_log_query._run_cache) == ["run_2"]
+
+    def test_create_indexes_wait_active(self, fake_log_query):
+        """test if create_indexes method polls the table until every
+        index is ACTIVE (instead of only waiting for the table)"""
+
+        # keep the original describe_table method
+        client = fake_log_query.table.meta.client
+        describe_table = client.describe_table
+
+        # define index statuses of the polls (backfill of the new index)
+        statuses = ["CREATING", "CREATING", "ACTIVE"]
+
+        def side_effect(**kwargs):
+            # describe table with the next status of the indexes
+            response = describe_table(**kwargs)
+            status = statuses.pop(0)
+            for index in response["Table"]["GlobalSecondaryIndexes"]:
+                index["IndexStatus"] = status
+            return response
+
+        # spy describe_table calls and skip poll waits
+        with patch.object(client, "describe_table", side_effect=side_effect) as mock:
+            with patch("time.sleep") as mock_sleep:
+                fake_log_query._wait_indexes_active(client)
+
+        assert (mock.call_count == 3) and (mock_sleep.call_count == 2)
+
+    def test_query_run_cache_ttl(self, fake_log_query):
+        """test if query_run method queries the table again when
+        the cached logs of a run expired"""
+
+        # expire cached runs right away
+        fake_log_query.cache_ttl = 0
+
+        # query run to fill the cache
+        fake_log_query.query_run("run_1")
+
+        # make sure the expired run queries the table
+        with patch.object(
+            fake_log_query, "query_all", return_value=[]
+        ) as mock_query_all:
+            fake_log_query.query_run("run_1")
+
+        assert mock_query_all.call_count == 1
+
+    def test_query_levels_run_id(self, fake_log_query):
+        """test if query_levels method filters runs on DynamoDB"""
+
+        # spy query_page calls
+        with patch.object(
+            fake_log_query, "query_page", wraps=fake_log_query.query_page
+        ) as mock_page:
+            items = fake_log_query.query_levels(["INFO", "CRITICAL"], run_id="run_2")
+
+        assert (
+            (len(items) == 4)
+            and ({item["run_id"] for item in items} == {"run_2"})
+            and all(
+                call.kwargs["run_id"] == "run_2" for call in mock_page.call_args_list
+            )
+        )
+
+    def test_query_levels_parallel(self, fake_log_query):
+        """test if query_levels method merges the results of all levels"""
+
+        # query levels of both runs
+        items = fake_log_query.query_levels(["INFO", "CRITICAL"])
+
+        assert (len(items) == 8) and (
+            [item["timestamp"] for item in items]
+            == sorted(item["timestamp"] for item in items)
+        )
+
+    def test_query_modules_interval(self, fake_log_query):
+        """test if query_modules method filters logs by timestamp interval"""
+
+        # query lambda logs of the first seconds
+        items = fake_log_query.query_modules(
+            ["lambda_ingestion.py"],
+            start="2022:07:01Z10:00:00",
+            end="2022:07:01Z10:00:02",
+        )
+
+        assert {item["msg"] for item in items} == {"report sent"}
+
+    def test_query_page_pagination(self, fake_log_query):
+        """test if query_page method returns a key to the next page"""
+
+        # query first page of a run
+        page = fake_log_query.query_page("run_id-timestamp-index", "run_1", limit=3)
+
+        # query the next page
+        next_page = fake_log_query.query_page(
+            "run_id-timestamp-index", "run_1", limit=3, start_key=page["last_key"]
+        )
+
+        assert (len(page["items"]) == 3) and (len(next_page["items"]) == 1)
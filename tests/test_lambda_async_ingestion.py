@@ -0,0 +1,162 @@
+# import required libraries
+import time
+import json
+import httpx
+import pytest
+import asyncio
+import requests
+from unittest.mock import patch
+from synthetic_data_ingestion.sample_creator import SynthCustomers
+from synthetic_data_ingestion.lambda_async_ingestion import AsyncLambdaIngestor
+
+
+def make_cohorts(num_cohorts: int) -> list:
+    """Create SynthCustomers objects with generated samples and reports"""
+
+    # instanciate list of cohorts
+    cohorts = []
+
+    # iterate over cohorts to be created
+    for idx in range(num_cohorts):
+        # instanciate SynthCustomers object and generate samples and report
+        synth_customers = SynthCustomers(
+            num_samples=10, group=["CONTROL", "TREATMENT"][idx % 2]
+        )
+        synth_customers.generate_samples()
+        synth_customers.generate_report()
+
+        # add cohort
+        cohorts.append(synth_customers)
+
+    return cohorts
+
+
+@pytest.fixture(scope="function", autouse=True)
+def lambda_api_url(monkeypatch):
+    """Define an absolute url of the AWS Lambda API (httpx rejects relative urls)"""
+    monkeypatch.setenv("AWS_LAMBDA_API", "https://lambda.test")
+
+
+class TestAsyncLambdaIngestor:
+    def test_send_reports_concurrent(self):
+        """test if reports are sent concurrently and
+        results are gathered in the cohorts order"""
+
+        # define a slow mocked api
+        async def handler(request):
+            await asyncio.sleep(0.2)
+            return httpx.Response(200, json=json.loads(request.content)["group"])
+
+        # instanciate async ingestor with a mocked transport
+        ingestor = AsyncLambdaIngestor(
+            max_concurrency=10, transport=httpx.MockTransport(handler)
+        )
+
+        # send 10 reports
+        start = time.perf_counter()
+        results = ingestor.send_reports_sync(make_cohorts(10))
+        elapsed = time.perf_counter() - start
+
+        assert (elapsed < 1) and (
+            [r["response"] for r in results] == ["CONTROL", "TREATMENT"] * 5
+        )
+
+    def test_send_reports_concurrency_limit(self):
+        """test if no more than max_concurrency reports are in flight"""
+
+        # define counters of reports in flight
+        in_flight = {"now": 0, "max": 0}
+
+        # define a mocked api that counts reports in flight
+        async def handler(request):
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            await asyncio.sleep(0.05)
+            in_flight["now"] -= 1
+            return httpx.Response(200, json="Okay")
+
+        # instanciate async ingestor with a mocked transport
+        ingestor = AsyncLambdaIngestor(
+            max_concurrency=2, transport=httpx.MockTransport(handler)
+        )
+
+        # send 6 reports
+        ingestor.send_reports_sync(make_cohorts(6))
+
+        assert in_flight["max"] == 2
+
+    def test_send_reports_per_cohort_errors(self):
+        """test if one failing report doesn't fail the others"""
+
+        # define a mocked api that fails for TREATMENT reports
+        async def handler(request):
+            if json.loads(request.content)["group"] == "TREATMENT":
+                raise httpx.ReadTimeout("timed out", request=request)
+            return httpx.Response(200, json="Okay")
+
+        # instanciate async ingestor with a mocked transport
+        ingestor = AsyncLambdaIngestor(transport=httpx.MockTransport(handler))
+
+        # send 2 reports
+        results = ingestor.send_reports_sync(make_cohorts(2))
+
+        assert (results[0]["status_code"] == 200) and (
+            results[1]["status_code"] is None
+        )
+
+    def test_send_reports_invalid_cohort(self):
+        """test if an invalid cohort raises an error before sending reports"""
+
+        # make sure it will raise an error
+        with pytest.raises(Exception):
+            AsyncLambdaIngestor().send_reports_sync(["INVALID_INPUT"])
+
+    def test_send_reports_large_upload(self):
+        """test if large reports are uploaded directly to S3 (as LambdaIngestor
+        does) and small reports are sent on the request body"""
+
+        # instanciate list of requests and of uploaded reports
+        requested, uploaded = [], []
+
+        # define a mocked api
+        async def handler(request):
+            requested.append(json.loads(request.content)["group"])
+            return httpx.Response(200, json="Okay")
+
+        def upload_report(lambda_ingestor, lambda_url):
+            # record uploaded report
+            uploaded.append((lambda_ingestor.raw_report["group"], lambda_url))
+
+            # response of the upload completion
+            r = requests.Response()
+            r.status_code, r._content = 200, b'"Uploaded"'
+
+            return r
+
+        # instanciate async ingestor with a mocked transport
+        # (every report is above the threshold)
+        ingestor = AsyncLambdaIngestor(
+            transport=httpx.MockTransport(handler), upload_threshold=0
+        )
+
+        # send 2 reports with a mocked upload
+        with patch(
+            "synthetic_data_ingestion.lambda_async_ingestion.LambdaIngestor._upload_report",
+            upload_report,
+        ):
+            results = ingestor.send_reports_sync(make_cohorts(2))
+
+        assert (
+            (requested == [])
+            and (
+                sorted(uploaded)
+                == [
+                    ("CONTROL", "https://lambda.test"),
+                    ("TREATMENT", "https://lambda.test"),
+                ]
+            )
+            and all(
+                (r["status_code"] == 200) and (r["response"] == "Uploaded")
+                for r in results
+            )
+        )
@@ -1,19 +1,98 @@
 # load the required libraries
 import os
 import json
+import time
+import httpx
+import asyncio
+import threading
+from datetime import datetime
 import boto3
 import pytest
+import requests
 from moto import mock_s3
 from dotenv import load_dotenv
 from unittest.mock import patch
+from botocore.exceptions import ClientError
 from fastapi.testclient import TestClient
+from lambda_api import lambda_function
 from lambda_api.lambda_function import app
+from synthetic_data_ingestion.sample_creator import SynthCustomers
+from synthetic_data_ingestion.lambda_ingestion import (
+    DEFAULT_UPLOAD_BYTES,
+    LambdaIngestor,
+)
+from synthetic_data_ingestion.report_manifest import (
+    MANIFEST_NAME,
+    MANIFEST_SHARDS,
+    REPORT_PREFIX,
+    ReportManifestReader,
+)
 
 
 # instanciate TestClient to test FastAPI
 client = TestClient(app)
 
 
+@pytest.fixture(scope="function", autouse=True)
+def fresh_runtime():
+    """Start each test as a new container (no cached configuration or S3 client)"""
+    lambda_function.reset_runtime()
+
+
+@pytest.fixture(scope="function")
+def batching(monkeypatch):
+    """Enable micro-batching of reports with a limit of 3 reports"""
+    monkeypatch.setenv("REPORT_BATCHING", "true")
+    monkeypatch.setenv("BATCH_MAX_REPORTS", "3")
+    monkeypatch.setenv("BATCH_MAX_AGE_S", "60")
+
+    yield
+
+    # send remaining reports while S3 is still mocked
+    lambda_function.reset_runtime()
+
+
+# report sent on micro-batching tests
+report = {
+    "group": "TREATMENT",
+    "gamma_shape": 20,
+    "gamma_scale": 10,
+    "poisson_lambda": 3,
+    "date_interval": "[2022-06-28,2022-07-04] [extremes included]",
+    "region": {"LAM": 0.2, "NAM": 0.2, "EUR": 0.2, "AFR": 0.2, "ASA": 0.2},
+    "gender": {"MALE": 0.5, "FEMALE": 0.5},
+    "device": {"MOBILE": 0.5, "COMPUTER": 0.5},
+}
+
+
+def list_report_objects(s3) -> list:
+    """List report objects on the fake bucket (partition manifests are skipped)"""
+
+    # list objects of the report prefix on the fake bucket
+    objects = s3.list_objects_v2(
+        Bucket=os.environ["AWS_S3_BUCKET"], Prefix=REPORT_PREFIX
+    ).get("Contents", [])
+
+    return [obj for obj in objects if f"/{MANIFEST_NAME}-" not in obj["Key"]]
+
+
+def wait_for_objects(s3, num_objects: int, timeout: float = 5) -> list:
+    """Wait until the fake bucket has num_objects objects (flushes run on a thread)"""
+
+    # define time limit
+    deadline = time.monotonic() + timeout
+
+    # check bucket until time limit
+    while True:
+        # list report objects on the fake bucket
+        objects = list_report_objects(s3)
+
+        if (len(objects) >= num_objects) or (time.monotonic() > deadline):
+            return objects
+
+        time.sleep(0.01)
+
+
 @pytest.fixture(scope="function")
 def aws_credentials():
     """Mocked AWS Credentials for moto."""
@@ -128,3 +207,946 @@ class TestFastAPI:
         response = client.post("/sampling_report", data=data_json, headers=headers)
 
         assert response.json() == "HTTP status of report input to S3 bucket --> 200"
+
+    def test_save_reports_ok(self, fake_s3_bucket):
+        """Check a successful POST request to /sampling_reports endpoint
+        writes a single NDJSON file with all reports"""
+
+        # request header
+        headers = {"Content-type": "application/json"}
+
+        # request data
+        data = [
+            {
+                "group": group,
+                "gamma_shape": 20,
+                "gamma_scale": 10,
+                "poisson_lambda": 3,
+                "date_interval": "[2022-06-28,2022-07-04] [extremes included]",
+                "region": {"LAM": 0.2, "NAM": 0.2, "EUR": 0.2, "AFR": 0.2, "ASA": 0.2},
+                "gender": {"MALE": 0.5, "FEMALE": 0.5},
+                "device": {"MOBILE": 0.5, "COMPUTER": 0.5},
+            }
+            for group in ["CONTROL", "TREATMENT", "CONTROL"]
+        ]
+
+        # make a POST request to /sampling_reports endpoint
+        response = client.post(
+            "/sampling_reports", data=json.dumps(data), headers=headers
+        )
+
+        # list report objects on the fake bucket
+        objects = list_report_objects(fake_s3_bucket)
+
+        # read the written file
+        body = fake_s3_bucket.get_object(
+            Bucket=os.environ["AWS_S3_BUCKET"], Key=objects[0]["Key"]
+        )["Body"].read()
+
+        assert (
+            (response.json() == "HTTP status of 3 reports input to S3 bucket --> 200")
+            and (len(objects) == 1)
+            and objects[0]["Key"].endswith(".ndjson")
+            and ([json.loads(line) for line in body.splitlines()] == data)
+        )
+
+    def test_save_reports_wrong_input(self):
+        """Check if api gives expected response in case
+        one report of the POST request has wrong values"""
+
+        # request header
+        headers = {"Content-type": "application/json"}
+
+        # make a POST request to /sampling_reports endpoint
+        response = client.post(
+            "/sampling_reports", data=json.dumps([{"group": "X"}]), headers=headers
+        )
+
+        assert response.status_code == 422  # Unprocessable Entity
+
+    def test_save_report_cached_runtime(self, fake_s3_bucket):
+        """Check if configuration and S3 client are created once per container
+        and .env is not loaded again on each request"""
+
+        # request header
+        headers = {"Content-type": "application/json"}
+
+        # request data
+        data = {
+            "group": "TREATMENT",
+            "gamma_shape": 20,
+            "gamma_scale": 10,
+            "poisson_lambda": 3,
+            "date_interval": "[2022-06-28,2022-07-04] [extremes included]",
+            "region": {"LAM": 0.2, "NAM": 0.2, "EUR": 0.2, "AFR": 0.2, "ASA": 0.2},
+            "gender": {"MALE": 0.5, "FEMALE": 0.5},
+            "device": {"MOBILE": 0.5, "COMPUTER": 0.5},
+        }
+
+        # make sure .env is not loaded on requests
+        with patch(
+            target="lambda_api.lambda_function.load_dotenv",
+            side_effect=Exception("load_dotenv called"),
+        ):
+            # make two POST requests to /sampling_report endpoint
+            for _ in range(2):
+                response = client.post(
+                    "/sampling_report", data=json.dumps(data), headers=headers
+                )
+
+        assert (
+            response.json() == "HTTP status of report input to S3 bucket --> 200"
+        ) and (lambda_function.get_s3_client.cache_info().misses == 1)
+
+    def test_api_timings(self, monkeypatch):
+        """Check if /timings endpoint exposes cold and warm request timings"""
+
+        # turn request timings on
+        monkeypatch.setenv("REQUEST_TIMINGS", "true")
+
+        # make a cold and two warm requests
+        for _ in range(3):
+            response = client.get("/")
+
+        # get timings
+        timings = client.get("/timings").json()
+
+        assert (
+            response.headers["Server-Timing"].startswith("app;dur=")
+            and (timings["init_ms"] > 0)
+            and (timings["cold_request_ms"] > 0)
+            and (timings["warm_requests"] == 2)
+            and (timings["warm_p50_ms"] > 0)
+        )
+
+    def test_api_timings_off(self):
+        """Check if requests are not timed and /timings endpoint is not found
+        unless REQUEST_TIMINGS is on"""
+
+        # make a request
+        response = client.get("/")
+
+        assert (
+            ("Server-Timing" not in response.headers)
+            and (lambda_function.TIMINGS["cold_request_ms"] is None)
+            and (client.get("/timings").status_code == 404)
+        )
+
+    def test_save_report_manifest(self, fake_s3_bucket, tmpdir):
+        """Check if written objects are recorded on the partition manifest"""
+
+        # make two POST requests to /sampling_report endpoint
+        for group in ["CONTROL", "TREATMENT"]:
+            client.post("/sampling_report", data=json.dumps({**report, "group": group}))
+
+        # make a POST request to /sampling_reports endpoint
+        client.post("/sampling_reports", data=json.dumps([report] * 2))
+
+        # read manifest of today partition
+        manifest = ReportManifestReader(log_folder=tmpdir).get_manifest(
+            datetime.utcnow().date()
+        )
+
+        assert sorted(entry["key"] for entry in manifest["objects"]) == sorted(
+            obj["Key"] for obj in list_report_objects(fake_s3_bucket)
+        ) and [len(entry["reports"]) for entry in manifest["objects"]] == [1, 1, 2]
+
+    def test_save_report_manifest_disabled(self, fake_s3_bucket, monkeypatch):
+        """Check if no manifest is written when REPORT_MANIFEST is false"""
+
+        # disable manifest
+        monkeypatch.setenv("REPORT_MANIFEST", "false")
+
+        # make a POST request to /sampling_report endpoint
+        client.post("/sampling_report", data=json.dumps(report))
+
+        # list objects on the fake bucket
+        objects = fake_s3_bucket.list_objects_v2(Bucket=os.environ["AWS_S3_BUCKET"])
+
+        assert len(objects["Contents"]) == 1
+
+    def test_save_report_manifest_requeued(self, fake_s3_bucket, tmpdir):
+        """Check if the entry of a failed manifest update is re-queued
+        and recorded by the next update"""
+
+        # first manifest update fails
+        with patch.object(
+            lambda_function,
+            "update_manifest",
+            side_effect=RuntimeError("conflicts"),
+        ):
+            client.post("/sampling_report", data=json.dumps(report))
+
+        # entry is pending
+        pending = sum(
+            len(entries) for entries in lambda_function.MANIFEST_PENDING.values()
+        )
+
+        # make a second POST request (records both entries)
+        client.post("/sampling_report", data=json.dumps(report))
+
+        # read manifest of today partition
+        manifest = ReportManifestReader(log_folder=tmpdir).get_manifest(
+            datetime.utcnow().date()
+        )
+
+        assert (
+            (pending == 1)
+            and (not lambda_function.MANIFEST_PENDING)
+            and (
+                sorted(entry["key"] for entry in manifest["objects"])
+                == sorted(obj["Key"] for obj in list_report_objects(fake_s3_bucket))
+            )
+            and (len(manifest["objects"]) == 2)
+        )
+
+    def test_save_report_write_thread_pool(self, fake_s3_bucket, monkeypatch):
+        """Check if concurrent requests write to S3 on the bounded
+        write thread pool (at most S3_MAX_POOL writes in flight)"""
+
+        # limit write thread pool and disable manifest
+        monkeypatch.setenv("S3_MAX_POOL", "4")
+        monkeypatch.setenv("REPORT_MANIFEST", "false")
+
+        # keep the original put_object method
+        s3 = lambda_function.get_s3_client()
+        put_object = s3.put_object
+
+        # instanciate thread names and in-flight write counters
+        thread_names, in_flight, max_in_flight = set(), [0], [0]
+        lock = threading.Lock()
+
+        def side_effect(**kwargs):
+            # count writes in flight
+            with lock:
+                thread_names.add(threading.current_thread().name)
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+
+            # slow write
+            time.sleep(0.02)
+            response = put_object(**kwargs)
+
+            with lock:
+                in_flight[0] -= 1
+
+            return response
+
+        async def send_all() -> list:
+            """Send 20 concurrent POST requests"""
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app), base_url="http://lambda-api"
+            ) as async_client:
+                return await asyncio.gather(
+                    *[
+                        async_client.post("/sampling_report", json=report)
+                        for _ in range(20)
+                    ]
+                )
+
+        # send requests spying put_object calls
+        with patch.object(s3, "put_object", side_effect=side_effect):
+            responses = asyncio.run(send_all())
+
+        assert (
+            all(
+                r.json() == "HTTP status of report input to S3 bucket --> 200"
+                for r in responses
+            )
+            and all(name.startswith("s3_write") for name in thread_names)
+            and (1 < max_in_flight[0] <= 4)
+            and (len(list_report_objects(fake_s3_bucket)) == 20)
+        )
+
+
+class TestMicroBatching:
+    def test_report_buffered(self, fake_s3_bucket, batching):
+        """Check if reports are acknowledged without being sent to S3"""
+
+        # make two POST requests to /sampling_report endpoint
+        responses = [
+            client.post("/sampling_report", data=json.dumps(report)) for _ in range(2)
+        ]
+
+        # list objects on the fake bucket
+        objects = fake_s3_bucket.list_objects_v2(Bucket=os.environ["AWS_S3_BUCKET"])
+
+        assert (
+            [r.json() for r in responses]
+            == [
+                f"Report buffered for batched input to S3 bucket --> {n} buffered reports"
+                for n in [1, 2]
+            ]
+        ) and ("Contents" not in objects)
+
+    def test_no_buffer_on_lambda(self, fake_s3_bucket, batching, monkeypatch):
+        """Check if reports are written on each request on AWS Lambda
+        (containers are dropped without flushing a buffer)"""
+
+        # run as on the AWS Lambda runtime
+        monkeypatch.setenv("AWS_LAMBDA_FUNCTION_NAME", "lambda_api")
+
+        # make a POST request to /sampling_report endpoint
+        response = client.post("/sampling_report", data=json.dumps(report))
+
+        assert (
+            response.json() == "HTTP status of report input to S3 bucket --> 200"
+        ) and (len(list_report_objects(fake_s3_bucket)) == 1)
+
+    def test_flush_on_count(self, fake_s3_bucket, batching):
+        """Check if a full buffer is sent as a single NDJSON file"""
+
+        # make seven POST requests to /sampling_report endpoint
+        for _ in range(7):
+            client.post("/sampling_report", data=json.dumps(report))
+
+        # wait for the flushes of the two full buffers
+        objects = wait_for_objects(fake_s3_bucket, 2)
+
+        # read the written files
+        bodies = [
+            fake_s3_bucket.get_object(
+                Bucket=os.environ["AWS_S3_BUCKET"], Key=obj["Key"]
+            )["Body"].read()
+            for obj in objects
+        ]
+
+        assert (
+            (len(objects) == 2)
+            and all(obj["Key"].endswith(".ndjson") for obj in objects)
+            and all(
+                [json.loads(line) for line in body.splitlines()] == [report] * 3
+                for body in bodies
+            )
+            and (len(lambda_function.get_report_buffer().lines) == 1)
+        )
+
+    def test_flush_on_age(self, fake_s3_bucket, batching, monkeypatch):
+        """Check if buffered reports are sent when the oldest one gets too old"""
+
+        # set a small maximum age
+        monkeypatch.setenv("BATCH_MAX_AGE_S", "0.05")
+
+        # make a POST request to /sampling_report endpoint
+        client.post("/sampling_report", data=json.dumps(report))
+
+        assert len(wait_for_objects(fake_s3_bucket, 1)) == 1
+
+    def test_flush_on_shutdown(self, fake_s3_bucket, batching):
+        """Check if buffered reports are sent when the API shuts down"""
+
+        # open a client with context manager -> runs startup and shutdown events
+        with TestClient(app) as lifespan_client:
+            # make two POST requests to /sampling_report endpoint
+            for _ in range(2):
+                lifespan_client.post("/sampling_report", data=json.dumps(report))
+
+        # list report objects on the fake bucket
+        objects = list_report_objects(fake_s3_bucket)
+
+        # read the written file
+        body = fake_s3_bucket.get_object(
+            Bucket=os.environ["AWS_S3_BUCKET"], Key=objects[0]["Key"]
+        )["Body"].read()
+
+        assert (len(objects) == 1) and (
+            [json.loads(line) for line in body.splitlines()] == [report] * 2
+        )
+
+    def test_flush_error_keeps_reports(self, fake_s3_bucket, batching):
+        """Check if reports are kept on the buffer when S3 raises an error"""
+
+        # make two POST requests to /sampling_report endpoint
+        for _ in range(2):
+            client.post("/sampling_report", data=json.dumps(report))
+
+        # get report buffer
+        buffer = lambda_function.get_report_buffer()
+
+        # make S3 raise an error
+        with patch.object(
+            lambda_function.get_s3_client(), "put_object", side_effect=Exception
+        ):
+            with pytest.raises(Exception):
+                buffer.flush()
+
+        assert (len(buffer.lines) == 2) and (buffer.flush() == 2)
+
+
+class TestReadReports:
+    def post_reports(self):
+        """Send a CONTROL and a TREATMENT report"""
+
+        for group in ["CONTROL", "TREATMENT"]:
+            client.post("/sampling_report", data=json.dumps({**report, "group": group}))
+
+    def test_get_reports(self, fake_s3_bucket):
+        """Check if reports are read by date and group"""
+
+        # send reports
+        self.post_reports()
+
+        # define query params
+        today = str(datetime.utcnow().date())
+
+        # get all reports and CONTROL reports
+        response = client.get("/sampling_reports", params={"start_date": today})
+        control = client.get(
+            "/sampling_reports",
+            params={"start_date": today, "end_date": today, "group": "CONTROL"},
+        )
+
+        assert (
+            (response.status_code == 200)
+            and (
+                sorted(r["group"] for r in response.json()) == ["CONTROL", "TREATMENT"]
+            )
+            and (control.json() == [{**report, "group": "CONTROL"}])
+            and response.headers["ETag"].startswith('"')
+            and ("Last-Modified" in response.headers)
+        )
+
+    def test_get_reports_cached(self, fake_s3_bucket):
+        """Check if a repeated query is answered without touching S3"""
+
+        # send reports
+        self.post_reports()
+
+        # define query params
+        params = {"start_date": str(datetime.utcnow().date()), "group": "CONTROL"}
+
+        # first query
+        first = client.get("/sampling_reports", params=params)
+
+        # make sure S3 is not called
+        with patch.object(
+            lambda_function.get_s3_client(), "get_object", side_effect=Exception
+        ):
+            second = client.get("/sampling_reports", params=params)
+            not_modified = client.get(
+                "/sampling_reports",
+                params=params,
+                headers={"If-None-Match": first.headers["ETag"]},
+            )
+            not_modified_since = client.get(
+                "/sampling_reports",
+                params=params,
+                headers={"If-Modified-Since": first.headers["Last-Modified"]},
+            )
+            not_modified_weak = client.get(
+                "/sampling_reports",
+                params=params,
+                headers={"If-None-Match": f'"other", W/{first.headers["ETag"]}'},
+            )
+
+        assert (
+            (second.content == first.content)
+            and (second.headers["ETag"] == first.headers["ETag"])
+            and (not_modified.status_code == 304)
+            and (not_modified.content == b"")
+            and (not_modified_since.status_code == 304)
+            and (not_modified_weak.status_code == 304)
+        )
+
+    def test_get_reports_revalidated(self, fake_s3_bucket, monkeypatch):
+        """Check if expired cached responses are validated with the manifests:
+        reports are only downloaded again when a manifest changed"""
+
+        # expire cached responses right away
+        monkeypatch.setenv("REPORT_CACHE_TTL_S", "0")
+
+        # send reports
+        self.post_reports()
+
+        # define query params
+        params = {"start_date": str(datetime.utcnow().date())}
+
+        # first query
+        first = client.get("/sampling_reports", params=params)
+
+        # keep the original get_object method
+        s3 = lambda_function.get_s3_client()
+        get_object = s3.get_object
+
+        # spy get_object calls
+        with patch.object(s3, "get_object", side_effect=get_object) as mock_get:
+            # manifest did not change -> only the manifest shards are read
+            second = client.get("/sampling_reports", params=params)
+            unchanged_calls = mock_get.call_count
+
+            # send a new report -> manifest changes
+            client.post("/sampling_report", data=json.dumps(report))
+            third = client.get("/sampling_reports", params=params)
+
+        assert (
+            (unchanged_calls == MANIFEST_SHARDS)
+            and (second.headers["ETag"] == first.headers["ETag"])
+            and (third.headers["ETag"] != first.headers["ETag"])
+            and (len(third.json()) == 3)
+        )
+
+    def test_get_reports_lru(self, fake_s3_bucket, monkeypatch):
+        """Check if the least recently used query is evicted"""
+
+        # cache a single query
+        monkeypatch.setenv("REPORT_CACHE_SIZE", "1")
+
+        # make two queries
+        for group in ["CONTROL", "TREATMENT"]:
+            client.get(
+                "/sampling_reports",
+                params={"start_date": "2022-07-01", "group": group},
+            )
+
+        assert [query[2] for query in lambda_function.REPORT_CACHE] == ["TREATMENT"]
+
+    @pytest.mark.parametrize(
+        "params",
+        [
+            {"start_date": "2022-07-02", "end_date": "2022-07-01"},
+            {"start_date": "2020-01-01", "end_date": "2022-07-01"},
+        ],
+    )
+    def test_get_reports_wrong_interval(self, fake_s3_bucket, params):
+        """Check if api gives expected response on invalid date intervals"""
+
+        # make a GET request to /sampling_reports endpoint
+        response = client.get("/sampling_reports", params=params)
+
+        assert response.json().startswith("The following error was raised on API: ")
+
+    def test_get_reports_wrong_input(self):
+        """Check if api gives expected response in case of invalid dates"""
+
+        # make a GET request to /sampling_reports endpoint
+        response = client.get("/sampling_reports", params={"start_date": "WRONG"})
+
+        assert response.status_code == 422  # Unprocessable Entity
+
+
+class TestIdempotency:
+    def post(self, key: str, path: str = "/sampling_report", data=None):
+        """Send a report with the given Idempotency-Key"""
+
+        return client.post(
+            path,
+            data=json.dumps(report if data is None else data),
+            headers={"Idempotency-Key": key},
+        )
+
+    def test_duplicated_report(self, fake_s3_bucket):
+        """Check if a retried report gets the original response
+        and no new object is written"""
+
+        # send the same report twice
+        responses = [self.post("key-1") for _ in range(2)]
+
+        assert (
+            (responses[0].json() == responses[1].json())
+            and (
+                responses[0].json()
+                == "HTTP status of report input to S3 bucket --> 200"
+            )
+            and (len(list_report_objects(fake_s3_bucket)) == 1)
+        )
+
+    def test_duplicated_report_other_container(self, fake_s3_bucket):
+        """Check if a retried report on another container (no LRU cache)
+        gets the original response from the S3 marker"""
+
+        # send report
+        first = self.post("key-1")
+
+        # start a new container
+        lambda_function.reset_runtime()
+
+        # retry report
+        second = self.post("key-1")
+
+        assert (second.json() == first.json()) and (
+            len(list_report_objects(fake_s3_bucket)) == 1
+        )
+
+    def test_different_keys(self, fake_s3_bucket):
+        """Check if reports with different keys are all written"""
+
+        # send reports with different keys
+        for key in ["key-1", "key-2"]:
+            self.post(key)
+
+        # send a batch
+        self.post("key-3", "/sampling_reports", [report] * 2)
+        self.post("key-3", "/sampling_reports", [report] * 2)
+
+        assert len(list_report_objects(fake_s3_bucket)) == 3
+
+    def test_pending_key(self, fake_s3_bucket):
+        """Check if a report whose key is being processed gets 409 Conflict"""
+
+        # create the marker of a request being processed
+        fake_s3_bucket.put_object(
+            Bucket=os.environ["AWS_S3_BUCKET"],
+            Key=lambda_function.idempotency_marker("key-1"),
+            Body=json.dumps({"idempotency_key": "key-1", "claimed_at": time.time()}),
+        )
+
+        # send report
+        response = self.post("key-1")
+
+        assert (response.status_code == 409) and (
+            response.json() == lambda_function.IDEMPOTENCY_PENDING_MSG
+        )
+
+    def test_stale_claim_taken_over(self, fake_s3_bucket):
+        """Check if a key claimed by a request that crashed (stale claim)
+        is taken over and its report is written"""
+
+        # create the marker of a request that never completed
+        fake_s3_bucket.put_object(
+            Bucket=os.environ["AWS_S3_BUCKET"],
+            Key=lambda_function.idempotency_marker("key-1"),
+            Body=json.dumps({"idempotency_key": "key-1", "claimed_at": 0}),
+        )
+
+        # send report
+        with patch.object(
+            lambda_function.get_s3_client(),
+            "put_object",
+            wraps=lambda_function.get_s3_client().put_object,
+        ) as put_object:
+            response = self.post("key-1")
+
+        # read marker
+        marker = json.loads(
+            fake_s3_bucket.get_object(
+                Bucket=os.environ["AWS_S3_BUCKET"],
+                Key=lambda_function.idempotency_marker("key-1"),
+            )["Body"].read()
+        )
+
+        assert (
+            (response.json() == "HTTP status of report input to S3 bucket --> 200")
+            and (len(list_report_objects(fake_s3_bucket)) == 1)
+            and ("IfMatch" in put_object.call_args_list[0].kwargs)
+            and (marker["response"] == response.json())
+        )
+
+    def test_buffered_report_key(self, fake_s3_bucket, batching):
+        """Check if a buffered report is acknowledged without writing its marker,
+        a retry gets the original response and the marker is written by the flush"""
+
+        # send the same report twice
+        with patch.object(
+            lambda_function.get_s3_client(),
+            "put_object",
+            wraps=lambda_function.get_s3_client().put_object,
+        ) as put_object:
+            responses = [self.post("key-1") for _ in range(2)]
+
+        # send buffered report
+        lambda_function.get_report_buffer().flush()
+
+        # read marker
+        marker = json.loads(
+            fake_s3_bucket.get_object(
+                Bucket=os.environ["AWS_S3_BUCKET"],
+                Key=lambda_function.idempotency_marker("key-1"),
+            )["Body"].read()
+        )
+
+        assert (
+            (responses[0].json() == responses[1].json())
+            and (not put_object.called)
+            and (len(list_report_objects(fake_s3_bucket)) == 1)
+            and (marker["response"] == responses[0].json())
+        )
+
+    def test_idempotency_lifecycle(self, fake_s3_bucket, monkeypatch):
+        """Check if the lifecycle rule of the key markers is added once and
+        other lifecycle rules are kept"""
+
+        # create another rule
+        other_rule = {
+            "ID": "other",
+            "Filter": {"Prefix": "other/"},
+            "Status": "Enabled",
+            "Expiration": {"Days": 30},
+        }
+        fake_s3_bucket.put_bucket_lifecycle_configuration(
+            Bucket=os.environ["AWS_S3_BUCKET"],
+            LifecycleConfiguration={"Rules": [other_rule]},
+        )
+
+        # configure the rule twice (second time with other TTL)
+        lambda_function.configure_idempotency_lifecycle()
+        monkeypatch.setenv("IDEMPOTENCY_TTL_DAYS", "3")
+        lambda_function.reset_runtime()
+        lambda_function.configure_idempotency_lifecycle()
+
+        # get rules of the bucket
+        rules = {
+            rule["ID"]: rule
+            for rule in fake_s3_bucket.get_bucket_lifecycle_configuration(
+                Bucket=os.environ["AWS_S3_BUCKET"]
+            )["Rules"]
+        }
+
+        assert (
+            set(rules) == {"other", lambda_function.IDEMPOTENCY_LIFECYCLE_RULE}
+        ) and (
+            rules[lambda_function.IDEMPOTENCY_LIFECYCLE_RULE]["Expiration"]["Days"] == 3
+        )
+
+    def test_claim_conflict(self, fake_s3_bucket):
+        """Check if a request that loses the conditional claim of its key
+        does not write the report"""
+
+        # keep the original put_object method
+        s3 = lambda_function.get_s3_client()
+        put_object = s3.put_object
+
+        def conditional_put(**kwargs):
+            # another request created the marker in the meantime
+            if kwargs.get("IfNoneMatch") == "*":
+                raise ClientError(
+                    {"Error": {"Code": "PreconditionFailed"}}, "PutObject"
+                )
+
+            return put_object(**kwargs)
+
+        # send report
+        with patch.object(s3, "put_object", side_effect=conditional_put):
+            response = self.post("key-1")
+
+        assert (response.status_code == 409) and (
+            list_report_objects(fake_s3_bucket) == []
+        )
+
+    def test_failed_write_releases_key(self, fake_s3_bucket, monkeypatch):
+        """Check if a report that was not written can be retried with its key"""
+
+        # make the report write fail on the first request
+        s3 = lambda_function.get_s3_client()
+        put_object = s3.put_object
+
+        def failing_put(**kwargs):
+            # report write fails
+            if kwargs["Key"].startswith(REPORT_PREFIX):
+                raise Exception("put error")
+
+            return put_object(**kwargs)
+
+        # send report
+        with patch.object(s3, "put_object", side_effect=failing_put):
+            first = self.post("key-1")
+
+        # retry report
+        second = self.post("key-1")
+
+        assert first.json().startswith("The following error was raised on API: ") and (
+            second.json() == "HTTP status of report input to S3 bucket --> 200"
+        )
+
+
+class TestReportUploads:
+    @pytest.fixture(scope="function")
+    def lambda_api(self, monkeypatch):
+        """Route the requests.Session.post calls of LambdaIngestor to the API
+        (presigned urls are called with requests.Session.put on moto)"""
+
+        def post(session, url, data=None, headers=None, timeout=None):
+            # call the API endpoint
+            return client.post(
+                url.replace(os.environ["AWS_LAMBDA_API"], ""),
+                content=data,
+                headers=headers,
+            )
+
+        # set a monkey patch so that when requests.Session.post is called
+        monkeypatch.setattr("requests.Session.post", post)
+
+    def lambda_ingestor(self, histogram_size: int = 0, **kwargs) -> LambdaIngestor:
+        """Create a LambdaIngestor object whose report has an empirical histogram"""
+
+        # instanciate SynthCustomers object and generate samples and report
+        synth_customers = SynthCustomers(num_samples=10, group="CONTROL")
+        synth_customers.generate_samples()
+        synth_customers.generate_report()
+
+        # add a large histogram to the report
+        synth_customers.creation_report["histogram_counts"] = list(
+            range(1_000_000, 1_000_000 + histogram_size)
+        )
+
+        return LambdaIngestor(synth_customers, upload_threshold=0, **kwargs)
+
+    def get_report(self, s3, key: str) -> dict:
+        """Read an uploaded report"""
+
+        return json.loads(
+            s3.get_object(Bucket=os.environ["AWS_S3_BUCKET"], Key=key)["Body"].read()
+        )
+
+    def test_upload_single_part(self, fake_s3_bucket, lambda_api, tmpdir):
+        """Check if a report smaller than one part is uploaded with one
+        presigned url and recorded on the partition manifest"""
+
+        # instanciate LambdaIngestor
+        lambda_ingestor = self.lambda_ingestor(histogram_size=10)
+
+        # send report
+        response = lambda_ingestor.send_report_to_lambda()
+
+        # get uploaded objects
+        objects = list_report_objects(fake_s3_bucket)
+
+        # read manifest of today partition
+        manifest = ReportManifestReader(log_folder=tmpdir).get_manifest(
+            datetime.utcnow().date()
+        )
+
+        assert (
+            (response == "HTTP status of report upload to S3 bucket --> 200")
+            and (len(objects) == 1)
+            and (
+                self.get_report(fake_s3_bucket, objects[0]["Key"])
+                == json.loads(lambda_ingestor.json_report)
+            )
+            and (manifest["objects"][0]["key"] == objects[0]["Key"])
+            and (manifest["objects"][0]["reports"][0]["group"] == "CONTROL")
+        )
+
+    def test_upload_complete_retried(self, fake_s3_bucket, lambda_api, tmpdir):
+        """Check if a retried upload completion (same Idempotency-Key) gets the
+        original response and records the report once on the partition manifest"""
+
+        # instanciate LambdaIngestor
+        lambda_ingestor = self.lambda_ingestor(histogram_size=10)
+
+        # spy requests sent to the api
+        with patch(
+            target="requests.Session.post",
+            side_effect=requests.Session.post,
+            autospec=True,
+        ) as mock_post:
+            response = lambda_ingestor.send_report_to_lambda()
+
+        # retry the upload completion request
+        retried = lambda_ingestor.session.post(**mock_post.call_args.kwargs).json()
+
+        # read manifest of today partition
+        manifest = ReportManifestReader(log_folder=tmpdir).get_manifest(
+            datetime.utcnow().date()
+        )
+
+        assert (
+            (mock_post.call_args.kwargs["url"].endswith("/report_uploads/complete"))
+            and (retried == response)
+            and (len(manifest["objects"]) == 1)
+        )
+
+    def test_upload_multipart(self, fake_s3_bucket, lambda_api, monkeypatch):
+        """Check if a report bigger than one part is uploaded in parallel parts"""
+
+        # define the smallest part size allowed by S3
+        monkeypatch.setenv("UPLOAD_PART_SIZE", str(5 * 1024 * 1024))
+
+        # instanciate LambdaIngestor with a report of about 3 parts
+        lambda_ingestor = self.lambda_ingestor(histogram_size=1_400_000)
+
+        # spy presigned url requests
+        with patch(
+            target="requests.Session.put",
+            side_effect=requests.Session.put,
+            autospec=True,
+        ) as mock_put:
+            response = lambda_ingestor.send_report_to_lambda()
+
+        # get uploaded objects
+        objects = list_report_objects(fake_s3_bucket)
+
+        assert (
+            (response == "HTTP status of report upload to S3 bucket --> 200")
+            and (mock_put.call_count == 3)
+            and (len(objects) == 1)
+            and (
+                self.get_report(fake_s3_bucket, objects[0]["Key"])
+                == json.loads(lambda_ingestor.json_report)
+            )
+        )
+
+    def test_upload_part_error(self, fake_s3_bucket, lambda_api, monkeypatch):
+        """Check if a failed part upload aborts the multipart upload"""
+
+        # define the smallest part size allowed by S3
+        monkeypatch.setenv("UPLOAD_PART_SIZE", str(5 * 1024 * 1024))
+
+        # instanciate LambdaIngestor with a report of about 3 parts
+        lambda_ingestor = self.lambda_ingestor(histogram_size=1_400_000)
+
+        # make presigned url requests fail
+        with patch(target="requests.Session.put", side_effect=Exception("put error")):
+            response = lambda_ingestor.send_report_to_lambda()
+
+        # list unfinished multipart uploads
+        uploads = fake_s3_bucket.list_multipart_uploads(
+            Bucket=os.environ["AWS_S3_BUCKET"]
+        )
+
+        assert (
+            response
+            == "send_report_to_lambda method raised the following error ---> put error"
+        ) and ("Uploads" not in uploads)
+
+    def test_small_report_not_uploaded(self, fake_s3_bucket, lambda_api):
+        """Check if reports below the upload threshold are sent on the request body"""
+
+        # instanciate LambdaIngestor with the default upload threshold
+        lambda_ingestor = self.lambda_ingestor()
+        lambda_ingestor.upload_threshold = DEFAULT_UPLOAD_BYTES
+
+        # send report
+        response = lambda_ingestor.send_report_to_lambda()
+
+        assert response == "HTTP status of report input to S3 bucket --> 200"
+
+    @pytest.mark.parametrize(
+        "size,status_code", [(0, 422), (-1, 422), (1024**3 + 1, 413), (10001, 413)]
+    )
+    def test_create_upload_size_limits(
+        self, fake_s3_bucket, monkeypatch, size, status_code
+    ):
+        """Check if uploads that are empty, too large or with too many parts
+        are rejected (1 byte parts -> 10001 bytes need 10001 parts)"""
+
+        # define a part size that makes the number of parts the limit
+        if size == 10001:
+            monkeypatch.setenv("UPLOAD_PART_SIZE", "1")
+
+        # make a POST request to /report_uploads endpoint
+        response = client.post("/report_uploads", json={"size": size})
+
+        # list unfinished multipart uploads
+        uploads = fake_s3_bucket.list_multipart_uploads(
+            Bucket=os.environ["AWS_S3_BUCKET"]
+        )
+
+        assert (response.status_code == status_code) and ("Uploads" not in uploads)
+
+    def test_complete_wrong_key(self, fake_s3_bucket):
+        """Check if only keys created by /report_uploads can be completed"""
+
+        # make a POST request to /report_uploads/complete endpoint
+        response = client.post(
+            "/report_uploads/complete",
+            json={
+                "key": "other_prefix/report.json",
+                "upload_id": None,
+                "parts": [],
+                "group": "CONTROL",
+                "gamma_shape": 10,
+                "poisson_lambda": 3,
+            },
+        )
+
+        assert response.json().startswith("The following error was raised on API: ")
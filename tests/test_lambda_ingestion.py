@@ -1,11 +1,20 @@
 # import required libraries
 import os
+import json
 import pytest
 import requests
+import threading
 import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch
 from synthetic_data_ingestion.sample_creator import SynthCustomers
-from synthetic_data_ingestion.lambda_ingestion import LambdaIngestor, NpEncoder
+from synthetic_data_ingestion.lambda_ingestion import (
+    LambdaIngestor,
+    LambdaReportBatcher,
+    NpEncoder,
+    get_session,
+    RETRY_STATUS_CODES,
+)
 
 
 # define samples to parameterize TestSynthCustomers class
@@ -29,6 +38,18 @@ class TestLambdaIngestor:
 
         assert hasattr(lambda_ingestor, "raw_report")
 
+    def test_constructor_cohort(self, num_samples, group):
+        """test correct construction of LambdaIngestor object
+        given the Cohort object returned by generate_samples"""
+
+        # generate samples (no report needed: the cohort holds it)
+        cohort = SynthCustomers(num_samples=num_samples, group=group).generate_samples()
+
+        # instanciate LambdaIngestor
+        lambda_ingestor = LambdaIngestor(cohort)
+
+        assert lambda_ingestor.raw_report == cohort.creation_report
+
     def test_constructor_invalid_type(self, num_samples, group):
         """test if constructor raises an error in case of
         incorrect input object type"""
@@ -38,6 +59,18 @@ class TestLambdaIngestor:
             # instanciate LambdaIngestor
             LambdaIngestor("INVALID_INPUT")
 
+    def test_constructor_invalid_serializer(self, num_samples, group):
+        """test if constructor raises a value error for a serializer
+        that is not a json serializer (e.g. msgpack)"""
+
+        # generate samples and report
+        cohort = SynthCustomers(num_samples=num_samples, group=group).generate_samples()
+
+        # make sure it will raise an error
+        with pytest.raises(ValueError, match="json serializer"):
+            # instanciate LambdaIngestor
+            LambdaIngestor(cohort, serializer="msgpack")
+
     def test_constructor_invalid_no_report(self, num_samples, group):
         """test if constructor raises an error in case of
         incorrect input object (missing report data)"""
@@ -71,7 +104,7 @@ class TestLambdaIngestor:
         lambda_ingestor._jsonify_report()
 
         assert (
-            lambda_ingestor.json_report == '{"X": 1, "Y": 1.5, "Z": []}'
+            json.loads(lambda_ingestor.json_report) == {"X": 1, "Y": 1.5, "Z": []}
         ) and isinstance(lambda_ingestor.json_report, str)
 
     def test_send_report_to_lambda_okay(self, num_samples, group, monkeypatch):
@@ -102,13 +135,13 @@ class TestLambdaIngestor:
                 # return status_code attribute
                 return 200
 
-        # set a monkey patch so that when requests.post is called
-        monkeypatch.setattr("requests.post", Monkey)
+        # set a monkey patch so that when requests.Session.post is called
+        monkeypatch.setattr("requests.Session.post", Monkey)
 
         assert lambda_ingestor.send_report_to_lambda() == "Okay"
 
-    # patch requests.post() so as to raise an Exception
-    @patch(target="requests.post", side_effect=Exception("post error"))
+    # patch requests.Session.post() so as to raise an Exception
+    @patch(target="requests.Session.post", side_effect=Exception("post error"))
     def test_send_report_to_lambda_request_raise_error(
         self, mock_post_error, num_samples, group
     ):
@@ -129,6 +162,166 @@ class TestLambdaIngestor:
             == "send_report_to_lambda method raised the following error ---> post error"
         )
 
+    def test_send_report_to_lambda_not_json(self, num_samples, group, monkeypatch):
+        """check if send_report_to_lambda method returns the response text
+        in case the api answers with a non json content"""
+
+        # instanciate SynthCustomers object given the num_samples and group params
+        # and generate samples and report
+        synth_customers = SynthCustomers(num_samples=num_samples, group=group)
+        synth_customers.generate_samples()
+        synth_customers.generate_report()
+
+        # instanciate LambdaIngestor
+        lambda_ingestor = LambdaIngestor(synth_customers)
+
+        # define a class to mock requests.Session.post
+        class Monkey:
+            def __init__(self, *args, **kwargs):
+                # class constructor
+                self.text = "Bad Gateway"
+
+            def json(self):
+                # non json content
+                raise ValueError("Expecting value")
+
+            @property
+            def status_code(self):
+                # return status_code attribute
+                return 502
+
+        # set a monkey patch so that when requests.Session.post is called
+        monkeypatch.setattr("requests.Session.post", Monkey)
+
+        assert lambda_ingestor.send_report_to_lambda() == "Bad Gateway"
+
+    def test_send_report_to_lambda_timeout(self, num_samples, group):
+        """check if send_report_to_lambda method sends the configured timeout
+        through the shared session"""
+
+        # instanciate SynthCustomers object given the num_samples and group params
+        # and generate samples and report
+        synth_customers = SynthCustomers(num_samples=num_samples, group=group)
+        synth_customers.generate_samples()
+        synth_customers.generate_report()
+
+        # instanciate LambdaIngestor with custom timeouts
+        lambda_ingestor = LambdaIngestor(synth_customers, timeout=(1, 5))
+
+        # mock requests.Session.post
+        with patch(target="requests.Session.post") as mock_post:
+            # set status code of the mocked response
+            mock_post.return_value.status_code = 200
+            # call send_report_to_lambda method
+            lambda_ingestor.send_report_to_lambda()
+
+        assert (mock_post.call_args.kwargs["timeout"] == (1, 5)) and (
+            lambda_ingestor.session is get_session()
+        )
+
+    def test_send_report_to_lambda_idempotency_key(self, num_samples, group):
+        """check if send_report_to_lambda method sends a key unique per
+        LambdaIngestor object (or the given key) on the Idempotency-Key header,
+        even for reports with the same content"""
+
+        # instanciate SynthCustomers object given the num_samples and group params
+        # and generate samples and report
+        synth_customers = SynthCustomers(num_samples=num_samples, group=group)
+        synth_customers.generate_samples()
+        synth_customers.generate_report()
+
+        # instanciate LambdaIngestor objects with default and run based keys
+        lambda_ingestors = [
+            LambdaIngestor(synth_customers),
+            LambdaIngestor(synth_customers),
+            LambdaIngestor(synth_customers, idempotency_key=f"run_1-{group}"),
+        ]
+
+        # mock requests.Session.post
+        with patch(target="requests.Session.post") as mock_post:
+            # set status code of the mocked response
+            mock_post.return_value.status_code = 200
+            # send reports
+            for lambda_ingestor in lambda_ingestors:
+                lambda_ingestor.send_report_to_lambda()
+            # send the first report again (retry)
+            lambda_ingestors[0].send_report_to_lambda()
+
+        # get sent keys
+        keys = [
+            call.kwargs["headers"]["Idempotency-Key"]
+            for call in mock_post.call_args_list
+        ]
+
+        assert (
+            lambda_ingestors[0].json_report == lambda_ingestors[1].json_report
+        ) and (
+            (keys[0] != keys[1])
+            and (keys[2] == f"run_1-{group}")
+            and (keys[3] == keys[0])
+        )
+
+
+class TestGetSession:
+    def test_get_session_shared(self):
+        """test if get_session returns the same session for the same params
+        and another session for other params"""
+        assert (get_session() is get_session()) and (
+            get_session(max_retries=1) is not get_session()
+        )
+
+    def test_get_session_retries(self):
+        """test if the session adapter retries the expected status codes
+        (POST requests only with an Idempotency-Key)"""
+
+        # get retry strategies of the https adapter
+        adapter = get_session().get_adapter("https://")
+        retry = adapter.max_retries
+        idempotent_retry = adapter.idempotent_adapter.max_retries
+
+        assert (
+            (set(retry.status_forcelist) == set(RETRY_STATUS_CODES))
+            and ("POST" not in retry.allowed_methods)
+            and ("POST" in idempotent_retry.allowed_methods)
+        )
+
+    def test_get_session_post_retries(self):
+        """test if POST requests are retried on server errors only when
+        they send an Idempotency-Key"""
+
+        # instanciate list of received requests
+        received = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                # record request and answer with a server error
+                self.rfile.read(int(self.headers["Content-Length"]))
+                received.append(self.headers.get("Idempotency-Key"))
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        # serve on a background thread
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}"
+
+        # send POST requests without and with an Idempotency-Key
+        session = get_session(max_retries=2, backoff_factor=0)
+        try:
+            r_no_key = session.post(url, data="{}")
+            r_key = session.post(url, data="{}", headers={"Idempotency-Key": "key"})
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert (r_no_key.status_code == r_key.status_code == 503) and (
+            received == [None, "key", "key", "key"]
+        )
+
 
 class TestNpEncoder:
     def test_default_int(self):
@@ -142,3 +335,171 @@ class TestNpEncoder:
     def test_default_array(self):
         """test default json encoder for np arrays"""
         assert NpEncoder().default(np.array([1, 1.5])) == [1, 1.5]
+
+
+class TestLambdaReportBatcher:
+    def _lambda_ingestor(self, group: str = "CONTROL") -> LambdaIngestor:
+        """Create a LambdaIngestor object with a generated report"""
+
+        # instanciate SynthCustomers object and generate samples and report
+        synth_customers = SynthCustomers(num_samples=10, group=group)
+        synth_customers.generate_samples()
+        synth_customers.generate_report()
+
+        return LambdaIngestor(synth_customers)
+
+    def test_add_flush_by_count(self):
+        """test if the batch is sent in one request when
+        the number of reports reaches max_reports"""
+
+        # instanciate batcher
+        batcher = LambdaReportBatcher(max_reports=3)
+
+        # mock requests.Session.post
+        with patch(target="requests.Session.post") as mock_post:
+            # set status code of the mocked response
+            mock_post.return_value.status_code = 200
+            # buffer reports through the LambdaIngestor batching mode
+            for group in ["CONTROL", "TREATMENT", "CONTROL"]:
+                self._lambda_ingestor(group).send_report_to_lambda(batcher=batcher)
+
+        # get sent reports
+        sent = json.loads(mock_post.call_args.kwargs["data"])
+
+        assert (
+            (mock_post.call_count == 1)
+            and mock_post.call_args.kwargs["url"].endswith("/sampling_reports")
+            and (
+                [report["group"] for report in sent]
+                == ["CONTROL", "TREATMENT", "CONTROL"]
+            )
+            and (batcher.json_reports == [])
+        )
+
+    def test_add_flush_by_size(self):
+        """test if the batch is sent when the size of reports reaches max_bytes"""
+
+        # instanciate batcher with a tiny size threshold
+        batcher = LambdaReportBatcher(max_bytes=1)
+
+        # mock requests.Session.post
+        with patch(target="requests.Session.post") as mock_post:
+            # set status code of the mocked response
+            mock_post.return_value.status_code = 200
+            # add two reports
+            batcher.add(self._lambda_ingestor())
+            batcher.add(self._lambda_ingestor())
+
+        assert mock_post.call_count == 2
+
+    def test_context_manager_flush(self):
+        """test if remaining reports are sent when leaving the context manager"""
+
+        # mock requests.Session.post
+        with patch(target="requests.Session.post") as mock_post:
+            # set status code of the mocked response
+            mock_post.return_value.status_code = 200
+            # buffer two reports
+            with LambdaReportBatcher() as batcher:
+                batcher.add(self._lambda_ingestor())
+                batcher.add(self._lambda_ingestor())
+
+                # nothing is sent before leaving the context manager
+                assert mock_post.call_count == 0
+
+        assert (mock_post.call_count == 1) and (batcher.json_reports == [])
+
+    # patch requests.Session.post() so as to raise an Exception
+    @patch(target="requests.Session.post", side_effect=Exception("post error"))
+    def test_flush_error_keeps_buffer(self, mock_post_error):
+        """test if reports are kept on the buffer in case the request fails"""
+
+        # instanciate batcher and buffer one report
+        batcher = LambdaReportBatcher()
+        batcher.add(self._lambda_ingestor())
+
+        assert (
+            batcher.flush() == "flush method raised the following error ---> post error"
+        ) and (len(batcher.json_reports) == 1)
+
+    def test_flush_api_error_keeps_buffer(self):
+        """test if reports are kept on the buffer in case the API answers
+        with an error message (status code 200)"""
+
+        # instanciate batcher and buffer one report
+        batcher = LambdaReportBatcher()
+        batcher.add(self._lambda_ingestor())
+
+        # mock requests.Session.post
+        with patch(target="requests.Session.post") as mock_post:
+            # set status code and content of the mocked response
+            mock_post.return_value.status_code = 200
+            mock_post.return_value.json.return_value = (
+                "The following error was raised on API: no bucket"
+            )
+            # send buffered reports
+            response = batcher.flush()
+
+        assert (response == "The following error was raised on API: no bucket") and (
+            len(batcher.json_reports) == 1
+        )
+
+    def test_flush_idempotency_key(self):
+        """test if a retried flush sends the same Idempotency-Key"""
+
+        # instanciate batcher and buffer one report
+        batcher = LambdaReportBatcher()
+        batcher.add(self._lambda_ingestor())
+
+        # mock requests.Session.post
+        with patch(target="requests.Session.post") as mock_post:
+            # first flush fails, second one succeeds
+            mock_post.return_value.status_code = 503
+            batcher.flush()
+            mock_post.return_value.status_code = 200
+            batcher.flush()
+
+        # get sent keys
+        keys = [
+            call.kwargs["headers"]["Idempotency-Key"]
+            for call in mock_post.call_args_list
+        ]
+
+        assert (keys[0] == keys[1]) and (batcher.idempotency_key is None)
+
+    def test_flush_idempotency_key_new_batch(self):
+        """test if batches with the same content send different Idempotency-Keys
+        and if a report added after a failed flush changes the key"""
+
+        # instanciate batcher and buffer one report
+        batcher = LambdaReportBatcher()
+        lambda_ingestor = self._lambda_ingestor()
+        batcher.add(lambda_ingestor)
+
+        # mock requests.Session.post
+        with patch(target="requests.Session.post") as mock_post:
+            # failed flush, then a report is added and the batch is sent
+            mock_post.return_value.status_code = 503
+            batcher.flush()
+            batcher.add(lambda_ingestor)
+            mock_post.return_value.status_code = 200
+            batcher.flush()
+            # a batch with the same content
+            batcher.add(lambda_ingestor)
+            batcher.add(lambda_ingestor)
+            batcher.flush()
+
+        # get sent keys
+        keys = [
+            call.kwargs["headers"]["Idempotency-Key"]
+            for call in mock_post.call_args_list
+        ]
+
+        assert len(set(keys)) == 3
+
+    def test_flush_empty(self):
+        """test if flush does nothing when there are no buffered reports"""
+        assert (
+            LambdaReportBatcher().flush()
+            == "Nothing was done once there are no buffered reports"
+        )
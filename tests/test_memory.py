@@ -0,0 +1,162 @@
+# import required libraries
+import pytest
+import tracemalloc
+import numpy as np
+from synthetic_data_ingestion import memory
+from synthetic_data_ingestion.sample_creator import SynthCustomers
+from synthetic_data_ingestion.dynamodb_ingestion import DynamodbIngestor
+
+
+@pytest.fixture
+def memory_profile():
+    """Turn memory profiling on during a test"""
+
+    # turn memory profiling on
+    memory.enable(top=3)
+
+    yield
+
+    # turn memory profiling off
+    memory.disable()
+
+
+class TestMemory:
+    def test_memory_off(self):
+        """Check if stages are not tracked when memory profiling is off"""
+
+        @memory.tracked("test.add")
+        def add(a, b):
+            return a + b
+
+        # track a stage with memory profiling off
+        with memory.track("test.stage") as record:
+            pass
+
+        assert (
+            (not memory.is_enabled())
+            and (record is None)
+            and (add(1, 2) == 3)
+            and (not tracemalloc.is_tracing())
+        )
+
+    def test_enable_invalid_top(self):
+        """Check if enable raises an error on invalid top"""
+
+        with pytest.raises(ValueError):
+            memory.enable(top=-1)
+
+    def test_track(self, memory_profile):
+        """Check if the peak, the kept memory and the top lines of a stage
+        are recorded, with nested stages as children"""
+
+        # track a stage with a temporary and a kept array
+        with memory.track("test.parent", cohort="control-10") as parent:
+            with memory.track("test.child") as child:
+                kept = np.zeros(2 * 1024 * 1024 // 8)
+            temporary = np.zeros(8 * 1024 * 1024 // 8)
+            del temporary
+
+        assert (
+            (parent["cohort"] == "control-10")
+            and (parent["children"] == [child])
+            # peak includes the 8 MB temporary array
+            and (parent["peak_mb"] >= 10)
+            # only the 2 MB array is kept
+            and (1.9 <= parent["allocated_mb"] < 3)
+            and (1.9 <= child["peak_mb"] < 3)
+            and (child["top"][0]["size_mb"] >= 1.9)
+            and ("test_memory.py" in child["top"][0]["line"])
+            and (parent["peak_rss_mb"] > 0)
+            and ("_peak" not in parent)
+            and (kept.nbytes == 2 * 1024 * 1024)
+        )
+
+    def test_child_peak(self, memory_profile):
+        """Check if the peak of a parent stage includes the peaks of its children"""
+
+        # track a stage whose child has a temporary array
+        with memory.track("test.parent") as parent:
+            with memory.track("test.child") as child:
+                temporary = np.zeros(4 * 1024 * 1024 // 8)
+                del temporary
+
+        assert (child["peak_mb"] >= 4) and (parent["peak_mb"] >= child["peak_mb"])
+
+    def test_track_without_reset_peak(self, memory_profile, monkeypatch):
+        """Check if peaks are recorded without tracemalloc.reset_peak (Python 3.8)"""
+
+        # remove tracemalloc.reset_peak
+        monkeypatch.delattr(tracemalloc, "reset_peak")
+
+        # track a stage whose child has a temporary and a kept array
+        with memory.track("test.parent") as parent:
+            with memory.track("test.child") as child:
+                temporary = np.zeros(4 * 1024 * 1024 // 8)
+                del temporary
+                kept = np.zeros(2 * 1024 * 1024 // 8)
+            with memory.track("test.small") as small:
+                pass
+
+        assert (
+            (4 <= child["peak_mb"] < 7)
+            and (1.9 <= child["allocated_mb"] < 3)
+            and (parent["peak_mb"] >= child["peak_mb"])
+            and (1.9 <= parent["allocated_mb"] < 3)
+            # the peak of the child is not counted on the next stage
+            and (small["peak_mb"] < 1)
+            and (child["top"][0]["size_mb"] >= 1.9)
+            and (kept.nbytes == 2 * 1024 * 1024)
+        )
+
+
+class TestInstrumentation:
+    def test_generate_samples_memory(self, tmpdir, memory_profile):
+        """Check if generate_samples and every gen_* method are tracked"""
+
+        # generate samples with memory profiling on
+        synth_customers = SynthCustomers(
+            num_samples=10_000, group="CONTROL", log_folder=tmpdir
+        )
+        with memory.track("generate") as record:
+            synth_customers.generate_samples()
+
+        # get record of generate_samples
+        generate_samples = record["children"][0]
+
+        assert (
+            (generate_samples["stage"] == "sample_creator.generate_samples")
+            and (
+                [child["stage"] for child in generate_samples["children"]]
+                == [
+                    "sample_creator.gen_total_purchase_price",
+                    "sample_creator.gen_num_diff_items",
+                    "sample_creator.gen_purchase_date",
+                    "sample_creator.gen_region",
+                    "sample_creator.gen_gender",
+                    "sample_creator.gen_group",
+                    "sample_creator.gen_device",
+                ]
+            )
+            and (
+                generate_samples["allocated_mb"] * memory.MB
+                >= sum(
+                    column.nbytes for column in synth_customers.sampling_dict.values()
+                )
+            )
+        )
+
+    def test_parse_logs_memory(self, tmpdir, memory_profile):
+        """Check if the log lines kept by DynamodbIngestor are tracked"""
+
+        # write log lines
+        tmpdir.join("data_ingestion-2022-01-03.log").write(
+            "2022:01:03 00:00:00 - INFO - sample_creator.py - message\n" * 1000
+        )
+
+        # parse logs with memory profiling on
+        with memory.track("dynamo") as record:
+            DynamodbIngestor(str(tmpdir))
+
+        assert (record["children"][0]["stage"] == "dynamo.parse_logs") and (
+            record["children"][0]["allocated_mb"] > 0
+        )
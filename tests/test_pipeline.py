@@ -0,0 +1,701 @@
+# import required libraries
+import time
+import json
+import threading
+import pytest
+import pyarrow.parquet as pq
+from multiprocessing import shared_memory
+from unittest.mock import patch
+from synthetic_data_ingestion import memory, pipeline, shared_columns, tracing
+from synthetic_data_ingestion.sample_creator import SynthCustomers
+from synthetic_data_ingestion.pipeline import (
+    define_cohorts,
+    is_failure,
+    main,
+    run_pipeline,
+    run_pipelined,
+    summarize_stages,
+    validate_cohorts,
+)
+
+
+def block_exists(name: str) -> bool:
+    """Check if a shared memory block exists"""
+
+    # try to attach block
+    try:
+        shared_memory.SharedMemory(name=name).close()
+        return True
+
+    # block was removed
+    except FileNotFoundError:
+        return False
+
+
+class SinkSpy:
+    def __init__(self) -> None:
+        """Record sink calls (stage, cohort group, start and end times)"""
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def sink(self, stage: str, response: str):
+        """Create a slow sink that records its calls"""
+
+        def func(*args):
+            # get group of the cohort (dynamo has no cohort)
+            group = getattr(args[0], "group", None)
+
+            # slow call
+            start = time.perf_counter()
+            time.sleep(0.05)
+
+            with self.lock:
+                self.calls.append((stage, group, start, time.perf_counter()))
+
+            return response
+
+        return func
+
+
+class TestDefineCohorts:
+    def test_define_cohorts(self):
+        """Check if there is one cohort per arm and size with its own seed"""
+
+        # define cohorts twice with the same seed
+        cohorts = [
+            define_cohorts(["CONTROL", "TREATMENT"], [10, 20], seed=7) for _ in range(2)
+        ]
+
+        assert (
+            (cohorts[0] == cohorts[1])
+            and (
+                [(c["group"], c["num_samples"]) for c in cohorts[0]]
+                == [
+                    ("CONTROL", 10),
+                    ("CONTROL", 20),
+                    ("TREATMENT", 10),
+                    ("TREATMENT", 20),
+                ]
+            )
+            and (len({c["seed"] for c in cohorts[0]}) == 4)
+            and ("seed" not in define_cohorts(["CONTROL"], [10])[0])
+        )
+
+    def test_define_cohorts_repeated(self):
+        """Check if repeated arms or cohort sizes raise an error"""
+
+        with pytest.raises(ValueError):
+            define_cohorts(["CONTROL", "TREATMENT"], [2000, 2000], seed=1)
+        with pytest.raises(ValueError):
+            define_cohorts(["CONTROL", "CONTROL"], [2000])
+
+    def test_validate_cohorts_replace(self):
+        """Check if replacing RDS rows needs a single cohort per group
+        (a replace deletes every row of the group and week)"""
+
+        # two cohorts per group
+        cohorts = define_cohorts(["CONTROL", "TREATMENT"], [1000, 2000])
+
+        # validate cohorts without replace
+        validate_cohorts(cohorts)
+
+        with pytest.raises(ValueError):
+            validate_cohorts(cohorts, replace=True)
+        with pytest.raises(ValueError):
+            run_pipelined(cohorts, sinks=["rds"], replace=True)
+
+
+class TestRunPipeline:
+    def test_run_pipeline(self, tmpdir):
+        """Check if RDS and Lambda sinks run concurrently and the
+        DynamoDB sink runs after all other stages"""
+
+        # instanciate sink spy
+        spy = SinkSpy()
+
+        # run pipeline with fake sinks
+        with patch.object(
+            pipeline,
+            "rds_sink",
+            spy.sink("rds", "ingest_samples method successfully called"),
+        ), patch.object(
+            pipeline, "lambda_sink", spy.sink("lambda", "HTTP status --> 200")
+        ), patch.object(
+            pipeline,
+            "dynamo_sink",
+            spy.sink("dynamo", "send_logs method successfully called"),
+        ):
+            run = run_pipeline(
+                define_cohorts(["CONTROL", "TREATMENT"], [10], seed=1),
+                process_workers=2,
+                log_folder=tmpdir,
+            )
+
+        # get sink calls
+        rds = [call for call in spy.calls if call[0] == "rds"]
+        lam = [call for call in spy.calls if call[0] == "lambda"]
+        dynamo = [call for call in spy.calls if call[0] == "dynamo"]
+
+        assert (
+            (
+                sorted((s["stage"], s["cohort"]) for s in run["stages"])
+                == sorted(
+                    [("dynamo", None)]
+                    + [
+                        (stage, cohort)
+                        for stage in ["generate", "rds", "lambda"]
+                        for cohort in ["control-10", "treatment-10"]
+                    ]
+                )
+            )
+            # RDS and Lambda sinks overlap in time
+            and any(r[2] < l[3] and l[2] < r[3] for r in rds for l in lam)
+            # DynamoDB sink starts after all other sinks
+            and all(dynamo[0][2] >= call[3] for call in rds + lam)
+            # wall time is below the sum of the sink durations
+            and (run["wall_s"] < sum(call[3] - call[2] for call in spy.calls))
+        )
+
+    def test_run_pipeline_sink_selection(self, tmpdir):
+        """Check if only the selected sinks run"""
+
+        # instanciate sink spy
+        spy = SinkSpy()
+
+        # run pipeline with fake sinks
+        with patch.object(pipeline, "rds_sink", spy.sink("rds", "ok")), patch.object(
+            pipeline, "lambda_sink", spy.sink("lambda", "ok")
+        ), patch.object(pipeline, "dynamo_sink", spy.sink("dynamo", "ok")):
+            run = run_pipeline(
+                define_cohorts(["CONTROL"], [10]),
+                sinks=["lambda"],
+                process_workers=1,
+                log_folder=tmpdir,
+            )
+
+        assert [call[0] for call in spy.calls] == ["lambda"] and (
+            [s["stage"] for s in run["stages"]] == ["generate", "lambda"]
+        )
+
+    def test_run_pipeline_sink_error(self, tmpdir):
+        """Check if sink errors are recorded as failures and logs are still sent"""
+
+        # instanciate sink spy
+        spy = SinkSpy()
+
+        # run pipeline with a failing RDS sink
+        with patch.object(
+            pipeline, "rds_sink", side_effect=Exception("no database")
+        ), patch.object(
+            pipeline, "lambda_sink", spy.sink("lambda", "ok")
+        ), patch.object(
+            pipeline, "dynamo_sink", spy.sink("dynamo", "ok")
+        ):
+            run = run_pipeline(
+                define_cohorts(["CONTROL"], [10]),
+                process_workers=1,
+                log_folder=tmpdir,
+            )
+
+        # summarize stages
+        summary = summarize_stages(run["stages"])
+
+        assert (
+            (summary["rds"]["failures"] == 1)
+            and (summary["lambda"]["failures"] == 0)
+            and (summary["dynamo"]["calls"] == 1)
+        )
+
+    def test_run_pipeline_shared_memory(self, tmpdir):
+        """Check if cohorts sent through shared memory are written like pickled
+        cohorts and their blocks are removed after their sinks"""
+
+        # record attached descriptors
+        descriptors = []
+
+        class SharedColumnsSpy(shared_columns.SharedColumns):
+            __slots__ = ()
+
+            def __init__(self, descriptor):
+                descriptors.append(descriptor)
+                super().__init__(descriptor)
+
+        # instanciate dict of Parquet tables per handoff
+        tables = {}
+
+        # run pipeline with the Parquet sink on both handoffs
+        for handoff in shared_columns.HANDOFFS:
+            with patch.object(shared_columns, "SharedColumns", SharedColumnsSpy):
+                run = run_pipeline(
+                    define_cohorts(["CONTROL", "TREATMENT"], [1000], seed=1),
+                    sinks=["parquet"],
+                    reference_date="2022-01-03",
+                    process_workers=2,
+                    parquet_folder=str(tmpdir.join(handoff)),
+                    log_folder=str(tmpdir),
+                    handoff=handoff,
+                )
+
+            # read Parquet files
+            tables[handoff] = [
+                pq.read_table(str(path))
+                for path in sorted(tmpdir.join(handoff).listdir())
+            ]
+
+        assert (
+            (len(descriptors) == 2)
+            and (summarize_stages(run["stages"])["parquet"]["failures"] == 0)
+            and all(
+                table.equals(pickled)
+                for table, pickled in zip(tables["shared_memory"], tables["pickle"])
+            )
+            and (len(tables["shared_memory"]) == 2)
+            # blocks are removed
+            and not any(
+                block_exists(spec["name"])
+                for descriptor in descriptors
+                for spec in descriptor.values()
+            )
+        )
+
+    def test_run_pipeline_invalid_handoff(self, tmpdir):
+        """Check if run_pipeline raises an error on invalid handoffs"""
+
+        with pytest.raises(ValueError):
+            run_pipeline(
+                define_cohorts(["CONTROL"], [10]), log_folder=tmpdir, handoff="pipe"
+            )
+
+    def test_run_pipeline_repeated_cohorts(self, tmpdir):
+        """Check if cohorts with the same name are rejected before any of them
+        is generated (their stages, shared samples and files would collide)"""
+
+        # define two cohorts of the same arm and size
+        cohorts = define_cohorts(["CONTROL"], [2000], seed=1) * 2
+
+        # try to run them on both modes
+        with pytest.raises(ValueError):
+            run_pipeline(
+                cohorts,
+                sinks=["parquet"],
+                parquet_folder=str(tmpdir),
+                log_folder=str(tmpdir),
+                handoff="shared_memory",
+            )
+        with pytest.raises(ValueError):
+            run_pipelined(
+                cohorts,
+                sinks=["parquet"],
+                parquet_folder=str(tmpdir),
+                log_folder=str(tmpdir),
+            )
+
+        assert tmpdir.listdir(lambda path: path.ext == ".parquet") == []
+
+    def test_run_pipeline_shared_memory_cohorts(self, tmpdir):
+        """Check if the shared samples of each cohort are released only after
+        its own sinks (several cohorts of each arm in flight)"""
+
+        # run pipeline with the Parquet sink on shared memory handoff
+        run = run_pipeline(
+            define_cohorts(["CONTROL", "TREATMENT"], [2000, 3000], seed=1),
+            sinks=["parquet"],
+            process_workers=2,
+            parquet_folder=str(tmpdir),
+            log_folder=str(tmpdir),
+            handoff="shared_memory",
+        )
+
+        # read Parquet files
+        tables = [
+            pq.read_table(str(path))
+            for path in tmpdir.listdir(lambda path: path.ext == ".parquet")
+        ]
+
+        assert (
+            (summarize_stages(run["stages"])["parquet"]["failures"] == 0)
+            and (sorted(table.num_rows for table in tables) == [2000, 2000, 3000, 3000])
+            and (
+                sorted(s["cohort"] for s in run["stages"] if s["stage"] == "parquet")
+                == ["control-2000", "control-3000", "treatment-2000", "treatment-3000"]
+            )
+        )
+
+
+class TestRunPipelined:
+    def test_run_pipelined_parquet(self, tmpdir):
+        """Check if every sample of every cohort is written to its Parquet file"""
+
+        # run pipeline with the Parquet sink
+        run = run_pipelined(
+            define_cohorts(["CONTROL", "TREATMENT"], [1000], seed=1),
+            sinks=["parquet"],
+            batch_size=300,
+            parquet_folder=str(tmpdir),
+            log_folder=str(tmpdir),
+        )
+
+        # read Parquet files
+        files = sorted(tmpdir.listdir(lambda path: path.ext == ".parquet"))
+        tables = [pq.read_table(str(path)) for path in files]
+
+        assert (
+            (len(tables) == 2)
+            and all(table.num_rows == 1000 for table in tables)
+            and all(pq.ParquetFile(str(path)).num_row_groups == 4 for path in files)
+            and (summarize_stages(run["stages"])["parquet"]["failures"] == 0)
+        )
+
+    def test_run_pipelined_backpressure(self, tmpdir):
+        """Check if generation waits for a slow sink (at most queue_batches
+        batches queued) and batches are consumed while they are generated"""
+
+        # keep the original generate_batches method
+        generate_batches = SynthCustomers.generate_batches
+
+        # instanciate counters of generated and consumed batches
+        generated, ahead = [0], []
+
+        def counted_batches(synth_customers, batch_size):
+            # define batches (eagerly, as generate_batches does)
+            batches = generate_batches(synth_customers, batch_size)
+
+            # count generated batches
+            def counter():
+                for batch in batches:
+                    generated[0] += 1
+                    yield batch
+
+            return counter()
+
+        def slow_sink(synth_customers, log_folder, replace=False):
+            # fake RdsIngestor that consumes slowly
+            class Ingestor:
+                def ingest_batches(self, batches, replace=False):
+                    for consumed, _ in enumerate(batches, start=1):
+                        # record how far generation is ahead of the sink
+                        ahead.append(generated[0] - consumed)
+                        time.sleep(0.005)
+                    return "ingest_batches method successfully called"
+
+            return Ingestor()
+
+        # run pipeline with a slow RDS sink
+        with patch.object(
+            SynthCustomers, "generate_batches", counted_batches
+        ), patch.object(pipeline, "RdsIngestor", slow_sink):
+            run = run_pipelined(
+                define_cohorts(["CONTROL"], [1000], seed=1),
+                sinks=["rds"],
+                batch_size=10,
+                queue_batches=2,
+                log_folder=str(tmpdir),
+            )
+
+        assert (
+            (len(ahead) == 100)
+            and (max(ahead) <= 2 + 1)
+            and (summarize_stages(run["stages"])["rds"]["failures"] == 0)
+        )
+
+    def test_run_pipelined_sink_error(self, tmpdir):
+        """Check if a failed sink does not block generation nor the other sinks"""
+
+        def failing_sink(synth_customers, log_folder, replace=False):
+            # fake RdsIngestor that fails on the first batch
+            class Ingestor:
+                def ingest_batches(self, batches, replace=False):
+                    next(iter(batches))
+                    raise Exception("no database")
+
+            return Ingestor()
+
+        # run pipeline with a failing RDS sink
+        with patch.object(pipeline, "RdsIngestor", failing_sink):
+            run = run_pipelined(
+                define_cohorts(["CONTROL"], [1000], seed=1),
+                sinks=["rds", "parquet"],
+                batch_size=10,
+                queue_batches=1,
+                parquet_folder=str(tmpdir),
+                log_folder=str(tmpdir),
+            )
+
+        # summarize stages
+        summary = summarize_stages(run["stages"])
+
+        assert (summary["rds"]["failures"] == 1) and (
+            summary["parquet"]["failures"] == 0
+        )
+
+    def test_run_pipelined_generation_error(self, tmpdir):
+        """Check if a failed generation makes the batch sinks discard the partial
+        cohort and if the stages of the sinks are still recorded"""
+
+        # keep the original generate_batches method
+        generate_batches = SynthCustomers.generate_batches
+
+        # instanciate batches consumed by the RDS sink and its committed rows
+        consumed, committed = [], []
+
+        def failing_batches(synth_customers, batch_size):
+            # define batches (eagerly, as generate_batches does)
+            batches = generate_batches(synth_customers, batch_size)
+
+            # fail after two batches
+            def failing():
+                yield next(batches)
+                yield next(batches)
+                raise Exception("generation error")
+
+            return failing()
+
+        def transactional_sink(synth_customers, log_folder, replace=False):
+            # fake RdsIngestor that commits the rows after the last batch
+            class Ingestor:
+                def ingest_batches(self, batches, replace=False):
+                    rows = []
+                    for batch in batches:
+                        consumed.append(batch)
+                        rows.append(batch)
+                    committed.extend(rows)
+                    return "ingest_batches method successfully called"
+
+            return Ingestor()
+
+        # run pipeline with a failing generation
+        with patch.object(
+            SynthCustomers, "generate_batches", failing_batches
+        ), patch.object(pipeline, "RdsIngestor", transactional_sink):
+            run = run_pipelined(
+                define_cohorts(["CONTROL"], [1000], seed=1),
+                sinks=["rds", "parquet"],
+                batch_size=10,
+                parquet_folder=str(tmpdir),
+                log_folder=str(tmpdir),
+            )
+
+        # get stages by name
+        stages = {stage["stage"]: stage for stage in run["stages"]}
+
+        assert (
+            (len(consumed) == 2)
+            and (committed == [])
+            and (set(stages) == {"generate", "rds", "parquet"})
+            and all(is_failure(stage["response"]) for stage in stages.values())
+            and ("generation error" in stages["generate"]["response"])
+            and ("cohort generation failed" in stages["rds"]["response"])
+            and (stages["parquet"]["duration_s"] is not None)
+            and (tmpdir.listdir(lambda path: path.ext == ".parquet") == [])
+        )
+
+
+class TestMain:
+    def test_is_failure(self):
+        """Check if ingestor failure messages are detected"""
+
+        assert (
+            is_failure(
+                "ingest_samples method NOT successfully called: raised error ---> X"
+            )
+            and is_failure(
+                "send_report_to_lambda method raised the following error ---> X"
+            )
+            and is_failure("The following error was raised on API: X")
+            and not is_failure("HTTP status of report input to S3 bucket --> 200")
+        )
+
+    def test_main(self, tmpdir, capsys):
+        """Check if main prints per-stage timings and saves the run"""
+
+        # define output file
+        output = str(tmpdir.join("run.json"))
+
+        # run pipeline without sinks
+        exit_code = main(
+            [
+                "--sinks",
+                "--cohort-sizes",
+                "10",
+                "20",
+                "--seed",
+                "3",
+                "--log-folder",
+                str(tmpdir),
+                "--output",
+                output,
+            ]
+        )
+
+        # read printed timings and saved run
+        printed = capsys.readouterr().out
+        with open(output) as output_file:
+            saved = json.load(output_file)
+
+        assert (
+            (exit_code == 0)
+            and printed.startswith("stage")
+            and ("generate" in printed)
+            and (saved["summary"]["generate"]["calls"] == 4)
+        )
+
+    def test_main_default_log_folder(self):
+        """Check if the default log folder is the project log folder
+        (the dynamo sink sends every file of it)"""
+
+        # run pipeline without running its stages
+        with patch.object(
+            pipeline, "run_pipeline", side_effect=Exception("not run")
+        ) as run_pipeline:
+            with pytest.raises(Exception):
+                main(["--sinks"])
+
+        assert run_pipeline.call_args.kwargs["log_folder"] == "../logs"
+
+    def test_main_failure(self, tmpdir, capsys):
+        """Check if main exits with 1 when a stage fails"""
+
+        # run pipeline with a failing Lambda sink
+        with patch.object(
+            pipeline,
+            "lambda_sink",
+            return_value="send_report_to_lambda method raised the following error ---> X",
+        ):
+            exit_code = main(
+                [
+                    "--sinks",
+                    "lambda",
+                    "--cohort-sizes",
+                    "10",
+                    "--log-folder",
+                    str(tmpdir),
+                ]
+            )
+
+        assert (exit_code == 1) and ("FAILED lambda" in capsys.readouterr().out)
+
+    def test_main_pipelined(self, tmpdir, capsys):
+        """Check if main runs the pipelined mode with the Parquet sink"""
+
+        # run pipelined mode with the Parquet sink
+        exit_code = main(
+            [
+                "--mode",
+                "pipelined",
+                "--sinks",
+                "parquet",
+                "--cohort-sizes",
+                "50",
+                "--batch-size",
+                "20",
+                "--parquet-folder",
+                str(tmpdir),
+                "--log-folder",
+                str(tmpdir),
+            ]
+        )
+
+        assert (
+            (exit_code == 0)
+            and ("parquet" in capsys.readouterr().out)
+            and (len(tmpdir.listdir(lambda path: path.ext == ".parquet")) == 2)
+        )
+
+    def test_main_trace(self, tmpdir, capsys):
+        """Check if main exports the spans of the run (children of the run span)"""
+
+        # define trace file
+        trace_file = str(tmpdir.join("traces.jsonl"))
+
+        # run pipeline with tracing on
+        try:
+            exit_code = main(
+                [
+                    "--sinks",
+                    "parquet",
+                    "--cohort-sizes",
+                    "10",
+                    "--process-workers",
+                    "1",
+                    "--parquet-folder",
+                    str(tmpdir),
+                    "--log-folder",
+                    str(tmpdir),
+                    "--trace-file",
+                    trace_file,
+                ]
+            )
+        finally:
+            tracing.disable()
+
+        # read exported spans
+        with open(trace_file) as trace_lines:
+            spans = [json.loads(line) for line in trace_lines]
+
+        # get run span
+        run = [span for span in spans if span["name"] == "pipeline.run_pipeline"][0]
+
+        assert (
+            (exit_code == 0)
+            and all(span["trace_id"] == run["trace_id"] for span in spans)
+            and (
+                sorted(
+                    span["name"]
+                    for span in spans
+                    if span["parent_span_id"] == run["span_id"]
+                )
+                == ["pipeline.generate_cohort"] * 2 + ["pipeline.parquet_sink"] * 2
+            )
+            and (
+                sum(span["name"] == "sample_creator.generate_samples" for span in spans)
+                == 2
+            )
+        )
+
+    def test_main_memory_profile(self, tmpdir, capsys):
+        """Check if main attaches the memory of each stage to the run"""
+
+        # define output file
+        output = str(tmpdir.join("run.json"))
+
+        # run pipeline (both modes) with memory profiling on
+        try:
+            for mode in ["staged", "pipelined"]:
+                exit_code = main(
+                    [
+                        "--mode",
+                        mode,
+                        "--sinks",
+                        "parquet",
+                        "--cohort-sizes",
+                        "1000",
+                        "--process-workers",
+                        "1",
+                        "--parquet-folder",
+                        str(tmpdir),
+                        "--log-folder",
+                        str(tmpdir),
+                        "--memory-profile",
+                        "--output",
+                        output,
+                    ]
+                )
+
+                # read saved run
+                with open(output) as output_file:
+                    saved = json.load(output_file)
+
+                assert (
+                    (exit_code == 0)
+                    and ("peak MB" in capsys.readouterr().out)
+                    and all(
+                        stage["memory"]["stage"].startswith(stage["stage"])
+                        and (stage["memory"]["peak_mb"] > 0)
+                        and (len(stage["memory"]["top"]) > 0)
+                        for stage in saved["stages"]
+                    )
+                    and (saved["summary"]["parquet"]["peak_mb"] > 0)
+                    and (saved["memory"]["peak_rss_mb"] > 0)
+                )
+        finally:
+            memory.disable()
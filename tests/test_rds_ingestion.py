@@ -5,6 +5,9 @@ import pytest
 import numpy as np
 from datetime import datetime
 from unittest.mock import patch
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+from synthetic_data_ingestion.cohort import Cohort
 from synthetic_data_ingestion.rds_ingestion import RdsIngestor
 from synthetic_data_ingestion.sample_creator import SynthCustomers
 
@@ -238,3 +241,168 @@ class TestRdsIngestor:
                 rds_ingestor.ingest_samples()
                 == "ingest_samples method successfully called"
             )
+
+
+@pytest.fixture(scope="function")
+def sqlite_engine():
+    """In-memory SQLite engine with a "public" schema standing in for AWS RDS"""
+
+    # one shared in-memory connection
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+
+    # attach a database named as the postgres schema
+    with engine.connect() as connection:
+        connection.execute(text("ATTACH DATABASE ':memory:' AS public"))
+
+    yield engine
+
+    engine.dispose()
+
+
+class TestRdsIngestorReplace:
+    def ingest(
+        self, engine, seed: int, replace: bool, reference_date: str = "2022-01-03"
+    ) -> str:
+        """Ingest a seeded cohort of the week of reference_date on the given engine"""
+
+        # instanciate SynthCustomers object and generate samples and report
+        synth_customers = SynthCustomers(
+            num_samples=100, group="CONTROL", reference_date=reference_date, seed=seed
+        )
+        synth_customers.generate_samples()
+        synth_customers.generate_report()
+
+        # instanciate RdsIngestor object
+        rds_ingestor = RdsIngestor(synth_customers)
+
+        # use the given engine instead of AWS RDS
+        def create_conn_engine():
+            rds_ingestor.engine = engine
+
+        with patch.object(rds_ingestor, "_create_conn_engine", create_conn_engine):
+            return rds_ingestor.ingest_samples(replace=replace)
+
+    def count_rows(self, engine) -> int:
+        """Count the rows of the SyntheticCustomers table"""
+
+        with engine.connect() as connection:
+            return connection.execute(
+                text('SELECT COUNT(*) FROM public."SyntheticCustomers"')
+            ).scalar()
+
+    def test_ingest_samples_replace(self, sqlite_engine):
+        """Check if reruns with replace overwrite the rows of the week and group"""
+
+        # ingest the same week twice
+        responses = [self.ingest(sqlite_engine, seed, True) for seed in [1, 2]]
+
+        assert (responses == ["ingest_samples method successfully called"] * 2) and (
+            self.count_rows(sqlite_engine) == 100
+        )
+
+    def test_ingest_samples_replace_not_monday(self, sqlite_engine):
+        """Check if a replace of a week that does not start on Monday is rejected"""
+
+        assert self.ingest(sqlite_engine, 1, True, "2022-01-05").startswith(
+            "ingest_samples method NOT successfully called: raised error ---> replace needs a reference date on Monday"
+        )
+
+    def test_ingest_samples_replace_other_cohorts(self, sqlite_engine):
+        """Check if a week with rows of other cohorts (e.g. appended by the DAG
+        on a day of the week) is not replaced"""
+
+        # append the rows of a cohort that starts on Wednesday and a backfilled week
+        self.ingest(sqlite_engine, 1, False, "2022-01-05")
+        self.ingest(sqlite_engine, 2, False)
+
+        assert (
+            "the week has rows of other cohorts" in self.ingest(sqlite_engine, 2, True)
+        ) and (self.count_rows(sqlite_engine) == 200)
+
+    def test_ingest_samples_append(self, sqlite_engine):
+        """Check if rows are appended without replace"""
+
+        # ingest the same week twice
+        for seed in [1, 2]:
+            self.ingest(sqlite_engine, seed, False)
+
+        assert self.count_rows(sqlite_engine) == 200
+
+    def test_ingest_cohort(self, sqlite_engine):
+        """Check if a deserialized Cohort object is ingested like its SynthCustomers object"""
+
+        # generate a seeded cohort of the week of 2022-01-03
+        cohort = SynthCustomers(
+            num_samples=100, group="CONTROL", reference_date="2022-01-03", seed=1
+        ).generate_samples()
+
+        # instanciate RdsIngestor object with the deserialized cohort
+        rds_ingestor = RdsIngestor(Cohort.from_bytes(cohort.to_bytes()))
+
+        # use the given engine instead of AWS RDS
+        def create_conn_engine():
+            rds_ingestor.engine = sqlite_engine
+
+        with patch.object(rds_ingestor, "_create_conn_engine", create_conn_engine):
+            response = rds_ingestor.ingest_samples(replace=True)
+
+        # rerun with the SynthCustomers object of the same seed
+        self.ingest(sqlite_engine, 1, True)
+
+        # read ingested rows
+        with sqlite_engine.connect() as connection:
+            regions = connection.execute(
+                text('SELECT region FROM public."SyntheticCustomers"')
+            ).scalars()
+
+        assert (
+            (response == "ingest_samples method successfully called")
+            and (self.count_rows(sqlite_engine) == 100)
+            and (list(regions) == list(cohort.sampling_dict["region"]))
+        )
+
+    def test_ingest_samples_no_samples(self):
+        """Check if an object without samples (SynthCustomers used with
+        generate_batches) is not reported as ingested"""
+
+        # define batches and report (no samples on sampling_dict)
+        synth_customers = SynthCustomers(num_samples=100, group="CONTROL", seed=1)
+        synth_customers.generate_batches(10)
+        synth_customers.generate_report()
+
+        # instanciate RdsIngestor object
+        rds_ingestor = RdsIngestor(synth_customers)
+
+        assert (
+            rds_ingestor.ingest_samples()
+            == "ingest_samples method NOT successfully called: synth_customer_object param has no samples"
+        )
+
+    def test_ingest_batches_replace(self, sqlite_engine):
+        """Check if batches are inserted and reruns with replace overwrite them"""
+
+        # ingest the same week twice, in batches
+        for seed in [1, 2]:
+            # instanciate SynthCustomers object and generate batches and report
+            synth_customers = SynthCustomers(
+                num_samples=100,
+                group="CONTROL",
+                reference_date="2022-01-03",
+                seed=seed,
+            )
+            batches = synth_customers.generate_batches(batch_size=30)
+            synth_customers.generate_report()
+
+            # instanciate RdsIngestor object
+            rds_ingestor = RdsIngestor(synth_customers)
+
+            # use the given engine instead of AWS RDS
+            def create_conn_engine():
+                rds_ingestor.engine = sqlite_engine
+
+            with patch.object(rds_ingestor, "_create_conn_engine", create_conn_engine):
+                response = rds_ingestor.ingest_batches(batches, replace=True)
+
+        assert (response == "ingest_batches method successfully called") and (
+            self.count_rows(sqlite_engine) == 100
+        )
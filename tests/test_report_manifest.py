@@ -0,0 +1,389 @@
+# load the required libraries
+import os
+import json
+import boto3
+import pytest
+import msgpack
+from moto import mock_s3
+from unittest.mock import patch
+from botocore.exceptions import ClientError, ParamValidationError
+from synthetic_data_ingestion.report_manifest import (
+    MANIFEST_SHARDS,
+    ReportManifestReader,
+    _shard_locks,
+    acquire_shard,
+    check_botocore_version,
+    manifest_entry,
+    manifest_key,
+    parse_reports,
+    partition_prefix,
+    read_manifests,
+    update_manifest,
+)
+
+
+# define reports stored on the fake bucket
+reports = [
+    {"group": group, "gamma_shape": gamma_shape, "poisson_lambda": 3}
+    for group, gamma_shape in [("CONTROL", 10), ("TREATMENT", 10), ("CONTROL", 20)]
+]
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_SECURITY_TOKEN"] = "testing"
+    os.environ["AWS_SESSION_TOKEN"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+
+
+@pytest.fixture(scope="function")
+def fake_s3_bucket(aws_credentials, *args, **kwargs):
+    """Pytest fixture that creates an fake s3 bucket on a
+    fake AWS account.
+    """
+    # open moto mock with fake aws credentials
+    with mock_s3(aws_credentials):
+        # create a fake client
+        s3 = boto3.client("s3")
+        # create the required s3 bucket on fake account
+        s3.create_bucket(Bucket=os.environ["AWS_S3_BUCKET"])
+        # yield the fake bucket on fake client account
+        yield s3
+
+
+@pytest.fixture(scope="function")
+def fake_partitions(fake_s3_bucket):
+    """Write one report object per report on two partitions
+    (and an NDJSON object with all reports on the second one)"""
+
+    # iterate over partitions
+    for partition_date in ["2022-07-01", "2022-07-02"]:
+        # iterate over reports
+        for idx, report in enumerate(reports):
+            # define object key and content
+            key = f"{partition_prefix(partition_date)}/api_request_at={idx}.json"
+            content = json.dumps(report).encode("UTF-8")
+
+            # put report object and record it on the manifest
+            fake_s3_bucket.put_object(
+                Bucket=os.environ["AWS_S3_BUCKET"], Key=key, Body=content
+            )
+            update_manifest(
+                fake_s3_bucket,
+                os.environ["AWS_S3_BUCKET"],
+                partition_date,
+                [manifest_entry(key, len(content), [report])],
+            )
+
+    # define NDJSON object
+    key = f"{partition_prefix('2022-07-02')}/api_request_at=all.ndjson"
+    content = b"\n".join(json.dumps(report).encode("UTF-8") for report in reports)
+
+    # put NDJSON object and record it on the manifest
+    fake_s3_bucket.put_object(Bucket=os.environ["AWS_S3_BUCKET"], Key=key, Body=content)
+    update_manifest(
+        fake_s3_bucket,
+        os.environ["AWS_S3_BUCKET"],
+        "2022-07-02",
+        [manifest_entry(key, len(content), reports)],
+    )
+
+    yield fake_s3_bucket
+
+
+def client_error(code: str) -> ClientError:
+    """Create a S3 client error with the given code"""
+    return ClientError({"Error": {"Code": code}}, "PutObject")
+
+
+def get_objects(s3, partition_date: str) -> list:
+    """Get the objects recorded on the manifest of the given partition"""
+
+    return read_manifests(s3, os.environ["AWS_S3_BUCKET"], [partition_date])[0][0][
+        "objects"
+    ]
+
+
+def put_after_errors(s3, errors: list):
+    """Create a put_object side effect that raises the given errors
+    and then calls the original put_object method"""
+
+    # keep the original put_object method
+    put_object = s3.put_object
+    # define errors to raise
+    errors = list(errors)
+
+    def side_effect(**kwargs):
+        # raise next error
+        if errors:
+            raise errors.pop(0)
+
+        return put_object(**kwargs)
+
+    return side_effect
+
+
+class TestUpdateManifest:
+    def test_update_manifest_ok(self, fake_s3_bucket):
+        """Check if entries are appended to the partition manifest"""
+
+        # add two entries
+        for idx in range(2):
+            num_objects = update_manifest(
+                fake_s3_bucket,
+                os.environ["AWS_S3_BUCKET"],
+                "2022-07-01",
+                [manifest_entry(f"key_{idx}", 10, reports[:1])],
+            )
+
+        assert (num_objects == 2) and (
+            get_objects(fake_s3_bucket, "2022-07-01")
+            == [
+                {
+                    "key": f"key_{idx}",
+                    "size": 10,
+                    "reports": [
+                        {"group": "CONTROL", "gamma_shape": 10, "poisson_lambda": 3}
+                    ],
+                }
+                for idx in range(2)
+            ]
+        )
+
+    def test_update_manifest_conditional_put(self, fake_s3_bucket):
+        """Check if manifests are written with If-None-Match (new manifest)
+        and If-Match (existing manifest)"""
+
+        # keep the original put_object method
+        put_object = fake_s3_bucket.put_object
+
+        # spy put_object calls
+        with patch.object(
+            fake_s3_bucket, "put_object", side_effect=put_object
+        ) as mock_put:
+            # add two entries
+            for _ in range(2):
+                update_manifest(
+                    fake_s3_bucket, os.environ["AWS_S3_BUCKET"], "2022-07-01", []
+                )
+
+        # get conditions of each call
+        first_call, second_call = [call.kwargs for call in mock_put.call_args_list]
+
+        assert (first_call["IfNoneMatch"] == "*") and ("IfMatch" in second_call)
+
+    @pytest.mark.parametrize(
+        "code", ["PreconditionFailed", "ConditionalRequestConflict"]
+    )
+    def test_update_manifest_conflict(self, fake_s3_bucket, code):
+        """Check if a conflicting write is retried"""
+
+        # first put loses the race to another writer
+        with patch.object(
+            fake_s3_bucket,
+            "put_object",
+            side_effect=put_after_errors(fake_s3_bucket, [client_error(code)]),
+        ) as mock_put:
+            with patch("time.sleep"):
+                num_objects = update_manifest(
+                    fake_s3_bucket,
+                    os.environ["AWS_S3_BUCKET"],
+                    "2022-07-01",
+                    [manifest_entry("key", 10, reports)],
+                )
+
+        assert (
+            (num_objects == 1)
+            and (mock_put.call_count == 2)
+            and (get_objects(fake_s3_bucket, "2022-07-01")[0]["key"] == "key")
+        )
+
+    def test_update_manifest_too_many_conflicts(self, fake_s3_bucket):
+        """Check if an error is raised after max_retries conflicting writes"""
+
+        # every put loses the race to another writer
+        with patch.object(
+            fake_s3_bucket,
+            "put_object",
+            side_effect=client_error("PreconditionFailed"),
+        ):
+            with patch("time.sleep"):
+                with pytest.raises(RuntimeError):
+                    update_manifest(
+                        fake_s3_bucket,
+                        os.environ["AWS_S3_BUCKET"],
+                        "2022-07-01",
+                        [],
+                        max_retries=3,
+                    )
+
+    def test_update_manifest_without_conditional_writes(self, fake_s3_bucket):
+        """Check if manifests are written without conditions when the
+        S3 store does not support conditional writes"""
+
+        # conditional put is rejected
+        with patch.object(
+            fake_s3_bucket,
+            "put_object",
+            side_effect=put_after_errors(
+                fake_s3_bucket, [client_error("NotImplemented")]
+            ),
+        ) as mock_put:
+            num_objects = update_manifest(
+                fake_s3_bucket,
+                os.environ["AWS_S3_BUCKET"],
+                "2022-07-01",
+                [manifest_entry("key", 10, reports)],
+            )
+
+        # get params of the last call
+        last_call = mock_put.call_args_list[-1].kwargs
+
+        assert (
+            (num_objects == 1)
+            and not ({"IfMatch", "IfNoneMatch"} & set(last_call))
+            and (get_objects(fake_s3_bucket, "2022-07-01")[0]["key"] == "key")
+        )
+
+    def test_update_manifest_old_sdk(self, fake_s3_bucket):
+        """Check if an SDK without conditional writes raises an error
+        (instead of writing manifests without conditions)"""
+
+        # conditional params are rejected by the SDK
+        with patch.object(
+            fake_s3_bucket,
+            "put_object",
+            side_effect=ParamValidationError(report="IfNoneMatch"),
+        ):
+            with pytest.raises(ParamValidationError):
+                update_manifest(
+                    fake_s3_bucket, os.environ["AWS_S3_BUCKET"], "2022-07-01", []
+                )
+
+    @pytest.mark.parametrize(
+        "version,valid", [("1.35.68", True), ("1.35.99", True), ("1.34.162", False)]
+    )
+    def test_check_botocore_version(self, version, valid):
+        """Check if an SDK without conditional writes fails loudly"""
+
+        # installed SDK with the given version
+        with patch("botocore.__version__", version):
+            # SDK with conditional writes
+            if valid:
+                check_botocore_version()
+
+            # SDK without conditional writes
+            else:
+                with pytest.raises(RuntimeError):
+                    check_botocore_version()
+
+    def test_update_manifest_busy_shard(self, fake_s3_bucket):
+        """Check if a writer uses another shard when the shard of its
+        thread is busy (and the partition manifest merges all shards)"""
+
+        # acquire the shard of the current thread (another writer is updating it)
+        busy = acquire_shard()
+
+        # try to add an entry
+        try:
+            update_manifest(
+                fake_s3_bucket,
+                os.environ["AWS_S3_BUCKET"],
+                "2022-07-01",
+                [manifest_entry("key", 10, reports)],
+            )
+
+        # release the busy shard
+        finally:
+            _shard_locks[busy].release()
+
+        # get shards of the partition
+        keys = [
+            obj["Key"]
+            for obj in fake_s3_bucket.list_objects_v2(
+                Bucket=os.environ["AWS_S3_BUCKET"],
+                Prefix=partition_prefix("2022-07-01"),
+            )["Contents"]
+        ]
+
+        assert (
+            (keys == [manifest_key("2022-07-01", (busy + 1) % MANIFEST_SHARDS)])
+            and (get_objects(fake_s3_bucket, "2022-07-01")[0]["key"] == "key")
+            and not any(lock.locked() for lock in _shard_locks)
+        )
+
+    def test_update_manifest_error(self, fake_s3_bucket):
+        """Check if other S3 errors are raised"""
+
+        # put raises an access error
+        with patch.object(
+            fake_s3_bucket, "put_object", side_effect=client_error("AccessDenied")
+        ):
+            with pytest.raises(ClientError):
+                update_manifest(
+                    fake_s3_bucket, os.environ["AWS_S3_BUCKET"], "2022-07-01", []
+                )
+
+
+class TestParseReports:
+    @pytest.mark.parametrize(
+        "key, content, expected",
+        [
+            ("a.json", json.dumps(reports[0]).encode(), reports[:1]),
+            ("a.msgpack", msgpack.packb(reports[0]), reports[:1]),
+            (
+                "a.ndjson",
+                b"\n".join(json.dumps(report).encode() for report in reports),
+                reports,
+            ),
+        ],
+    )
+    def test_parse_reports(self, key, content, expected):
+        """Check if reports are deserialized by the key extension"""
+
+        assert parse_reports(key, content) == expected
+
+
+class TestReportManifestReader:
+    def test_get_manifest_missing(self, fake_s3_bucket, tmpdir):
+        """Check if a missing manifest is an empty manifest"""
+
+        # instanciate reader
+        reader = ReportManifestReader(log_folder=tmpdir)
+
+        assert reader.get_manifest("2022-07-01") == {"objects": []}
+
+    @pytest.mark.parametrize(
+        "filters, expected",
+        [
+            ({}, 7),
+            ({"group": "CONTROL"}, 5),
+            ({"group": "CONTROL", "gamma_shape": 20}, 3),
+            ({"poisson_lambda": 100}, 0),
+        ],
+    )
+    def test_select(self, fake_partitions, tmpdir, filters, expected):
+        """Check if objects are selected by the manifest fields"""
+
+        # instanciate reader
+        reader = ReportManifestReader(log_folder=tmpdir)
+
+        assert len(reader.select("2022-07-01", "2022-07-02", **filters)) == expected
+
+    def test_read_reports(self, fake_partitions, tmpdir):
+        """Check if matching reports are read without listing the bucket"""
+
+        # instanciate reader
+        reader = ReportManifestReader(log_folder=tmpdir, max_workers=4)
+
+        # make sure the bucket is not listed
+        with patch.object(
+            reader.s3, "list_objects_v2", side_effect=Exception("bucket listed")
+        ):
+            control = reader.read_reports("2022-07-01", "2022-07-02", group="CONTROL")
+            first_day = reader.read_reports("2022-07-01", "2022-07-01")
+
+        assert (control == [reports[0], reports[2]] * 3) and (first_day == reports)
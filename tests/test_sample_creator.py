@@ -237,3 +237,98 @@ class TestSynthCustomers:
 
         with pytest.raises(Exception):
             synth_customers.generate_report()
+
+    def test_generate_samples_seed(self, num_samples, group):
+        """check if the same seed generates the same samples and report"""
+
+        synth_customers = [
+            SynthCustomers(num_samples=num_samples, group=group, seed=42)
+            for _ in range(2)
+        ]
+        for synth_customer in synth_customers:
+            synth_customer.generate_samples()
+            synth_customer.generate_report()
+
+        assert all(
+            (synth_customers[0].sampling_dict[key] == array).all()
+            for key, array in synth_customers[1].sampling_dict.items()
+        ) and (synth_customers[0].creation_report == synth_customers[1].creation_report)
+
+    def test_gen_purchase_date_reference_date(self, num_samples, group):
+        """purchase_date must cover the week that starts on the reference date"""
+
+        synth_customers = SynthCustomers(
+            num_samples=num_samples, group=group, reference_date="2022-01-03"
+        )
+        synth_customers.generate_samples()
+        synth_customers.generate_report()
+
+        assert (
+            set(synth_customers.sampling_dict["purchase_date"])
+            <= {f"2022-01-0{day}" for day in range(3, 10)}
+        ) and (
+            synth_customers.creation_report["date_interval"]
+            == "[2022-01-03,2022-01-09] [extremes included]"
+        )
+
+    def test_constructor_invalid_seed(self, num_samples, group):
+        """test if constructor raises an error on invalid seed and reference_date"""
+
+        with pytest.raises(ValueError):
+            SynthCustomers(num_samples=num_samples, group=group, seed=-1)
+
+        with pytest.raises(TypeError):
+            SynthCustomers(
+                num_samples=num_samples, group=group, reference_date=20220103
+            )
+
+    def test_generate_batches_seed(self, num_samples, group):
+        """check if seeded batches are reproducible for the same batch_size
+        but do not match the samples of generate_samples (other draw order)"""
+
+        def draw_batches() -> np.ndarray:
+            # draw seeded batches of total_purchase_price
+            synth_customers = SynthCustomers(
+                num_samples=num_samples, group=group, seed=1
+            )
+            return np.concatenate(
+                [
+                    batch["total_purchase_price"]
+                    for batch in synth_customers.generate_batches(batch_size=7)
+                ]
+            )
+
+        # generate seeded samples
+        synth_customers = SynthCustomers(num_samples=num_samples, group=group, seed=1)
+        synth_customers.generate_samples()
+
+        assert np.array_equal(draw_batches(), draw_batches()) and not np.array_equal(
+            draw_batches(), synth_customers.sampling_dict["total_purchase_price"]
+        )
+
+    def test_generate_batches(self, num_samples, group):
+        """check if batches have all samples and sampling_dict stays empty"""
+
+        synth_customers = SynthCustomers(num_samples=num_samples, group=group, seed=1)
+        batches = list(synth_customers.generate_batches(batch_size=7))
+        synth_customers.generate_report()
+
+        assert (
+            (sum(len(batch["group"]) for batch in batches) == num_samples)
+            and all(len(batch["group"]) <= 7 for batch in batches)
+            and all(
+                set(batch.keys())
+                == {
+                    "total_purchase_price",
+                    "num_diff_items",
+                    "purchase_date",
+                    "region",
+                    "gender",
+                    "group",
+                    "device",
+                }
+                for batch in batches
+            )
+            and (synth_customers.sampling_dict == {})
+            and (synth_customers.creation_report["group"] == group)
+        )
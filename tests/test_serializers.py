@@ -0,0 +1,109 @@
+# import required libraries
+import json
+import pytest
+import numpy as np
+from synthetic_data_ingestion.serializers import (
+    NpEncoder,
+    SERIALIZERS,
+    get_serializer,
+    register_serializer,
+    numpy_default,
+)
+
+
+# define a report with numpy scalars and arrays
+report = {
+    "group": "CONTROL",
+    "gamma_shape": np.int64(3),
+    "gamma_scale": np.float16(10),
+    "poisson_lambda": np.int32(2),
+    "region": {f"R{idx}": np.float64(1 / 1000) for idx in range(1000)},
+    "histogram": np.arange(100, dtype=np.float64),
+    "counts": np.arange(10, dtype=np.int16),
+}
+
+# define the expected python report
+expected = {
+    "group": "CONTROL",
+    "gamma_shape": 3,
+    "gamma_scale": 10.0,
+    "poisson_lambda": 2,
+    "region": {f"R{idx}": 1 / 1000 for idx in range(1000)},
+    "histogram": list(range(100)),
+    "counts": list(range(10)),
+}
+
+
+# parameterize class with all available serializers
+@pytest.mark.parametrize("name", list(SERIALIZERS))
+class TestSerializers:
+    def test_round_trip(self, name):
+        """serialized numpy reports must be read back as python reports"""
+
+        # get serializer
+        serializer = get_serializer(name)
+
+        assert serializer.loads(serializer.dumps(report)) == expected
+
+    def test_dumps_bytes(self, name):
+        """dumps must return bytes"""
+        assert isinstance(get_serializer(name).dumps(report), bytes)
+
+    def test_instance_cached(self, name):
+        """get_serializer must create each serializer only once"""
+        assert get_serializer(name) is get_serializer(name)
+
+
+class TestGetSerializer:
+    def test_json_fastest(self):
+        """json must be the fastest available json serializer"""
+        assert get_serializer("json").name == (
+            "orjson" if "orjson" in SERIALIZERS else "stdlib-json"
+        )
+
+    def test_json_output_compatible(self):
+        """json serializers must produce the same content"""
+        assert json.loads(get_serializer("json").dumps(report)) == json.loads(
+            get_serializer("stdlib-json").dumps(report)
+        )
+
+    def test_unknown(self):
+        """unknown serializers must raise a ValueError"""
+        with pytest.raises(ValueError):
+            get_serializer("WRONG")
+
+    def test_register_serializer(self):
+        """registered serializers must be available on get_serializer"""
+
+        # define a custom serializer
+        class ReprSerializer:
+            name = "repr"
+            content_type = "text/plain"
+            extension = "txt"
+
+            def dumps(self, obj):
+                return repr(obj).encode("UTF-8")
+
+            def loads(self, data):
+                return data.decode("UTF-8")
+
+        # register serializer
+        register_serializer("repr", ReprSerializer)
+
+        try:
+            assert get_serializer("repr").dumps(1) == b"1"
+        finally:
+            # remove custom serializer
+            SERIALIZERS.pop("repr")
+
+
+class TestNumpyDefault:
+    def test_not_numpy(self):
+        """non numpy objects must raise a TypeError"""
+        with pytest.raises(TypeError):
+            numpy_default(object())
+
+    def test_np_encoder_fallback(self):
+        """NpEncoder must keep the json.JSONEncoder error for other objects"""
+        with pytest.raises(TypeError):
+            json.dumps({"X": object()}, cls=NpEncoder)
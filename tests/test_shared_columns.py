@@ -0,0 +1,135 @@
+# import required libraries
+import pickle
+import pytest
+import numpy as np
+from multiprocessing import shared_memory
+from synthetic_data_ingestion import shared_columns
+from synthetic_data_ingestion.sample_creator import SynthCustomers
+
+
+@pytest.fixture
+def sampling_dict(tmpdir):
+    """Generate the samples of a small cohort"""
+
+    # generate samples
+    synth_customers = SynthCustomers(
+        num_samples=1000, group="CONTROL", log_folder=tmpdir, seed=3
+    )
+    synth_customers.generate_samples()
+
+    return synth_customers.sampling_dict
+
+
+def block_exists(name: str) -> bool:
+    """Check if a shared memory block exists"""
+
+    # try to attach block
+    try:
+        shared_memory.SharedMemory(name=name).close()
+        return True
+
+    # block was removed
+    except FileNotFoundError:
+        return False
+
+
+class TestSharedColumns:
+    def test_share_and_attach(self, sampling_dict):
+        """Check if attached columns are equal read-only views of the shared blocks
+        and if the descriptor size does not depend on the cohort size"""
+
+        # share columns
+        descriptor = shared_columns.share_columns(sampling_dict)
+
+        # attach columns
+        with shared_columns.SharedColumns(descriptor) as columns:
+            # check columns
+            equal = all(
+                np.array_equal(columns[column], values)
+                and (columns[column].dtype == values.dtype)
+                for column, values in sampling_dict.items()
+            )
+            read_only = not any(values.flags.writeable for values in columns.values())
+
+        # share a 100x bigger cohort
+        big_descriptor = shared_columns.share_columns(
+            {column: np.tile(values, 100) for column, values in sampling_dict.items()}
+        )
+        shared_columns.unlink_columns(big_descriptor)
+
+        assert (
+            equal
+            and read_only
+            and (list(descriptor) == list(sampling_dict))
+            # blocks are removed on exit
+            and not any(block_exists(spec["name"]) for spec in descriptor.values())
+            and not any(block_exists(spec["name"]) for spec in big_descriptor.values())
+            # descriptor size is constant
+            and (
+                abs(len(pickle.dumps(big_descriptor)) - len(pickle.dumps(descriptor)))
+                < 50
+            )
+        )
+
+    def test_object_column(self):
+        """Check if object columns raise an error and leave no blocks behind"""
+
+        # try to share an object column after a numeric one
+        with pytest.raises(ValueError), pytest.MonkeyPatch.context() as monkeypatch:
+            # record created and attached blocks
+            created = []
+            original = shared_memory.SharedMemory
+
+            def spy(*args, **kwargs):
+                block = original(*args, **kwargs)
+                created.append(block.name)
+                return block
+
+            monkeypatch.setattr(shared_memory, "SharedMemory", spy)
+            shared_columns.share_columns(
+                {
+                    "total_purchase_price": np.zeros(10),
+                    "region": np.array(["LAM"] * 10, dtype=object),
+                }
+            )
+
+        assert (len(set(created)) == 1) and not block_exists(created[0])
+
+    def test_attach_missing_block(self, sampling_dict):
+        """Check if attaching a removed block raises an error and removes the others"""
+
+        # share columns and remove one block
+        descriptor = shared_columns.share_columns(sampling_dict)
+        shared_columns.unlink_columns({"region": descriptor["region"]})
+
+        # try to attach columns
+        with pytest.raises(FileNotFoundError):
+            shared_columns.SharedColumns(descriptor)
+
+        assert not any(block_exists(spec["name"]) for spec in descriptor.values())
+
+    def test_release_with_views(self, sampling_dict):
+        """Check if releasing blocks with views kept elsewhere (e.g. by a Cohort)
+        keeps the views readable and unmaps the blocks once the views are gone"""
+
+        # share and attach columns
+        descriptor = shared_columns.share_columns(sampling_dict)
+        shared = shared_columns.SharedColumns(descriptor)
+
+        # keep a view after the release
+        region = shared.columns["region"]
+        shared.release()
+
+        # views are alive -> blocks are not closed yet
+        num_open = shared_columns.close_deferred()
+        equal = np.array_equal(region, sampling_dict["region"])
+
+        # drop the view
+        del region
+
+        assert (
+            (num_open == 1)
+            and equal
+            and not any(block_exists(spec["name"]) for spec in descriptor.values())
+            and (shared_columns.close_deferred() == 0)
+        )
@@ -0,0 +1,216 @@
+# import required libraries
+import json
+import pytest
+import threading
+import numpy as np
+from synthetic_data_ingestion import tracing
+from synthetic_data_ingestion.sample_creator import SynthCustomers
+from synthetic_data_ingestion.rds_ingestion import RdsIngestor
+
+
+@pytest.fixture
+def trace_file(tmpdir):
+    """Turn tracing on (JSON lines) during a test"""
+
+    # define trace file
+    path = str(tmpdir.join("traces.jsonl"))
+
+    # turn tracing on
+    tracing.configure(path)
+
+    yield path
+
+    # turn tracing off
+    tracing.disable()
+
+
+def read_spans(path: str) -> list:
+    """Read the exported spans of a trace file"""
+
+    with open(path) as trace_lines:
+        return [json.loads(line) for line in trace_lines]
+
+
+class TestTracing:
+    def test_tracing_off(self, tmpdir):
+        """Check if spans are no-ops and traced functions run as usual when tracing is off"""
+
+        @tracing.traced("test.add")
+        def add(a, b):
+            return a + b
+
+        # use spans with tracing off
+        with tracing.span("test.span", rows=10) as current:
+            current.set_attributes(bytes=10)
+            tracing.set_attributes(bytes=10)
+            tracing.record_error("error")
+
+        assert (
+            (not tracing.is_enabled())
+            and (current is tracing.NOOP_SPAN)
+            and (tracing.current_context() is None)
+            and (add(1, 2) == 3)
+            and (tmpdir.listdir() == [])
+        )
+
+    def test_configure_invalid_exporter(self, tmpdir):
+        """Check if configure raises an error on invalid exporters"""
+
+        with pytest.raises(ValueError):
+            tracing.configure(str(tmpdir.join("traces.jsonl")), exporter="zipkin")
+
+    def test_nested_spans(self, trace_file):
+        """Check if nested spans are exported with their parent, duration,
+        attributes and status"""
+
+        @tracing.traced("test.fail")
+        def fail():
+            raise ValueError("invalid")
+
+        # create nested spans
+        with tracing.span("test.parent", cohort="control-10"):
+            with tracing.span("test.child") as child:
+                child.set_attributes(rows=10, bytes=np.int64(80))
+            with pytest.raises(ValueError):
+                fail()
+
+        # read exported spans (children finish first)
+        spans = {span["name"]: span for span in read_spans(trace_file)}
+        parent = spans["test.parent"]
+
+        assert (
+            (list(spans) == ["test.child", "test.fail", "test.parent"])
+            and (parent["parent_span_id"] is None)
+            and all(
+                (spans[name]["parent_span_id"] == parent["span_id"])
+                and (spans[name]["trace_id"] == parent["trace_id"])
+                for name in ["test.child", "test.fail"]
+            )
+            and (spans["test.child"]["attributes"] == {"rows": 10, "bytes": 80})
+            and (parent["attributes"] == {"cohort": "control-10"})
+            and (parent["duration_s"] >= spans["test.child"]["duration_s"] >= 0)
+            and (spans["test.fail"]["status"] == "error")
+            and (spans["test.fail"]["attributes"]["error"] == "ValueError: invalid")
+            and (parent["status"] == "ok")
+        )
+
+    def test_otlp_exporter(self, tmpdir):
+        """Check if spans are exported as OTLP/JSON trace requests"""
+
+        # define trace file
+        path = str(tmpdir.join("traces.otlp.jsonl"))
+
+        # export a span as OTLP/JSON
+        tracing.configure(path, exporter="otlp")
+        try:
+            with tracing.span("test.span", rows=10, group="CONTROL") as current:
+                current.record_error("no database")
+        finally:
+            tracing.disable()
+
+        # get exported span
+        request = read_spans(path)[0]
+        span = request["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+
+        assert (
+            (span["name"] == "test.span")
+            and (len(span["traceId"]) == 32)
+            and (len(span["spanId"]) == 16)
+            and ("parentSpanId" not in span)
+            and (int(span["endTimeUnixNano"]) >= int(span["startTimeUnixNano"]))
+            and (
+                span["attributes"]
+                == [
+                    {"key": "rows", "value": {"intValue": "10"}},
+                    {"key": "group", "value": {"stringValue": "CONTROL"}},
+                    {"key": "error", "value": {"stringValue": "no database"}},
+                ]
+            )
+            and (span["status"] == {"code": 2, "message": "no database"})
+        )
+
+    def test_propagate(self, trace_file):
+        """Check if spans opened on other threads are children of the current span"""
+
+        def child():
+            # open a span
+            with tracing.span("test.thread"):
+                pass
+
+        # open a span on another thread
+        with tracing.span("test.parent") as parent:
+            thread = threading.Thread(target=tracing.propagate(child))
+            thread.start()
+            thread.join()
+
+        # read exported spans
+        spans = {span["name"]: span for span in read_spans(trace_file)}
+
+        assert (spans["test.thread"]["parent_span_id"] == parent.span_id) and (
+            spans["test.thread"]["thread"] != spans["test.parent"]["thread"]
+        )
+
+
+class TestInstrumentation:
+    def test_generate_samples_spans(self, tmpdir, trace_file):
+        """Check if generate_samples and every gen_* method are traced
+        with their rows and bytes"""
+
+        # generate samples with tracing on
+        synth_customers = SynthCustomers(
+            num_samples=100, group="CONTROL", log_folder=tmpdir, seed=1
+        )
+        synth_customers.generate_samples()
+
+        # read exported spans
+        spans = {span["name"]: span for span in read_spans(trace_file)}
+        root = spans["sample_creator.generate_samples"]
+
+        assert (
+            (len(spans) == 8)
+            and all(
+                (span["parent_span_id"] == root["span_id"])
+                and (span["attributes"]["rows"] == 100)
+                and (span["attributes"]["bytes"] > 0)
+                for name, span in spans.items()
+                if name.startswith("sample_creator.gen_")
+            )
+            and (
+                root["attributes"]["bytes"]
+                == sum(
+                    column.nbytes for column in synth_customers.sampling_dict.values()
+                )
+            )
+        )
+
+    def test_ingest_samples_error_span(self, tmpdir, trace_file, monkeypatch):
+        """Check if a failed RDS ingestion is exported as an error span"""
+
+        # remove AWS RDS credentials
+        monkeypatch.delenv("AWS_RDB_ENDPOINT", raising=False)
+        monkeypatch.setattr(
+            "synthetic_data_ingestion.rds_ingestion.load_dotenv", lambda: None
+        )
+
+        # generate samples
+        synth_customers = SynthCustomers(
+            num_samples=10, group="CONTROL", log_folder=tmpdir
+        )
+        synth_customers.generate_samples()
+        synth_customers.generate_report()
+
+        # try to ingest samples without AWS RDS
+        response = RdsIngestor(synth_customers, tmpdir).ingest_samples()
+
+        # get exported span
+        span = [
+            span
+            for span in read_spans(trace_file)
+            if span["name"] == "rds.ingest_samples"
+        ][0]
+
+        assert (
+            response.startswith("ingest_samples method NOT successfully called")
+            and (span["status"] == "error")
+            and (span["attributes"]["rows"] == 10)
+        )